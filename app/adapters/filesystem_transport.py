@@ -3,13 +3,36 @@ File system transport adapter for reading/writing HL7 messages from local direct
 
 Provides:
 - FileSystemReader: scans inbox directories for message files, processes them alphabetically
-- FileSystemWriter: writes messages to outbox directories
+- FileLease: exclusive, expiring claim on an inbox file (`<name>.lease` next to it), so
+  several workers can share an inbox and a crashed worker's files are reclaimed once
+  the lease expires (FILE_LEASE_SECONDS, default 300s)
+- FileSystemWriter: writes messages to outbox directories, atomically (temporary file,
+  fsync, then renamed to a free final name)
 """
+import json
 import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Callable
+from typing import List, Optional, Callable, Tuple
 from datetime import datetime
 
+LEASE_SUFFIX = ".lease"
+DEFAULT_LEASE_SECONDS = float(os.getenv("FILE_LEASE_SECONDS", "300"))
+# Work files living next to messages in an inbox, never processed as messages
+IGNORED_SUFFIXES = (".processing", ".error", LEASE_SUFFIX, ".stale", ".checkpoint", ".tmp")
+
+
+@dataclass
+class FileLease:
+    """Claim held on an inbox file until `expires_at` (epoch seconds)."""
+    path: Path
+    lease_path: Path
+    token: str
+    expires_at: float
+
 
 class FileSystemReader:
     """
@@ -22,7 +45,8 @@ class FileSystemReader:
         inbox_path: str,
         extensions: Optional[List[str]] = None,
         archive_path: Optional[str] = None,
-        error_path: Optional[str] = None
+        error_path: Optional[str] = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS
     ):
         """
         Args:
@@ -30,8 +54,10 @@ class FileSystemReader:
             extensions: List of file extensions to process (e.g., ['.hl7', '.txt']). None = all files
             archive_path: Directory to move processed files (None = delete)
             error_path: Directory to move failed files (None = keep in inbox)
+            lease_seconds: Lease duration of a claimed file (longer than processing one file)
         """
         self.inbox_path = Path(inbox_path)
+        self.lease_seconds = lease_seconds
         self.extensions = extensions or []
         self.archive_path = Path(archive_path) if archive_path else None
         self.error_path = Path(error_path) if error_path else None
@@ -50,7 +76,7 @@ class FileSystemReader:
         
         files = []
         for item in self.inbox_path.iterdir():
-            if not item.is_file():
+            if not item.is_file() or item.name.endswith(IGNORED_SUFFIXES):
                 continue
             if self.extensions and item.suffix.lower() not in self.extensions:
                 continue
@@ -75,6 +101,84 @@ class FileSystemReader:
             print(f"Error reading {file_path}: {e}")
             return None
     
+    def claim(self, file_path: Path) -> Optional[FileLease]:
+        """
+        Claims a file for processing by creating its lease file exclusively.
+        An expired lease (crashed or stalled worker) is taken over.
+        Returns None if the file is leased by another worker or already gone.
+        """
+        lease_path = file_path.with_name(file_path.name + LEASE_SUFFIX)
+        token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        for _ in range(2):
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._reclaim(lease_path):
+                    return None
+                continue
+            expires_at = time.time() + self.lease_seconds
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"owner": token, "expires_at": expires_at}, f)
+            if not file_path.exists():
+                # Processed and moved by another worker between listing and claim
+                lease_path.unlink(missing_ok=True)
+                return None
+            return FileLease(file_path, lease_path, token, expires_at)
+        return None
+    
+    def renew(self, lease: FileLease) -> bool:
+        """Extends a lease still held (long files); False if it was taken over."""
+        if self._read_lease(lease.lease_path)[0] != lease.token:
+            return False
+        lease.expires_at = time.time() + self.lease_seconds
+        tmp_path = lease.lease_path.with_name(lease.lease_path.name + ".tmp")
+        tmp_path.write_text(json.dumps({"owner": lease.token, "expires_at": lease.expires_at}), encoding="utf-8")
+        os.replace(tmp_path, lease.lease_path)
+        return True
+    
+    def release(self, lease: FileLease):
+        """Removes the lease file, unless it was taken over after expiring."""
+        if self._read_lease(lease.lease_path)[0] == lease.token:
+            lease.lease_path.unlink(missing_ok=True)
+    
+    def _read_lease(self, lease_path: Path) -> Tuple[Optional[str], Optional[float]]:
+        """Returns (owner token, expiry) of a lease file; expiry None if the file is gone."""
+        try:
+            raw = lease_path.read_text(encoding="utf-8")
+            mtime = lease_path.stat().st_mtime
+        except FileNotFoundError:
+            return None, None
+        try:
+            data = json.loads(raw)
+            return data["owner"], float(data["expires_at"])
+        except (ValueError, KeyError, TypeError):
+            # Lease left half-written by a crash: expires relative to its creation
+            return None, mtime + self.lease_seconds
+    
+    def _reclaim(self, lease_path: Path) -> bool:
+        """Removes an expired lease; True when the claim can be retried."""
+        token, expires_at = self._read_lease(lease_path)
+        if expires_at is None:
+            return True
+        if expires_at > time.time():
+            return False
+        # Move the lease aside atomically (a single reclaimer wins), then check it is
+        # still the expired one and not a fresh lease created in the meantime
+        stale_path = lease_path.with_name(f"{lease_path.name}.{uuid.uuid4().hex}.stale")
+        try:
+            lease_path.rename(stale_path)
+        except FileNotFoundError:
+            return True
+        if self._read_lease(stale_path)[0] != token:
+            try:
+                os.link(stale_path, lease_path)
+            except OSError:
+                pass
+            stale_path.unlink(missing_ok=True)
+            return False
+        stale_path.unlink(missing_ok=True)
+        return True
+    
     def mark_processed(self, file_path: Path, success: bool = True):
         """
         Marks a file as processed by moving it to archive or error directory.
@@ -111,26 +215,40 @@ class FileSystemReader:
         """
         stats = {"processed": 0, "succeeded": 0, "failed": 0}
         
+        # One listing per pass (not per file); new arrivals are picked up by the next pass
+        seen = set()
         while True:
-            result = self.read_next()
-            if not result:
+            files = [f for f in self.list_pending_files() if f not in seen]
+            if not files:
                 break
             
-            content, file_path = result
-            stats["processed"] += 1
-            
-            try:
-                success = handler(content, file_path)
-                if success:
-                    stats["succeeded"] += 1
-                    self.mark_processed(file_path, success=True)
-                else:
-                    stats["failed"] += 1
-                    self.mark_processed(file_path, success=False)
-            except Exception as e:
-                print(f"Handler error for {file_path}: {e}")
-                stats["failed"] += 1
-                self.mark_processed(file_path, success=False)
+            for file_path in files:
+                seen.add(file_path)
+                lease = self.claim(file_path)
+                if not lease:
+                    continue
+                try:
+                    try:
+                        content = file_path.read_text(encoding='utf-8')
+                    except Exception as e:
+                        print(f"Error reading {file_path}: {e}")
+                        continue
+                    stats["processed"] += 1
+                    
+                    try:
+                        success = handler(content, file_path)
+                        if success:
+                            stats["succeeded"] += 1
+                            self.mark_processed(file_path, success=True)
+                        else:
+                            stats["failed"] += 1
+                            self.mark_processed(file_path, success=False)
+                    except Exception as e:
+                        print(f"Handler error for {file_path}: {e}")
+                        stats["failed"] += 1
+                        self.mark_processed(file_path, success=False)
+                finally:
+                    self.release(lease)
         
         return stats
 
@@ -163,19 +281,59 @@ class FileSystemWriter:
         self,
         content: str,
         filename: Optional[str] = None,
-        message_id: Optional[str] = None
+        message_id: Optional[str] = None,
+        sync_directory: bool = True
     ) -> Path:
         """
-        Write a message to a file.
+        Write a message to a file, atomically: readers never see a partial file.
+        
+        Content goes to a temporary file (ignored by readers), is flushed to disk, then
+        published under its final name without overwriting an existing file (a suffix
+        is added on name collision).
         
         Args:
             content: Message content to write
             filename: Optional explicit filename (default: timestamp-based)
             message_id: Optional message ID to include in filename
+            sync_directory: Flush the directory entry too (write_batch does it once)
         
         Returns:
             Path to the written file
         """
+        file_path = self._target_path(filename, message_id)
+        tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        try:
+            file_path = self._publish(tmp_path, file_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        if sync_directory:
+            _fsync_directory(file_path.parent)
+        return file_path
+    
+    def write_batch(self, messages: List[tuple[str, Optional[str]]]) -> List[Path]:
+        """
+        Write multiple messages at once (one directory flush for the whole batch).
+        
+        Args:
+            messages: List of (content, message_id) tuples
+        
+        Returns:
+            List of written file paths
+        """
+        paths = []
+        for content, message_id in messages:
+            path = self.write_message(content, message_id=message_id, sync_directory=False)
+            paths.append(path)
+        for directory in {path.parent for path in paths}:
+            _fsync_directory(directory)
+        return paths
+    
+    def _target_path(self, filename: Optional[str], message_id: Optional[str]) -> Path:
         # Determine target directory
         if self.use_subdirs:
             date_str = datetime.now().strftime("%Y-%m-%d")
@@ -192,25 +350,31 @@ class FileSystemWriter:
             else:
                 filename = f"{timestamp}{self.extension}"
         
-        file_path = target_dir / filename
-        
-        # Write content
-        file_path.write_text(content, encoding='utf-8')
-        
-        return file_path
+        return target_dir / filename
     
-    def write_batch(self, messages: List[tuple[str, Optional[str]]]) -> List[Path]:
-        """
-        Write multiple messages at once.
-        
-        Args:
-            messages: List of (content, message_id) tuples
-        
-        Returns:
-            List of written file paths
+    @staticmethod
+    def _publish(tmp_path: Path, file_path: Path) -> Path:
+        """Gives the temporary file its final name (atomic rename, names already taken skipped).
+
+        A rename raises IN_MOVED_TO, which the inotify watcher of a watched inbox listens to
+        (a hard link would only raise IN_CREATE).
         """
-        paths = []
-        for content, message_id in messages:
-            path = self.write_message(content, message_id=message_id)
-            paths.append(path)
-        return paths
+        stem, suffix = file_path.stem, file_path.suffix
+        for attempt in range(1000):
+            candidate = file_path if attempt == 0 else file_path.with_name(f"{stem}_{attempt}{suffix}")
+            if candidate.exists():
+                continue
+            os.replace(tmp_path, candidate)
+            return candidate
+        raise FileExistsError(f"No free file name for {file_path}")
+
+
+def _fsync_directory(directory: Path):
+    """Flushes a directory entry (new file names) to disk; no-op where unsupported."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -11,43 +11,48 @@ Points clés
 - En mode tests (env TESTING=1), on évite l'init DB/serveurs et on laisse les
     fixtures contrôler l'environnement pour des tests isolés.
 - Les logs MLLP détaillés s'activent avec `MLLP_TRACE=1`.
+- Démarrage rapide : les routeurs peu utilisés (documentation, /admin/ght) et
+    SQLAdmin (/sqladmin) sont importés à leur premier accès (`LazyRoutes`) ;
+    LAZY_ROUTERS=0 les charge dès la création de l'app. Mesure du coût à
+    l'import : `python tools/import_time_report.py`.
+- Plusieurs workers (uvicorn --workers / gunicorn) : chaque écoute MLLP et chaque
+    tâche planifiée est tenue par un seul worker via des baux (`leader_lease`,
+    désactivables avec LEADER_LEASES=0). `MLLP_REUSE_PORT=1` fait au contraire
+    écouter tous les workers sur chaque port (SO_REUSEPORT).
 """
 
 import logging, os, secrets
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, APIRouter
+from fastapi import FastAPI
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from sqladmin import Admin, ModelView
-from sqlmodel import select
 
 from app.middleware.flash import FlashMessageMiddleware
 from app.middleware.ght_context import GHTContextMiddleware
 
-from app.db import init_db, engine, get_session
-from app.models import Patient, Dossier, Venue, Mouvement
-from app.models_structure_fhir import IdentifierNamespace, GHTContext, EntiteJuridique
-from app.models_endpoints import SystemEndpoint, MessageLog
+from app.db import init_db, get_session
 from app import models_scenarios  # ensure scenario models are registered
-from app.models_structure import (
-    EntiteGeographique, Pole, Service, UniteFonctionnelle,
-    UniteHebergement, Chambre, Lit
-)
+from app.db_async import dispose_async_engines
 from app.db_session_factory import session_factory
 from app.services.transport_inbound import on_message_inbound
 from app.services.mllp_manager import MLLPManager
 from app.services.entity_events import register_entity_events
 from app.services.entity_events_structure import register_structure_entity_events
+from app.services.structure_emission_coalescer import structure_emitter
+from app.services.fhir_batcher import fhir_batcher
+from app.services.file_sender import file_sender
+from app.services.fhir_transport import fhir_client_pool
+from app.services.leader_lease import leader_leases
 from app.services.scheduler import start_scheduler, stop_scheduler
+from app.utils.lazy_routes import LazyRoutes, lazy_router, load_lazy_routes
 
 from app.routers import (
     home, patients, dossiers, venues, mouvements, structure_hl7,
     endpoints, transport, transport_views, fhir_inbox, messages, interop,
-    generate, structure, workflow, fhir_structure, vocabularies, ght, namespaces,
+    generate, structure, workflow, fhir_structure, vocabularies,
     health, scenarios, guide, docs, ihe, dossier_type, structure_select, validation,
-    documentation
 )
 
 logging.basicConfig(
@@ -56,11 +61,19 @@ logging.basicConfig(
 )
 if os.getenv("MLLP_TRACE", "0") in ("1","true","True"):
     logging.getLogger("mllp").setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
 # Instance unique du manager et publication via app.state
-# - `session_factory` fournit des sessions DB courtes et sûres côté workers.
+# - `session_factory` fournit des sessions DB courtes et sûres côté workers. Pas
+#   d'AsyncSession ici : elle garderait le verrou d'écriture SQLite entre deux requêtes
+#   pendant que des routes écrivent encore en synchrone sur la boucle (voir app.db_async).
 # - `on_message_inbound` est appelé pour chaque message entrant HL7.
-mllp_manager = MLLPManager(session_factory=session_factory, on_message=on_message_inbound)
+mllp_manager = MLLPManager(
+    session_factory=session_factory,
+    on_message=on_message_inbound,
+    leases=leader_leases,
+    reuse_port=os.getenv("MLLP_REUSE_PORT", "0") in ("1", "true", "True"),
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -89,8 +102,10 @@ async def lifespan(app: FastAPI):
         
         # Démarrer le scheduler pour le polling des endpoints FILE
         # Par défaut: 60 secondes (1 minute). Configurable via FILE_POLL_INTERVAL
+        # Surveillance inotify des boîtes de réception (Linux), désactivable via FILE_WATCHER=0
         poll_interval = int(os.getenv("FILE_POLL_INTERVAL", "60"))
-        await start_scheduler(poll_interval)
+        watch_files = os.getenv("FILE_WATCHER", "1") not in ("0", "false", "False")
+        await start_scheduler(poll_interval, watch_files, leader_leases)
         logging.info(f"File endpoint polling started (interval: {poll_interval}s)")
 
     try:
@@ -98,145 +113,19 @@ async def lifespan(app: FastAPI):
     finally:
         if not testing:
             await stop_scheduler()
+            # Emettre les modifications de structure encore en fenêtre de coalescence
+            await structure_emitter.drain()
             await mllp_manager.stop_all()
+        # Fichiers batch HL7 et Bundles FHIR en attente, puis connexions keep-alive FHIR
+        await file_sender.drain()
+        await fhir_batcher.drain()
+        await fhir_client_pool.aclose()
+        await dispose_async_engines()
 
-# Admin auto (CRUD) via SQLAdmin
-class PatientAdmin(ModelView, model=Patient):
-    # Vue d'admin pour Patient
-    name = "Patient"
-    name_plural = "Patients"
-
-class VenueAdmin(ModelView, model=Venue):
-    name = "Venue"
-    name_plural = "Venues"
-
-class DossierAdmin(ModelView, model=Dossier):
-    name = "Dossier"
-    name_plural = "Dossiers"
-
-class MouvementAdmin(ModelView, model=Mouvement):
-    name = "Mouvement"
-    name_plural = "Mouvements"
-
-class SystemEndpointAdmin(ModelView, model=SystemEndpoint):
-    name = "Point d'accès système"
-    name_plural = "Points d'accès systèmes"
-    icon = "fa-solid fa-network-wired"
-    column_list = [
-        SystemEndpoint.id, SystemEndpoint.name, SystemEndpoint.role,
-        SystemEndpoint.is_enabled, SystemEndpoint.created_at,
-        SystemEndpoint.forced_identifier_system, SystemEndpoint.forced_identifier_oid,
-        SystemEndpoint.pam_validate_enabled, SystemEndpoint.pam_validate_mode, SystemEndpoint.pam_profile
-    ]
-    column_searchable_list = [SystemEndpoint.name, SystemEndpoint.forced_identifier_system]
-    column_sortable_list = [SystemEndpoint.id, SystemEndpoint.name, SystemEndpoint.is_enabled]
-    # Afficher payload / ack en lecture (onglets "Detail")
-    details_template = None  # on garde le template par défaut
-
-class MessageLogAdmin(ModelView, model=MessageLog):
-    name = "Message"
-    name_plural = "Messages"
-    icon = "fa-solid fa-envelope"
-    column_list = [
-        MessageLog.id, MessageLog.direction, MessageLog.kind, MessageLog.endpoint_id,
-        MessageLog.status, MessageLog.correlation_id, MessageLog.created_at,
-    ]
-    column_searchable_list = [MessageLog.status, MessageLog.correlation_id]
-    column_sortable_list = [MessageLog.id, MessageLog.created_at, MessageLog.status]
-    can_create = False   # journal en lecture seule
-    can_edit = False
-
-class NamespaceAdmin(ModelView, model=IdentifierNamespace):
-    name = "Espace de noms"
-    name_plural = "Espaces de noms"
-    icon = "fa-solid fa-tag"
-    column_list = [
-        IdentifierNamespace.id, IdentifierNamespace.name, IdentifierNamespace.system, IdentifierNamespace.type,
-        IdentifierNamespace.is_active, IdentifierNamespace.ght_context_id, IdentifierNamespace.entite_juridique_id
-    ]
-    column_searchable_list = [IdentifierNamespace.name, IdentifierNamespace.system, IdentifierNamespace.type]
-    column_sortable_list = [IdentifierNamespace.id, IdentifierNamespace.name, IdentifierNamespace.is_active]
-    can_delete = False
-
-# Admin pour les contextes GHT et EJ
-class GHTContextAdmin(ModelView, model=GHTContext):
-    name = "Contexte GHT"
-    name_plural = "Contextes GHT"
-    icon = "fa-solid fa-network-wired"
-    column_list = [GHTContext.id, GHTContext.name, GHTContext.code, GHTContext.is_active, GHTContext.created_at]
-    column_searchable_list = [GHTContext.name, GHTContext.code]
-    column_sortable_list = [GHTContext.id, GHTContext.name, GHTContext.is_active]
-
-class EntiteJuridiqueAdmin(ModelView, model=EntiteJuridique):
-    name = "Entité Juridique"
-    name_plural = "Entités Juridiques"
-    icon = "fa-solid fa-building"
-    column_list = [
-        EntiteJuridique.id, EntiteJuridique.name, EntiteJuridique.finess_ej, 
-        EntiteJuridique.siren, EntiteJuridique.is_active, EntiteJuridique.ght_context_id
-    ]
-    column_searchable_list = [EntiteJuridique.name, EntiteJuridique.finess_ej, EntiteJuridique.siren]
-    column_sortable_list = [EntiteJuridique.id, EntiteJuridique.name, EntiteJuridique.is_active]
+def _mount_admin(app: FastAPI) -> None:
+    from app.admin_views import mount_admin
+    mount_admin(app)
 
-    # Admin pour la structure
-class EntiteGeographiqueAdmin(ModelView, model=EntiteGeographique):
-    name = "Entité Géographique"
-    name_plural = "Entités Géographiques"
-    icon = "fa-solid fa-hospital"
-    column_list = [
-        EntiteGeographique.id, EntiteGeographique.name, EntiteGeographique.finess, 
-        EntiteGeographique.entite_juridique_id
-    ]
-    column_searchable_list = [EntiteGeographique.name, EntiteGeographique.finess]
-    column_sortable_list = [EntiteGeographique.id, EntiteGeographique.name]
-
-class PoleAdmin(ModelView, model=Pole):
-    name = "Pôle"
-    name_plural = "Pôles"
-    icon = "fa-solid fa-sitemap"
-    column_list = [Pole.id, Pole.name, Pole.identifier, Pole.entite_geo_id]
-    column_searchable_list = [Pole.name, Pole.identifier]
-    column_sortable_list = [Pole.id, Pole.name]
-
-class ServiceAdmin(ModelView, model=Service):
-    name = "Service"
-    name_plural = "Services"
-    icon = "fa-solid fa-building"
-    column_list = [Service.id, Service.name, Service.identifier, Service.service_type, Service.pole_id]
-    column_searchable_list = [Service.name, Service.identifier]
-    column_sortable_list = [Service.id, Service.name]
-
-class UniteFonctionnelleAdmin(ModelView, model=UniteFonctionnelle):
-    name = "Unité Fonctionnelle"
-    name_plural = "Unités Fonctionnelles"
-    icon = "fa-solid fa-folder"
-    column_list = [UniteFonctionnelle.id, UniteFonctionnelle.name, UniteFonctionnelle.identifier, UniteFonctionnelle.service_id]
-    column_searchable_list = [UniteFonctionnelle.name, UniteFonctionnelle.identifier]
-    column_sortable_list = [UniteFonctionnelle.id, UniteFonctionnelle.name]
-
-class UniteHebergementAdmin(ModelView, model=UniteHebergement):
-    name = "Unité d'Hébergement"
-    name_plural = "Unités d'Hébergement"
-    icon = "fa-solid fa-bed"
-    column_list = [UniteHebergement.id, UniteHebergement.name, UniteHebergement.identifier, UniteHebergement.unite_fonctionnelle_id]
-    column_searchable_list = [UniteHebergement.name, UniteHebergement.identifier]
-    column_sortable_list = [UniteHebergement.id, UniteHebergement.name]
-
-class ChambreAdmin(ModelView, model=Chambre):
-    name = "Chambre"
-    name_plural = "Chambres"
-    icon = "fa-solid fa-door-open"
-    column_list = [Chambre.id, Chambre.name, Chambre.identifier, Chambre.unite_hebergement_id]
-    column_searchable_list = [Chambre.name, Chambre.identifier]
-    column_sortable_list = [Chambre.id, Chambre.name]
-
-class LitAdmin(ModelView, model=Lit):
-    name = "Lit"
-    name_plural = "Lits"
-    icon = "fa-solid fa-bed"
-    column_list = [Lit.id, Lit.name, Lit.identifier, Lit.status, Lit.operational_status, Lit.chambre_id]
-    column_searchable_list = [Lit.name, Lit.identifier]
-    column_sortable_list = [Lit.id, Lit.name]
 
 def create_app() -> FastAPI:
     app = FastAPI(
@@ -245,7 +134,7 @@ def create_app() -> FastAPI:
         lifespan=lifespan
     )
 
-    print("\nFastAPI app initialization")
+    logger.debug("FastAPI app initialization")
 
     # Filtre Jinja2 global pour masquer None ou 'None' par '—'
     def none_to_dash(value):
@@ -279,7 +168,7 @@ def create_app() -> FastAPI:
     )
     if not session_secret:
         session_secret = secrets.token_urlsafe(32)
-        logging.getLogger(__name__).warning(
+        logger.warning(
             "SESSION_SECRET_KEY non défini - utilisation d'un secret éphémère pour cette instance"
         )
     app.add_middleware(SessionMiddleware, secret_key=session_secret)
@@ -297,18 +186,16 @@ def create_app() -> FastAPI:
     # Some routers have their own prefix defined in their router creation
     
     # Register routes in order with correct prefixes
-    print("\nRegistering routes:")
+    logger.debug("Registering routes")
     
     # 1. Basic UI routes 
     app.include_router(home.router)
-    print(" - Home router mounted at /")
     
     # 2. Entity and core data routes - all have their own prefixes
     app.include_router(patients.router)
     app.include_router(dossiers.router)
     app.include_router(venues.router)
     app.include_router(mouvements.router)
-    print(" - Core entity routers mounted with their prefixes")
     
     # 3. Structure management
     app.include_router(structure.redirect_router)  # Redirections singulier->pluriel (AVANT le router principal)
@@ -317,13 +204,14 @@ def create_app() -> FastAPI:
     app.include_router(structure_hl7.router)  # Has prefix /structure
     app.include_router(fhir_structure.router)  # Has prefix /fhir
     app.include_router(structure_select.router)  # Has prefix /structure
-    print(" - Structure routers mounted")
     
     # 4. Admin interfaces (mount under /admin so templates/redirects using
-    # /admin/ght work as expected)
-    app.include_router(ght.router, prefix="/admin")
-    app.include_router(namespaces.router, prefix="/admin")
-    print(" - Admin routers mounted under /admin")
+    # /admin/ght work as expected). Lourds à l'import : chargés au premier accès.
+    app.router.routes.append(LazyRoutes(
+        app, "/admin/ght",
+        lazy_router("app.routers.ght", prefix="/admin"),
+        lazy_router("app.routers.namespaces", prefix="/admin"),
+    ))
     
     # 5. Integration and transport
     app.include_router(messages.router)
@@ -332,7 +220,6 @@ def create_app() -> FastAPI:
     app.include_router(transport.router)  # Has own prefix
     app.include_router(endpoints.router)  # Has own prefix
     app.include_router(ihe.router)  # Has own prefix /ihe
-    print(" - Integration routers mounted")
     
     # 6. Utilities and workflow
     app.include_router(workflow.router)
@@ -340,33 +227,28 @@ def create_app() -> FastAPI:
     app.include_router(interop.router)
     app.include_router(vocabularies.router)
     app.include_router(validation.router)  # Validation hors contexte
-    app.include_router(documentation.router)  # Documentation
-    print(" - Validation router mounted")
+    app.router.routes.append(LazyRoutes(app, "/documentation", lazy_router("app.routers.documentation")))
     # Context management (patient/dossier quick set/clear)
     try:
         from app.routers import context
         app.include_router(context.router, prefix="/context", tags=["context"])
-        print(" - Context router mounted")
     except Exception as e:
-        logging.getLogger(__name__).warning(f"Context router not available: {e}")
+        logger.warning(f"Context router not available: {e}")
     app.include_router(guide.router)
     app.include_router(docs.router)
     app.include_router(scenarios.router)
-    print(" - Utility routers mounted")
     
     # 7. Test helpers
     app.include_router(health.router)
-    print(" - Test helpers mounted")
     
     # 8. Debug endpoints (dev only)
     try:
         from app.routers import debug_events
         app.include_router(debug_events.router)
-        print(" - Debug router mounted at /debug")
     except Exception as e:
-        logging.getLogger(__name__).warning(f"Debug router not available: {e}")
+        logger.warning(f"Debug router not available: {e}")
     
-    print("All routes registered.")
+    logger.debug("All routes registered")
 
     # Initialize the admin interface (SQLAdmin) only when not running
     # tests. In test runs a separate test engine/session is used and
@@ -377,33 +259,10 @@ def create_app() -> FastAPI:
         # We do this after route registration so SQLAdmin's mounting at
         # /admin doesn't intercept our custom /admin/ght pages.
         # Mount SQLAdmin under /sqladmin to avoid conflict with our admin pages.
-        admin = Admin(app, engine, base_url="/sqladmin")
-
-        # Contextes
-        admin.add_view(GHTContextAdmin)
-        admin.add_view(EntiteJuridiqueAdmin)
-        
-        # Entités de base
-        admin.add_view(PatientAdmin)
-        admin.add_view(DossierAdmin)
-        admin.add_view(VenueAdmin)
-        admin.add_view(MouvementAdmin)
-
-        # Structure (hiérarchie des locations)
-        admin.add_view(EntiteGeographiqueAdmin)
-        admin.add_view(PoleAdmin)
-        admin.add_view(ServiceAdmin)
-        admin.add_view(UniteFonctionnelleAdmin)
-        admin.add_view(UniteHebergementAdmin)
-        admin.add_view(ChambreAdmin)
-        admin.add_view(LitAdmin)
-
-        # Connectivité et messages
-        admin.add_view(SystemEndpointAdmin)
-        admin.add_view(MessageLogAdmin)
+        app.router.routes.append(LazyRoutes(app, "/sqladmin", _mount_admin))
 
-        # Espaces de noms
-        admin.add_view(NamespaceAdmin)
+    if os.getenv("LAZY_ROUTERS", "1") in ("0", "false", "False"):
+        load_lazy_routes(app)
 
     return app
 
@@ -7,6 +7,12 @@ Contenu
 - Gestion de séquences applicatives simples (table `Sequence`) avec `peek_next_sequence`
     et `get_next_sequence`.
 - Hook `before_flush` pour normaliser certains champs date/heure (chaînes → datetime).
+- Import de `app.services.patient_search` qui enregistre les écouteurs maintenant
+    les colonnes de recherche PDQ (nom normalisé, phonétique, trigrammes).
+- Import de `app.services.location_index` qui enregistre les écouteurs maintenant
+    le registre unifié des lieux de structure (`LocationIndex`).
+- Import de `app.services.bed_occupancy` qui enregistre les écouteurs maintenant
+    l'index d'occupation des lits (`BedOccupancy`).
 
 Notes
 - En contexte transactionnel (session.in_transaction()), on privilégie `flush()`
@@ -25,6 +31,10 @@ from app.models_structure import EntiteGeographique, Pole, Service, UniteFonctio
 from app.models_identifiers import Identifier
 from app import models_scenarios  # ensure scenario models are registered
 from app import models_workflows  # ensure workflow models are registered
+from app.services import patient_search  # noqa: F401 - maintient les colonnes de recherche patient
+from app.services import location_index  # noqa: F401 - maintient le registre unifié des lieux
+from app.services import bed_occupancy  # noqa: F401 - maintient l'index d'occupation des lits
+from app.services import endpoint_cache  # noqa: F401 - invalide le cache de configuration des endpoints
 
 # Moteur SQLite local. Par défaut, fichier `poc.db` au répertoire courant.
 # Pool size increased to handle concurrent emissions
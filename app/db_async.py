@@ -0,0 +1,164 @@
+"""
+Accès base asynchrone (AsyncSession), à côté du moteur synchrone de `app.db`
+
+Contenu
+- `async_database_url()` : URL du moteur async, dérivée de celle du moteur synchrone
+    (sqlite → sqlite+aiosqlite, postgresql → postgresql+asyncpg) ou fournie par
+    ASYNC_DATABASE_URL.
+- `get_async_engine()` : moteur async de la boucle asyncio courante, créé à la demande
+    (les connexions d'un pilote async sont liées à leur boucle).
+- `async_session_factory()` : `async with async_session_factory() as session` ;
+    `get_async_session` : dépendance FastAPI équivalente à `get_session`.
+- `run_sync(session, fn, ...)` : exécute du code ORM synchrone existant (générateurs HL7,
+    handlers PAM) avec une Session ou une AsyncSession ; avec une AsyncSession, ses
+    requêtes passent par le pilote async (`AsyncSession.run_sync`) sans bloquer la boucle.
+- `dispose_async_engines()` : fermeture des connexions (arrêt de l'application).
+- `to_thread(fn, ...)` : travail base synchrone (Session) dans un thread ; `event_loop()`
+    y retrouve la boucle appelante (planification des émissions après commit).
+
+Notes
+- Les sessions async utilisent la classe Session de SQLModel : les écouteurs enregistrés
+    sur Session (normalisation des dates, cache des endpoints, émission automatique)
+    s'appliquent aussi.
+- `expire_on_commit=False` : les objets restent lisibles après commit sans requête implicite.
+- AsyncSession réservée aux lectures (pages messages) : les écrivains (réception MLLP,
+    /messages/send, émissions) restent sur le moteur synchrone, comme sqladmin, les
+    scripts et les routes non portées (voir ci-dessous).
+- Avec une AsyncSession, le moteur de la session se résout via `session.sync_session`
+    (dans `run_sync`), jamais via le moteur global de `app.db`.
+
+Écritures synchrones et verrou SQLite
+- Une AsyncSession qui a écrit garde le verrou d'écriture SQLite en rendant la main à la
+    boucle entre deux requêtes. Une écriture synchrone exécutée sur le thread de la
+    boucle attendrait alors ce verrou en bloquant la boucle dont l'AsyncSession a besoin
+    pour commiter (blocage jusqu'au délai d'attente, puis « database is locked »).
+- Tant que des routes `async def` écrivent avec une Session synchrone sur le thread de
+    la boucle, aucune AsyncSession n'écrit : pas de verrou tenu par une transaction qui a
+    besoin de la boucle pour se terminer.
+- Les traitements de fond qui écrivent avec une Session synchrone (fichiers entrants,
+    bascule des statuts planifiés, émissions de structure) le font via `to_thread`, en
+    une transaction qui ne s'étend jamais sur un `await` : une écriture de la boucle
+    n'attend alors qu'une transaction qui se termine sans elle.
+
+Invariant de `run_to_completion`
+- Les handlers PAM (`on_message_inbound_async`, `IHEMessageRouter.route_message`,
+    `app.services.pam`, `handle_merge_patient`) sont des coroutines qui n'attendent que
+    d'autres coroutines de cette liste, jamais une E/S réelle (asyncio.sleep, réseau,
+    verrou, `AsyncSession`...). Ils peuvent ainsi s'exécuter d'un bloc dans
+    `AsyncSession.run_sync`.
+- Une coroutine qui se suspend lève RuntimeError, éventuellement après des écritures
+    déjà faites dans la session : l'appelant doit alors annuler la transaction (rollback).
+    L'invariant est vérifié par tests/test_async_session.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional, TypeVar
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db import engine
+
+T = TypeVar("T")
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+_caller_loop: ContextVar[Optional[asyncio.AbstractEventLoop]] = ContextVar("db_async_caller_loop", default=None)
+
+_engines: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncEngine]" = weakref.WeakKeyDictionary()
+_sessionmakers: "weakref.WeakKeyDictionary[AsyncEngine, async_sessionmaker]" = weakref.WeakKeyDictionary()
+
+
+def async_database_url() -> str:
+    override = os.getenv("ASYNC_DATABASE_URL")
+    if override:
+        return override
+    url = engine.url
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(
+        hide_password=False
+    )
+
+
+def _create_engine() -> AsyncEngine:
+    url = async_database_url()
+    if make_url(url).get_backend_name() == "sqlite":
+        # Connexion ouverte par session : aucune connexion ne survit à sa boucle
+        return create_async_engine(url, echo=False, poolclass=NullPool)
+    return create_async_engine(url, echo=False, pool_size=20, max_overflow=30, pool_timeout=60, pool_pre_ping=True)
+
+
+def get_async_engine() -> AsyncEngine:
+    loop = asyncio.get_running_loop()
+    async_engine = _engines.get(loop)
+    if async_engine is None:
+        async_engine = _engines[loop] = _create_engine()
+    return async_engine
+
+
+@asynccontextmanager
+async def async_session_factory() -> AsyncIterator[AsyncSession]:
+    async_engine = get_async_engine()
+    maker = _sessionmakers.get(async_engine)
+    if maker is None:
+        maker = _sessionmakers[async_engine] = async_sessionmaker(
+            async_engine, class_=AsyncSession, expire_on_commit=False
+        )
+    async with maker() as session:
+        yield session
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Dépendance FastAPI: fournit une AsyncSession courte."""
+    async with async_session_factory() as session:
+        yield session
+
+
+async def dispose_async_engines() -> None:
+    """Ferme les connexions du moteur async de la boucle courante."""
+    async_engine = _engines.pop(asyncio.get_running_loop(), None)
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+async def run_sync(session: Any, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """`fn(session_sync, *args)` avec une Session, ou via `run_sync` avec une AsyncSession."""
+    if isinstance(session, AsyncSession):
+        return await session.run_sync(fn, *args, **kwargs)
+    return fn(session, *args, **kwargs)
+
+
+async def to_thread(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """`asyncio.to_thread` dont le thread connaît la boucle appelante (voir `event_loop`)."""
+    _caller_loop.set(asyncio.get_running_loop())
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+def event_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Boucle courante, ou boucle ayant lancé le thread courant via `to_thread`."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return _caller_loop.get()
+
+
+def run_to_completion(coro: Coroutine[Any, Any, T]) -> T:
+    """Exécute jusqu'au bout une coroutine qui ne se suspend jamais.
+
+    Les handlers PAM sont déclarés async mais n'attendent que d'autres coroutines sans
+    E/S : ils peuvent ainsi tourner dans `AsyncSession.run_sync`, où seules les requêtes
+    (via le pilote async) rendent la main à la boucle. Voir l'invariant du module : une
+    suspension lève RuntimeError.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError("La coroutine s'est suspendue : non exécutable dans AsyncSession.run_sync")
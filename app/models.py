@@ -1,6 +1,7 @@
 from typing import Optional, List, TYPE_CHECKING, ForwardRef
 from datetime import datetime
 from enum import Enum
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship, Session
 
 from app.models_identifiers import Identifier, IdentifierType
@@ -80,6 +81,12 @@ class Patient(SQLModel, table=True):
     religion: Optional[str] = None  # ⚠️ INTERDIT EN FRANCE - Ne pas collecter (Article 9 RGPD)
     administrative_gender: Optional[str] = None  # ⚠️ DOUBLON - Utiliser 'gender' uniquement
 
+    # Colonnes de recherche PDQ/PDQm (maintenues par app.services.patient_search, ne pas saisir)
+    family_norm: Optional[str] = Field(default=None, index=True)  # Nom majuscule, sans accents, tokenisé
+    given_norm: Optional[str] = Field(default=None, index=True)  # Prénom majuscule, sans accents, tokenisé
+    family_phonetic: Optional[str] = Field(default=None, index=True)  # Clé phonétique française du nom
+    given_phonetic: Optional[str] = Field(default=None, index=True)  # Clé phonétique française du prénom
+
     dossiers: List["Dossier"] = Relationship(back_populates="patient")
     identifiers: List["Identifier"] = Relationship(back_populates="patient")
 
@@ -101,6 +108,16 @@ class Patient(SQLModel, table=True):
         self.given = value
 
 
+# --- Index trigrammes des noms patients (recherche approchée PDQ/PDQm) ---
+class PatientNameTrigram(SQLModel, table=True):
+    __table_args__ = (Index("ix_patientnametrigram_field_trigram", "field", "trigram"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    patient_id: int = Field(foreign_key="patient.id", index=True)
+    field: str  # "F" = nom (usage + naissance), "G" = prénom
+    trigram: str
+
+
 # --- Dossier ---
 class Dossier(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -5,6 +5,7 @@ from enum import Enum
 from typing import Optional, TYPE_CHECKING
 from datetime import datetime
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 if TYPE_CHECKING:
@@ -27,6 +28,11 @@ class IdentifierType(str, Enum):
 
 class Identifier(SQLModel, table=True):
     """Modèle pour stocker les identifiants avec leur domaine"""
+    __table_args__ = (
+        # Résolution (system, value) en une recherche d'index (cf. identifier_resolver)
+        Index("ux_identifier_system_value_type", "system", "value", "type", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     
     # L'identifiant lui-même
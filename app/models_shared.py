@@ -91,4 +91,8 @@ class SystemEndpoint(SQLModel, table=True):
     # IHE PAM validation configuration (for receivers)
     pam_validate_enabled: bool = Field(default=False)
     pam_validate_mode: Optional[str] = Field(default="warn")  # warn|reject
-    pam_profile: Optional[str] = Field(default="IHE_PAM_FR")
\ No newline at end of file
+    pam_profile: Optional[str] = Field(default="IHE_PAM_FR")
+
+    # Emission structure (MFN^M05) vers un sender MLLP : snapshot complet ou delta incrémental
+    # depuis la dernière version acquittée (voir StructureSyncState)
+    mfn_emission_mode: Optional[str] = Field(default="snapshot")  # snapshot|delta
\ No newline at end of file
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional, List, TYPE_CHECKING
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import SQLModel, Field, Relationship
 from enum import Enum
 
@@ -170,3 +171,102 @@ class Lit(BaseLocation, table=True):
     class Config:
         use_enum_values = True
 
+
+
+class LocationIndex(SQLModel, table=True):
+    """Registre unifié des lieux (EJ → EG → Pôle → Service → UF → UH → Chambre → Lit).
+
+    Une ligne par entité de structure, avec un identifiant global (les id des tables
+    de structure se recouvrent) et un chemin matérialisé des id globaux ("/1/5/9/")
+    permettant de lire un sous-arbre par intervalle sur un index.
+    Maintenu par les écouteurs de `app.services.location_index`.
+    """
+    __table_args__ = (
+        UniqueConstraint("model", "entity_id", name="ux_locationindex_model_entity"),
+        Index("ix_locationindex_entity_depth", "entity_id", "depth"),
+        {'extend_existing': True},
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    model: str = Field(index=True)  # nom de la classe (EntiteGeographique, Pole, ...)
+    entity_id: int
+    identifier: Optional[str] = Field(default=None, index=True)  # ID_GLBL (finess_ej pour une EJ)
+    finess: Optional[str] = Field(default=None, index=True)  # FINESS géographique (EG)
+    name: Optional[str] = None
+    name_norm: Optional[str] = Field(default=None, index=True)  # majuscules sans accents
+    status: Optional[str] = Field(default=None, index=True)
+    # Prochain passage du balayage des statuts programmés (activation/désactivation)
+    next_status_change: Optional[datetime] = Field(default=None, index=True)
+    parent_id: Optional[int] = Field(default=None, index=True)  # LocationIndex.id du parent
+    path: str = Field(default="/", index=True)
+    depth: int = 0
+    version: int = 1  # incrémentée à chaque écriture de l'entité (meta.versionId / ETag)
+    last_updated: Optional[datetime] = None  # meta.lastUpdated / Last-Modified
+
+
+class BedOccupancy(SQLModel, table=True):
+    """Index d'occupation et de disponibilité des lits (une ligne par lit).
+
+    Dénormalise la hiérarchie du lit (chambre → EG) et le type de service pour
+    répondre à « lits libres du type de service X / de l'UF Y » en une requête indexée.
+    - `structure_active` : lit et ancêtres actifs compte tenu des programmations
+      (activation/désactivation) ; `next_status_change` : prochaine échéance programmée.
+    - `occupancy` : "free", "occupied" ou "leave" (absence provisoire, lit conservé),
+      maintenu à partir des mouvements (A01/A02/A03/A21/A22 et annulations).
+    Maintenu par `app.services.bed_occupancy`.
+    """
+    __table_args__ = (
+        Index("ix_bedoccupancy_available_service_type", "available", "service_type"),
+        Index("ix_bedoccupancy_available_uf", "available", "uf_id"),
+        {'extend_existing': True},
+    )
+    lit_id: int = Field(primary_key=True)
+    chambre_id: Optional[int] = Field(default=None, index=True)
+    uh_id: Optional[int] = Field(default=None, index=True)
+    uf_id: Optional[int] = Field(default=None, index=True)
+    service_id: Optional[int] = Field(default=None, index=True)
+    pole_id: Optional[int] = Field(default=None, index=True)
+    eg_id: Optional[int] = None
+    service_type: Optional[str] = None
+    operational_status: Optional[str] = None
+    structure_active: bool = True
+    next_status_change: Optional[datetime] = Field(default=None, index=True)
+    occupancy: str = "free"
+    venue_id: Optional[int] = Field(default=None, index=True)  # venue occupant le lit
+    occupied_since: Optional[datetime] = None
+    available: bool = False
+    updated_at: Optional[datetime] = None
+
+
+class StructureChange(SQLModel, table=True):
+    """Journal des modifications de structure (une ligne par écriture d'entité).
+
+    `id` croissant sert de version globale de la structure : un récepteur MFN qui a
+    acquitté la version N ne reçoit que les lignes d'id > N (voir `StructureSyncState`).
+    Écrit dans la transaction de l'écriture par les écouteurs de `app.services.location_index`.
+    """
+    __table_args__ = (
+        Index("ix_structurechange_model_entity", "model", "entity_id"),
+        # Jamais de réutilisation d'id après purge : les versions restent croissantes
+        {'extend_existing': True, 'sqlite_autoincrement': True},
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    model: str  # nom de la classe (EntiteGeographique, Pole, ...)
+    entity_id: int
+    op: str  # "insert", "update" ou "delete"
+    identifier: Optional[str] = None  # ID_GLBL au moment de l'écriture (MDL après suppression)
+    entity_version: Optional[int] = None  # LocationIndex.version après l'écriture
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class StructureSyncState(SQLModel, table=True):
+    """Point de synchronisation MFN d'un endpoint récepteur (high-water mark).
+
+    `acked_version` : dernier `StructureChange.id` inclus dans un message acquitté (AA/CA).
+    Absence de ligne : le prochain envoi est un snapshot complet (MFI-3 = REP).
+    """
+    __table_args__ = {'extend_existing': True}
+    endpoint_id: int = Field(primary_key=True, foreign_key="systemendpoint.id")
+    acked_version: int = 0
+    acked_at: Optional[datetime] = None
+    sent_version: Optional[int] = None  # dernier envoi, acquitté ou non
+    sent_at: Optional[datetime] = None
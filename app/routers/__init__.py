@@ -1,25 +1,40 @@
-from app.routers.home import router as home_router
-from app.routers.messages import router as messages_router
-from app.routers.endpoints import router as endpoints_router
-from app.routers.transport import router as transport_router
-from app.routers.transport_views import router as transport_views_router
-from app.routers.fhir_inbox import router as fhir_inbox_router
-from app.routers.messages import router as messages_router
-from app.routers.patients import router as patients_router
-from app.routers.dossiers import router as dossiers_router
-from app.routers.venues import router as venues_router
-from app.routers.mouvements import router as mouvements_router
-from app.routers.structure_hl7 import router as structure_hl7_router
-from app.routers.fhir_structure import router as fhir_structure_router
-from app.routers.structure import router as structure_router
-from app.routers.workflow import router as workflow_router
-from app.routers.generate import router as generate_router
-from app.routers.interop import router as interop_router
-from app.routers.vocabularies import router as vocabularies_router
-from app.routers.ght import router as ght_router
-from app.routers.namespaces import router as namespaces_router
-from app.routers.guide import router as guide_router
-from app.routers.scenarios import router as scenarios_router
-from app.routers.ihe import router as ihe_router
-from app.routers.docs import router as docs_router
-from app.routers.dossier_type import router as dossier_type_router
+"""
+Routeurs FastAPI de l'application.
+
+Les alias `<module>_router` sont résolus à la demande (import du seul module concerné),
+ce qui permet d'importer un routeur sans charger tous les autres.
+"""
+import importlib
+
+_ROUTER_MODULES = {
+    "home_router": "home",
+    "messages_router": "messages",
+    "endpoints_router": "endpoints",
+    "transport_router": "transport",
+    "transport_views_router": "transport_views",
+    "fhir_inbox_router": "fhir_inbox",
+    "patients_router": "patients",
+    "dossiers_router": "dossiers",
+    "venues_router": "venues",
+    "mouvements_router": "mouvements",
+    "structure_hl7_router": "structure_hl7",
+    "fhir_structure_router": "fhir_structure",
+    "structure_router": "structure",
+    "workflow_router": "workflow",
+    "generate_router": "generate",
+    "interop_router": "interop",
+    "vocabularies_router": "vocabularies",
+    "ght_router": "ght",
+    "namespaces_router": "namespaces",
+    "guide_router": "guide",
+    "scenarios_router": "scenarios",
+    "ihe_router": "ihe",
+    "docs_router": "docs",
+    "dossier_type_router": "dossier_type",
+}
+
+
+def __getattr__(name):
+    if name in _ROUTER_MODULES:
+        return importlib.import_module(f"{__name__}.{_ROUTER_MODULES[name]}").router
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
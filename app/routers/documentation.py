@@ -2,11 +2,6 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 from pathlib import Path
-import markdown
-from markdown.extensions.toc import TocExtension
-from markdown.extensions.fenced_code import FencedCodeExtension
-from markdown.extensions.tables import TableExtension
-from markdown.extensions.codehilite import CodeHiliteExtension
 
 router = APIRouter(prefix="/documentation", tags=["documentation"])
 
@@ -89,17 +84,27 @@ def get_doc_structure():
     }
 
 
-def render_markdown(content: str) -> str:
-    """Convertit Markdown en HTML avec extensions (sans exposer la ToC)."""
-    md = markdown.Markdown(extensions=[
-        TocExtension(baselevel=1, toc_depth=3),
+def _markdown(permalink: bool = False):
+    """Convertisseur Markdown (import de markdown/pygments au premier rendu seulement)."""
+    import markdown
+    from markdown.extensions.toc import TocExtension
+    from markdown.extensions.fenced_code import FencedCodeExtension
+    from markdown.extensions.tables import TableExtension
+    from markdown.extensions.codehilite import CodeHiliteExtension
+
+    return markdown.Markdown(extensions=[
+        TocExtension(baselevel=1, toc_depth=3, permalink=permalink),
         FencedCodeExtension(),
         TableExtension(),
         CodeHiliteExtension(css_class='highlight', linenums=False),
         'nl2br',
         'sane_lists'
     ])
-    return md.convert(content)
+
+
+def render_markdown(content: str) -> str:
+    """Convertit Markdown en HTML avec extensions (sans exposer la ToC)."""
+    return _markdown().convert(content)
 
 
 def render_markdown_with_toc(content: str) -> tuple[str, str]:
@@ -107,14 +112,7 @@ def render_markdown_with_toc(content: str) -> tuple[str, str]:
 
     Retourne un tuple (html, toc_html).
     """
-    md = markdown.Markdown(extensions=[
-        TocExtension(baselevel=1, toc_depth=3, permalink=True),
-        FencedCodeExtension(),
-        TableExtension(),
-        CodeHiliteExtension(css_class='highlight', linenums=False),
-        'nl2br',
-        'sane_lists'
-    ])
+    md = _markdown(permalink=True)
     html = md.convert(content)
     toc_html = getattr(md, 'toc', '') or ''
     return html, toc_html
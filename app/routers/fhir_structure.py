@@ -10,22 +10,33 @@ Expose les endpoints REST standard FHIR pour la gestion de la structure d'un ét
 
 Paramètres de recherche supportés :
 - _id, _lastUpdated, name, status, identifier, type, operational-status
-- _count (pagination), _sort (tri), _format (json/xml)
+- _count / _offset (pagination), _sort (tri), _format (json/xml)
 - partof : recherche des enfants d'une Location parente (navigation hiérarchique)
+- partof:below : tout le sous-arbre d'une Location
+- name:contains / name:exact : variantes de la recherche par nom (préfixe par défaut)
+
+_id, _lastUpdated, identifier, partof, partof:below, name et status sont résolus par le
+registre unifié des lieux (app.services.location_index) : une requête indexée par recherche.
 
 Conversion assurée par app.services.fhir_structure (process_fhir_location, entity_to_fhir_location).
 """
+import hashlib
 import logging
+from email.utils import format_datetime
 from typing import Dict, Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response, Request
 from sqlmodel import Session, select
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 from app.db import get_session
-from app.services.fhir_structure import process_fhir_location, entity_to_fhir_location
+from app.services.fhir_structure import (
+    process_fhir_location, entity_to_fhir_location, entities_to_fhir_locations,
+    index_rows_to_fhir_locations, load_location_versions,
+)
+from app.services.location_index import PARTOF_MODEL_PRIORITY, resolve_location, search_location_index
 from app.models_structure import (
     EntiteGeographique, Pole, Service, UniteFonctionnelle,
-    UniteHebergement, Chambre, Lit, LocationStatus, LocationServiceType
+    UniteHebergement, Chambre, Lit, LocationIndex, LocationStatus, LocationServiceType
 )
 
 logger = logging.getLogger(__name__)
@@ -45,6 +56,70 @@ common_search_params = {
     "_format": Query(None, description="Desired response format (json, xml)")
 }
 
+# Paramètres non couverts par le registre unifié (LocationIndex) : ancienne requête multi-tables
+LEGACY_SEARCH_PARAMS = ("type", "operational-status", "finess")
+
+
+def _http_date(value: datetime) -> str:
+    """Date HTTP (RFC 7231) d'un datetime UTC naïf."""
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Comparaison faible If-None-Match / ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [t.removeprefix("W/") for t in tags]
+
+
+def _set_version_headers(response: Response, row: Optional[LocationIndex]) -> None:
+    """ETag (version du registre unifié) et Last-Modified d'une Location."""
+    if row is None:
+        return
+    response.headers["ETag"] = f'W/"{row.version}"'
+    if row.last_updated:
+        response.headers["Last-Modified"] = _http_date(row.last_updated)
+
+
+def _parse_id_param(raw: str) -> List[int]:
+    """_id FHIR (valeurs séparées par des virgules, sémantique OU) → ids logiques."""
+    try:
+        return [int(value) for value in raw.split(",") if value.strip()]
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid _id parameter: {raw}") from exc
+
+
+def _parse_last_updated(values: List[str]) -> tuple[Optional[datetime], Optional[datetime]]:
+    """_lastUpdated FHIR ([eq|gt|ge|lt|le]date, répétable) → intervalle UTC [début, fin).
+
+    La précision de la valeur (jour ou seconde) définit l'intervalle qu'elle désigne.
+    """
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    for raw in values:
+        prefix, value = "eq", raw
+        if raw[:2].isalpha():
+            prefix, value = raw[:2], raw[2:]
+        if prefix not in ("eq", "gt", "ge", "lt", "le"):
+            raise HTTPException(status_code=400, detail=f"Unsupported _lastUpdated prefix: {prefix}")
+        try:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid _lastUpdated value: {raw}") from exc
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        precision = timedelta(days=1) if len(value) == 10 else timedelta(seconds=1)
+        lower = {"eq": moment, "ge": moment, "gt": moment + precision}.get(prefix)
+        upper = {"eq": moment + precision, "lt": moment, "le": moment + precision}.get(prefix)
+        if lower is not None:
+            start = lower if start is None else max(start, lower)
+        if upper is not None:
+            end = upper if end is None else min(end, upper)
+    return start, end
+
+
 def _get_query_params(request: Request) -> Dict[str, Any]:
     """Extrait tous les paramètres de requête (query string) pour la recherche FHIR."""
     return dict(request.query_params)
@@ -52,6 +127,7 @@ def _get_query_params(request: Request) -> Dict[str, Any]:
 
 @router.get("/Location", response_model=Dict)
 async def search_locations(
+    request: Request,
     response: Response,
     session: Session = Depends(get_session),
     search_params: Dict[str, Any] = Depends(_get_query_params),
@@ -59,15 +135,21 @@ async def search_locations(
     """Recherche de Location FHIR par paramètres (GET /fhir/Location?...).
     
     Supporte les paramètres standard FHIR :
-    - identifier : recherche par identifiant métier ou FINESS (multiples modèles)
+    - identifier : recherche par identifiant métier ou FINESS (tous modèles)
     - partof=Location/[id] : enfants directs de la Location parente (hiérarchie)
-    - _count : pagination (1-1000, défaut=50)
+    - partof:below=Location/[id] : tout le sous-arbre de la Location
+    - name (préfixe, sans accents), name:contains, name:exact, status
+    - _id (ids séparés par des virgules), _lastUpdated ([eq|gt|ge|lt|le]date, répétable)
+    - _count : taille de page (1-1000, défaut=50), _offset : début de page
     - _format : json (défaut) ou application/fhir+json
-    - name, status, type, operational-status (filtres additionnels via process_search_params)
+    - type, operational-status, finess : filtres via process_search_params (sans pagination)
     
-    Retourne un Bundle FHIR de type 'searchset' avec liens de pagination (self, first, last).
+    Retourne un Bundle FHIR de type 'searchset' avec liens de pagination (self, next).
+    Via le registre unifié, la page porte un ETag (lignes et versions de la page) et un
+    Last-Modified (mise à jour la plus récente) ; If-None-Match correspondant → 304.
     
     Args:
+        request: Requête HTTP (If-None-Match)
         response: FastAPI Response pour définir Content-Type
         session: Session DB
         search_params: Dictionnaire des paramètres de requête
@@ -90,90 +172,76 @@ async def search_locations(
         return max(1, min(value, 1000))
 
     count = _clamp_count(search_params.get("_count", 50))
-    identifier = search_params.get("identifier")
-    partof = search_params.get("partof")
+    try:
+        offset = max(0, int(search_params.get("_offset", 0)))
+    except (TypeError, ValueError):
+        offset = 0
+    partof = search_params.get("partof") or search_params.get("partof:below")
     locations: List[Dict[str, Any]] = []
+    total = 0
+    next_offset: Optional[int] = None
 
     try:
-        if partof:
-            if not isinstance(partof, str) or "/" not in partof:
-                raise HTTPException(status_code=400, detail="Invalid partof parameter format. Expected 'Location/[id]'")
-            try:
-                parent_id = int(partof.split("/")[-1])
-            except ValueError as exc:  # pragma: no cover - defensive
-                raise HTTPException(status_code=400, detail="Invalid partof identifier") from exc
-
+        if not any(search_params.get(k) for k in LEGACY_SEARCH_PARAMS):
+            # Recherche via le registre unifié : une requête indexée + chargement par modèle
             parent = None
-            for model in [EntiteGeographique, Pole, Service, UniteFonctionnelle, UniteHebergement, Chambre, Lit]:
-                parent = session.get(model, parent_id)
-                if parent:
-                    break
-            if not parent:
-                raise HTTPException(status_code=404, detail=f"Parent entity not found with id {parent_id}")
-
-            logger.debug(
-                "FHIR partOf resolved %s#%s",
-                type(parent).__name__,
-                getattr(parent, "id", None),
+            if partof:
+                if not isinstance(partof, str) or "/" not in partof:
+                    raise HTTPException(status_code=400, detail="Invalid partof parameter format. Expected 'Location/[id]'")
+                try:
+                    parent_id = int(partof.split("/")[-1])
+                except ValueError as exc:  # pragma: no cover - defensive
+                    raise HTTPException(status_code=400, detail="Invalid partof identifier") from exc
+                parent = resolve_location(session, parent_id, PARTOF_MODEL_PRIORITY)
+                if not parent:
+                    raise HTTPException(status_code=404, detail=f"Parent entity not found with id {parent_id}")
+                logger.debug("FHIR partOf resolved %s#%s", parent.model, parent.entity_id)
+
+            name, name_mode = search_params.get("name"), "prefix"
+            for mode in ("contains", "exact"):
+                if search_params.get(f"name:{mode}"):
+                    name, name_mode = search_params[f"name:{mode}"], mode
+
+            ids = _parse_id_param(search_params["_id"]) if search_params.get("_id") else None
+            updated_from, updated_before = _parse_last_updated(request.query_params.getlist("_lastUpdated"))
+
+            page = search_location_index(
+                session,
+                identifier=search_params.get("identifier"),
+                parent=parent,
+                below=bool(search_params.get("partof:below")),
+                name=name,
+                name_mode=name_mode,
+                status=search_params.get("status"),
+                ids=ids,
+                updated_from=updated_from,
+                updated_before=updated_before,
+                offset=offset,
+                count=count,
             )
-
-            if isinstance(parent, EntiteGeographique):
-                poles = session.exec(select(Pole).where(Pole.entite_geo_id == parent.id)).all()
-                locations.extend(entity_to_fhir_location(p, session) for p in poles)
-                pole_ids = [p.id for p in poles]
-                if pole_ids:
-                    services = session.exec(select(Service).where(Service.pole_id.in_(pole_ids))).all()
-                    locations.extend(entity_to_fhir_location(s, session) for s in services)
-            elif isinstance(parent, Pole):
-                services = session.exec(select(Service).where(Service.pole_id == parent.id)).all()
-                locations.extend(entity_to_fhir_location(s, session) for s in services)
-            elif isinstance(parent, Service):
-                ufs = session.exec(select(UniteFonctionnelle).where(UniteFonctionnelle.service_id == parent.id)).all()
-                locations.extend(entity_to_fhir_location(u, session) for u in ufs)
-            elif isinstance(parent, UniteFonctionnelle):
-                uhs = session.exec(
-                    select(UniteHebergement).where(UniteHebergement.unite_fonctionnelle_id == parent.id)
-                ).all()
-                locations.extend(entity_to_fhir_location(u, session) for u in uhs)
-            elif isinstance(parent, UniteHebergement):
-                chambres = session.exec(
-                    select(Chambre).where(Chambre.unite_hebergement_id == parent.id)
-                ).all()
-                locations.extend(entity_to_fhir_location(c, session) for c in chambres)
-            elif isinstance(parent, Chambre):
-                lits = session.exec(select(Lit).where(Lit.chambre_id == parent.id)).all()
-                locations.extend(entity_to_fhir_location(l, session) for l in lits)
-
-            locations = locations[:count]
-
-        elif identifier:
-            seen: Dict[tuple[str, int], Dict[str, Any]] = {}
-            model_sequence = [
-                EntiteGeographique,
-                Service,
-                Pole,
-                UniteFonctionnelle,
-                UniteHebergement,
-                Chambre,
-                Lit,
-            ]
-
-            for model in model_sequence:
-                if model is EntiteGeographique:
-                    stmt = select(EntiteGeographique).where(
-                        (EntiteGeographique.identifier == identifier)
-                        | (EntiteGeographique.finess == identifier)
-                    )
-                else:
-                    stmt = select(model).where(model.identifier == identifier)
-
-                for entity in session.exec(stmt).all():
-                    resource = entity_to_fhir_location(entity, session)
-                    seen[(model.__name__, entity.id)] = resource
-
-            locations = list(seen.values())[:count]
+            total = page.total
+            next_offset = page.next_offset
+
+            digest = hashlib.sha1(repr((
+                sorted(search_params.items()), total,
+                [(r.model, r.entity_id, r.version) for r in page.rows],
+            )).encode("utf-8")).hexdigest()
+            etag = f'W/"{digest[:20]}"'
+            response.headers["ETag"] = etag
+            updates = [r.last_updated for r in page.rows if r.last_updated]
+            if updates:
+                response.headers["Last-Modified"] = _http_date(max(updates))
+            if _etag_matches(request, etag):
+                return Response(status_code=304, headers=dict(response.headers))
+
+            locations = index_rows_to_fhir_locations(session, page.rows)
 
         else:
+            if search_params.get("_id") or search_params.get("_lastUpdated"):
+                raise HTTPException(
+                    status_code=400,
+                    detail="_id and _lastUpdated cannot be combined with type, operational-status or finess",
+                )
             query = process_search_params(search_params, session)
             if query is None:
                 locations = []
@@ -187,11 +255,15 @@ async def search_locations(
                         entity = row
                     if entity is not None:
                         entities.append(entity)
-                locations = [entity_to_fhir_location(entity, session) for entity in entities]
+                versions = load_location_versions(session, entities)
+                locations = entities_to_fhir_locations(entities, session, index_rows=versions)
+                updates = [r.last_updated for r in versions.values() if r.last_updated]
+                if updates:
+                    response.headers["Last-Modified"] = _http_date(max(updates))
+            total = len(locations)
 
         response.headers["Content-Type"] = "application/fhir+json"
-        response.headers["Last-Modified"] = datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
-        return build_fhir_bundle(locations, len(locations), search_params)
+        return build_fhir_bundle(locations, total, search_params, next_offset=next_offset, count=count)
 
     except HTTPException:
         raise
@@ -210,18 +282,22 @@ async def search_locations(
 @router.get("/Location/{location_id}", response_model=Dict)
 async def read_location(
     location_id: str,
+    request: Request,
     session: Session = Depends(get_session),
     response: Response = None
 ) -> Dict:
     """Lecture d'une Location spécifique par son ID logique (GET /fhir/Location/{id}).
     
-    Recherche séquentielle dans tous les modèles de structure (priorité Service, puis EG, Pole, UF, UH, Chambre, Lit).
+    Résolution en une requête sur le registre unifié (priorité Service, puis EG, Pole, UF,
+    UH, Chambre, Lit) ; recherche séquentielle dans les tables pour une entité non indexée.
+    ETag = version de l'entité ; If-None-Match correspondant → 304 sans rendu.
     Retourne OperationOutcome avec code 404 si non trouvée.
     
     Args:
         location_id: ID logique (numérique) de la ressource
+        request: Requête HTTP (If-None-Match)
         session: Session DB
-        response: FastAPI Response pour headers FHIR (Content-Type, Last-Modified)
+        response: FastAPI Response pour headers FHIR (Content-Type, ETag, Last-Modified)
     
     Returns:
         Ressource FHIR Location ou OperationOutcome en cas d'erreur
@@ -233,7 +309,17 @@ async def read_location(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid location ID format")
 
-        # D'abord chercher dans Service car c'est le cas de test
+        row = resolve_location(session, id_num)
+        if row is not None:
+            _set_version_headers(response, row)
+            if _etag_matches(request, f'W/"{row.version}"'):
+                return Response(status_code=304, headers=dict(response.headers))
+            resources = index_rows_to_fhir_locations(session, [row])
+            if resources:
+                response.headers["Content-Type"] = "application/fhir+json"
+                return resources[0]
+
+        # Entité absente du registre (base antérieure à la migration 012)
         entity = session.get(Service, id_num)
         if not entity:
             # Si pas trouvé, chercher dans les autres modèles par ordre hiérarchique
@@ -256,7 +342,6 @@ async def read_location(
             
         # Headers FHIR standards
         response.headers["Content-Type"] = "application/fhir+json"
-        response.headers["Last-Modified"] = datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
         
         return entity_to_fhir_location(entity, session)
         
@@ -282,30 +367,38 @@ async def read_location(
             }]
         }
 
-def build_fhir_bundle(resources: List[Dict], total: int, search_params: Dict = None) -> Dict:
+def build_fhir_bundle(
+    resources: List[Dict],
+    total: int,
+    search_params: Dict = None,
+    next_offset: Optional[int] = None,
+    count: Optional[int] = None,
+) -> Dict:
     """Construit un Bundle FHIR de recherche (type 'searchset').
     
-    Inclut le nombre total de résultats, les liens de navigation (self), 
-    et la liste des ressources avec mode de recherche 'match'.
+    Inclut le nombre total de résultats, les liens de navigation (self, et next
+    si une page suivante existe), et la liste des ressources avec mode de recherche 'match'.
     
     Args:
         resources: Liste de ressources FHIR Location
         total: Nombre total de résultats (avant pagination)
-        search_params: Paramètres de requête pour reconstruire le lien 'self'
+        search_params: Paramètres de requête pour reconstruire les liens
+        next_offset: Début de la page suivante (None si dernière page)
+        count: Taille de page pour le lien 'next'
     
     Returns:
         Bundle FHIR (searchset) avec timestamp UTC
     """
+    params = {k: v for k, v in (search_params or {}).items() if v}
+    links = [{"relation": "self", "url": "Location?" + "&".join(f"{k}={v}" for k, v in params.items())}]
+    if next_offset is not None:
+        params.update({"_count": count, "_offset": next_offset})
+        links.append({"relation": "next", "url": "Location?" + "&".join(f"{k}={v}" for k, v in params.items())})
     return {
         "resourceType": "Bundle",
         "type": "searchset",
         "total": total,
-        "link": [
-            {
-                "relation": "self",
-                "url": "Location?" + "&".join([f"{k}={v}" for k,v in (search_params or {}).items() if v])
-            }
-        ],
+        "link": links,
         "entry": [
             {
                 "resource": resource,
@@ -478,7 +571,7 @@ async def create_location(
         # Headers FHIR standards
         response.headers["Content-Type"] = "application/fhir+json"
         response.headers["Location"] = f"Location/{entity.id}"
-        response.headers["ETag"] = f'W/"{entity.id}"'
+        _set_version_headers(response, load_location_versions(session, [entity]).get((type(entity).__name__, entity.id)))
         
         return entity_to_fhir_location(entity, session)
         
@@ -544,7 +637,7 @@ async def update_location(
             
         # Headers FHIR standards
         response.headers["Content-Type"] = "application/fhir+json"
-        response.headers["ETag"] = f'W/"{entity.id}"'
+        _set_version_headers(response, load_location_versions(session, [entity]).get((type(entity).__name__, entity.id)))
         
         return entity_to_fhir_location(entity, session)
         
@@ -1,5 +1,7 @@
 """Routes FastAPI pour les profils IHE PIX/PDQ et FHIR PIXm/PDQm."""
-from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from sqlmodel import Session
 import logging
@@ -82,7 +84,7 @@ async def pdq_query(request: Request, session: Session = Depends(get_session)):
         if not msg.startswith("MSH|") or "\r" not in msg:
             raise HTTPException(status_code=400, detail="Invalid HL7 message")
         
-        success, error, patients = pix_pdq_manager.handle_pdq_query(msg, session)
+        success, error, result, query_tag = pix_pdq_manager.handle_pdq_query(msg, session)
         
         # Logger la requête
         log = MessageLog(
@@ -112,10 +114,21 @@ async def pdq_query(request: Request, session: Session = Depends(get_session)):
         rsp = f"MSH|^~\\&|SERVEUR|DOMAINE|CLIENT|DOMAINE|{now}||RSP^K22^RSP_K21|{now}|P|2.5|||NE|AL|FRA|UTF-8||FR\r"
         rsp += f"MSA|AA|{msg_id}\r"
         
-        if patients:
-            for p in patients:
-                rsp += (f"PID|||{p.external_id or ''}||{p.family or ''}^{p.given or ''}||"
-                       f"{p.birth_date or ''}|{p.gender or ''}|||||\r")
+        # QAK: tag de requête, statut, nombre total / renvoyé / restant
+        remaining = result.total - result.offset - result.count
+        status = "OK" if result.total else "NF"
+        rsp += f"QAK|{query_tag}|{status}||{result.total}|{result.count}|{max(remaining, 0)}\r"
+        
+        for match in result.matches:
+            p = match.patient
+            rsp += (f"PID|||{p.external_id or ''}||{p.family or ''}^{p.given or ''}||"
+                   f"{p.birth_date or ''}|{p.gender or ''}|||||\r")
+            # QRI-1: score de confiance, QRI-2: raisons de correspondance (table 0392)
+            rsp += f"QRI|{match.score}|{'~'.join(match.reasons)}|\r"
+        
+        # DSC: pointeur de continuation si des résultats restent à lire
+        if result.next_offset is not None:
+            rsp += f"DSC|{result.next_offset}|I\r"
                 
         log.ack_payload = rsp
         log.message_type = "QBP^Q22"
@@ -164,11 +177,16 @@ async def pdqm_search(
     identifier: str = None,
     birthdate: str = None,
     gender: str = None,
+    count: Optional[int] = Query(default=None, alias="_count", ge=1),
+    offset: Optional[int] = Query(default=None, alias="_offset", ge=0),
     session: Session = Depends(get_session)
 ):
     """
     Point d'entrée pour les requêtes PDQm.
     Implémente la recherche Patient du profil IHE PDQm.
+    
+    Résultats classés par score (entry.search.score) ; `_count` limite la page
+    et le lien "next" du Bundle porte la continuation (`_offset`).
     """
     try:
         params = {
@@ -176,7 +194,9 @@ async def pdqm_search(
             "given": given,
             "identifier": identifier,
             "birthdate": birthdate,
-            "gender": gender
+            "gender": gender,
+            "_count": count,
+            "_offset": offset,
         }
         # Filtrer les paramètres None
         params = {k: v for k, v in params.items() if v is not None}
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, Request, Query, Form
 from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select, col
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
 from typing import Optional
 import logging
@@ -10,6 +11,7 @@ import io
 import zipfile
 
 from app.db import get_session
+from app.db_async import get_async_session
 from app.models_endpoints import MessageLog, SystemEndpoint
 from app.models import Dossier
 from app.db_session_factory import session_factory
@@ -61,9 +63,9 @@ def _extract_ipp_and_dossier(payload: str) -> tuple[str, str]:
 
 @router.get("", response_class=HTMLResponse)
 @router.get("/", response_class=HTMLResponse)
-def list_messages(
+async def list_messages(
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     endpoint_id: Optional[str] = Query(None),
     date_start: Optional[str] = Query(None),  # "2025-10-01T00:00"
     date_end: Optional[str] = Query(None),    # "2025-10-31T23:59"
@@ -108,8 +110,8 @@ def list_messages(
     if direction in ("in", "out"):
         stmt = stmt.where(MessageLog.direction == direction)
 
-    msgs = session.exec(stmt.limit(limit)).all()
-    endpoints = session.exec(select(SystemEndpoint).order_by(SystemEndpoint.name)).all()
+    msgs = (await session.exec(stmt.limit(limit))).all()
+    endpoints = (await session.exec(select(SystemEndpoint).order_by(SystemEndpoint.name))).all()
     ep_name = {e.id: e.name for e in endpoints}
 
     return templates.TemplateResponse(
@@ -134,9 +136,9 @@ def list_messages(
 
 
 @router.get("/rejections", response_class=HTMLResponse)
-def list_rejections(
+async def list_rejections(
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     endpoint_id: Optional[str] = Query(None),
     date_start: Optional[str] = Query(None),
     date_end: Optional[str] = Query(None),
@@ -178,7 +180,7 @@ def list_rejections(
         except Exception:
             pass
 
-    logs = session.exec(stmt.limit(limit)).all()
+    logs = (await session.exec(stmt.limit(limit))).all()
 
     # Group rows
     groups: dict[tuple[Optional[int], str, str], dict] = {}
@@ -213,7 +215,7 @@ def list_rejections(
     # Sort by most recent group first
     grouped = sorted(groups.values(), key=lambda x: x["last_created"] or datetime.min, reverse=True)
 
-    endpoints = session.exec(select(SystemEndpoint).order_by(SystemEndpoint.name)).all()
+    endpoints = (await session.exec(select(SystemEndpoint).order_by(SystemEndpoint.name))).all()
     ep_name = {e.id: e.name for e in endpoints}
 
     return templates.TemplateResponse(
@@ -636,6 +638,18 @@ def get_scheduler_status():
     }
 
 
+@router.get("/structure-emission/status")
+def get_structure_emission_status():
+    """Métriques de l'émission coalescée des structures (événements reçus / entités émises)"""
+    from app.services.structure_emission_coalescer import structure_emitter
+
+    return {
+        "window_seconds": structure_emitter.window,
+        "max_delay_seconds": structure_emitter.max_delay,
+        **structure_emitter.metrics(),
+    }
+
+
 @router.get("/validate-dossier", response_class=HTMLResponse)
 def validate_dossier_form(request: Request, session: Session = Depends(get_session)):
     """Affiche le formulaire de validation d'un dossier."""
@@ -737,11 +751,11 @@ async def validate_dossier(
 
 
 @router.get("/{message_id}", response_class=HTMLResponse)
-def message_detail(message_id: int, request: Request, session: Session = Depends(get_session)):
-    m = session.get(MessageLog, message_id)
+async def message_detail(message_id: int, request: Request, session: AsyncSession = Depends(get_async_session)):
+    m = await session.get(MessageLog, message_id)
     if not m:
         return templates.TemplateResponse(request, "not_found.html", {"request": request, "title": "Message introuvable"}, status_code=404)
-    ep = session.get(SystemEndpoint, m.endpoint_id) if m.endpoint_id else None
+    ep = await session.get(SystemEndpoint, m.endpoint_id) if m.endpoint_id else None
     
     # Parser le JSON des issues de validation si présent
     validation_issues = None
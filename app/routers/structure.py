@@ -16,6 +16,7 @@ from app.services.structure_schedule import (
     hl7_to_form_datetime,
 )
 from app.services.mfn_importer import import_mfn
+from app.services.bed_occupancy import find_available_beds
 from app.dependencies.ght import require_ght_context
 
 logger = logging.getLogger(__name__)
@@ -65,15 +66,7 @@ async def get_structure_tree(
     ej: Optional[int] = Query(None, description="ID de l'établissement juridique à filtrer"),
     eg_ids: Optional[str] = Query(None, description="Liste d'IDs d'entités géographiques séparés par des virgules")
 ):
-    # Apply scheduled status updates
-    changed = False
-    for model in (Pole, Service, UniteFonctionnelle, UniteHebergement, Chambre, Lit):
-        entities = session.exec(select(model)).all()
-        if apply_scheduled_status(entities):
-            changed = True
-    if changed:
-        session.commit()
-    
+    # Statuts programmés appliqués par le scheduler (sweep_scheduled_status)
     # Start with EGs (filtered by ej OR eg_ids, with eg_ids taking precedence)
     query = select(EntiteGeographique)
     if eg_ids:
@@ -256,7 +249,7 @@ async def import_structure_hl7(
     """Importe un message HL7 MFN^M05 (text/plain) dans le GHT courant.
 
     - Le GHT est déterminé via le middleware de contexte (request.state.ght_context).
-    - Retourne un JSON de synthèse: nombre d'EJ, d'EG et de services créés/mis à jour.
+    - Retourne un JSON de synthèse: nombre d'entités créées, mises à jour et inchangées par type.
     """
     # Vérifier contexte GHT
     ght = getattr(request.state, "ght_context", None)
@@ -275,7 +268,7 @@ async def import_structure_hl7(
             raise HTTPException(status_code=400, detail="Payload vide")
 
     summary = import_mfn(text, session, ght)
-    return {"status": "ok", "created": summary}
+    return {"status": "ok", **summary}
 
 # --- Entité Géographique ---
 @router.get("/eg", response_class=HTMLResponse)
@@ -425,8 +418,6 @@ async def list_poles(
         )
     
     poles = session.exec(query.order_by(Pole.name)).all()
-    if apply_scheduled_status(poles):
-        session.commit()
     
     egs = session.exec(select(EntiteGeographique).order_by(EntiteGeographique.name)).all()
     eg_map = {eg.id: eg.name for eg in egs}
@@ -452,8 +443,6 @@ async def list_poles_api(
     if eg_id:
         query = query.where(Pole.entite_geo_id == eg_id)
     poles = session.exec(query).all()
-    if apply_scheduled_status(poles):
-        session.commit()
     return poles
 
 @router.post("/poles", response_model=Pole)
@@ -552,8 +541,6 @@ async def list_services(
         )
     
     services = session.exec(query.order_by(Service.name)).all()
-    if apply_scheduled_status(services):
-        session.commit()
     
     poles = session.exec(select(Pole).order_by(Pole.name)).all()
     pole_map = {pole.id: pole.name for pole in poles}
@@ -584,8 +571,6 @@ async def list_services_api(
     if service_type:
         query = query.where(Service.service_type == service_type)
     services = session.exec(query).all()
-    if apply_scheduled_status(services):
-        session.commit()
     return services
 
 @router.post("/services", response_model=Service)
@@ -693,12 +678,7 @@ async def list_unites_fonctionnelles(
         )
 
     ufs = session.exec(query.order_by(UniteFonctionnelle.name)).all()
-    changed = apply_scheduled_status(ufs)
     services = session.exec(select(Service).order_by(Service.name)).all()
-    if apply_scheduled_status(services):
-        changed = True
-    if changed:
-        session.commit()
     service_map = {service.id: service.name for service in services}
 
     return templates.TemplateResponse(
@@ -726,8 +706,6 @@ async def list_unites_fonctionnelles_api(
     if service_id:
         query = query.where(UniteFonctionnelle.service_id == service_id)
     ufs = session.exec(query).all()
-    if apply_scheduled_status(ufs):
-        session.commit()
     return ufs
 
 @router.post("/ufs", response_model=UniteFonctionnelle)
@@ -829,14 +807,9 @@ async def list_unites_hebergement(
         query = query.where(UniteHebergement.status == status)
     
     uhs = session.exec(query).all()
-    changed = apply_scheduled_status(uhs)
 
     # Récupération des UFs pour le filtre
     ufs = session.exec(select(UniteFonctionnelle)).all()
-    if apply_scheduled_status(ufs):
-        changed = True
-    if changed:
-        session.commit()
     
     return templates.TemplateResponse(
         "structure/uh.html",
@@ -861,8 +834,6 @@ async def list_unites_hebergement_api(
     if uf_id:
         query = query.where(UniteHebergement.unite_fonctionnelle_id == uf_id)
     uhs = session.exec(query).all()
-    if apply_scheduled_status(uhs):
-        session.commit()
     return uhs
 
 @router.get("/uh/new", response_class=HTMLResponse)
@@ -893,21 +864,14 @@ async def view_unite_hebergement(
     uh = session.get(UniteHebergement, uh_id)
     if not uh:
         raise HTTPException(status_code=404, detail="Unité d'hébergement non trouvée")
-    changed = apply_scheduled_status([uh])
 
     # Charger les chambres liées à cette UH avec leurs lits
     chambres = session.exec(select(Chambre).where(Chambre.unite_hebergement_id == uh_id)).all()
     # Eager-load lits for each chambre so template can access them
     for chambre in chambres:
         lits = session.exec(select(Lit).where(Lit.chambre_id == chambre.id)).all()
-        if apply_scheduled_status(lits):
-            changed = True
         # attach lits to the chambre instance for template rendering
         setattr(chambre, "lits", lits)
-    if apply_scheduled_status(chambres):
-        changed = True
-    if changed:
-        session.commit()
     
     return templates.TemplateResponse(
         "structure/uh_detail.html",
@@ -927,13 +891,8 @@ async def edit_unite_hebergement_form(
     uh = session.get(UniteHebergement, uh_id)
     if not uh:
         raise HTTPException(status_code=404, detail="Unité d'hébergement non trouvée")
-    changed = apply_scheduled_status([uh])
 
     ufs = session.exec(select(UniteFonctionnelle)).all()
-    if apply_scheduled_status(ufs):
-        changed = True
-    if changed:
-        session.commit()
     return templates.TemplateResponse(
         "structure/uh_form.html",
         {
@@ -1063,8 +1022,6 @@ async def list_chambres(
         )
     
     chambres = session.exec(query.order_by(Chambre.name)).all()
-    if apply_scheduled_status(chambres):
-        session.commit()
     
     uhs = session.exec(select(UniteHebergement).order_by(UniteHebergement.name)).all()
     uh_map = {uh.id: uh.name for uh in uhs}
@@ -1091,8 +1048,6 @@ async def new_chambre_form(
     uh = session.get(UniteHebergement, uh_id)
     if not uh:
         raise HTTPException(status_code=404, detail="Unité d'hébergement non trouvée")
-    if apply_scheduled_status([uh]):
-        session.commit()
 
     return templates.TemplateResponse(
         "structure/chambre_form.html",
@@ -1217,8 +1172,6 @@ async def list_chambres(
     if status:
         query = query.where(Chambre.status == status)
     chambres = session.exec(query).all()
-    if apply_scheduled_status(chambres):
-        session.commit()
     return chambres
 
 @router.post("/chambres", response_model=Chambre)
@@ -1273,8 +1226,6 @@ async def list_lits(
         )
     
     lits = session.exec(query.order_by(Lit.name)).all()
-    if apply_scheduled_status(lits):
-        session.commit()
     
     chambres = session.exec(select(Chambre).order_by(Chambre.name)).all()
     chambre_map = {chambre.id: chambre.name for chambre in chambres}
@@ -1305,8 +1256,6 @@ async def list_lits_api(
     if status:
         query = query.where(Lit.status == status)
     lits = session.exec(query).all()
-    if apply_scheduled_status(lits):
-        session.commit()
     return lits
 
 @router.post("/lits", response_model=Lit)
@@ -1389,9 +1338,8 @@ async def structure_search(
     service_type: Optional[LocationServiceType] = Query(None),
     uf_id: Optional[int] = Query(None),
 ):
+    # Lecture seule : l'état programmé est porté par l'index d'occupation des lits
     services = session.exec(select(Service).order_by(Service.name)).all()
-    if apply_scheduled_status(services):
-        session.commit()
 
     service_ids = [svc.id for svc in services if not service_type or svc.service_type == service_type]
     available_ufs_query = select(UniteFonctionnelle).order_by(UniteFonctionnelle.name)
@@ -1401,30 +1349,10 @@ async def structure_search(
         else:
             available_ufs_query = available_ufs_query.where(False)
     ufs = session.exec(available_ufs_query).all()
-    if apply_scheduled_status(ufs):
-        session.commit()
 
     results = []
     if service_type or uf_id:
-        lits = _fetch_available_lits(session, service_type=service_type, uf_id=uf_id)
-        for lit in lits:
-            chambre = lit.chambre
-            uh = chambre.unite_hebergement if chambre else None
-            uf = uh.unite_fonctionnelle if uh else None
-            service = uf.service if uf else None
-            pole = service.pole if service else None
-            eg = pole.entite_geo if pole else None
-            results.append(
-                {
-                    "lit": lit,
-                    "chambre": chambre,
-                    "uh": uh,
-                    "uf": uf,
-                    "service": service,
-                    "pole": pole,
-                    "entite_geo": eg,
-                }
-            )
+        results = _fetch_available_lits(session, service_type=service_type, uf_id=uf_id)
 
     return templates.TemplateResponse(
         "structure/search.html",
@@ -1445,52 +1373,21 @@ def _fetch_available_lits(
     service_type: Optional[LocationServiceType] = None,
     uf_id: Optional[int] = None,
 ):
-    """Return lits libres en tenant compte des programmations."""
-    query = (
-        select(Lit)
-        .options(
-            selectinload(Lit.chambre)
-            .selectinload(Chambre.unite_hebergement)
-            .selectinload(UniteHebergement.unite_fonctionnelle)
-            .selectinload(UniteFonctionnelle.service)
-            .selectinload(Service.pole)
-            .selectinload(Pole.entite_geo)
+    """Return lits libres (index d'occupation, une requête, sans écriture) avec leur hiérarchie."""
+    return [
+        {
+            "lit": lit,
+            "chambre": chambre,
+            "uh": uh,
+            "uf": uf,
+            "service": service,
+            "pole": pole,
+            "entite_geo": eg,
+        }
+        for _, lit, chambre, uh, uf, service, pole, eg in find_available_beds(
+            session, service_type=service_type, uf_id=uf_id
         )
-        .join(Chambre)
-        .join(UniteHebergement)
-        .join(UniteFonctionnelle)
-        .join(Service)
-        .where(Lit.operationalStatus == "libre")
-    )
-    if service_type:
-        query = query.where(Service.service_type == service_type)
-    if uf_id:
-        query = query.where(UniteFonctionnelle.id == uf_id)
-
-    lits = session.exec(query).scalars().all()
-    changed = apply_scheduled_status(lits)
-    for lit in lits:
-        if lit.chambre and apply_scheduled_status([lit.chambre]):
-            changed = True
-        uh = getattr(lit.chambre, "unite_hebergement", None)
-        if uh and apply_scheduled_status([uh]):
-            changed = True
-        uf = getattr(uh, "unite_fonctionnelle", None) if uh else None
-        if uf and apply_scheduled_status([uf]):
-            changed = True
-        service = getattr(uf, "service", None) if uf else None
-        if service and apply_scheduled_status([service]):
-            changed = True
-        pole = getattr(service, "pole", None) if service else None
-        if pole and apply_scheduled_status([pole]):
-            changed = True
-        eg = getattr(pole, "entite_geo", None) if pole else None
-        if eg and apply_scheduled_status([eg]):
-            changed = True
-    if changed:
-        session.commit()
-    # Filtrer les lits actifs après application
-    return [lit for lit in lits if lit.status == LocationStatus.ACTIVE]
+    ]
 
 
 @router.get("/search/lits-disponibles")
@@ -1500,7 +1397,7 @@ async def search_lits_disponibles(
     uf_id: Optional[int] = None,
 ):
     """Recherche les lits disponibles avec filtres (JSON)."""
-    return _fetch_available_lits(session, service_type=service_type, uf_id=uf_id)
+    return [row["lit"] for row in _fetch_available_lits(session, service_type=service_type, uf_id=uf_id)]
 
 
 @router.get("/{type}/{id}/map", response_class=HTMLResponse)
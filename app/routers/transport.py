@@ -6,7 +6,7 @@ from sqlmodel import Session, select
 from app.db import get_session
 from app.models_endpoints import SystemEndpoint, MLLPConfig, FHIRConfig, MessageLog
 from app.services.mllp import send_mllp
-from app.services.fhir_transport import post_fhir_bundle as send_fhir
+from app.services.fhir_transport import fhir_config_options, post_fhir_bundle as send_fhir
 from app.services.pam import generate_pam_messages_for_dossier
 from app.models import Dossier
 
@@ -135,7 +135,8 @@ async def send_fhir_bundle(
         full_url,
         bundle,
         config.auth_kind or "none",
-        config.auth_token
+        config.auth_token,
+        **fhir_config_options(config)
     )
     
     log.ack_payload = str(resp)
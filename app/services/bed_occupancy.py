@@ -0,0 +1,431 @@
+"""
+Index d'occupation et de disponibilité des lits (table `BedOccupancy`)
+
+Contenu
+- Écouteurs mapper qui maintiennent l'index dans la transaction d'écriture (par lots
+  en fin de flush) :
+  - `Lit` (insert/update/delete) et ancêtres (Chambre, UH, UF, Service, Pôle) quand le
+    statut, les dates programmées, le rattachement ou le type de service changent ;
+  - `Mouvement` (insert) : occupation selon l'événement IHE PAM (A01/A02/A03/A21/A22 et
+    annulations A11/A12/A13/A52/A53), lit résolu depuis PV1-3 (composant lit = identifiant).
+- `refresh_scheduled_beds`: recalcul des lits dont une échéance programmée est passée
+  (requête sur `next_status_change`), appelé par le scheduler en tâche de fond.
+- `find_available_beds`: « lits libres pour le type de service X / l'UF Y » en une requête
+  indexée, sans écriture.
+- `rebuild_bed_occupancy`: reconstruction complète (structure + rejeu des mouvements).
+
+Notes
+- Un lit est disponible si lui et ses ancêtres (hors EG) sont actifs à l'instant du calcul
+  (mêmes règles que `apply_scheduled_status`), s'il n'est ni occupé ni réservé (absence
+  provisoire) et si son statut opérationnel est vide ou « libre ».
+- L'occupation est suivie par venue : un nouveau lit pour une venue libère le précédent.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Sequence
+
+from sqlalchemy import and_, bindparam, case, delete, event, func, insert, inspect, or_, select as sa_select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from app.models import Mouvement
+from app.models_structure import (
+    BedOccupancy,
+    Chambre,
+    EntiteGeographique,
+    Lit,
+    Pole,
+    Service,
+    UniteFonctionnelle,
+    UniteHebergement,
+)
+from app.services.structure_schedule import scheduled_state
+
+logger = logging.getLogger(__name__)
+
+# Statuts opérationnels (v2-0116 / libellés locaux) qui n'empêchent pas l'attribution du lit
+FREE_OPERATIONAL_STATUSES = ("libre", "free", "U")
+
+# Événements IHE PAM → effet sur l'occupation
+OCCUPY_TRIGGERS = {"A01", "A02", "A12", "A13"}  # lit = PV1-3 du mouvement
+RELEASE_TRIGGERS = {"A03", "A11"}
+LEAVE_TRIGGERS = {"A21", "A53"}  # absence provisoire : lit conservé
+RETURN_TRIGGERS = {"A22", "A52"}
+
+# Colonne de BedOccupancy désignant chaque ancêtre
+ANCESTOR_COLUMNS = {
+    Chambre: "chambre_id",
+    UniteHebergement: "uh_id",
+    UniteFonctionnelle: "uf_id",
+    Service: "service_id",
+    Pole: "pole_id",
+}
+_ANCESTOR_WATCHED = (
+    "status", "activation_date", "deactivation_date",
+    "unite_hebergement_id", "unite_fonctionnelle_id", "service_id", "pole_id", "service_type",
+)
+
+_CHUNK = 500
+
+# session.info : lits, ancêtres et mouvements écrits pendant le flush courant
+_PENDING_KEY = "bed_occupancy_pending"
+
+
+# ----------------------------------------------------------------------
+# Structure : colonnes dénormalisées et état programmé
+# ----------------------------------------------------------------------
+
+def _structure_query():
+    lit, ch, uh = Lit.__table__, Chambre.__table__, UniteHebergement.__table__
+    uf, sv, po = UniteFonctionnelle.__table__, Service.__table__, Pole.__table__
+    columns = [
+        lit.c.id, lit.c.operational_status, lit.c.chambre_id,
+        ch.c.unite_hebergement_id.label("uh_id"),
+        uh.c.unite_fonctionnelle_id.label("uf_id"),
+        uf.c.service_id,
+        sv.c.pole_id, sv.c.service_type,
+        po.c.entite_geo_id.label("eg_id"),
+    ]
+    for prefix, table in (("lit", lit), ("ch", ch), ("uh", uh), ("uf", uf), ("sv", sv), ("po", po)):
+        columns += [
+            table.c.status.label(f"{prefix}_status"),
+            table.c.activation_date.label(f"{prefix}_activation"),
+            table.c.deactivation_date.label(f"{prefix}_deactivation"),
+        ]
+    joined = (
+        lit.outerjoin(ch, ch.c.id == lit.c.chambre_id)
+        .outerjoin(uh, uh.c.id == ch.c.unite_hebergement_id)
+        .outerjoin(uf, uf.c.id == uh.c.unite_fonctionnelle_id)
+        .outerjoin(sv, sv.c.id == uf.c.service_id)
+        .outerjoin(po, po.c.id == sv.c.pole_id)
+    )
+    return sa_select(*columns).select_from(joined)
+
+
+def _structure_values(row: Any, now: datetime) -> dict:
+    active = True
+    upcoming: List[datetime] = []
+    for prefix in ("lit", "ch", "uh", "uf", "sv", "po"):
+        status = getattr(row, f"{prefix}_status")
+        if status is None and prefix != "lit":
+            continue  # ancêtre absent (jointure externe)
+        level_active, next_change = scheduled_state(
+            status, getattr(row, f"{prefix}_activation"), getattr(row, f"{prefix}_deactivation"), now=now
+        )
+        active = active and level_active
+        if next_change:
+            upcoming.append(next_change)
+    return {
+        "lit_id": row.id,
+        "chambre_id": row.chambre_id,
+        "uh_id": row.uh_id,
+        "uf_id": row.uf_id,
+        "service_id": row.service_id,
+        "pole_id": row.pole_id,
+        "eg_id": row.eg_id,
+        "service_type": getattr(row.service_type, "value", row.service_type),
+        "operational_status": row.operational_status,
+        "structure_active": active,
+        "next_status_change": min(upcoming) if upcoming else None,
+        "updated_at": now,
+    }
+
+
+def _available_expr():
+    table = BedOccupancy.__table__
+    return case(
+        (
+            and_(
+                table.c.structure_active.is_(True),
+                table.c.occupancy == "free",
+                or_(
+                    table.c.operational_status.is_(None),
+                    table.c.operational_status == "",
+                    table.c.operational_status.in_(FREE_OPERATIONAL_STATUSES),
+                ),
+            ),
+            True,
+        ),
+        else_=False,
+    )
+
+
+def _refresh_available(connection, condition) -> None:
+    table = BedOccupancy.__table__
+    connection.execute(update(table).where(condition).values(available=_available_expr()))
+
+
+def recompute_beds(connection, lit_ids: Iterable[int], now: Optional[datetime] = None) -> int:
+    """Recalcule la partie structure (hiérarchie, état programmé) des lits donnés."""
+    table = BedOccupancy.__table__
+    now = now or datetime.utcnow()
+    ids = list(lit_ids)
+    count = 0
+    for start in range(0, len(ids), _CHUNK):
+        chunk = ids[start:start + _CHUNK]
+        rows = connection.execute(_structure_query().where(Lit.__table__.c.id.in_(chunk))).all()
+        values = [_structure_values(row, now) for row in rows]
+        if values:
+            _upsert(connection, table, values)
+        _refresh_available(connection, table.c.lit_id.in_(chunk))
+        count += len(values)
+    return count
+
+
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def _upsert(connection, table, values: List[dict]) -> None:
+    """INSERT ... ON CONFLICT (lit_id) DO UPDATE (SQLite, PostgreSQL) ; ailleurs UPDATE puis INSERT."""
+    columns = [k for k in values[0] if k != "lit_id"]
+    dialect_insert = _UPSERT_INSERTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.lit_id],
+            set_={k: stmt.excluded[k] for k in columns},
+        )
+        connection.execute(stmt, values)
+        return
+    existing = set(connection.execute(
+        sa_select(table.c.lit_id).where(table.c.lit_id.in_([v["lit_id"] for v in values]))
+    ).scalars())
+    updates = [{**v, "b_lit_id": v["lit_id"]} for v in values if v["lit_id"] in existing]
+    if updates:
+        connection.execute(
+            update(table).where(table.c.lit_id == bindparam("b_lit_id")).values(
+                {k: bindparam(k) for k in columns}
+            ),
+            updates,
+        )
+    inserts = [v for v in values if v["lit_id"] not in existing]
+    if inserts:
+        connection.execute(insert(table), inserts)
+
+
+def _beds_where(connection, condition) -> List[int]:
+    table = BedOccupancy.__table__
+    return [r[0] for r in connection.execute(sa_select(table.c.lit_id).where(condition)).all()]
+
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault(_PENDING_KEY, {"lits": set(), "ancestors": set(), "mouvements": []})
+
+
+def _after_lit_write(mapper, connection, target):
+    # Différé à la fin du flush : les lits d'un même flush sont recalculés par lots
+    session = Session.object_session(target)
+    if session is None:
+        recompute_beds(connection, [target.id])
+        return
+    _pending(session)["lits"].add(target.id)
+
+
+def _after_lit_delete(mapper, connection, target):
+    table = BedOccupancy.__table__
+    session = Session.object_session(target)
+    if session is not None and _PENDING_KEY in session.info:
+        session.info[_PENDING_KEY]["lits"].discard(target.id)
+    connection.execute(delete(table).where(table.c.lit_id == target.id))
+
+
+def _after_ancestor_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(
+        name in state.attrs and state.attrs[name].history.has_changes() for name in _ANCESTOR_WATCHED
+    ):
+        return
+    column = ANCESTOR_COLUMNS[type(target)]
+    session = Session.object_session(target)
+    if session is None:
+        recompute_beds(connection, _beds_where(connection, BedOccupancy.__table__.c[column] == target.id))
+        return
+    _pending(session)["ancestors"].add((column, target.id))
+
+
+# ----------------------------------------------------------------------
+# Occupation : mouvements
+# ----------------------------------------------------------------------
+
+def _trigger_of(mouvement: Any) -> Optional[str]:
+    if mouvement.trigger_event:
+        return mouvement.trigger_event.strip().upper()
+    if mouvement.type and "^" in mouvement.type:
+        return mouvement.type.split("^")[1].strip().upper()
+    return None
+
+
+def resolve_bed(connection, location: Optional[str]) -> Optional[int]:
+    """Lit désigné par un PV1-3 (PL) : composant lit (PL-3), ou valeur simple, comparé à l'identifiant puis au nom."""
+    if not location:
+        return None
+    parts = location.split("^")
+    key = parts[2].strip() if len(parts) > 2 else (location.strip() if len(parts) == 1 else "")
+    if not key:
+        return None
+    lit = Lit.__table__
+    found = connection.execute(sa_select(lit.c.id).where(lit.c.identifier == key)).first()
+    if found is None:
+        found = connection.execute(
+            sa_select(lit.c.id).where(lit.c.name == key).order_by(lit.c.id).limit(1)
+        ).first()
+    return found[0] if found else None
+
+
+def _release_venue(connection, venue_id: int, keep_lit_id: Optional[int] = None) -> None:
+    table = BedOccupancy.__table__
+    condition = table.c.venue_id == venue_id
+    if keep_lit_id is not None:
+        condition = and_(condition, table.c.lit_id != keep_lit_id)
+    released = _beds_where(connection, condition)
+    if not released:
+        return
+    connection.execute(
+        update(table)
+        .where(table.c.lit_id.in_(released))
+        .values(occupancy="free", venue_id=None, occupied_since=None)
+    )
+    _refresh_available(connection, table.c.lit_id.in_(released))
+
+
+def apply_mouvement(connection, mouvement: Any) -> None:
+    """Met à jour l'occupation à partir d'un mouvement (événement IHE PAM)."""
+    trigger = _trigger_of(mouvement)
+    venue_id = mouvement.venue_id
+    if not trigger or venue_id is None:
+        return
+    table = BedOccupancy.__table__
+
+    if trigger in OCCUPY_TRIGGERS:
+        lit_id = resolve_bed(connection, mouvement.location)
+        _release_venue(connection, venue_id, keep_lit_id=lit_id)
+        if lit_id is None:
+            return
+        connection.execute(
+            update(table)
+            .where(table.c.lit_id == lit_id)
+            .values(occupancy="occupied", venue_id=venue_id, occupied_since=mouvement.when, available=False)
+        )
+    elif trigger in RELEASE_TRIGGERS:
+        _release_venue(connection, venue_id)
+    elif trigger in LEAVE_TRIGGERS:
+        connection.execute(update(table).where(table.c.venue_id == venue_id).values(occupancy="leave"))
+    elif trigger in RETURN_TRIGGERS:
+        connection.execute(update(table).where(table.c.venue_id == venue_id).values(occupancy="occupied"))
+
+
+def _apply_mouvement_safe(connection, mouvement: Any) -> None:
+    try:
+        apply_mouvement(connection, mouvement)
+    except Exception:  # l'index ne doit pas faire échouer l'intégration du message
+        logger.exception("[bed_occupancy] Mise à jour impossible pour le mouvement id=%s", mouvement.id)
+
+
+def _after_mouvement_insert(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is None:
+        _apply_mouvement_safe(connection, target)
+        return
+    _pending(session)["mouvements"].append(target)
+
+
+def _after_flush(session, flush_context):
+    """Recalcule les lits touchés par le flush, puis applique les mouvements dans l'ordre."""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    connection = session.connection()
+    lit_ids = set(pending["lits"])
+    table = BedOccupancy.__table__
+    for column, entity_id in pending["ancestors"]:
+        lit_ids.update(_beds_where(connection, table.c[column] == entity_id))
+    if lit_ids:
+        recompute_beds(connection, sorted(lit_ids))
+    for mouvement in pending["mouvements"]:
+        _apply_mouvement_safe(connection, mouvement)
+
+
+event.listen(Lit, "after_insert", _after_lit_write)
+event.listen(Lit, "after_update", _after_lit_write)
+event.listen(Lit, "after_delete", _after_lit_delete)
+for _model in ANCESTOR_COLUMNS:
+    event.listen(_model, "after_update", _after_ancestor_update)
+event.listen(Mouvement, "after_insert", _after_mouvement_insert)
+event.listen(Session, "after_flush", _after_flush)
+
+
+# ----------------------------------------------------------------------
+# Tâche de fond, reconstruction et lecture
+# ----------------------------------------------------------------------
+
+def refresh_scheduled_beds(session: Session, now: Optional[datetime] = None) -> int:
+    """Recalcule les lits dont une activation/désactivation programmée est échue."""
+    now = now or datetime.utcnow()
+    connection = session.connection()
+    due = _beds_where(connection, BedOccupancy.__table__.c.next_status_change <= now)
+    count = recompute_beds(connection, due, now=now) if due else 0
+    session.commit()
+    return count
+
+
+def next_bed_status_change(session: Session) -> Optional[datetime]:
+    """Prochaine échéance programmée parmi les lits (MIN indexé)."""
+    return session.connection().execute(
+        sa_select(func.min(BedOccupancy.__table__.c.next_status_change))
+    ).scalar()
+
+
+def rebuild_bed_occupancy(session: Session, batch_size: int = 1000) -> int:
+    """Reconstruit l'index : structure de tous les lits puis rejeu des mouvements."""
+    connection = session.connection()
+    connection.execute(delete(BedOccupancy.__table__))
+    lit_ids = [r[0] for r in connection.execute(sa_select(Lit.__table__.c.id)).all()]
+    count = recompute_beds(connection, lit_ids)
+    last_id = 0
+    while True:
+        mouvements = session.exec(
+            select(Mouvement).where(Mouvement.id > last_id).order_by(Mouvement.id).limit(batch_size)
+        ).all()
+        if not mouvements:
+            break
+        last_id = mouvements[-1].id
+        for mouvement in mouvements:
+            apply_mouvement(connection, mouvement)
+    session.commit()
+    return count
+
+
+def find_available_beds(
+    session: Session,
+    service_type: Optional[str] = None,
+    uf_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Sequence[tuple]:
+    """
+    Lits disponibles, en une requête indexée sur (available, service_type|uf_id).
+
+    Retourne des tuples (BedOccupancy, Lit, Chambre, UH, UF, Service, Pole, EG) ;
+    les ancêtres sont joints par les id dénormalisés de l'index.
+    """
+    query = (
+        select(BedOccupancy, Lit, Chambre, UniteHebergement, UniteFonctionnelle, Service, Pole, EntiteGeographique)
+        .join(Lit, Lit.id == BedOccupancy.lit_id)
+        .outerjoin(Chambre, Chambre.id == BedOccupancy.chambre_id)
+        .outerjoin(UniteHebergement, UniteHebergement.id == BedOccupancy.uh_id)
+        .outerjoin(UniteFonctionnelle, UniteFonctionnelle.id == BedOccupancy.uf_id)
+        .outerjoin(Service, Service.id == BedOccupancy.service_id)
+        .outerjoin(Pole, Pole.id == BedOccupancy.pole_id)
+        .outerjoin(EntiteGeographique, EntiteGeographique.id == BedOccupancy.eg_id)
+        .where(BedOccupancy.available.is_(True))
+    )
+    if service_type:
+        query = query.where(BedOccupancy.service_type == getattr(service_type, "value", service_type))
+    if uf_id:
+        query = query.where(BedOccupancy.uf_id == uf_id)
+    query = query.order_by(BedOccupancy.lit_id)
+    if limit:
+        query = query.limit(limit)
+    return session.exec(query).all()
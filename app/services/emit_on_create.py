@@ -1,14 +1,21 @@
 import asyncio
 import json
-from typing import Literal, Sequence, Tuple
+import os
+import weakref
+from typing import Any, Dict, Literal, Sequence, Tuple
 
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.db_async import run_sync
 from app.models import Patient, Dossier, Venue, Mouvement
-from app.models_endpoints import SystemEndpoint, MessageLog, FHIRConfig
+from app.models_endpoints import SystemEndpoint, MessageLog
 from app.models_identifiers import Identifier, IdentifierType
 from app.services.fhir import generate_fhir_bundle_for_dossier
-from app.services.fhir_transport import post_fhir_bundle as send_fhir
+from app.services.endpoint_cache import endpoint_config
+from app.services.fhir_batcher import fhir_batcher, resource_entries
+from app.services.file_sender import file_sender
+from app.services.fhir_transport import fhir_config_options
 from app.services.mllp import send_mllp
 from app.services.pam_validation import validate_pam
 import json
@@ -410,17 +417,15 @@ def generate_fhir(
     }
 
 
-def _build_fhir_targets(endpoint: SystemEndpoint) -> Sequence[Tuple[str, str, str | None]]:
-    """Return (base_url, auth_kind, auth_token) tuples for an endpoint."""
-    targets: list[Tuple[str, str, str | None]] = []
+def _build_fhir_targets(endpoint: SystemEndpoint) -> Sequence[Tuple[str, str, str | None, dict]]:
+    """Return (base_url, auth_kind, auth_token, send options) tuples for an endpoint."""
+    targets: list[Tuple[str, str, str | None, dict]] = []
 
     # Prioritise explicit FHIR configs
     for cfg in getattr(endpoint, "fhir_configs", []) or []:
-        if not isinstance(cfg, FHIRConfig):
-            continue
         if not cfg.is_enabled or not cfg.base_url:
             continue
-        targets.append((cfg.base_url, cfg.auth_kind or "none", cfg.auth_token))
+        targets.append((cfg.base_url, cfg.auth_kind or "none", cfg.auth_token, fhir_config_options(cfg)))
 
     if targets:
         return targets
@@ -439,156 +444,258 @@ def _build_fhir_targets(endpoint: SystemEndpoint) -> Sequence[Tuple[str, str, st
         if endpoint.port:
             base_url = f"{base_url}:{endpoint.port}"
 
-    targets.append((base_url, "none", None))
+    targets.append((base_url, "none", None, {}))
     return targets
 
 
-async def emit_to_senders_async(
-    entity,
-    entity_type: Literal["patient", "dossier", "venue", "mouvement"],
-    session: Session,
-    operation: str = "insert",
-) -> None:
-    """Emit HL7/FHIR notifications for newly created or updated entities."""
-
-    endpoints = session.exec(select(SystemEndpoint).where(SystemEndpoint.role == "sender")).all()
-    sent_logs: list[MessageLog] = []
-
-    for endpoint in endpoints:
-        hl7_message = generate_pam_hl7(
-            entity,
-            entity_type,
-            session,
-            forced_identifier_system=getattr(endpoint, "forced_identifier_system", None),
-            forced_identifier_oid=getattr(endpoint, "forced_identifier_oid", None),
-            operation=operation,
+def _pam_validation(hl7_message: str) -> Tuple[str, str]:
+    """Run outbound PAM validation; return (status, JSON issues) for the MessageLog."""
+    try:
+        val = validate_pam(hl7_message, direction="out")
+        return val.level, json.dumps([i.__dict__ for i in val.issues], ensure_ascii=False)
+    except Exception:
+        return "warn", json.dumps([{"code": "VALIDATOR_ERROR", "message": "Erreur interne du validateur", "severity": "warn"}], ensure_ascii=False)
+
+
+# Per-endpoint MLLP send cap shared by concurrent emissions (1 = messages leave in order).
+# FHIR sends are grouped by fhir_batcher instead, FILE sends by file_sender.
+ENDPOINT_CONCURRENCY = int(os.getenv("EMIT_ENDPOINT_CONCURRENCY", "1"))
+_endpoint_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[int, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _endpoint_limit(endpoint_id: int | None) -> asyncio.Semaphore:
+    limits = _endpoint_limits.setdefault(asyncio.get_running_loop(), {})
+    if endpoint_id not in limits:
+        limits[endpoint_id] = asyncio.Semaphore(max(1, ENDPOINT_CONCURRENCY))
+    return limits[endpoint_id]
+
+
+async def _send_mllp_variant(endpoint: SystemEndpoint, variant: Tuple[str, str, str]) -> list[MessageLog]:
+    hl7_message, pam_status, pam_issues = variant
+    try:
+        if not endpoint.host or not endpoint.port:
+            raise ValueError("Endpoint MLLP host/port non configuré")
+        async with _endpoint_limit(endpoint.id):
+            ack_payload = await send_mllp(endpoint.host, endpoint.port, hl7_message)
+        status = "sent"
+    except Exception as exc:  # noqa: BLE001 - we want to log the failure
+        status = "error"
+        ack_payload = str(exc)
+    return [
+        MessageLog(
+            direction="out",
+            kind="MLLP",
+            endpoint_id=endpoint.id,
+            payload=hl7_message,
+            ack_payload=ack_payload or "",
+            status=status,
+            pam_validation_status=pam_status,
+            pam_validation_issues=pam_issues,
         )
-        
-        # TEMPORARILY DISABLED: FHIR generation fails with detached entities
-        # TODO: Fix FHIR generation to work with expunged entities or use different strategy
-        # fhir_payload = generate_fhir(
-        #     entity,
-        #     entity_type,
-        #     session,
-        #     forced_identifier_system=getattr(endpoint, "forced_identifier_system", None),
-        #     forced_identifier_oid=getattr(endpoint, "forced_identifier_oid", None),
-        # )
-        fhir_payload = None
-
-        if endpoint.kind == "MLLP":
-            status = "generated"
-            ack_payload = ""
-            # Run PAM validation for outbound HL7 and store on log
-            try:
-                val = validate_pam(hl7_message, direction="out")
-                pam_status = val.level
-                pam_issues = json.dumps([i.__dict__ for i in val.issues], ensure_ascii=False)
-            except Exception:
-                pam_status = "warn"
-                pam_issues = json.dumps([{"code": "VALIDATOR_ERROR", "message": "Erreur interne du validateur", "severity": "warn"}], ensure_ascii=False)
-            try:
-                if not endpoint.host or not endpoint.port:
-                    raise ValueError("Endpoint MLLP host/port non configuré")
-                ack_payload = await send_mllp(endpoint.host, endpoint.port, hl7_message)
-                status = "sent"
-            except Exception as exc:  # noqa: BLE001 - we want to log the failure
-                status = "error"
-                ack_payload = str(exc)
-            sent_logs.append(
-                MessageLog(
-                    direction="out",
-                    kind="MLLP",
-                    endpoint_id=endpoint.id,
-                    payload=hl7_message,
-                    ack_payload=ack_payload or "",
-                    status=status,
-                    pam_validation_status=pam_status,
-                    pam_validation_issues=pam_issues,
-                )
-            )
-            continue
+    ]
+
+
+async def _send_file_variant(endpoint: SystemEndpoint, variant: Tuple[str, str, str]) -> list[MessageLog]:
+    hl7_message, pam_status, pam_issues = variant
+    result = await file_sender.send(endpoint, hl7_message)
+    return [
+        MessageLog(
+            direction="out",
+            kind="FILE",
+            endpoint_id=endpoint.id,
+            payload=hl7_message,
+            ack_payload=result.ack_payload(),
+            status="sent" if result.ok else "error",
+            pam_validation_status=pam_status,
+            pam_validation_issues=pam_issues,
+        )
+    ]
 
-        if endpoint.kind == "FHIR":
-            targets = _build_fhir_targets(endpoint)
-            if not targets:
-                payload_str = json.dumps(fhir_payload, default=str)
-                sent_logs.append(
-                    MessageLog(
-                        direction="out",
-                        kind="FHIR",
-                        endpoint_id=endpoint.id,
-                        payload=payload_str,
-                        ack_payload="Endpoint FHIR non configuré",
-                        status="error",
-                    )
-                )
-                continue
-
-            for base_url, auth_kind, auth_token in targets:
-                status = "generated"
-                ack_payload = ""
-                payload_str = json.dumps(fhir_payload, default=str)
-                try:
-                    status_code, response_body = await send_fhir(
-                        base_url, fhir_payload, auth_kind=auth_kind, auth_token=auth_token
-                    )
-                    status = "sent" if 200 <= status_code < 300 else "error"
-                    ack_payload = json.dumps(response_body or {}, default=str)
-                except Exception as exc:  # noqa: BLE001
-                    status = "error"
-                    ack_payload = str(exc)
-                sent_logs.append(
-                    MessageLog(
-                        direction="out",
-                        kind="FHIR",
-                        endpoint_id=endpoint.id,
-                        payload=payload_str,
-                        ack_payload=ack_payload,
-                        status=status,
-                    )
-                )
-            continue
 
-    if not endpoints:
-        # No sender configured: store generated payloads for audit trail.
-        hl7_message = generate_pam_hl7(entity, entity_type, session)
-        # Validate PAM for audit
-        try:
-            val = validate_pam(hl7_message, direction="out")
-            pam_status = val.level
-            pam_issues = json.dumps([i.__dict__ for i in val.issues], ensure_ascii=False)
-        except Exception:
-            pam_status = "warn"
-            pam_issues = json.dumps([{"code": "VALIDATOR_ERROR", "message": "Erreur interne du validateur", "severity": "warn"}], ensure_ascii=False)
-        fhir_payload = generate_fhir(entity, entity_type, session)
-        sent_logs.append(
+async def _send_fhir_payload(endpoint: SystemEndpoint, variant: Tuple[Any, str | None]) -> list[MessageLog]:
+    fhir_payload, render_error = variant
+    payload_str = json.dumps(fhir_payload, default=str)
+    targets = _build_fhir_targets(endpoint)
+    if render_error or not targets:
+        return [
             MessageLog(
                 direction="out",
-                kind="MLLP",
-                endpoint_id=None,
-                payload=hl7_message,
-                ack_payload="",
-                status="generated",
-                pam_validation_status=pam_status,
-                pam_validation_issues=pam_issues,
+                kind="FHIR",
+                endpoint_id=endpoint.id,
+                payload=payload_str,
+                ack_payload=render_error or "Endpoint FHIR non configuré",
+                status="error",
             )
-        )
-        sent_logs.append(
+        ]
+
+    # Entrées regroupées avec les émissions concurrentes dans un Bundle par cible
+    entries = resource_entries(fhir_payload)
+    logs: list[MessageLog] = []
+    for base_url, auth_kind, auth_token, options in targets:
+        if entries:
+            # Pas de plafond par endpoint ici : le batcher ordonne déjà les entrées, et
+            # les émissions concurrentes doivent pouvoir rejoindre le même Bundle
+            result = await fhir_batcher.submit(
+                base_url, entries, auth_kind=auth_kind, auth_token=auth_token, **options
+            )
+            status = "sent" if result.ok else "error"
+            ack_payload = result.ack_payload()
+        else:
+            status = "error"
+            ack_payload = "Aucune ressource FHIR à émettre"
+        logs.append(
             MessageLog(
                 direction="out",
                 kind="FHIR",
-                endpoint_id=None,
-                payload=json.dumps(fhir_payload, default=str),
-                ack_payload="",
-                status="generated",
+                endpoint_id=endpoint.id,
+                payload=payload_str,
+                ack_payload=ack_payload,
+                status=status,
             )
         )
+    return logs
+
 
-    for log in sent_logs:
-        session.add(log)
+def _render_variants(
+    session: Session,
+    entity,
+    entity_type: str,
+    endpoints: Sequence[SystemEndpoint],
+    operation: str,
+) -> Dict[Tuple[str | None, str | None], Tuple[str, str, str]]:
+    """Render and validate one HL7 message per identifier-override variant used by MLLP/FILE endpoints."""
+    variants: Dict[Tuple[str | None, str | None], Tuple[str, str, str]] = {}
+    for endpoint in endpoints:
+        if endpoint.kind not in ("MLLP", "FILE"):
+            continue
+        key = _variant_key(endpoint)
+        if key not in variants:
+            hl7_message = generate_pam_hl7(
+                entity,
+                entity_type,
+                session,
+                forced_identifier_system=key[0],
+                forced_identifier_oid=key[1],
+                operation=operation,
+            )
+            variants[key] = (hl7_message, *_pam_validation(hl7_message))
+    return variants
+
+
+def _render_fhir_variants(
+    session: Session,
+    entity,
+    entity_type: str,
+    endpoints: Sequence[SystemEndpoint],
+) -> Dict[Tuple[str | None, str | None], Tuple[Any, str | None]]:
+    """Render one FHIR payload per identifier-override variant used by FHIR endpoints.
+
+    A generation failure is kept as the variant's error and logged by each endpoint
+    instead of aborting the other emissions.
+    """
+    variants: Dict[Tuple[str | None, str | None], Tuple[Any, str | None]] = {}
+    for endpoint in endpoints:
+        if endpoint.kind != "FHIR":
+            continue
+        key = _variant_key(endpoint)
+        if key not in variants:
+            try:
+                payload = generate_fhir(
+                    entity,
+                    entity_type,
+                    session,
+                    forced_identifier_system=key[0],
+                    forced_identifier_oid=key[1],
+                )
+                variants[key] = (payload, None)
+            except Exception as exc:  # noqa: BLE001 - logged per endpoint
+                variants[key] = (None, f"Génération FHIR impossible: {exc}")
+    return variants
+
+
+def _variant_key(endpoint: SystemEndpoint) -> Tuple[str | None, str | None]:
+    return (
+        getattr(endpoint, "forced_identifier_system", None),
+        getattr(endpoint, "forced_identifier_oid", None),
+    )
+
+
+def _generated_logs(session: Session, entity, entity_type: str) -> list[MessageLog]:
+    """No sender configured: generated payloads kept for the audit trail."""
+    hl7_message = generate_pam_hl7(entity, entity_type, session)
+    # Validate PAM for audit
+    pam_status, pam_issues = _pam_validation(hl7_message)
+    fhir_payload = generate_fhir(entity, entity_type, session)
+    return [
+        MessageLog(
+            direction="out",
+            kind="MLLP",
+            endpoint_id=None,
+            payload=hl7_message,
+            ack_payload="",
+            status="generated",
+            pam_validation_status=pam_status,
+            pam_validation_issues=pam_issues,
+        ),
+        MessageLog(
+            direction="out",
+            kind="FHIR",
+            endpoint_id=None,
+            payload=json.dumps(fhir_payload, default=str),
+            ack_payload="",
+            status="generated",
+        ),
+    ]
+
+
+async def emit_to_senders_async(
+    entity,
+    entity_type: Literal["patient", "dossier", "venue", "mouvement"],
+    session: Session | AsyncSession,
+    operation: str = "insert",
+) -> None:
+    """Emit HL7/FHIR notifications for newly created or updated entities.
+
+    Each distinct HL7 variant (endpoint identifier overrides) is rendered and validated
+    once and shared by MLLP and FILE senders (FHIR payloads likewise for FHIR senders), then all endpoints are sent to
+    concurrently; a slow receiver only delays its own messages.
+
+    `session` may be an AsyncSession: rendering then runs through `AsyncSession.run_sync`
+    and the logs are committed without blocking the event loop.
+    """
+
+    # Detached snapshot of the session's own database (an AsyncSession resolves its
+    # engine through its sync_session inside run_sync)
+    endpoints = (await run_sync(session, endpoint_config)).senders()
+
+    # Render phase (uses the session, sequential): one message per override variant
+    variants = await run_sync(session, _render_variants, entity, entity_type, endpoints, operation)
+    fhir_variants = await run_sync(session, _render_fhir_variants, entity, entity_type, endpoints)
+    sends = []
+    for endpoint in endpoints:
+        if endpoint.kind == "MLLP":
+            sends.append(_send_mllp_variant(endpoint, variants[_variant_key(endpoint)]))
+        elif endpoint.kind == "FILE":
+            sends.append(_send_file_variant(endpoint, variants[_variant_key(endpoint)]))
+        elif endpoint.kind == "FHIR":
+            sends.append(_send_fhir_payload(endpoint, fhir_variants[_variant_key(endpoint)]))
+
+    # Send phase: all endpoints concurrently, logs kept in endpoint order
+    sent_logs: list[MessageLog] = []
+    for logs in await asyncio.gather(*sends):
+        sent_logs.extend(logs)
+
+    if not endpoints:
+        sent_logs.extend(await run_sync(session, _generated_logs, entity, entity_type))
 
     if sent_logs:
-        session.commit()
+        session.add_all(sent_logs)
+        if isinstance(session, AsyncSession):
+            await session.commit()
+        else:
+            session.commit()
 
 
 class _EmitToSendersWrapper:
@@ -0,0 +1,211 @@
+"""
+Cache en mémoire de la configuration des endpoints (SystemEndpoint, MLLPConfig, FHIRConfig,
+IdentifierNamespace), exposée en instantanés immuables.
+
+Contenu
+- `endpoint_config(session=None)` : instantané courant (`EndpointConfig`) de la base de la
+  session (ou de la base de l'application), rechargé en une fois après invalidation.
+- `EndpointConfig` : lignes figées (attributs identiques aux modèles, en lecture seule) et
+  filtres usuels (`senders`, `by_kind`, `endpoint`, `namespaces_for`).
+- `invalidate_endpoint_config()` : invalidation manuelle.
+
+Invalidation
+- Écouteurs de session : un flush (ou un UPDATE/DELETE ORM groupé) touchant l'une des
+  tables suivies marque la session ; le commit incrémente la version du cache.
+- Création/suppression du schéma (create_all/drop_all) : invalidation.
+- Filet de sécurité pour les écritures d'autres processus : durée de vie maximale
+  (ENDPOINT_CACHE_TTL_SECONDS, 30 s par défaut ; 0 désactive le cache).
+
+Notes
+- Les instantanés sont détachés de toute session : utilisables dans les tâches asyncio et
+  les threads. Pour modifier un endpoint, recharger la ligne ORM (`session.get`).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field, make_dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, SQLModel, select
+
+from app.models_endpoints import FHIRConfig, MLLPConfig, SystemEndpoint
+from app.models_structure_fhir import IdentifierNamespace
+
+CACHE_TTL = float(os.getenv("ENDPOINT_CACHE_TTL_SECONDS", "30"))
+
+_WATCHED = (SystemEndpoint, MLLPConfig, FHIRConfig, IdentifierNamespace)
+_DIRTY_KEY = "endpoint_cache_dirty"
+_snapshot_types: Dict[type, type] = {}
+
+
+def _snapshot_type(model: type, *extra: str) -> type:
+    if model not in _snapshot_types:
+        columns = [(column.key, Any) for column in model.__table__.columns]
+        columns += [(name, Tuple[Any, ...], field(default=())) for name in extra]
+        _snapshot_types[model] = make_dataclass(f"{model.__name__}Snapshot", columns, frozen=True)
+    return _snapshot_types[model]
+
+
+def _freeze(row: Any, **extra: Any) -> Any:
+    snapshot_type = _snapshot_type(type(row), *extra)
+    values = {column.key: getattr(row, column.key) for column in type(row).__table__.columns}
+    return snapshot_type(**values, **extra)
+
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    """Instantané de la configuration des endpoints à une version donnée."""
+
+    version: int
+    loaded_at: float
+    endpoints: Tuple[Any, ...] = ()
+    namespaces: Tuple[Any, ...] = ()
+
+    def endpoint(self, endpoint_id: Optional[int]) -> Optional[Any]:
+        return next((e for e in self.endpoints if e.id == endpoint_id), None)
+
+    def senders(self, kind: Optional[str] = None, enabled_only: bool = False) -> Tuple[Any, ...]:
+        return tuple(
+            e for e in self.endpoints
+            if e.role == "sender"
+            and (kind is None or (e.kind or "").upper() == kind.upper())
+            and (e.is_enabled or not enabled_only)
+        )
+
+    def by_kind(self, kind: str, enabled_only: bool = True) -> Tuple[Any, ...]:
+        return tuple(
+            e for e in self.endpoints
+            if (e.kind or "").upper() == kind.upper() and (e.is_enabled or not enabled_only)
+        )
+
+    def namespaces_for(self, ght_context_id: Optional[int], active_only: bool = True) -> Tuple[Any, ...]:
+        return tuple(
+            ns for ns in self.namespaces
+            if ns.ght_context_id == ght_context_id and (ns.is_active or not active_only)
+        )
+
+
+class EndpointConfigCache:
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._snapshots: "weakref.WeakKeyDictionary[Engine, EndpointConfig]" = weakref.WeakKeyDictionary()
+        self.metrics: Dict[str, int] = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._snapshots.clear()
+            self.metrics["invalidations"] += 1
+
+    def get(self, session: Optional[Session] = None) -> EndpointConfig:
+        if session is not None and _has_pending_changes(session):
+            # Modifications non commitées dans cette session : lecture directe, non mise en cache
+            return self._read(session, -1)
+        if session is not None:
+            bind = session.get_bind()
+            engine = getattr(bind, "engine", bind)
+        else:
+            from app.db import engine
+        with self._lock:
+            snapshot = self._snapshots.get(engine)
+            if (
+                snapshot is not None
+                and snapshot.version == self.version
+                and time.monotonic() - snapshot.loaded_at < self.ttl
+            ):
+                self.metrics["hits"] += 1
+                return snapshot
+            version = self.version
+        snapshot = self._load(engine, version)
+        with self._lock:
+            # Une invalidation pendant le chargement : l'instantané reste utilisable, non conservé
+            if version == self.version:
+                self._snapshots[engine] = snapshot
+        return snapshot
+
+    def _load(self, engine: Engine, version: int) -> EndpointConfig:
+        self.metrics["loads"] += 1
+        with Session(engine) as session:
+            return self._read(session, version)
+
+    @staticmethod
+    def _read(session: Session, version: int) -> EndpointConfig:
+        mllp: Dict[int, list] = {}
+        fhir: Dict[int, list] = {}
+        for cfg in session.exec(select(MLLPConfig).order_by(MLLPConfig.id)).all():
+            mllp.setdefault(cfg.endpoint_id, []).append(_freeze(cfg))
+        for cfg in session.exec(select(FHIRConfig).order_by(FHIRConfig.id)).all():
+            fhir.setdefault(cfg.endpoint_id, []).append(_freeze(cfg))
+        endpoints = tuple(
+            _freeze(e, mllp_configs=tuple(mllp.get(e.id, ())), fhir_configs=tuple(fhir.get(e.id, ())))
+            for e in session.exec(select(SystemEndpoint).order_by(SystemEndpoint.id)).all()
+        )
+        namespaces = tuple(
+            _freeze(ns) for ns in session.exec(select(IdentifierNamespace).order_by(IdentifierNamespace.id)).all()
+        )
+        return EndpointConfig(version, time.monotonic(), endpoints, namespaces)
+
+
+endpoint_config_cache = EndpointConfigCache()
+
+
+def endpoint_config(session: Optional[Session] = None) -> EndpointConfig:
+    """Instantané courant de la configuration des endpoints (voir module)."""
+    return endpoint_config_cache.get(session)
+
+
+def invalidate_endpoint_config() -> None:
+    endpoint_config_cache.invalidate()
+
+
+# ---------------------------------------------------------------------------
+# Écouteurs d'invalidation
+# ---------------------------------------------------------------------------
+
+def _has_pending_changes(session: Session) -> bool:
+    if session.info.get(_DIRTY_KEY):
+        return True
+    return any(isinstance(obj, _WATCHED) for obj in (*session.new, *session.dirty, *session.deleted))
+
+
+def _after_flush(session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _WATCHED):
+            session.info[_DIRTY_KEY] = True
+            return
+
+
+def _do_orm_execute(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    if any(mapper.class_ in _WATCHED for mapper in orm_execute_state.all_mappers):
+        orm_execute_state.session.info[_DIRTY_KEY] = True
+
+
+def _after_commit(session) -> None:
+    if session.info.pop(_DIRTY_KEY, False):
+        endpoint_config_cache.invalidate()
+
+
+def _after_rollback(session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def _after_schema_change(target, connection, **kw) -> None:
+    endpoint_config_cache.invalidate()
+
+
+event.listen(OrmSession, "after_flush", _after_flush)
+event.listen(OrmSession, "do_orm_execute", _do_orm_execute)
+event.listen(OrmSession, "after_commit", _after_commit)
+event.listen(OrmSession, "after_rollback", _after_rollback)
+event.listen(SQLModel.metadata, "after_create", _after_schema_change)
+event.listen(SQLModel.metadata, "after_drop", _after_schema_change)
@@ -17,6 +17,7 @@ from typing import Any, Dict, Set
 from sqlalchemy import event
 from sqlalchemy.orm import Session
 
+from app.db_async import event_loop
 from app.models import Patient, Dossier, Venue, Mouvement
 from app.services.emit_on_create import emit_to_senders_async
 
@@ -101,8 +102,15 @@ def after_commit(session: Session):
                 # We're in an async context (FastAPI), schedule the emission
                 loop.create_task(_emit_in_new_session(entity_class, entity_id, entity_type, operation))
             except RuntimeError:
-                # No event loop running, skip emission
-                logger.warning(f"[entity_events] No event loop available, skipping emission for {entity_type} id={entity_id}")
+                # Commit in a worker thread started by db_async.to_thread: hand over to its loop
+                loop = event_loop()
+                if loop is None or loop.is_closed():
+                    # No event loop running, skip emission
+                    logger.warning(f"[entity_events] No event loop available, skipping emission for {entity_type} id={entity_id}")
+                    continue
+                asyncio.run_coroutine_threadsafe(
+                    _emit_in_new_session(entity_class, entity_id, entity_type, operation), loop
+                )
         
         except Exception as exc:
             logger.error(f"[entity_events] Failed to schedule emission {entity_type} id={entity_id}: {exc}")
@@ -116,6 +124,8 @@ async def _emit_in_new_session(entity_class: type, entity_id: int, entity_type:
     IMPORTANT: 
     - Set emission flag to prevent recursive emissions (emission → new entity → emission loop).
     - Use semaphore to limit concurrent emissions and prevent pool exhaustion.
+    - Synchronous session, not an AsyncSession: its only write is the final commit of the
+      logs, and it never holds the SQLite write lock across an await (see app.db_async).
     """
     from app.db import engine
     from sqlmodel import Session as SQLModelSession
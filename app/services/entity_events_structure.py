@@ -3,13 +3,17 @@
 This registers SQLAlchemy event listeners to detect insert/update/delete on
 structure models and emit structure notifications (FHIR Location and HL7 MFN)
 after transaction commit, for all sources (UI, HL7 importers, scripts).
+Committed changes are handed to `structure_emitter`, which coalesces them over
+a short debounce window and emits one FHIR Bundle / one MFN per endpoint.
+
+It also evicts rendered FHIR Location resources from `location_cache` when a
+structure entity is written (and again on commit/rollback). These cache
+listeners are registered at import, independently of the emission listeners.
 """
 
 from __future__ import annotations
 
-import asyncio
 import logging
-import threading
 from typing import Any, Dict, Set, Tuple
 
 from sqlalchemy import event
@@ -25,7 +29,8 @@ from app.models_structure import (
     Lit,
 )
 from app.models_structure_fhir import EntiteJuridique
-from app.services.structure_emit import emit_structure_change, emit_structure_delete
+from app.services.fhir_structure import location_cache
+from app.services.structure_emission_coalescer import structure_emitter
 
 logger = logging.getLogger(__name__)
 
@@ -33,11 +38,12 @@ logger = logging.getLogger(__name__)
 # Format: (model_name, entity_id, op, frozen_metadata)
 _pending: Dict[int, Set[Tuple[str, int, str, tuple]]] = {}
 
-# Re-entrancy guard for emissions
-_emitting_flag = threading.local()
+# session.info key: (model_name, entity_id) written in the current transaction
+_CACHE_TOUCHED_KEY = "structure_location_cache_touched"
 
-# Limit concurrency of background emissions
-_sem = asyncio.Semaphore(5)
+# session.info key: set by bulk writers (e.g. structure cloning) to skip emissions
+# for the transaction; the structure change journal still records the writes
+SUPPRESS_EMISSION_KEY = "structure_emission_suppressed"
 
 
 def _sess_id(session: Session) -> int:
@@ -45,9 +51,6 @@ def _sess_id(session: Session) -> int:
 
 
 def _schedule(session: Session, model_name: str, entity_id: int, op: str, metadata: Dict[str, Any] = None) -> None:
-    if getattr(_emitting_flag, "active", False):
-        logger.debug("[structure_events] Skip during emission: %s id=%s op=%s", model_name, entity_id, op)
-        return
     sid = _sess_id(session)
     if sid not in _pending:
         _pending[sid] = set()
@@ -64,65 +67,21 @@ def _after_commit(session: Session):
     items = _pending.pop(sid, None)
     if not items:
         return
-    logger.info("[structure_events] Processing %d structure emission(s)", len(items))
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        # No loop available, skip (e.g., scripts without async loop)
-        logger.warning("[structure_events] No event loop; skipping emissions")
+    if session.info.get(SUPPRESS_EMISSION_KEY):
+        logger.info("[structure_events] Emission suppressed for %d structure change(s)", len(items))
         return
-    for model_name, entity_id, op, frozen_metadata in items:
-        # Convert frozen metadata back to dict
-        metadata = dict(frozen_metadata) if frozen_metadata else {}
-        loop.create_task(_emit_background(model_name, entity_id, op, metadata))
-
-
-async def _emit_background(model_name: str, entity_id: int, op: str, metadata: Dict[str, Any]):
-    from app.db import engine
-    from sqlmodel import Session as SQLModelSession
-    from app.models_structure import (
-        EntiteGeographique,
-        Pole,
-        Service,
-        UniteFonctionnelle,
-        UniteHebergement,
-        Chambre,
-        Lit,
+    logger.info("[structure_events] Queueing %d structure emission(s)", len(items))
+    # Order within the commit: inserts before updates before deletes of the same entity
+    order = {"insert": 0, "update": 1, "delete": 2}
+    structure_emitter.add_many(
+        (model_name, entity_id, op, dict(frozen_metadata))
+        for model_name, entity_id, op, frozen_metadata in sorted(items, key=lambda item: order.get(item[2], 1))
     )
-    from app.models_structure_fhir import EntiteJuridique
-
-    model_map = {
-        "EntiteJuridique": EntiteJuridique,
-        "EntiteGeographique": EntiteGeographique,
-        "Pole": Pole,
-        "Service": Service,
-        "UniteFonctionnelle": UniteFonctionnelle,
-        "UniteHebergement": UniteHebergement,
-        "Chambre": Chambre,
-        "Lit": Lit,
-    }
-
-    model = model_map.get(model_name)
-    if not model:
-        return
 
-    async with _sem:
-        _emitting_flag.active = True
-        try:
-            with SQLModelSession(engine) as s:
-                if op == "delete":
-                    # Entity is gone; emit delete using id and metadata
-                    await emit_structure_delete(entity_id, s, entity_type=model_name, **metadata)
-                else:
-                    entity = s.get(model, entity_id)
-                    if not entity:
-                        logger.warning("[structure_events] %s id=%s not found for op=%s", model_name, entity_id, op)
-                        return
-                    await emit_structure_change(entity, s, operation=op)
-        except Exception as exc:
-            logger.error("[structure_events] Emission failed for %s id=%s op=%s: %s", model_name, entity_id, op, exc, exc_info=True)
-        finally:
-            _emitting_flag.active = False
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    _pending.pop(_sess_id(session), None)
 
 
 def _after_insert(mapper, connection, target):
@@ -145,13 +104,38 @@ def _after_delete(mapper, connection, target):
         return
     # id is still available on target in after_delete
     # For EntiteJuridique, capture finess_ej for delete emission
+    # For other models, capture the identifier for MFN delta deletions (MDL)
     metadata = {}
-    from app.models_structure_fhir import EntiteJuridique
     if isinstance(target, EntiteJuridique):
         metadata["finess_ej"] = target.finess_ej
+    else:
+        metadata["identifier"] = target.identifier
     _schedule(session, type(target).__name__, target.id, "delete", metadata)
 
 
+def _invalidate_cached_location(mapper, connection, target):
+    model_name = type(target).__name__
+    location_cache.invalidate(model_name, target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault(_CACHE_TOUCHED_KEY, set()).add((model_name, target.id))
+
+
+def _evict_touched(session: Session) -> None:
+    # A resource rendered inside the transaction may carry a version that a
+    # rollback discards (and a later write reuses): evict again at the end.
+    for model_name, entity_id in session.info.pop(_CACHE_TOUCHED_KEY, ()):
+        location_cache.invalidate(model_name, entity_id)
+
+
+event.listen(Session, "after_commit", _evict_touched)
+event.listen(Session, "after_rollback", _evict_touched)
+for _model in (EntiteJuridique, EntiteGeographique, Pole, Service, UniteFonctionnelle, UniteHebergement, Chambre, Lit):
+    event.listen(_model, "after_insert", _invalidate_cached_location)
+    event.listen(_model, "after_update", _invalidate_cached_location)
+    event.listen(_model, "after_delete", _invalidate_cached_location)
+
+
 def register_structure_entity_events() -> None:
     """Register SQLAlchemy listeners for structure models."""
     for model in (EntiteJuridique, EntiteGeographique, Pole, Service, UniteFonctionnelle, UniteHebergement, Chambre, Lit):
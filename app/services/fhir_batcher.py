@@ -0,0 +1,200 @@
+"""
+Regroupement des émissions FHIR sortantes en Bundles `batch` / `transaction`
+
+Contenu
+- `FHIRBatcher.submit(url, entries, **options)` : met en attente les entrées d'une émission
+  (une « unité » = les entrées d'une entité, journalisée par un MessageLog) et attend le
+  résultat. Les unités d'une même cible (URL, authentification, délai, TLS) sont envoyées
+  ensemble dans un Bundle dès que `max_entries` est atteint ou après `max_latency`.
+- `FHIRBatchResult` : réponse HTTP du Bundle et entrées de réponse propres à l'unité
+  (`ok`, `ack_payload()` pour le MessageLog de l'unité).
+- `resource_entries(payload)` : entrées de Bundle d'une ressource ou d'un Bundle.
+- `fhir_batcher` : instance globale.
+
+Notes
+- Une unité n'est jamais découpée entre deux Bundles (une unité plus grande que
+  `max_entries` part seule).
+- Type de Bundle : `batch` par défaut (entrées indépendantes, une erreur n'annule pas les
+  autres unités) ou `transaction` (tout ou rien).
+  Réglages : FHIR_BATCH_MAX_ENTRIES / FHIR_BATCH_MAX_LATENCY_MS / FHIR_BATCH_BUNDLE_TYPE.
+- Les réponses sont associées aux unités par position (ordre des entrées du Bundle).
+- Aucun accès base : les appelants écrivent eux-mêmes leurs MessageLog dans leur session.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.fhir_transport import post_fhir_bundle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("FHIR_BATCH_MAX_ENTRIES", "100"))
+DEFAULT_MAX_LATENCY = float(os.getenv("FHIR_BATCH_MAX_LATENCY_MS", "20")) / 1000
+DEFAULT_BUNDLE_TYPE = os.getenv("FHIR_BATCH_BUNDLE_TYPE", "batch")
+
+
+@dataclass
+class FHIRBatchResult:
+    """Résultat d'une unité : statut HTTP du Bundle et entrées de réponse de l'unité."""
+
+    status_code: Optional[int]
+    entries: List[Dict[str, Any]] = field(default_factory=list)
+    response: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    bundle_type: str = DEFAULT_BUNDLE_TYPE
+
+    @property
+    def ok(self) -> bool:
+        if self.error or self.status_code is None or not 200 <= self.status_code < 300:
+            return False
+        return all(
+            str((entry.get("response") or {}).get("status", "200")).strip().startswith("2")
+            for entry in self.entries
+        )
+
+    def ack_payload(self) -> str:
+        if self.error:
+            return self.error
+        if not self.entries:
+            return json.dumps(self.response or {}, ensure_ascii=False, default=str)
+        return json.dumps(
+            {"resourceType": "Bundle", "type": f"{self.bundle_type}-response", "entry": self.entries},
+            ensure_ascii=False,
+            default=str,
+        )
+
+
+def _resource_request(resource: Dict[str, Any]) -> Dict[str, str]:
+    resource_type = resource.get("resourceType")
+    if resource.get("id"):
+        return {"method": "PUT", "url": f"{resource_type}/{resource['id']}"}
+    return {"method": "POST", "url": resource_type}
+
+
+def resource_entries(payload: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Entrées de Bundle d'un payload : entrées d'un Bundle, ou PUT/POST de la ressource.
+
+    Les entrées sans `request` (Bundle `collection`) reçoivent le PUT/POST de leur
+    ressource : un Bundle `batch` / `transaction` l'exige pour chaque entrée.
+    """
+    if not payload:
+        return []
+    if payload.get("resourceType") != "Bundle":
+        return [{"resource": payload, "request": _resource_request(payload)}]
+    entries = []
+    for entry in payload.get("entry") or []:
+        if not entry.get("request") and isinstance(entry.get("resource"), dict):
+            entry = {**entry, "request": _resource_request(entry["resource"])}
+        entries.append(entry)
+    return entries
+
+
+@dataclass
+class _Pending:
+    units: List[Tuple[List[Dict[str, Any]], asyncio.Future]] = field(default_factory=list)
+    count: int = 0
+    handle: Optional[asyncio.TimerHandle] = None
+
+
+class FHIRBatcher:
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_latency: float = DEFAULT_MAX_LATENCY,
+        bundle_type: str = DEFAULT_BUNDLE_TYPE,
+    ):
+        if bundle_type not in ("batch", "transaction"):
+            raise ValueError(f"Type de Bundle non supporté: {bundle_type}")
+        self.max_entries = max(1, max_entries)
+        self.max_latency = max(0.0, max_latency)
+        self.bundle_type = bundle_type
+        # Files d'attente par boucle asyncio (les futures y sont liées)
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, _Pending]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._tasks: set = set()
+        self.metrics: Dict[str, int] = {"units": 0, "entries": 0, "bundles": 0, "errors": 0}
+
+    async def submit(self, url: str, entries: List[Dict[str, Any]], **options: Any) -> FHIRBatchResult:
+        """Met en attente une unité et retourne son résultat une fois le Bundle envoyé."""
+        loop = asyncio.get_running_loop()
+        key = (url, tuple(sorted(options.items())))
+        pending = self._loops.setdefault(loop, {}).setdefault(key, _Pending())
+        future: asyncio.Future = loop.create_future()
+        pending.units.append((list(entries), future))
+        pending.count += len(entries)
+        self.metrics["units"] += 1
+        if pending.count >= self.max_entries:
+            self._start_flush(loop, key)
+        elif pending.handle is None:
+            pending.handle = loop.call_later(self.max_latency, self._start_flush, loop, key)
+        return await future
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop, key: tuple) -> None:
+        pending = self._loops.get(loop, {}).pop(key, None)
+        if pending is None:
+            return
+        if pending.handle is not None:
+            pending.handle.cancel()
+        task = loop.create_task(self._send(key, pending.units))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _bundles(self, units: List[Tuple[List[Dict], asyncio.Future]]) -> List[List[Tuple[List[Dict], asyncio.Future]]]:
+        bundles: List[List[Tuple[List[Dict], asyncio.Future]]] = [[]]
+        size = 0
+        for unit in units:
+            if bundles[-1] and size + len(unit[0]) > self.max_entries:
+                bundles.append([])
+                size = 0
+            bundles[-1].append(unit)
+            size += len(unit[0])
+        return bundles
+
+    async def _send(self, key: tuple, units: List[Tuple[List[Dict], asyncio.Future]]) -> None:
+        await asyncio.gather(*(self._send_bundle(key, group) for group in self._bundles(units)))
+
+    async def _send_bundle(self, key: tuple, units: List[Tuple[List[Dict], asyncio.Future]]) -> None:
+        url, options = key[0], dict(key[1])
+        entries = [entry for unit_entries, _ in units for entry in unit_entries]
+        bundle = {"resourceType": "Bundle", "type": self.bundle_type, "entry": entries}
+        self.metrics["bundles"] += 1
+        self.metrics["entries"] += len(entries)
+        try:
+            status_code, response = await post_fhir_bundle(url, bundle, **options)
+        except Exception as exc:  # noqa: BLE001 - remonté dans le résultat de chaque unité
+            self.metrics["errors"] += 1
+            logger.warning(f"[fhir_batcher] Échec d'envoi de {len(entries)} entrées vers {url}: {exc}")
+            for _, future in units:
+                if not future.done():
+                    future.set_result(FHIRBatchResult(None, error=str(exc), bundle_type=self.bundle_type))
+            return
+
+        response_entries = response.get("entry") if isinstance(response, dict) else None
+        by_position = isinstance(response_entries, list) and len(response_entries) == len(entries)
+        offset = 0
+        for unit_entries, future in units:
+            unit_response = response_entries[offset:offset + len(unit_entries)] if by_position else []
+            offset += len(unit_entries)
+            if not future.done():
+                future.set_result(FHIRBatchResult(
+                    status_code, unit_response, response=response, bundle_type=self.bundle_type,
+                ))
+
+    async def drain(self) -> None:
+        """Envoie immédiatement les unités en attente de la boucle courante."""
+        loop = asyncio.get_running_loop()
+        for key in list(self._loops.get(loop, {})):
+            self._start_flush(loop, key)
+        tasks = [task for task in self._tasks if task.get_loop() is loop]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+fhir_batcher = FHIRBatcher()
@@ -11,18 +11,24 @@ Fonctionnalités principales :
 - Gestion des relations parent-child via Location.partOf
 - Support des extensions FHIR personnalisées (responsables, typologie, dates d'ouverture/fermeture)
 - Mapping des identifiants FINESS pour les entités géographiques
+- Sérialisation par lot (`entities_to_fhir_locations`) avec activités UF préchargées et
+  cache des ressources rendues (`location_cache`, clé modèle/id/version du registre unifié)
 
 Point d'entrée pour l'API : via routers/fhir_structure.py (POST /fhir/Location, GET /fhir/Location/{id})
 """
 import logging
+import threading
+from collections import OrderedDict
 from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import inspect as sa_inspect, tuple_
 from sqlmodel import Session, select
 from datetime import datetime
 from app.models_structure import (
     EntiteGeographique, Pole, Service, UniteFonctionnelle,
-    UniteHebergement, Chambre, Lit,
+    UniteHebergement, Chambre, Lit, LocationIndex, UFActivity, UniteFonctionnelleActivityLink,
     LocationStatus, LocationMode, LocationPhysicalType, LocationServiceType
 )
+from app.services.location_index import load_indexed_entities
 
 logger = logging.getLogger(__name__)
 
@@ -362,29 +368,10 @@ def fhir_location_to_entity(location: Dict[Any, Any], session: Session) -> tuple
 
     return (None, parent_ref)
 
-def entity_to_fhir_location(entity: Any, session: Session) -> Dict[Any, Any]:
-    """Convertit une entité de structure en ressource FHIR Location.
-    
-    Génère une Location conforme au profil fr-location avec :
-    - Attributs communs : id, name, status, mode, identifier (OID 1.2.250.1.71.4.2.2)
-    - Extensions de dates : opening-date, activation-date, closing-date, deactivation-date
-    - Spécificités par type :
-      - EntiteGeographique : FINESS identifier, adresse, position GPS, manager extension
-      - Pole : physicalType=area
-      - Service : type avec fr-service-type, responsable extension
-      - UniteFonctionnelle : physicalType=area + fr-uf-type extension
-      - UniteHebergement : physicalType=wi + floor/wing extensions
-      - Chambre : physicalType=ro + room-type extension
-      - Lit : physicalType=bd + operationalStatus
-    - partOf : référence l'entité parente (EG pour Pole, Pole pour Service, etc.)
-    
-    Args:
-        entity: Instance de EntiteGeographique, Pole, Service, UniteFonctionnelle, 
-                UniteHebergement, Chambre ou Lit
-        session: Session SQLModel pour requêtes de parentalité
+def _render_location(entity: Any, activity_codes: Optional[List[str]] = None) -> Dict[Any, Any]:
+    """Construit la ressource FHIR Location d'une entité (sans accès base).
     
-    Returns:
-        Dictionnaire représentant une ressource FHIR Location
+    `activity_codes` : codes d'activité préchargés d'une UF (None : relation `activities`).
     """
     
     # Base commune
@@ -546,9 +533,10 @@ def entity_to_fhir_location(entity: Any, session: Session) -> Dict[Any, Any]:
         # Support multi-activité: répéter l'extension fr-uf-type pour chaque activité
         uf_extensions = []
         try:
-            # Relation many-to-many (si présente)
-            for act in getattr(entity, "activities", []) or []:
-                code = getattr(act, "code", None)
+            # Relation many-to-many (préchargée par le sérialiseur par lot, sinon relation)
+            if activity_codes is None:
+                activity_codes = [getattr(act, "code", None) for act in getattr(entity, "activities", []) or []]
+            for code in activity_codes:
                 if code:
                     uf_extensions.append({
                         "url": "http://interop-sante.fr/fhir/StructureDefinition/fr-uf-type",
@@ -616,6 +604,203 @@ def entity_to_fhir_location(entity: Any, session: Session) -> Dict[Any, Any]:
             
     return location
 
+class LocationResourceCache:
+    """Cache LRU des ressources Location rendues, clé (modèle, id, version).
+    
+    La version provient du registre unifié (`LocationIndex.version`, incrémentée à chaque
+    écriture) : une entrée obsolète n'est plus jamais servie. Les entrées d'une entité sont
+    de plus évincées par `entity_events_structure` à l'écriture, au commit et au rollback.
+    Les ressources servies sont partagées : les appelants ne doivent pas les modifier.
+    """
+
+    def __init__(self, max_size: int = 20000):
+        self.max_size = max_size
+        self._data: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+        self._versions: Dict[Tuple[str, int], set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, int, int]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            resource = self._data.get(key)
+            if resource is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return resource
+
+    def put(self, key: Tuple[str, int, int], resource: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data[key] = resource
+            self._data.move_to_end(key)
+            self._versions.setdefault(key[:2], set()).add(key[2])
+            while len(self._data) > self.max_size:
+                old_key, _ = self._data.popitem(last=False)
+                self._discard_version(old_key)
+
+    def _discard_version(self, key: Tuple[str, int, int]) -> None:
+        versions = self._versions.get(key[:2])
+        if versions is not None:
+            versions.discard(key[2])
+            if not versions:
+                del self._versions[key[:2]]
+
+    def invalidate(self, model_name: str, entity_id: int) -> None:
+        with self._lock:
+            for version in self._versions.pop((model_name, entity_id), ()):
+                self._data.pop((model_name, entity_id, version), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+location_cache = LocationResourceCache()
+
+
+def _load_uf_activity_codes(session: Session, uf_ids: List[int]) -> Dict[int, List[str]]:
+    """Codes d'activité de plusieurs UF en une requête (table de liaison N-N)."""
+    codes: Dict[int, List[str]] = {uf_id: [] for uf_id in uf_ids}
+    if not uf_ids:
+        return codes
+    rows = session.exec(
+        select(UniteFonctionnelleActivityLink.uf_id, UFActivity.code)
+        .join(UFActivity, UFActivity.id == UniteFonctionnelleActivityLink.activity_id)
+        .where(UniteFonctionnelleActivityLink.uf_id.in_(uf_ids))
+        .order_by(UniteFonctionnelleActivityLink.uf_id, UFActivity.id)
+    ).all()
+    for uf_id, code in rows:
+        codes[uf_id].append(code)
+    return codes
+
+
+def load_location_versions(session: Session, entities: List[Any]) -> Dict[Tuple[str, int], LocationIndex]:
+    """Lignes du registre unifié (version, date de mise à jour) des entités, en une requête."""
+    keys = {(type(e).__name__, e.id) for e in entities if e.id is not None}
+    if not keys:
+        return {}
+    rows = session.exec(
+        select(LocationIndex).where(tuple_(LocationIndex.model, LocationIndex.entity_id).in_(list(keys)))
+    ).all()
+    return {(row.model, row.entity_id): row for row in rows}
+
+
+def entities_to_fhir_locations(
+    entities: List[Any],
+    session: Session,
+    index_rows: Optional[Dict[Tuple[str, int], LocationIndex]] = None,
+) -> List[Dict[Any, Any]]:
+    """Sérialiseur par lot : convertit des entités de structure en ressources FHIR Location.
+    
+    - Version et date de mise à jour lues dans le registre unifié (une requête, ou
+      `index_rows` fourni par l'appelant) → meta.versionId / meta.lastUpdated.
+    - Ressources servies par `location_cache` (clé modèle, id, version) ; seules les
+      entités absentes du cache sont rendues.
+    - Activités des UF à rendre préchargées en une requête.
+    Les entités modifiées non encore écrites (ou hors registre) sont rendues sans cache.
+    
+    Args:
+        entities: Entités de structure (tous types confondus)
+        session: Session SQLModel
+        index_rows: Lignes LocationIndex déjà chargées, indexées par (modèle, id)
+    
+    Returns:
+        Ressources FHIR Location, dans l'ordre des entités
+    """
+    if index_rows is None:
+        index_rows = load_location_versions(session, entities)
+
+    out: List[Optional[Dict[Any, Any]]] = [None] * len(entities)
+    to_render: List[Tuple[int, Any, Optional[Tuple[str, int, int]], Optional[LocationIndex]]] = []
+    for pos, entity in enumerate(entities):
+        model_name = type(entity).__name__
+        row = index_rows.get((model_name, entity.id))
+        key = None
+        if row is not None and not sa_inspect(entity).modified:
+            key = (model_name, entity.id, row.version)
+            cached = location_cache.get(key)
+            if cached is not None:
+                out[pos] = cached
+                continue
+        to_render.append((pos, entity, key, row))
+
+    uf_ids = [e.id for _, e, _, _ in to_render if isinstance(e, UniteFonctionnelle) and e.id is not None]
+    activity_codes = _load_uf_activity_codes(session, uf_ids)
+
+    for pos, entity, key, row in to_render:
+        resource = _render_location(entity, activity_codes.get(entity.id) if isinstance(entity, UniteFonctionnelle) else None)
+        if row is not None:
+            resource["meta"]["versionId"] = str(row.version)
+            if row.last_updated:
+                resource["meta"]["lastUpdated"] = row.last_updated.isoformat() + "Z"
+        if key is not None:
+            location_cache.put(key, resource)
+        out[pos] = resource
+    return out
+
+
+def index_rows_to_fhir_locations(session: Session, rows: List[LocationIndex]) -> List[Dict[Any, Any]]:
+    """Ressources Location d'une page du registre unifié.
+    
+    Les ressources en cache pour (modèle, id, version) sont servies sans charger l'entité ;
+    les autres entités sont chargées (une requête par modèle) puis rendues par lot.
+    """
+    out: List[Optional[Dict[Any, Any]]] = []
+    missing: List[LocationIndex] = []
+    for row in rows:
+        cached = location_cache.get((row.model, row.entity_id, row.version))
+        out.append(cached)
+        if cached is None:
+            missing.append(row)
+    if missing:
+        entities = load_indexed_entities(session, missing)
+        rendered = entities_to_fhir_locations(
+            entities, session, index_rows={(r.model, r.entity_id): r for r in missing}
+        )
+        by_key = {(type(e).__name__, e.id): r for e, r in zip(entities, rendered)}
+        out = [
+            res if res is not None else by_key.get((row.model, row.entity_id))
+            for res, row in zip(out, rows)
+        ]
+    return [res for res in out if res is not None]
+
+
+def entity_to_fhir_location(entity: Any, session: Session) -> Dict[Any, Any]:
+    """Convertit une entité de structure en ressource FHIR Location.
+    
+    Génère une Location conforme au profil fr-location avec :
+    - Attributs communs : id, name, status, mode, identifier (OID 1.2.250.1.71.4.2.2)
+    - Extensions de dates : opening-date, activation-date, closing-date, deactivation-date
+    - Spécificités par type :
+      - EntiteGeographique : FINESS identifier, adresse, position GPS, manager extension
+      - Pole : physicalType=area
+      - Service : type avec fr-service-type, responsable extension
+      - UniteFonctionnelle : physicalType=area + fr-uf-type extension
+      - UniteHebergement : physicalType=wi + floor/wing extensions
+      - Chambre : physicalType=ro + room-type extension
+      - Lit : physicalType=bd + operationalStatus
+    - meta.versionId / meta.lastUpdated : version du registre unifié (LocationIndex)
+    
+    Passe par le sérialiseur par lot (`entities_to_fhir_locations`) et son cache.
+    
+    Args:
+        entity: Instance de EntiteGeographique, Pole, Service, UniteFonctionnelle, 
+                UniteHebergement, Chambre ou Lit
+        session: Session SQLModel (version et activités UF)
+    
+    Returns:
+        Dictionnaire représentant une ressource FHIR Location
+    """
+    return entities_to_fhir_locations([entity], session)[0]
+
+
 def process_fhir_location(location: Dict[Any, Any], session: Session) -> Optional[Any]:
     """Traite une ressource FHIR Location reçue : conversion + persistance + gestion des relations parent.
     
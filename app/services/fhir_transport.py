@@ -1,17 +1,199 @@
 """Transport FHIR sortant (HTTP POST) et validation de transitions.
 
+Pool de clients
+- `fhir_client_pool` garde un `httpx.AsyncClient` par serveur (schéma/hôte/port, TLS)
+  et par boucle asyncio : connexions keep-alive réutilisées d'une émission à l'autre
+  (pas de DNS/TCP/TLS à chaque envoi).
+- Concurrence bornée par serveur (FHIR_MAX_CONNECTIONS_PER_ENDPOINT, 10 par défaut).
+- HTTP/2 optionnel (FHIR_HTTP2=1, nécessite le paquet `h2` : `pip install httpx[http2]`).
+- Réessais sur 429/5xx et erreurs de connexion (FHIR_RETRY_ATTEMPTS, 3 par défaut),
+  backoff exponentiel avec jitter complet, `Retry-After` respecté (plafonné).
+- Délai et vérification TLS par appel : `FHIRConfig.timeout` / `FHIRConfig.verify_ssl`
+  via `fhir_config_options` / `fhir_endpoint_options`.
+
 Notes SSL
 - En environnement d'entreprise avec proxy/PKI, passer `verify` au client
     httpx (ex: `verify='/chemin/ca.pem'`) ou définir `SSL_CERT_FILE` /
     `REQUESTS_CA_BUNDLE` dans l'environnement.
 """
 
+import asyncio
+import importlib.util
+import logging
+import os
+import random
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
 import httpx
-from typing import Optional, Tuple
+
 from app.state_transitions import is_valid_transition
 
-async def post_fhir_bundle(base_url: str, resource_json: dict, auth_kind: str = "none", auth_token: str | None = None) -> Tuple[int, dict]:
-    """POST d'une Resource/Bundle FHIR vers `base_url`.
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 15.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Erreurs survenues avant l'envoi de la requête : réessai sans risque de doublon
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in {"1", "true", "yes", "on"}
+
+
+class FHIRClientPool:
+    """Clients HTTP persistants par serveur FHIR, avec limite de concurrence et réessais."""
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        http2: Optional[bool] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+    ):
+        self.max_connections = max_connections or int(os.getenv("FHIR_MAX_CONNECTIONS_PER_ENDPOINT", "10"))
+        self.keepalive_expiry = keepalive_expiry if keepalive_expiry is not None else float(
+            os.getenv("FHIR_KEEPALIVE_SECONDS", "30")
+        )
+        self.http2 = _env_flag("FHIR_HTTP2") if http2 is None else http2
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("[fhir_transport] FHIR_HTTP2 demandé mais paquet h2 absent : HTTP/1.1")
+            self.http2 = False
+        self.retries = retries if retries is not None else int(os.getenv("FHIR_RETRY_ATTEMPTS", "3"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("FHIR_RETRY_BACKOFF_SECONDS", "0.2"))
+        self.backoff_max = backoff_max if backoff_max is not None else float(
+            os.getenv("FHIR_RETRY_BACKOFF_MAX_SECONDS", "5")
+        )
+        # Un client httpx est lié à la boucle qui a ouvert ses connexions
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Dict]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, int] = {"clients": 0, "requests": 0, "retries": 0}
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parsed = httpx.URL(url)
+        return f"{parsed.scheme}://{parsed.host}:{parsed.port or ''}"
+
+    def _state(self) -> Dict[str, Dict]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.get(loop)
+            if state is None:
+                state = self._loops[loop] = {"clients": {}, "limits": {}}
+            return state
+
+    def client(self, url: str, verify: bool = True) -> httpx.AsyncClient:
+        """Client persistant du serveur de `url` pour la boucle courante."""
+        clients = self._state()["clients"]
+        key = f"{self._origin(url)}|{int(bool(verify))}"
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                verify=verify,
+                http2=self.http2,
+                timeout=DEFAULT_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            clients[key] = client
+            self.metrics["clients"] += 1
+        return client
+
+    def _limit(self, url: str) -> asyncio.Semaphore:
+        limits = self._state()["limits"]
+        origin = self._origin(url)
+        if origin not in limits:
+            limits[origin] = asyncio.Semaphore(self.max_connections)
+        return limits[origin]
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    async def post(
+        self,
+        url: str,
+        payload: Any,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        verify: bool = True,
+    ) -> httpx.Response:
+        """POST JSON avec réessais ; retourne la dernière réponse (ou lève la dernière erreur)."""
+        client = self.client(url, verify=verify)
+        attempt = 0
+        while True:
+            last = attempt >= self.retries
+            async with self._limit(url):
+                self.metrics["requests"] += 1
+                try:
+                    response = await client.post(url, headers=headers, json=payload, timeout=timeout or DEFAULT_TIMEOUT)
+                except _RETRYABLE_ERRORS:
+                    if last:
+                        raise
+                    delay = self._delay(attempt)
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        return response
+                    delay = self._delay(attempt, response)
+            self.metrics["retries"] += 1
+            logger.info(f"[fhir_transport] Réessai {attempt + 1}/{self.retries} vers {url} dans {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        """Ferme les clients ouverts dans la boucle courante."""
+        try:
+            state = self._state()
+        except RuntimeError:
+            return
+        clients = list(state["clients"].values())
+        state["clients"].clear()
+        for client in clients:
+            await client.aclose()
+
+
+fhir_client_pool = FHIRClientPool()
+
+
+def fhir_config_options(config) -> Dict[str, Any]:
+    """Options d'envoi (délai, TLS) d'un FHIRConfig pour `post_fhir_bundle`."""
+    return {"timeout": config.timeout or DEFAULT_TIMEOUT, "verify_ssl": bool(config.verify_ssl)}
+
+
+def fhir_endpoint_options(endpoint) -> Dict[str, Any]:
+    """Options d'envoi d'un SystemEndpoint FHIR : authentification + premier FHIRConfig actif."""
+    options: Dict[str, Any] = {
+        "auth_kind": getattr(endpoint, "auth_kind", None) or "none",
+        "auth_token": getattr(endpoint, "auth_token", None),
+    }
+    for cfg in getattr(endpoint, "fhir_configs", None) or []:
+        if getattr(cfg, "is_enabled", False):
+            options.update(fhir_config_options(cfg))
+            break
+    return options
+
+
+async def post_fhir_bundle(
+    base_url: str,
+    resource_json: dict,
+    auth_kind: str = "none",
+    auth_token: str | None = None,
+    *,
+    timeout: Optional[float] = None,
+    verify_ssl: bool = True,
+) -> Tuple[int, dict]:
+    """POST d'une Resource/Bundle FHIR vers `base_url` (via le pool partagé).
 
     Headers
     - Content-Type: application/fhir+json
@@ -20,15 +202,14 @@ async def post_fhir_bundle(base_url: str, resource_json: dict, auth_kind: str =
     headers = {"Content-Type": "application/fhir+json"}
     if auth_kind == "bearer" and auth_token:
         headers["Authorization"] = f"Bearer {auth_token}"
-    async with httpx.AsyncClient(timeout=15) as client:
-        # pour le POC, POST vers base_url (Bundle ou Resource)
-        r = await client.post(base_url, headers=headers, json=resource_json)
-        out_json = {}
-        try:
-            out_json = r.json()
-        except Exception:
-            pass
-        return r.status_code, out_json
+    # pour le POC, POST vers base_url (Bundle ou Resource)
+    r = await fhir_client_pool.post(base_url, resource_json, headers=headers, timeout=timeout, verify=verify_ssl)
+    out_json = {}
+    try:
+        out_json = r.json()
+    except Exception:
+        pass
+    return r.status_code, out_json
 
 def validate_fhir_transition(current_state: Optional[str], event_code: str) -> bool:
     """Valide les transitions d'état pour les mouvements FHIR."""
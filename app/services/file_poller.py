@@ -3,20 +3,67 @@ File polling service - scans file-based endpoints and processes messages.
 
 Automatically detects message type (MFN structure vs ADT PAM) and routes
 to the appropriate handler.
+
+Inbox files are either scanned periodically (`scan_all_file_endpoints`) or handed
+over as they arrive by the inotify watcher (`process_files`, see file_watcher).
+
+Concurrency: endpoints are scanned concurrently and, within an inbox, files are
+claimed with leases (see FileLease) and grouped by patient (PID-3, `ordering_key`):
+each patient's files are processed in order, different patients in parallel
+(FILE_WORKERS chains at a time, each with its own session). Delivery is
+at-least-once: a file whose worker died before archiving is processed again once
+its lease expires.
+
+Database writes: each message is processed in a worker thread (`to_thread`, see
+app.db_async), in transactions that end before the thread returns. A write waiting
+for the SQLite lock then waits in that thread, never on the event loop, and the loop
+never waits for a transaction that needs it to finish.
+
+HL7 batch files (FHS/BHS...BTS/FTS) are streamed message by message with checkpoints
+(a restart resumes mid-file) and acknowledged with a batch ACK file (`<name>.ack`,
+written to the outbox, else the archive or error directory).
 """
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from pathlib import Path
 from sqlmodel import Session, select
 import asyncio
+import os
 
+from app.db_async import run_to_completion, to_thread
 from app.models_shared import SystemEndpoint, MessageLog
 from app.models_structure_fhir import GHTContext
-from app.adapters.filesystem_transport import FileSystemReader
+from app.adapters.filesystem_transport import IGNORED_SUFFIXES, FileLease, FileSystemReader
 from app.utils.hl7_detector import HL7Detector
+from app.services.endpoint_cache import endpoint_config
+from app.services.hl7_batch import (
+    CHECKPOINT_EVERY, HL7BatchReader, build_batch_ack, clear_checkpoint, is_batch_file, load_checkpoint,
+    save_checkpoint,
+)
+from app.services.mllp import build_ack
 from app.services.mfn_importer import import_mfn
 from app.services.transport_inbound import on_message_inbound_async
 
 
+FILE_WORKERS = int(os.getenv("FILE_WORKERS", "4"))
+CLAIM_BATCH_SIZE = int(os.getenv("FILE_CLAIM_BATCH_SIZE", "32"))
+
+
+def ordering_key(content: str) -> str:
+    """
+    Ordering key of a message: first PID-3 identifier (ID^^^authority) for patient
+    messages; a single shared key otherwise (structure messages stay sequential).
+    """
+    for segment in content.replace('\r\n', '\r').replace('\n', '\r').split('\r'):
+        if segment.startswith('PID|'):
+            fields = segment.split('|')
+            if len(fields) > 3 and fields[3]:
+                components = fields[3].split('~')[0].split('^')
+                authority = components[3] if len(components) > 3 else ''
+                return f"PID:{components[0]}^^^{authority}"
+            break
+    return ''
+
+
 class FilePollerService:
     """
     Service to poll file-based endpoints and process messages.
@@ -28,30 +75,31 @@ class FilePollerService:
     
     def __init__(self, session: Session):
         self.session = session
+        self._slots = asyncio.Semaphore(max(1, FILE_WORKERS))
         self.stats = {
             'endpoints_scanned': 0,
             'files_processed': 0,
             'mfn_messages': 0,
             'adt_messages': 0,
             'unknown_messages': 0,
+            'batch_messages': 0,
             'errors': []
         }
     
-    async def scan_all_file_endpoints(self) -> Dict[str, Any]:
+    async def scan_all_file_endpoints(self, exclude_ids: Optional[Set[int]] = None) -> Dict[str, Any]:
         """
-        Scan all enabled FILE endpoints and process pending messages.
+        Scan all enabled FILE endpoints (concurrently) and process pending messages.
+        
+        Args:
+            exclude_ids: Endpoints to skip (inboxes already handled by the file watcher)
         
         Returns:
             dict with processing statistics
         """
-        # Find all FILE endpoints that are enabled
-        stmt = select(SystemEndpoint).where(
-            SystemEndpoint.kind == "FILE",
-            SystemEndpoint.is_enabled == True
-        )
-        endpoints = self.session.exec(stmt).all()
+        # Find all FILE endpoints that are enabled (cached configuration snapshot)
+        endpoints = endpoint_config(self.session).by_kind("FILE")
         
-        for endpoint in endpoints:
+        async def scan(endpoint):
             try:
                 await self._scan_endpoint(endpoint)
                 self.stats['endpoints_scanned'] += 1
@@ -60,10 +108,27 @@ class FilePollerService:
                 self.stats['errors'].append(error_msg)
                 print(error_msg)
         
+        await asyncio.gather(*(
+            scan(endpoint) for endpoint in endpoints
+            if not (exclude_ids and endpoint.id in exclude_ids)
+        ))
+        
         return self.stats
     
-    async def _scan_endpoint(self, endpoint: SystemEndpoint):
-        """Scan a single file endpoint"""
+    async def process_files(self, endpoint: SystemEndpoint, files: List[Path]) -> Dict[str, Any]:
+        """
+        Process the given inbox files of an endpoint, in order, without listing the inbox.
+        Files already taken (or removed) in the meantime are skipped.
+        
+        Returns:
+            dict with processing statistics
+        """
+        await self._scan_endpoint(endpoint, files)
+        self.stats['endpoints_scanned'] += 1
+        return self.stats
+    
+    async def _scan_endpoint(self, endpoint: SystemEndpoint, files: Optional[List[Path]] = None):
+        """Scan a single file endpoint (or only the given files of its inbox)"""
         if not endpoint.inbox_path:
             return
         
@@ -80,85 +145,172 @@ class FilePollerService:
             error_path=endpoint.error_path
         )
         
-        # Process all pending files
-        async def process_message(content: str, file_path: Path) -> bool:
-            """Handler function for processing each message"""
-            try:
-                return await self._process_message(content, file_path, endpoint)
-            except Exception as e:
-                error_msg = f"Error processing {file_path.name}: {str(e)}"
-                self.stats['errors'].append(error_msg)
-                print(error_msg)
-                return False
-        
-        # Process files synchronously but handle async message processing
-        result = await self._process_all_files_async(reader, process_message)
+        result = await self._process_all_files_async(reader, endpoint, files)
         self.stats['files_processed'] += result['processed']
     
-    async def _process_all_files_async(self, reader: FileSystemReader, callback):
-        """Process all files with async callback support"""
+    async def _process_all_files_async(
+        self,
+        reader: FileSystemReader,
+        endpoint: SystemEndpoint,
+        files: Optional[List[Path]] = None
+    ) -> Dict[str, int]:
+        """
+        Process all files (or the given ones) of an inbox, CLAIM_BATCH_SIZE at a time:
+        claim each file with a lease, run one ordered chain per patient concurrently,
+        then archive the whole batch and release the leases.
+        """
         stats = {'processed': 0, 'failed': 0}
         
-        # Get all files (exclude .processing files)
-        files = sorted(reader.inbox_path.glob('*'))
+        if files is None:
+            files = reader.list_pending_files()
         if reader.extensions:
             files = [f for f in files if f.suffix.lower() in reader.extensions]
-        files = [f for f in files if f.is_file() and not f.name.endswith('.processing')]
+        files = [f for f in files if not f.name.endswith(IGNORED_SUFFIXES) and f.is_file()]
         
-        for file_path in files:
-            processing_path = None
+        for start in range(0, len(files), CLAIM_BATCH_SIZE):
+            outcomes: List[Tuple[FileLease, bool]] = []
+            chains: Dict[str, List[Tuple[FileLease, str]]] = {}
+            
+            async def run_chains():
+                for chain_outcomes in await asyncio.gather(*(
+                    self._process_chain(endpoint, chain) for chain in chains.values()
+                )):
+                    outcomes.extend(chain_outcomes)
+                chains.clear()
+            
+            for file_path in files[start:start + CLAIM_BATCH_SIZE]:
+                lease = reader.claim(file_path)
+                if not lease:
+                    continue
+                if is_batch_file(lease.path):
+                    # HL7 batch file: streamed in order, after the files listed before it
+                    await run_chains()
+                    outcomes.append((lease, await self._process_batch_file(reader, lease, endpoint)))
+                    continue
+                try:
+                    content = lease.path.read_text(encoding='utf-8')
+                except Exception as e:
+                    self.stats['errors'].append(f"Error reading {lease.path.name}: {str(e)}")
+                    outcomes.append((lease, False))
+                    continue
+                chains.setdefault(ordering_key(content), []).append((lease, content))
+            await run_chains()
+            
+            self._finish_batch(reader, outcomes)
+            succeeded = sum(1 for _, success in outcomes if success)
+            stats['processed'] += succeeded
+            stats['failed'] += len(outcomes) - succeeded
+        
+        return stats
+    
+    async def _process_chain(self, endpoint: SystemEndpoint, chain: List[Tuple[FileLease, str]]) -> List[Tuple[FileLease, bool]]:
+        """Process the files of one ordering key in order, with a dedicated session"""
+        outcomes = []
+        async with self._slots:
+            with Session(self.session.get_bind()) as session:
+                worker = FilePollerService(session)
+                worker.stats = self.stats
+                for lease, content in chain:
+                    try:
+                        success = await worker._process_message(content, lease.path, endpoint)
+                    except Exception as e:
+                        error_msg = f"Error processing {lease.path.name}: {str(e)}"
+                        self.stats['errors'].append(error_msg)
+                        print(error_msg)
+                        session.rollback()
+                        success = False
+                    outcomes.append((lease, success))
+        return outcomes
+    
+    async def _process_batch_file(self, reader: FileSystemReader, lease: FileLease, endpoint: SystemEndpoint) -> bool:
+        """
+        Stream the messages of an HL7 batch file (FHS/BHS...BTS/FTS) in order, resuming
+        from its checkpoint, then write the batch acknowledgement file.
+        
+        Returns:
+            True if every message was accepted
+        """
+        batch = HL7BatchReader(lease.path)
+        state = load_checkpoint(lease.path)
+        if state['offset']:
+            batch.read_envelope()
+        complete = True
+        with Session(self.session.get_bind()) as session:
+            worker = FilePollerService(session)
+            worker.stats = self.stats
+            try:
+                for message in batch.messages(state['offset']):
+                    try:
+                        success = await worker._process_message(message.text, lease.path, endpoint)
+                    except Exception as e:
+                        self.stats['errors'].append(f"Error processing {lease.path.name} @{message.start}: {str(e)}")
+                        session.rollback()
+                        success = False
+                    state['messages'] += 1
+                    if success:
+                        state['accepted'] += 1
+                    else:
+                        state['error_acks'].append(build_ack(message.text, ack_code="AE", text="Rejected in batch"))
+                    state['offset'] = message.end
+                    if state['messages'] % CHECKPOINT_EVERY == 0:
+                        save_checkpoint(lease.path, state)
+                        reader.renew(lease)
+            except Exception as e:
+                # Unreadable remainder (encoding...): acknowledge what was read, file goes to error
+                self.stats['errors'].append(f"Error reading batch {lease.path.name}: {str(e)}")
+                complete = False
+        
+        ack_dir = endpoint.outbox_path or endpoint.archive_path or endpoint.error_path
+        if ack_dir:
+            ack_path = Path(ack_dir) / f"{lease.path.name}.ack"
+            ack_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = ack_path.with_name(ack_path.name + '.tmp')
+            tmp_path.write_text(build_batch_ack(batch, state), encoding='utf-8')
+            tmp_path.replace(ack_path)
+        clear_checkpoint(lease.path)
+        self.stats['batch_messages'] += state['messages']
+        return complete and state['accepted'] == state['messages']
+    
+    def _finish_batch(self, reader: FileSystemReader, outcomes: List[Tuple[FileLease, bool]]):
+        """Move a batch of processed files to archive/error, then release their leases"""
+        if reader.archive_path and any(success for _, success in outcomes):
+            reader.archive_path.mkdir(parents=True, exist_ok=True)
+        if reader.error_path and not all(success for _, success in outcomes):
+            reader.error_path.mkdir(parents=True, exist_ok=True)
+        
+        for lease, success in outcomes:
+            file_path = lease.path
             try:
-                # Rename file to .processing to mark it as being processed
-                processing_path = file_path.with_suffix(file_path.suffix + '.processing')
-                file_path.rename(processing_path)
-                
-                # Read and process
-                content = processing_path.read_text(encoding='utf-8')
-                success = await callback(content, processing_path)
-                
                 if success:
-                    # Archive the file (remove .processing extension)
                     if reader.archive_path:
-                        reader.archive_path.mkdir(parents=True, exist_ok=True)
-                        archived_name = file_path.name  # Original name without .processing
-                        processing_path.rename(reader.archive_path / archived_name)
+                        file_path.replace(reader.archive_path / file_path.name)
                     else:
-                        processing_path.unlink()
-                    stats['processed'] += 1
+                        file_path.unlink(missing_ok=True)
+                elif reader.error_path:
+                    file_path.replace(reader.error_path / file_path.name)
                 else:
-                    # Move to error path (remove .processing extension)
-                    if reader.error_path:
-                        reader.error_path.mkdir(parents=True, exist_ok=True)
-                        error_name = file_path.name  # Original name without .processing
-                        processing_path.rename(reader.error_path / error_name)
-                    else:
-                        # Keep in inbox with .error suffix
-                        error_path = file_path.with_suffix(file_path.suffix + '.error')
-                        processing_path.rename(error_path)
-                    stats['failed'] += 1
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-                # If we have a .processing file, move it to error
-                current_file = processing_path if processing_path and processing_path.exists() else file_path
-                if current_file.exists():
-                    if reader.error_path:
-                        reader.error_path.mkdir(parents=True, exist_ok=True)
-                        error_name = file_path.name  # Original name
-                        current_file.rename(reader.error_path / error_name)
-                    else:
-                        error_path = file_path.with_suffix(file_path.suffix + '.error')
-                        current_file.rename(error_path)
-                stats['failed'] += 1
-        
-        return stats
+                    # Keep in inbox with .error suffix
+                    file_path.replace(file_path.with_suffix(file_path.suffix + '.error'))
+            except OSError as e:
+                print(f"Error moving {file_path}: {e}")
+            finally:
+                reader.release(lease)
     
     async def _process_message(self, content: str, file_path: Path, endpoint: SystemEndpoint) -> bool:
         """
-        Process a single message file.
+        Process a single message file, in a worker thread (see module docstring).
         
         Returns:
             True if successful, False otherwise
         """
+        return await to_thread(self._process_in_thread, content, file_path, endpoint)
+    
+    def _process_in_thread(self, content: str, file_path: Path, endpoint: SystemEndpoint) -> bool:
+        # With a sync Session the PAM handlers never suspend (see app.db_async)
+        return run_to_completion(self._handle_message(content, file_path, endpoint))
+    
+    async def _handle_message(self, content: str, file_path: Path, endpoint: SystemEndpoint) -> bool:
+        """Detect the message type, log it and route it (never suspends)"""
         # Detect message type
         details = HL7Detector.get_message_type_details(content)
         category = details['category']
@@ -245,15 +397,16 @@ class FilePollerService:
             return False
 
 
-def scan_file_endpoints(session: Session) -> Dict[str, Any]:
+def scan_file_endpoints(session: Session, exclude_ids: Optional[Set[int]] = None) -> Dict[str, Any]:
     """
     Convenience function to scan all file endpoints.
     
     Args:
         session: SQLModel session
+        exclude_ids: Endpoints to skip (watched inboxes)
     
     Returns:
         dict with processing statistics
     """
     poller = FilePollerService(session)
-    return poller.scan_all_file_endpoints()
+    return poller.scan_all_file_endpoints(exclude_ids)
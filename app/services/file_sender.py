@@ -0,0 +1,145 @@
+"""
+Émission HL7 vers les endpoints FILE (dépôt dans `outbox_path`)
+
+Contenu
+- `FileSender.send(endpoint, message, message_id=None)` : écrit le message de façon atomique
+  (FileSystemWriter : fichier temporaire, fsync, publication sans écrasement) hors de la
+  boucle asyncio et retourne le fichier écrit (`FileSendResult`).
+- Regroupement optionnel en fichiers batch HL7 (FHS/BHS ... BTS/FTS) par endpoint, dès
+  `max_messages` messages ou après `max_latency`.
+  Réglages : FILE_SENDER_BATCH_MAX_MESSAGES (1 = un fichier par message, défaut) /
+  FILE_SENDER_BATCH_MAX_LATENCY_MS.
+- `file_sender` : instance globale ; `drain()` écrit les messages en attente.
+
+Notes
+- L'ordre des messages d'un endpoint est conservé : écritures sérialisées par endpoint.
+- Aucun accès base : les appelants écrivent eux-mêmes leurs MessageLog.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.adapters.filesystem_transport import FileSystemWriter
+from app.services.hl7_batch import build_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MESSAGES = int(os.getenv("FILE_SENDER_BATCH_MAX_MESSAGES", "1"))
+DEFAULT_MAX_LATENCY = float(os.getenv("FILE_SENDER_BATCH_MAX_LATENCY_MS", "200")) / 1000
+
+
+@dataclass
+class FileSendResult:
+    """Fichier écrit pour un message (partagé par les messages d'un même batch)."""
+
+    path: Optional[Path] = None
+    error: Optional[str] = None
+    messages: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.path is not None
+
+    def ack_payload(self) -> str:
+        if self.error:
+            return self.error
+        return f"Fichier écrit: {self.path}" + (f" ({self.messages} messages)" if self.messages > 1 else "")
+
+
+@dataclass
+class _Pending:
+    messages: List[Tuple[str, asyncio.Future]] = field(default_factory=list)
+    handle: Optional[asyncio.TimerHandle] = None
+
+
+def _extension(endpoint: Any) -> str:
+    extensions = [ext.strip() for ext in (endpoint.file_extensions or "").split(",") if ext.strip()]
+    return extensions[0] if extensions else ".hl7"
+
+
+def _write(outbox_path: str, extension: str, messages: List[str], message_id: Optional[str]) -> Path:
+    content = messages[0] if len(messages) == 1 else build_batch(messages)
+    return FileSystemWriter(outbox_path, extension=extension).write_message(content, message_id=message_id)
+
+
+class FileSender:
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES, max_latency: float = DEFAULT_MAX_LATENCY):
+        self.max_messages = max(1, max_messages)
+        self.max_latency = max(0.0, max_latency)
+        # Files d'attente et verrous par boucle asyncio (les futures y sont liées)
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, _Pending]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, asyncio.Lock]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._tasks: set = set()
+        self.metrics: Dict[str, int] = {"messages": 0, "files": 0, "errors": 0}
+
+    def _lock(self, loop: asyncio.AbstractEventLoop, key: tuple) -> asyncio.Lock:
+        return self._locks.setdefault(loop, {}).setdefault(key, asyncio.Lock())
+
+    async def send(self, endpoint: Any, message: str, message_id: Optional[str] = None) -> FileSendResult:
+        """Écrit `message` dans l'outbox de l'endpoint (seul ou dans le prochain fichier batch)."""
+        if not endpoint.outbox_path:
+            return FileSendResult(error="Endpoint FILE sans outbox_path")
+        loop = asyncio.get_running_loop()
+        key = (endpoint.outbox_path, _extension(endpoint))
+        self.metrics["messages"] += 1
+        if self.max_messages == 1:
+            async with self._lock(loop, key):
+                return await self._write(key, [message], message_id)
+
+        pending = self._loops.setdefault(loop, {}).setdefault(key, _Pending())
+        future: asyncio.Future = loop.create_future()
+        pending.messages.append((message, future))
+        if len(pending.messages) >= self.max_messages:
+            self._start_flush(loop, key)
+        elif pending.handle is None:
+            pending.handle = loop.call_later(self.max_latency, self._start_flush, loop, key)
+        return await future
+
+    async def _write(self, key: tuple, messages: List[str], message_id: Optional[str] = None) -> FileSendResult:
+        try:
+            path = await asyncio.to_thread(_write, key[0], key[1], messages, message_id)
+        except Exception as exc:  # noqa: BLE001 - remonté dans le résultat de chaque message
+            self.metrics["errors"] += 1
+            logger.warning(f"[file_sender] Échec d'écriture de {len(messages)} message(s) dans {key[0]}: {exc}")
+            return FileSendResult(error=str(exc), messages=len(messages))
+        self.metrics["files"] += 1
+        return FileSendResult(path, messages=len(messages))
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop, key: tuple) -> None:
+        pending = self._loops.get(loop, {}).pop(key, None)
+        if pending is None:
+            return
+        if pending.handle is not None:
+            pending.handle.cancel()
+        task = loop.create_task(self._flush(loop, key, pending.messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, loop: asyncio.AbstractEventLoop, key: tuple, messages: List[Tuple[str, asyncio.Future]]) -> None:
+        async with self._lock(loop, key):
+            result = await self._write(key, [message for message, _ in messages])
+        for _, future in messages:
+            if not future.done():
+                future.set_result(result)
+
+    async def drain(self) -> None:
+        """Écrit immédiatement les messages en attente de la boucle courante."""
+        loop = asyncio.get_running_loop()
+        for key in list(self._loops.get(loop, {})):
+            self._start_flush(loop, key)
+        tasks = [task for task in self._tasks if task.get_loop() is loop]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+file_sender = FileSender()
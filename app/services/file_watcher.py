@@ -0,0 +1,253 @@
+"""
+Event-driven watching of FILE endpoint inboxes (Linux inotify).
+
+- `InotifyWatcher`: thin ctypes wrapper around inotify_init1/inotify_add_watch,
+  reporting files closed after writing (IN_CLOSE_WRITE) or moved into a watched
+  directory (IN_MOVED_TO).
+- `FileEndpointWatcher`: one watch per enabled FILE endpoint inbox, a FIFO queue of
+  newly arrived files per endpoint, and one worker per endpoint that hands them to
+  `FilePollerService.process_files` as soon as they land (no directory listing).
+
+Fallback: `inotify_available()` is False outside Linux; the scheduler then keeps the
+periodic scan. Files already present when a watch is added and event queue
+overflows (IN_Q_OVERFLOW) are recovered with a single directory listing.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlmodel import Session
+
+from app.adapters.filesystem_transport import IGNORED_SUFFIXES
+from app.db import engine
+from app.services.endpoint_cache import endpoint_config
+from app.services.file_poller import FilePollerService
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ name)
+_libc_handle = None
+
+
+def _libc():
+    global _libc_handle
+    if _libc_handle is None and sys.platform.startswith("linux"):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            _libc_handle = libc
+        except (OSError, AttributeError):
+            _libc_handle = False
+    return _libc_handle or None
+
+
+def inotify_available() -> bool:
+    return _libc() is not None
+
+
+class InotifyWatcher:
+    """Non-blocking inotify descriptor watching directories for completed files."""
+
+    def __init__(self):
+        libc = _libc()
+        if libc is None:
+            raise OSError("inotify is not available on this platform")
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._paths: Dict[int, Path] = {}
+        self._wds: Dict[Path, int] = {}
+
+    def add(self, directory: Path) -> None:
+        directory = Path(directory).resolve()
+        if directory in self._wds:
+            return
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(str(directory)), IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+        self._paths[wd] = directory
+        self._wds[directory] = wd
+
+    def remove(self, directory: Path) -> None:
+        wd = self._wds.pop(Path(directory).resolve(), None)
+        if wd is not None:
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[Optional[Path], str, int]]:
+        """Pending events as (directory, file name, mask); directory is None on overflow."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                directory = self._paths.pop(wd, None)
+                if directory is not None:
+                    self._wds.pop(directory, None)
+                continue
+            events.append((self._paths.get(wd), name, mask))
+        return events
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self._paths.clear()
+        self._wds.clear()
+
+
+class FileEndpointWatcher:
+    """Queue inbox files per FILE endpoint on inotify events and process them at once."""
+
+    def __init__(self):
+        self._inotify: Optional[InotifyWatcher] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inboxes: Dict[int, Path] = {}
+        self._owners: Dict[Path, int] = {}
+        self._queues: Dict[int, "OrderedDict[Path, None]"] = {}
+        self._wakeups: Dict[int, asyncio.Event] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.metrics: Dict[str, int] = {"events": 0, "files": 0, "overflows": 0}
+
+    @property
+    def active(self) -> bool:
+        return self._inotify is not None
+
+    @property
+    def watched_ids(self) -> Set[int]:
+        return set(self._inboxes)
+
+    def start(self) -> bool:
+        """Open the inotify descriptor and watch current inboxes; False means keep polling."""
+        try:
+            self._inotify = InotifyWatcher()
+        except OSError as e:
+            logger.info(f"File watcher unavailable ({e}), falling back to polling")
+            return False
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._inotify.fd, self._on_readable)
+        self.sync()
+        return True
+
+    def sync(self) -> None:
+        """Reconcile watches with the enabled FILE endpoints (cached configuration)."""
+        if not self.active:
+            return
+        wanted: Dict[int, Path] = {}
+        for endpoint in endpoint_config().by_kind("FILE"):
+            if endpoint.inbox_path:
+                wanted[endpoint.id] = Path(endpoint.inbox_path).resolve()
+
+        for endpoint_id in [eid for eid in self._inboxes if wanted.get(eid) != self._inboxes[eid]]:
+            self._unwatch(endpoint_id)
+        for endpoint_id, inbox in wanted.items():
+            if endpoint_id in self._inboxes or inbox in self._owners:
+                continue
+            try:
+                inbox.mkdir(parents=True, exist_ok=True)
+                self._inotify.add(inbox)
+            except OSError as e:
+                logger.warning(f"Cannot watch inbox {inbox} (endpoint {endpoint_id}): {e}")
+                continue
+            self._inboxes[endpoint_id] = inbox
+            self._owners[inbox] = endpoint_id
+            self._queues[endpoint_id] = OrderedDict()
+            self._wakeups[endpoint_id] = asyncio.Event()
+            self._workers[endpoint_id] = self._loop.create_task(self._worker(endpoint_id))
+            # Files dropped before the watch existed
+            self._enqueue_listing(endpoint_id)
+
+    def _unwatch(self, endpoint_id: int) -> None:
+        inbox = self._inboxes.pop(endpoint_id)
+        self._owners.pop(inbox, None)
+        self._inotify.remove(inbox)
+        self._queues.pop(endpoint_id, None)
+        self._wakeups.pop(endpoint_id, None)
+        worker = self._workers.pop(endpoint_id, None)
+        if worker:
+            worker.cancel()
+
+    def _on_readable(self) -> None:
+        for directory, name, mask in self._inotify.read_events():
+            self.metrics["events"] += 1
+            if mask & IN_Q_OVERFLOW:
+                self.metrics["overflows"] += 1
+                for endpoint_id in self._inboxes:
+                    self._enqueue_listing(endpoint_id)
+                continue
+            endpoint_id = self._owners.get(directory)
+            if endpoint_id is None or not name or name.endswith(IGNORED_SUFFIXES):
+                continue
+            self._enqueue(endpoint_id, [directory / name])
+
+    def _enqueue_listing(self, endpoint_id: int) -> None:
+        inbox = self._inboxes[endpoint_id]
+        self._enqueue(endpoint_id, sorted(
+            path for path in inbox.iterdir() if not path.name.endswith(IGNORED_SUFFIXES)
+        ))
+
+    def _enqueue(self, endpoint_id: int, paths: List[Path]) -> None:
+        if not paths:
+            return
+        queue = self._queues[endpoint_id]
+        for path in paths:
+            queue[path] = None
+        self._wakeups[endpoint_id].set()
+
+    async def _worker(self, endpoint_id: int) -> None:
+        wakeup = self._wakeups[endpoint_id]
+        queue = self._queues[endpoint_id]
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            files = list(queue)
+            queue.clear()
+            try:
+                with Session(engine) as session:
+                    endpoint = endpoint_config(session).endpoint(endpoint_id)
+                    if endpoint is None or not endpoint.is_enabled:
+                        continue
+                    stats = await FilePollerService(session).process_files(endpoint, files)
+                self.metrics["files"] += stats["files_processed"]
+                for error in stats["errors"]:
+                    logger.error(f"  - {error}")
+            except Exception as e:
+                logger.error(f"Error processing watched files of endpoint {endpoint_id}: {e}", exc_info=True)
+
+    async def stop(self) -> None:
+        if not self.active:
+            return
+        self._loop.remove_reader(self._inotify.fd)
+        workers = list(self._workers.values())
+        for endpoint_id in list(self._inboxes):
+            self._unwatch(endpoint_id)
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._inotify.close()
+        self._inotify = None
@@ -0,0 +1,201 @@
+"""
+Fichiers batch HL7 v2 (FHS/BHS ... BTS/FTS) : lecture en flux, reprise, acquittement
+
+Contenu
+- `is_batch_file(path)` : le fichier commence par FHS ou BHS.
+- `HL7BatchReader(path).messages(offset)` : lit le fichier par blocs (HL7_BATCH_CHUNK_BYTES)
+  et produit les messages un à un (`BatchMessage`, avec l'offset de reprise `end`), sans
+  charger le fichier en mémoire. Les segments d'enveloppe (FHS/BHS/BTS/FTS) sont
+  conservés sur le lecteur (`file_header`, `batch_header`, `batch_trailers`).
+- Points de reprise (`<fichier>.checkpoint`, JSON écrit atomiquement) : offset du prochain
+  message, compteurs et ACK d'erreur ; un traitement interrompu reprend en milieu de fichier.
+- `build_batch_ack(reader, state)` : batch d'acquittement (FHS/BHS, ACK des messages
+  rejetés, BTS avec le nombre de messages reçus/acceptés/rejetés, FTS).
+- `build_batch(messages)` : fichier batch sortant (enveloppe reprise du MSH du premier
+  message), utilisé par l'émission vers les endpoints FILE.
+
+Notes
+- Séparateurs de segments acceptés : \\r, \\n ou \\r\\n ; messages produits avec \\r.
+- Un fichier sans enveloppe (un seul MSH) n'est pas un batch : lecture habituelle.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+CHUNK_BYTES = int(os.getenv("HL7_BATCH_CHUNK_BYTES", str(256 * 1024)))
+CHECKPOINT_EVERY = int(os.getenv("HL7_BATCH_CHECKPOINT_EVERY", "100"))
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+_TERMINATOR = re.compile(rb"\r\n|\r|\n")
+_ENVELOPE = (b"FHS", b"BHS", b"BTS", b"FTS")
+
+
+@dataclass(frozen=True)
+class BatchMessage:
+    """Message d'un batch : texte (segments séparés par \\r) et offsets en octets."""
+
+    text: str
+    start: int
+    end: int
+
+
+def is_batch_file(path: Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16).lstrip(b"\xef\xbb\xbf \t\r\n")
+    except OSError:
+        return False
+    return head[:3] in (b"FHS", b"BHS")
+
+
+class HL7BatchReader:
+    """Lecture en flux d'un fichier batch HL7."""
+
+    def __init__(self, path: Path, chunk_size: int = CHUNK_BYTES):
+        self.path = Path(path)
+        self.chunk_size = max(1024, chunk_size)
+        self.file_header: Optional[str] = None
+        self.batch_header: Optional[str] = None
+        self.batch_trailers: List[str] = []
+
+    def read_envelope(self) -> None:
+        """Lit les en-têtes FHS/BHS (début du fichier), utile avant une reprise."""
+        for _ in self.messages(0):
+            break
+
+    def _segments(self, offset: int) -> Iterator[tuple]:
+        """(segment, offset de début, offset de fin terminateur inclus) à partir de `offset`."""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            buffer = bytearray()
+            base = offset
+            while True:
+                chunk = f.read(self.chunk_size)
+                buffer += chunk
+                pos = 0
+                for match in _TERMINATOR.finditer(buffer):
+                    yield bytes(buffer[pos:match.start()]), base + pos, base + match.end()
+                    pos = match.end()
+                del buffer[:pos]
+                base += pos
+                if not chunk:
+                    if buffer:
+                        yield bytes(buffer), base, base + len(buffer)
+                    return
+
+    def messages(self, offset: int = 0) -> Iterator[BatchMessage]:
+        """Messages à partir de `offset` (0 ou l'offset `end` d'un message déjà traité)."""
+        segments: List[bytes] = []
+        start = end = offset
+        for segment, seg_start, seg_end in self._segments(offset):
+            segment = segment.strip(b"\x0b\x1c")
+            if not segment.strip():
+                continue
+            kind = segment[:3]
+            if kind == b"MSH" or kind in _ENVELOPE:
+                if segments:
+                    yield BatchMessage(b"\r".join(segments).decode("utf-8"), start, seg_start)
+                    segments = []
+                if kind == b"MSH":
+                    segments, start = [segment], seg_start
+                elif kind == b"FHS":
+                    self.file_header = segment.decode("utf-8")
+                elif kind == b"BHS":
+                    self.batch_header = self.batch_header or segment.decode("utf-8")
+                else:
+                    self.batch_trailers.append(segment.decode("utf-8"))
+            elif segments:
+                segments.append(segment)
+            end = seg_end
+        if segments:
+            yield BatchMessage(b"\r".join(segments).decode("utf-8"), start, end)
+
+
+# ---------------------------------------------------------------------------
+# Points de reprise
+# ---------------------------------------------------------------------------
+
+def _checkpoint_path(path: Path) -> Path:
+    return path.with_name(path.name + CHECKPOINT_SUFFIX)
+
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    state = {"offset": 0, "messages": 0, "accepted": 0, "error_acks": []}
+    try:
+        state.update(json.loads(_checkpoint_path(path).read_text(encoding="utf-8")))
+    except (OSError, ValueError):
+        pass
+    return state
+
+
+def save_checkpoint(path: Path, state: Dict[str, Any]) -> None:
+    target = _checkpoint_path(path)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, target)
+
+
+def clear_checkpoint(path: Path) -> None:
+    _checkpoint_path(path).unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------
+# Acquittement du batch
+# ---------------------------------------------------------------------------
+
+def _field(segment: Optional[str], index: int) -> str:
+    """Champ n d'un segment d'en-tête FHS/BHS (le séparateur est le champ 1, comme MSH)."""
+    parts = (segment or "").split("|")
+    return parts[index - 1] if len(parts) >= index else ""
+
+
+def _reply_header(kind: str, header: Optional[str], now: str) -> str:
+    encoding = _field(header, 2) or "^~\\&"
+    return "|".join([
+        kind, encoding,
+        _field(header, 5), _field(header, 6),  # émetteur de l'ACK = destinataire du batch
+        _field(header, 3), _field(header, 4),
+        now, "", "", "", f"ACK{now}", _field(header, 11),
+    ])
+
+
+def build_batch_ack(reader: HL7BatchReader, state: Dict[str, Any]) -> str:
+    """Batch d'acquittement : ACK des messages rejetés et totaux dans BTS."""
+    now = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    received, accepted = state["messages"], state["accepted"]
+    comment = f"{received} received, {accepted} accepted, {received - accepted} rejected"
+    declared = reader.batch_trailers[0].split("|")[1] if reader.batch_trailers and "|" in reader.batch_trailers[0] else ""
+    if declared.isdigit() and int(declared) != received:
+        comment += f", BTS-1 declared {declared}"
+
+    segments = [_reply_header("FHS", reader.file_header or reader.batch_header, now)]
+    segments.append(_reply_header("BHS", reader.batch_header or reader.file_header, now))
+    for ack in state["error_acks"]:
+        segments.extend(seg for seg in ack.split("\r") if seg)
+    segments.append(f"BTS|{len(state['error_acks'])}|{comment}")
+    segments.append("FTS|1")
+    return "\r".join(segments) + "\r"
+
+
+def build_batch(messages: List[str]) -> str:
+    """Fichier batch FHS/BHS ... BTS/FTS regroupant `messages` (segments séparés par \\r)."""
+    now = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    msh = messages[0].split("\r", 1)[0] if messages else None
+    control_id = uuid.uuid4().hex[:20]
+    header = "|".join([
+        _field(msh, 2) or "^~\\&",
+        _field(msh, 3), _field(msh, 4), _field(msh, 5), _field(msh, 6),
+        now, "", "", "", control_id,
+    ])
+    segments = [f"FHS|{header}", f"BHS|{header}"]
+    for message in messages:
+        segments.extend(seg for seg in message.replace("\r\n", "\r").replace("\n", "\r").split("\r") if seg)
+    segments.extend([f"BTS|{len(messages)}", "FTS|1"])
+    return "\r".join(segments) + "\r"
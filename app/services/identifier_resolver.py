@@ -0,0 +1,205 @@
+"""
+Résolution centralisée des identifiants (system, value) → entités
+
+Contenu
+- `IdentifierResolver`: point d'entrée unique pour retrouver un `Identifier` (et le
+  patient associé) à partir d'un couple (system, value) ou d'une liste de CX HL7.
+- `resolve_many()`: résolution par lot en une seule requête (IN sur le couple
+  (system, value)), utilisée pour les répétitions PID-3 / MRG-1 / QPD-3.
+- Cache par transaction stocké dans `session.info`, vidé automatiquement à chaque
+  commit/rollback (événements SQLAlchemy sur `Session`). Les absences mémorisées
+  sont oubliées dès qu'un `Identifier` portant le même couple est ajouté à la session
+  ou modifié (`transient_to_pending`, `before_flush`), quel que soit son créateur.
+
+Notes
+- Les requêtes s'appuient sur l'index composite unique (system, value, type) déclaré
+  sur `Identifier` (cf. `app/models_identifiers.py`, migration 010).
+- `remember()` rend un identifiant créé pendant la transaction résolvable sans requête.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, tuple_
+from sqlmodel import Session, select
+
+from app.models import Patient
+from app.models_identifiers import Identifier
+from app.services.identifier_manager import parse_hl7_cx_identifier
+
+# Clé de cache dans session.info
+_CACHE_KEY = "identifier_resolver_cache"
+# Marqueur "résolu mais absent" (évite de re-interroger la base pour un miss)
+_MISSING = object()
+
+IdentifierKey = Tuple[str, str]
+
+
+def _cache(session: Session) -> Dict[IdentifierKey, object]:
+    return session.info.setdefault(_CACHE_KEY, {})
+
+
+def _clear_cache(session, *args) -> None:
+    session.info.pop(_CACHE_KEY, None)
+
+
+def _forget_missing(session, identifier: Identifier) -> None:
+    cache = session.info.get(_CACHE_KEY)
+    if cache and identifier.value:
+        key = (identifier.system or "", identifier.value)
+        if cache.get(key) is _MISSING:
+            del cache[key]
+
+
+def _on_pending(session, instance) -> None:
+    if isinstance(instance, Identifier):
+        _forget_missing(session, instance)
+
+
+def _before_flush(session, flush_context, instances) -> None:
+    # Couple renseigné ou modifié après l'ajout à la session
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Identifier):
+            _forget_missing(session, obj)
+
+
+event.listen(Session, "after_commit", _clear_cache)
+event.listen(Session, "after_rollback", _clear_cache)
+event.listen(Session, "transient_to_pending", _on_pending)
+event.listen(Session, "before_flush", _before_flush)
+
+
+class IdentifierResolver:
+    """Résout des identifiants patients/dossiers/venues avec cache transactionnel."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    # ------------------------------------------------------------------
+    # Résolution (system, value)
+    # ------------------------------------------------------------------
+    def resolve(self, system: str, value: str) -> Optional[Identifier]:
+        """Retourne l'identifiant correspondant au couple (system, value) ou None."""
+        return self.resolve_many([(system, value)]).get((system or "", value))
+
+    def resolve_many(self, keys: Iterable[IdentifierKey]) -> Dict[IdentifierKey, Identifier]:
+        """
+        Résout un lot de couples (system, value) en une seule requête.
+
+        Les couples déjà présents dans le cache de transaction ne sont pas
+        ré-interrogés. Retourne un dict {(system, value): Identifier} ne contenant
+        que les couples trouvés.
+        """
+        cache = _cache(self.session)
+        wanted = []
+        for system, value in keys:
+            if not value:
+                continue
+            key = (system or "", value)
+            if key not in cache and key not in wanted:
+                wanted.append(key)
+
+        if wanted:
+            rows = self.session.exec(
+                select(Identifier).where(tuple_(Identifier.system, Identifier.value).in_(wanted))
+            ).all()
+            for row in rows:
+                key = (row.system or "", row.value)
+                current = cache.get(key)
+                # Plusieurs types possibles pour un même couple: privilégier l'actif
+                if not isinstance(current, Identifier) or (current.status != "active" and row.status == "active"):
+                    cache[key] = row
+            for key in wanted:
+                cache.setdefault(key, _MISSING)
+
+        out: Dict[IdentifierKey, Identifier] = {}
+        for system, value in keys:
+            key = (system or "", value)
+            hit = cache.get(key)
+            if isinstance(hit, Identifier):
+                out[key] = hit
+        return out
+
+    def resolve_cx_many(self, cx_list: Iterable[str]) -> Dict[str, Identifier]:
+        """Résout une liste de CX HL7 (ID^^^AUTH^TYPE) → {cx: Identifier}."""
+        parsed = []
+        for cx in cx_list:
+            value, system, _, _ = parse_hl7_cx_identifier(cx)
+            if value:
+                parsed.append((cx, (system or "", value)))
+        found = self.resolve_many([key for _, key in parsed])
+        return {cx: found[key] for cx, key in parsed if key in found}
+
+    def exists(self, system: str, value: str) -> bool:
+        return self.resolve(system, value) is not None
+
+    def remember(self, identifier: Identifier) -> None:
+        """Enregistre dans le cache un identifiant ajouté pendant la transaction."""
+        if identifier.value:
+            _cache(self.session)[(identifier.system or "", identifier.value)] = identifier
+
+    # ------------------------------------------------------------------
+    # Résolution patient
+    # ------------------------------------------------------------------
+    def find_patient_by_cx(self, cx_list: List[str], match_system: bool = True) -> Optional[Patient]:
+        """
+        Trouve un patient à partir d'une liste de CX HL7.
+
+        - match_system=True: correspondance stricte (system, value) via `resolve_many`.
+        - match_system=False: correspondance sur la valeur seule (identifiants actifs
+          rattachés à un patient), comportement historique de la fusion A40.
+        La liste est parcourue dans l'ordre: le premier CX résolu l'emporte.
+        """
+        if not cx_list:
+            return None
+
+        patient_ids: Dict[str, int] = {}
+        if match_system:
+            for cx, ident in self.resolve_cx_many(cx_list).items():
+                if ident.patient_id:
+                    patient_ids[cx] = ident.patient_id
+        else:
+            values = {cx: parse_hl7_cx_identifier(cx)[0] for cx in cx_list}
+            wanted = [v for v in values.values() if v]
+            if wanted:
+                rows = self.session.exec(
+                    select(Identifier.value, Identifier.patient_id)
+                    .where(Identifier.value.in_(wanted))
+                    .where(Identifier.status == "active")
+                    .where(Identifier.patient_id.isnot(None))
+                ).all()
+                by_value = {}
+                for value, patient_id in rows:
+                    by_value.setdefault(value, patient_id)
+                for cx, value in values.items():
+                    if value in by_value:
+                        patient_ids[cx] = by_value[value]
+
+        for cx in cx_list:
+            if cx in patient_ids:
+                patient = self.session.get(Patient, patient_ids[cx])
+                if patient:
+                    return patient
+        return None
+
+    def find_patient_by_plain_ids(self, cx_list: List[str]) -> Optional[Patient]:
+        """
+        Repli sur les colonnes directes `Patient.external_id` / `Patient.identifier`
+        (premier composant CX), en une requête par colonne.
+        """
+        values = [cx.split("^")[0] for cx in cx_list if cx and cx.split("^")[0]]
+        if not values:
+            return None
+        for column in (Patient.external_id, Patient.identifier):
+            rows = self.session.exec(select(Patient).where(column.in_(values))).all()
+            if rows:
+                by_value = {getattr(p, column.key): p for p in reversed(rows)}
+                for value in values:
+                    if value in by_value:
+                        return by_value[value]
+        return None
+
+
+def get_resolver(session: Session) -> IdentifierResolver:
+    """Raccourci: resolver lié à la session (le cache vit dans `session.info`)."""
+    return IdentifierResolver(session)
@@ -0,0 +1,105 @@
+"""
+Baux de direction entre workers (uvicorn/gunicorn multi-processus)
+
+Contenu
+- `LeaderLeases` : un bail nommé par ressource (écoute MLLP sur host:port, tâche planifiée) ;
+  un seul processus le détient à la fois. `acquire(name)` est non bloquant et idempotent,
+  `release(name)` / `release_all()` le rendent.
+- Implémentation : verrou `fcntl.flock` exclusif sur `<LEADER_LEASE_DIR>/<nom>.lock`. Le
+  verrou est libéré par le système à la mort du processus : les autres workers le
+  reprennent à leur prochaine tentative (toutes les LEADER_LEASE_RETRY_SECONDS), ce qui
+  assure la bascule automatique sans horloge partagée.
+- Le fichier de verrou contient le détenteur (pid, hôte, date de prise) pour le diagnostic.
+- `leader_leases` : instance globale (None si désactivée via LEADER_LEASES=0 ou sans fcntl,
+  par exemple sous Windows : chaque processus se comporte alors comme seul worker).
+
+Notes
+- Les verrous sont locaux à la machine, comme la base SQLite (`./poc.db`) partagée par
+  les workers.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import socket
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LEASE_DIR = os.getenv("LEADER_LEASE_DIR", "./.leases")
+RETRY_SECONDS = float(os.getenv("LEADER_LEASE_RETRY_SECONDS", "5"))
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class LeaderLeases:
+    """Baux exclusifs par nom, détenus jusqu'à `release` ou la fin du processus."""
+
+    def __init__(self, directory: str = LEASE_DIR, retry_seconds: float = RETRY_SECONDS):
+        self.directory = Path(directory)
+        self.retry_seconds = retry_seconds
+        self._held: Dict[str, int] = {}
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{_UNSAFE.sub('_', name)}.lock"
+
+    def holds(self, name: str) -> bool:
+        return name in self._held
+
+    @property
+    def held(self) -> set:
+        return set(self._held)
+
+    def acquire(self, name: str) -> bool:
+        """Prend le bail `name` s'il est libre (ou déjà détenu). Ne bloque jamais."""
+        if name in self._held:
+            return True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._path(name), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        owner = {"pid": os.getpid(), "host": socket.gethostname(), "since": time.time()}
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, json.dumps(owner).encode(), 0)
+        self._held[name] = fd
+        logger.info(f"[leader_lease] Bail '{name}' pris par le processus {os.getpid()}")
+        return True
+
+    def release(self, name: str) -> None:
+        fd = self._held.pop(name, None)
+        if fd is None:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def release_all(self) -> None:
+        for name in list(self._held):
+            self.release(name)
+
+    def owner(self, name: str) -> Optional[dict]:
+        """Détenteur déclaré du bail (informatif : le verrou fait foi)."""
+        try:
+            return json.loads(self._path(name).read_text() or "null")
+        except (OSError, ValueError):
+            return None
+
+
+def _enabled() -> bool:
+    return fcntl is not None and os.getenv("LEADER_LEASES", "1") not in ("0", "false", "False")
+
+
+leader_leases: Optional[LeaderLeases] = LeaderLeases() if _enabled() else None
@@ -0,0 +1,433 @@
+"""
+Registre unifié des lieux de structure (table `LocationIndex`)
+
+Contenu
+- Écouteurs mapper (`after_insert`/`after_update`/`after_delete`) sur les modèles de
+  structure (EJ, EG, Pôle, Service, UF, UH, Chambre, Lit) qui maintiennent une ligne
+  d'index par entité dans la même transaction que l'écriture (par lots en fin de
+  flush, parents avant enfants) : id global, type de
+  modèle, identifiant, FINESS, nom normalisé, statut, prochaine échéance de statut
+  programmée (activation/désactivation), parent, chemin matérialisé,
+  version (incrémentée à chaque écriture) et date de dernière mise à jour. Chaque
+  écriture est aussi journalisée dans `StructureChange` (voir `structure_journal`).
+- `search_location_index`: recherche FHIR Location (identifier, partof, partof:below,
+  name, status) en une requête indexée avec total (fenêtre COUNT) et pagination.
+- `load_indexed_entities`: chargement des entités d'une page (une requête par modèle).
+- `rebuild_location_index`: reconstruction complète (données antérieures à la migration 012).
+
+Notes
+- Les id des tables de structure se recouvrent : `LocationIndex.id` est l'id global, la
+  ressource FHIR garde l'id de l'entité (`entity_id`).
+- Chemin matérialisé : "/<id global racine>/.../<id global>/". Un sous-arbre est lu par
+  intervalle [path, path[:-1] + "0") sur l'index de `path` ("0" suit "/" en ASCII).
+- Ces écouteurs sont enregistrés à l'import (via `app.db`), indépendamment des écouteurs
+  d'émission de `entity_events_structure` qui ne sont actifs qu'au démarrage de l'application.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    String, and_, bindparam, case, delete, event, func, insert, literal, or_, select as sa_select, update,
+)
+from sqlmodel import Session, select
+
+from app.models_structure import (
+    BaseLocation,
+    EntiteGeographique,
+    Pole,
+    Service,
+    UniteFonctionnelle,
+    UniteHebergement,
+    Chambre,
+    Lit,
+    LocationIndex,
+)
+from app.models_structure_fhir import EntiteJuridique
+from app.services.patient_search import normalize_name
+from app.services.structure_schedule import next_status_check
+from app.services.structure_journal import record_changes
+
+# modèle -> (modèle parent, attribut de clé étrangère vers le parent)
+HIERARCHY: Dict[str, Tuple[Optional[str], Optional[str]]] = {
+    "EntiteJuridique": (None, None),
+    "EntiteGeographique": ("EntiteJuridique", "entite_juridique_id"),
+    "Pole": ("EntiteGeographique", "entite_geo_id"),
+    "Service": ("Pole", "pole_id"),
+    "UniteFonctionnelle": ("Service", "service_id"),
+    "UniteHebergement": ("UniteFonctionnelle", "unite_fonctionnelle_id"),
+    "Chambre": ("UniteHebergement", "unite_hebergement_id"),
+    "Lit": ("Chambre", "chambre_id"),
+}
+
+MODELS = {
+    "EntiteJuridique": EntiteJuridique,
+    "EntiteGeographique": EntiteGeographique,
+    "Pole": Pole,
+    "Service": Service,
+    "UniteFonctionnelle": UniteFonctionnelle,
+    "UniteHebergement": UniteHebergement,
+    "Chambre": Chambre,
+    "Lit": Lit,
+}
+
+# L'EJ est une Organization FHIR : indexée pour la hiérarchie, jamais renvoyée comme Location
+NON_LOCATION_MODELS = ("EntiteJuridique",)
+
+# Ordre de résolution d'un id logique de Location (les id des tables se recouvrent) :
+# lecture et _id ; partof garde l'ordre hiérarchique historique (EG d'abord)
+READ_MODEL_PRIORITY = [
+    "Service", "EntiteGeographique", "Pole", "UniteFonctionnelle", "UniteHebergement", "Chambre", "Lit",
+]
+PARTOF_MODEL_PRIORITY = [
+    "EntiteGeographique", "Pole", "Service", "UniteFonctionnelle", "UniteHebergement", "Chambre", "Lit",
+]
+
+
+def _model_rank(priority: Sequence[str]):
+    """Rang de la ligne dans `priority` (expression SQL)."""
+    return case(
+        {model: rank for rank, model in enumerate(priority)},
+        value=LocationIndex.model, else_=len(priority),
+    )
+
+
+def _subtree_range(column, path: str):
+    """Le nœud et tous ses descendants : intervalle [path, path[:-1] + "0")."""
+    return and_(column >= path, column < path[:-1] + "0")
+
+
+def _prefix_range(column, prefix: str):
+    """Intervalle [prefix, prefix+U+FFFF) : équivalent LIKE 'prefix%' utilisable par l'index."""
+    return and_(column >= prefix, column < prefix + "\uffff")
+
+
+def _row_values(target: Any) -> Dict[str, Any]:
+    if isinstance(target, EntiteJuridique):
+        identifier = target.finess_ej
+        finess = target.finess_ej
+        status = "active" if target.is_active else "inactive"
+    else:
+        identifier = target.identifier
+        finess = getattr(target, "finess", None)
+        status = getattr(target.status, "value", target.status)
+    next_change = None
+    if isinstance(target, BaseLocation):
+        next_change = next_status_check(target.status, target.activation_date, target.deactivation_date)
+    return {
+        "identifier": identifier,
+        "finess": finess,
+        "name": target.name,
+        "name_norm": normalize_name(target.name) or None,
+        "status": status,
+        "next_status_change": next_change,
+    }
+
+
+# ----------------------------------------------------------------------
+# Maintenance de l'index
+# ----------------------------------------------------------------------
+
+# Taille des listes IN (entités d'un modèle par requête)
+_CHUNK = 500
+
+# session.info : entités écrites pendant le flush courant, par modèle
+_PENDING_KEY = "location_index_pending"
+
+
+def sync_entities(connection, targets: Sequence[Any], journal: bool = True) -> None:
+    """
+    Insère ou met à jour les lignes d'index d'entités d'un même modèle, par lots :
+    une lecture des parents et des lignes existantes, un INSERT groupé puis un UPDATE
+    des chemins pour les nouvelles lignes, un UPDATE groupé pour les existantes
+    (et réécriture des chemins du sous-arbre en cas de changement de parent).
+    Avec `journal`, les écritures sont ajoutées au journal des modifications.
+    """
+    if not targets:
+        return
+    table = LocationIndex.__table__
+    model_name = type(targets[0]).__name__
+    parent_model, parent_attr = HIERARCHY[model_name]
+
+    for start in range(0, len(targets), _CHUNK):
+        chunk = targets[start:start + _CHUNK]
+        parents: Dict[int, Any] = {}
+        parent_ids = {getattr(t, parent_attr) for t in chunk} - {None} if parent_attr else set()
+        if parent_model and parent_ids:
+            parents = {
+                row.entity_id: row
+                for row in connection.execute(
+                    sa_select(table.c.id, table.c.entity_id, table.c.path, table.c.depth)
+                    .where(table.c.model == parent_model)
+                    .where(table.c.entity_id.in_(parent_ids))
+                )
+            }
+        existing = {
+            row.entity_id: row
+            for row in connection.execute(
+                sa_select(table.c.id, table.c.entity_id, table.c.path, table.c.depth, table.c.version)
+                .where(table.c.model == model_name)
+                .where(table.c.entity_id.in_([t.id for t in chunk]))
+            )
+        }
+
+        now = datetime.utcnow()
+        inserts, updates, moved, changes = [], [], [], []
+        for target in chunk:
+            parent_row = parents.get(getattr(target, parent_attr)) if parent_attr else None
+            values = _row_values(target)
+            values["parent_id"] = parent_row.id if parent_row else None
+            values["depth"] = parent_row.depth + 1 if parent_row else 0
+            values["last_updated"] = now
+            parent_path = parent_row.path if parent_row else "/"
+            row = existing.get(target.id)
+            changes.append({
+                "model": model_name,
+                "entity_id": target.id,
+                "op": "insert" if row is None else "update",
+                "identifier": values["identifier"],
+                "entity_version": 1 if row is None else row.version + 1,
+            })
+            if row is None:
+                inserts.append(dict(values, model=model_name, entity_id=target.id, path=parent_path, version=1))
+                continue
+            new_path = f"{parent_path}{row.id}/"
+            updates.append(dict(values, _id=row.id, path=new_path))
+            if new_path != row.path:
+                moved.append((row, new_path, values["depth"]))
+
+        if inserts:
+            connection.execute(insert(table), inserts)
+            # Le chemin se termine par l'id global, connu seulement après insertion
+            connection.execute(
+                update(table)
+                .where(table.c.model == model_name)
+                .where(table.c.entity_id.in_([v["entity_id"] for v in inserts]))
+                .values(path=table.c.path + func.cast(table.c.id, String) + "/")
+            )
+        if updates:
+            connection.execute(
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values(version=table.c.version + 1, **{k: bindparam(k) for k in updates[0] if k != "_id"}),
+                updates,
+            )
+        for row, new_path, depth in moved:
+            # Rattachement à un autre parent : réécrire le préfixe de tout le sous-arbre
+            connection.execute(
+                update(table)
+                .where(_subtree_range(table.c.path, row.path))
+                .where(table.c.id != row.id)
+                .values(
+                    path=literal(new_path) + func.substr(table.c.path, len(row.path) + 1),
+                    depth=table.c.depth + (depth - row.depth),
+                )
+            )
+        if journal:
+            record_changes(connection, changes)
+
+
+def sync_entity(connection, target: Any) -> None:
+    """Insère ou met à jour la ligne d'index d'une entité (et les chemins de son sous-arbre)."""
+    sync_entities(connection, [target])
+
+
+def remove_entity(connection, target: Any) -> None:
+    table = LocationIndex.__table__
+    connection.execute(
+        delete(table)
+        .where(table.c.model == type(target).__name__)
+        .where(table.c.entity_id == target.id)
+    )
+    record_changes(connection, [{
+        "model": type(target).__name__,
+        "entity_id": target.id,
+        "op": "delete",
+        "identifier": target.finess_ej if isinstance(target, EntiteJuridique) else target.identifier,
+        "entity_version": None,
+    }])
+
+
+def _after_write(mapper, connection, target):
+    # Différé à la fin du flush : les écritures d'un même flush sont indexées par lots
+    session = Session.object_session(target)
+    if session is None:
+        sync_entity(connection, target)
+        return
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    pending.setdefault(type(target).__name__, {})[target.id] = target
+
+
+def _after_delete(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.get(_PENDING_KEY, {}).get(type(target).__name__, {}).pop(target.id, None)
+    remove_entity(connection, target)
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    connection = session.connection()
+    # Parents avant enfants : le chemin d'un enfant dépend de la ligne de son parent
+    for model_name in HIERARCHY:
+        if model_name in pending:
+            sync_entities(connection, list(pending[model_name].values()))
+
+
+for _model in MODELS.values():
+    event.listen(_model, "after_insert", _after_write)
+    event.listen(_model, "after_update", _after_write)
+    event.listen(_model, "after_delete", _after_delete)
+event.listen(Session, "after_flush", _after_flush)
+
+
+def rebuild_location_index(session: Session, batch_size: int = 1000) -> int:
+    """Reconstruit tout l'index (parents avant enfants). Retourne le nombre de lignes."""
+    connection = session.connection()
+    connection.execute(delete(LocationIndex.__table__))
+    count = 0
+    for model in MODELS.values():
+        last_id = 0
+        while True:
+            entities = session.exec(
+                select(model).where(model.id > last_id).order_by(model.id).limit(batch_size)
+            ).all()
+            if not entities:
+                break
+            last_id = entities[-1].id
+            # Reconstruction : pas de journal, les récepteurs se resynchronisent par snapshot
+            sync_entities(connection, entities, journal=False)
+            count += len(entities)
+    session.commit()
+    return count
+
+
+# ----------------------------------------------------------------------
+# Recherche
+# ----------------------------------------------------------------------
+
+@dataclass
+class LocationIndexPage:
+    rows: List[LocationIndex]
+    total: int
+    offset: int
+
+    @property
+    def next_offset(self) -> Optional[int]:
+        nxt = self.offset + len(self.rows)
+        return nxt if nxt < self.total else None
+
+
+def resolve_location(
+    session: Session, entity_id: int, priority: Sequence[str] = READ_MODEL_PRIORITY
+) -> Optional[LocationIndex]:
+    """Ligne d'index d'une Location FHIR par id logique (`priority` en cas de collision)."""
+    return session.exec(
+        select(LocationIndex)
+        .where(LocationIndex.entity_id == entity_id)
+        .where(LocationIndex.model.not_in(NON_LOCATION_MODELS))
+        .order_by(_model_rank(priority), LocationIndex.id)
+        .limit(1)
+    ).first()
+
+
+def search_location_index(
+    session: Session,
+    identifier: Optional[str] = None,
+    parent: Optional[LocationIndex] = None,
+    below: bool = False,
+    name: Optional[str] = None,
+    name_mode: str = "prefix",
+    status: Optional[str] = None,
+    ids: Optional[Sequence[int]] = None,
+    updated_from: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    offset: int = 0,
+    count: int = 50,
+) -> LocationIndexPage:
+    """
+    Recherche de Locations dans l'index, en une requête (total via COUNT(*) OVER ()).
+
+    - identifier: ID_GLBL ou FINESS (EG).
+    - parent: enfants directs ; avec below=True, tout le sous-arbre.
+      Une EG renvoie ses pôles et leurs services (comportement historique de partof).
+    - name: nom normalisé (sans accents), préfixe par défaut (sémantique FHIR),
+      "contains" ou "exact".
+    - ids: ids logiques (_id), résolus comme une lecture (`resolve_location` :
+      READ_MODEL_PRIORITY en cas de collision entre modèles).
+    - updated_from / updated_before: intervalle [from, before) sur last_updated (_lastUpdated).
+    """
+    query = select(LocationIndex, func.count().over().label("total")).where(
+        LocationIndex.model.not_in(NON_LOCATION_MODELS)
+    )
+    if identifier:
+        query = query.where(or_(LocationIndex.identifier == identifier, LocationIndex.finess == identifier))
+    if parent is not None:
+        if below:
+            query = query.where(_subtree_range(LocationIndex.path, parent.path)).where(
+                LocationIndex.depth > parent.depth
+            )
+        elif parent.model == "EntiteGeographique":
+            query = query.where(_subtree_range(LocationIndex.path, parent.path)).where(
+                LocationIndex.depth.in_([parent.depth + 1, parent.depth + 2])
+            )
+        else:
+            query = query.where(LocationIndex.parent_id == parent.id)
+    if name:
+        q_norm = normalize_name(name)
+        if name_mode == "exact":
+            query = query.where(LocationIndex.name_norm == q_norm).where(LocationIndex.name == name)
+        elif name_mode == "contains":
+            query = query.where(LocationIndex.name_norm.contains(q_norm))
+        else:
+            query = query.where(_prefix_range(LocationIndex.name_norm, q_norm))
+    if status:
+        query = query.where(LocationIndex.status == status)
+    if ids is not None:
+        ranked = (
+            sa_select(
+                LocationIndex.id,
+                func.row_number().over(
+                    partition_by=LocationIndex.entity_id, order_by=(_model_rank(READ_MODEL_PRIORITY), LocationIndex.id)
+                ).label("rank"),
+            )
+            .where(LocationIndex.entity_id.in_(list(ids)))
+            .where(LocationIndex.model.not_in(NON_LOCATION_MODELS))
+            .subquery()
+        )
+        query = query.where(LocationIndex.id.in_(sa_select(ranked.c.id).where(ranked.c.rank == 1)))
+    if updated_from is not None:
+        query = query.where(LocationIndex.last_updated >= updated_from)
+    if updated_before is not None:
+        query = query.where(LocationIndex.last_updated < updated_before)
+
+    offset = max(0, offset)
+    results = session.exec(
+        query.order_by(LocationIndex.depth, LocationIndex.id).offset(offset).limit(count)
+    ).all()
+    rows = [row for row, _ in results]
+    if results:
+        total = results[0][1]
+    elif offset:
+        # Page au-delà de la fin : le total n'est pas porté par une ligne
+        total = session.execute(query.with_only_columns(func.count()).order_by(None)).scalar_one()
+    else:
+        total = 0
+    return LocationIndexPage(rows=rows, total=total, offset=offset)
+
+
+def load_indexed_entities(session: Session, rows: Sequence[LocationIndex]) -> List[Any]:
+    """Entités correspondant aux lignes d'index, dans l'ordre des lignes (une requête par modèle)."""
+    ids_by_model: Dict[str, List[int]] = {}
+    for row in rows:
+        ids_by_model.setdefault(row.model, []).append(row.entity_id)
+    loaded: Dict[Tuple[str, int], Any] = {}
+    for model_name, ids in ids_by_model.items():
+        model = MODELS[model_name]
+        for entity in session.exec(select(model).where(model.id.in_(ids))).all():
+            loaded[(model_name, entity.id)] = entity
+    return [loaded[(r.model, r.entity_id)] for r in rows if (r.model, r.entity_id) in loaded]
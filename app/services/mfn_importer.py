@@ -11,6 +11,11 @@ Importeur HL7 MFN^M05 pour structure hospitalière (LOC/LCH/LRL).
 Hypothèses (POC):
 - On importe dans le GHT courant (fourni par le routeur); pour EG/EJ, liaison via LRL ETBLSMNT.
 - Les Services (D) sont rattachés à un Pôle par défaut de l'EG parent.
+
+Performance:
+- Import en masse par niveau : identifiants existants chargés par lots, diff avec les
+  entités entrantes, INSERT/UPDATE groupés dans une seule transaction (ou par lots
+  avec `chunk_size`). Synthèse créés / mis à jour / inchangés par type.
 """
 from __future__ import annotations
 
@@ -124,271 +129,324 @@ def parse_mfn_message(text: str) -> List[RawEntity]:
     return entities
 
 
-def _get_or_create_default_pole(session: Session, eg: EntiteGeographique) -> Pole:
-    pole = session.exec(select(Pole).where(Pole.entite_geo_id == eg.id).limit(1)).first()
-    if pole:
-        return pole
-    pole = Pole(
-        identifier=f"{eg.identifier}-POLE",
-        name="Pôle par défaut",
-        short_name="DEF",
-        description="Pôle généré automatiquement lors de l'import MFN",
-        status=LocationStatus.ACTIVE,
-        mode=LocationMode.INSTANCE,
-        physical_type=LocationPhysicalType.AREA,
-        entite_geo_id=eg.id,
-    )
-    session.add(pole); session.commit(); session.refresh(pole)
-    return pole
-
-
-def import_mfn(text: str, session: Session, ght: GHTContext) -> Dict[str, int]:
-    """Importe le message MFN dans la base pour le GHT donné.
-    Retourne un résumé des entités créées/trouvées.
+# ----------------------------------------------------------------------
+# Import en masse
+# ----------------------------------------------------------------------
+
+# Taille des lots de chargement des identifiants existants et d'insertion (flush)
+BATCH_SIZE = 500
+
+KINDS = ("ej", "eg", "pole", "service", "uf", "uh", "chambre", "lit")
+
+
+@dataclass
+class _Planned:
+    """Entité à synchroniser : clé MFN (type, code), identifiant, champs comparés et champs de création."""
+    key: Optional[Tuple[str, str]]
+    identifier: str
+    fields: Dict[str, object]
+    create: Dict[str, object] = field(default_factory=dict)
+
+
+def _new_summary() -> Dict[str, Dict[str, int]]:
+    return {status: {kind: 0 for kind in KINDS} for status in ("created", "updated", "unchanged")}
+
+
+def _find_parent(ent: RawEntity, index: Dict[Tuple[str, str], Tuple[str, int, str]], kinds: Tuple[str, ...]):
+    """Premier parent LRL déjà indexé et du type attendu : (kind, id, identifiant)."""
+    for ref in ent.parent_refs:
+        found = index.get(ref)
+        if found and found[0] in kinds:
+            return found
+    return None
+
+
+def _sync_level(
+    session: Session,
+    model,
+    kind: str,
+    planned: List[_Planned],
+    index: Dict[Tuple[str, str], Tuple[str, int, str]],
+    summary: Dict[str, Dict[str, int]],
+    chunk_size: Optional[int],
+    identifier_attr: str = "identifier",
+    scope=None,
+) -> Dict[str, int]:
     """
-    raw = parse_mfn_message(text)
+    Synchronise un niveau de la hiérarchie par lots : chargement des existants
+    (une requête par lot), diff, ajout des créations puis un flush (INSERT groupés).
+    Commit par lot si `chunk_size` est fourni. Retourne identifiant -> id.
+    """
+    column = getattr(model, identifier_attr)
+    ids: Dict[str, int] = {}
+    step = chunk_size or BATCH_SIZE
+    for start in range(0, len(planned), step):
+        batch = planned[start:start + step]
+        query = select(model).where(column.in_({p.identifier for p in batch}))
+        if scope is not None:
+            query = query.where(scope)
+        existing = {getattr(obj, identifier_attr): obj for obj in session.exec(query).all()}
+        for p in batch:
+            obj = existing.get(p.identifier)
+            if obj is None:
+                obj = model(**{identifier_attr: p.identifier}, **p.fields, **p.create)
+                session.add(obj)
+                existing[p.identifier] = obj
+                summary["created"][kind] += 1
+                continue
+            changed = False
+            for name, value in p.fields.items():
+                if getattr(obj, name) != value:
+                    setattr(obj, name, value)
+                    changed = True
+            summary["updated" if changed else "unchanged"][kind] += 1
+        session.flush()
+        for p in batch:
+            obj_id = existing[p.identifier].id
+            ids[p.identifier] = obj_id
+            if p.key is not None:
+                index[p.key] = (kind, obj_id, p.identifier)
+        if chunk_size:
+            session.commit()
+    return ids
 
-    # Index existants par (type_code, code)
-    index: Dict[Tuple[str, str], object] = {}
 
-    created = {"ej": 0, "eg": 0, "service": 0}
+def _default_poles(
+    session: Session,
+    eg_ids: List[int],
+    eg_identifiers: Dict[int, str],
+    summary: Dict[str, Dict[str, int]],
+) -> Dict[int, int]:
+    """Pôle de rattachement des services par EG (premier pôle existant, sinon pôle par défaut créé)."""
+    poles: Dict[int, int] = {}
+    for start in range(0, len(eg_ids), BATCH_SIZE):
+        rows = session.exec(
+            select(Pole.id, Pole.entite_geo_id)
+            .where(Pole.entite_geo_id.in_(eg_ids[start:start + BATCH_SIZE]))
+            .order_by(Pole.id)
+        ).all()
+        for pole_id, eg_id in rows:
+            poles.setdefault(eg_id, pole_id)
+    missing = []
+    for eg_id in eg_ids:
+        if eg_id in poles:
+            summary["unchanged"]["pole"] += 1
+            continue
+        pole = Pole(
+            identifier=f"{eg_identifiers[eg_id]}-POLE",
+            name="Pôle par défaut",
+            short_name="DEF",
+            description="Pôle généré automatiquement lors de l'import MFN",
+            status=LocationStatus.ACTIVE,
+            mode=LocationMode.INSTANCE,
+            physical_type=LocationPhysicalType.AREA,
+            entite_geo_id=eg_id,
+        )
+        session.add(pole)
+        missing.append(pole)
+        summary["created"]["pole"] += 1
+    if missing:
+        session.flush()
+        poles.update({pole.entite_geo_id: pole.id for pole in missing})
+    return poles
+
+
+def _label(ent: RawEntity, default: str) -> str:
+    return ent.get("LBL") or ent.get("TYPE_LABEL") or default
+
+
+def import_mfn(
+    text: str,
+    session: Session,
+    ght: GHTContext,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, Dict[str, int]]:
+    """Importe le message MFN dans la base pour le GHT donné.
 
-    # 1ère passe: créer EJ / EG sans relations
-    # On itère pour créer EJ et EG, et indexer par (type, code)
+    Import en masse, niveau par niveau (EJ, EG, Service, UF, Chambre, Lit) : les
+    identifiants existants sont chargés par lots, les entités entrantes comparées
+    puis créées ou mises à jour par INSERT/UPDATE groupés, dans une seule
+    transaction (ou un commit tous les `chunk_size` entités d'un niveau).
+    Les écouteurs mapper (registre des lieux, occupation des lits) restent actifs.
+
+    Retourne {"created"|"updated"|"unchanged": {type: nombre}}.
+    """
+    raw = parse_mfn_message(text)
+    summary = _new_summary()
+    # (type_code, code) -> (kind, id, identifiant)
+    index: Dict[Tuple[str, str], Tuple[str, int, str]] = {}
+
+    by_type: Dict[str, List[RawEntity]] = {}
     for ent in raw:
         t = (ent.type_code or "").upper()
-        code = ent.get("CD")
-        if not t or not code:
-            continue
-        if t == "M":
-            # Entité Juridique
-            finess_ej = ent.get("FNS")
-            name = ent.get("LBL") or ent.get("TYPE_LABEL") or f"EJ {code}"
-            short = ent.get("LBL_CRT") or None
-            # Rechercher l'EJ existante DANS LE GHT ACTUEL
-            existing = session.exec(
-                select(EntiteJuridique).where(
-                    EntiteJuridique.finess_ej == finess_ej,
-                    EntiteJuridique.ght_context_id == ght.id
-                )
-            ).first() if finess_ej else None
-            if existing:
-                ej = existing
-            else:
-                ej = EntiteJuridique(
-                    name=name,
-                    short_name=short,
-                    finess_ej=finess_ej or code,
+        if t and ent.get("CD"):
+            by_type.setdefault(t, []).append(ent)
+
+    def entities(*types: str) -> List[RawEntity]:
+        return [ent for t in types for ent in by_type.get(t, [])]
+
+    try:
+        # Entités juridiques : réconciliées par FINESS dans le GHT courant, jamais modifiées
+        planned = []
+        for ent in entities("M"):
+            code = ent.get("CD")
+            planned.append(_Planned(
+                key=("M", code),
+                identifier=ent.get("FNS") or code,
+                fields={},
+                create=dict(
+                    name=_label(ent, f"EJ {code}"),
+                    short_name=ent.get("LBL_CRT") or None,
                     address_line=ent.get("ADRS_1") or None,
                     postal_code=ent.get("CD_PSTL") or None,
                     city=ent.get("VL") or None,
                     ght_context_id=ght.id,
-                )
-                session.add(ej); session.commit(); session.refresh(ej)
-                created["ej"] += 1
-            index[(t, code)] = ej
-        elif t in {"ETBL_GRPQ"}:
-            # Entité géographique
-            finess = ent.get("FNS")
-            identifier = ent.get("ID_GLBL") or f"EG-{code}"
-            name = ent.get("LBL") or ent.get("TYPE_LABEL") or f"EG {code}"
-            short = ent.get("LBL_CRT") or None
-            # Rechercher l'EG existante par identifier (plus fiable que FINESS qui peut être partagé)
-            # On ne filtre pas par GHT ici car l'EG sera liée à l'EJ qui elle est dans le bon GHT
-            existing = session.exec(select(EntiteGeographique).where(EntiteGeographique.identifier == identifier)).first()
-            if existing:
-                eg = existing
-                # Mettre à jour les infos si nécessaire
-                eg.name = name
-                eg.short_name = short
-                eg.finess = finess or code
-                session.add(eg)
-                session.commit()
-                session.refresh(eg)
-            else:
-                eg = EntiteGeographique(
-                    identifier=identifier,
-                    name=name,
-                    short_name=short,
-                    finess=finess or code,
+                ),
+            ))
+        _sync_level(session, EntiteJuridique, "ej", planned, index, summary, chunk_size,
+                    identifier_attr="finess_ej", scope=EntiteJuridique.ght_context_id == ght.id)
+
+        # Entités géographiques : identifiant global, rattachées à l'EJ parente si présente
+        planned = []
+        for ent in entities("ETBL_GRPQ"):
+            code = ent.get("CD")
+            fields = dict(
+                name=_label(ent, f"EG {code}"),
+                short_name=ent.get("LBL_CRT") or None,
+                finess=ent.get("FNS") or code,
+            )
+            parent = _find_parent(ent, index, ("ej",))
+            if parent:
+                fields["entite_juridique_id"] = parent[1]
+            planned.append(_Planned(
+                key=("ETBL_GRPQ", code),
+                identifier=ent.get("ID_GLBL") or f"EG-{code}",
+                fields=fields,
+                create=dict(
                     address_line1=ent.get("ADRS_1") or None,
                     address_line2=ent.get("ADRS_2") or None,
                     address_line3=ent.get("ADRS_3") or None,
                     address_postalcode=ent.get("CD_PSTL") or None,
                     address_city=ent.get("VL") or None,
-                )
-                session.add(eg); session.commit(); session.refresh(eg)
-                created["eg"] += 1
-            index[(t, code)] = eg
-        # Services et autres seront faits en 2e passe (besoin de parent)
+                ),
+            ))
+        _sync_level(session, EntiteGeographique, "eg", planned, index, summary, chunk_size)
 
-    # 2e passe: relier EG -> EJ et créer Services sous EG
-    for ent in raw:
-        t = (ent.type_code or "").upper()
-        code = ent.get("CD")
-        if not t or not code:
-            continue
-        if t == "ETBL_GRPQ":
-            eg = index.get((t, code))
-            if not eg:
-                continue
-            # Chercher un parent EntiteJuridique parmi tous les parents possibles
-            for p_type, p_code in ent.parent_refs:
-                parent_ej = index.get((p_type, p_code))
-                if isinstance(parent_ej, EntiteJuridique):
-                    eg.entite_juridique_id = parent_ej.id
-                    session.add(eg); session.commit(); session.refresh(eg)
-                    break
-        elif t in {"D", "SERV"}:
-            # Créer Service sous EG parent (via LRL LCLSTN)
-            # Chercher un parent EntiteGeographique parmi tous les parents possibles
-            parent_eg = None
-            for p_type, p_code in ent.parent_refs:
-                obj = index.get((p_type, p_code))
-                if isinstance(obj, EntiteGeographique):
-                    parent_eg = obj
-                    break
-            if not parent_eg:
-                continue
-            pole = _get_or_create_default_pole(session, parent_eg)
-            identifier = ent.get("ID_GLBL") or f"SRV-{code}"
-            name = ent.get("LBL") or ent.get("TYPE_LABEL") or f"Service {code}"
-            short = ent.get("LBL_CRT") or None
-            # Déterminer service_type (par défaut MCO)
-            service_type = LocationServiceType.MCO
-            srv = session.exec(select(Service).where(Service.identifier == identifier)).first()
-            if srv:
-                # Update minimal fields
-                srv.name = name
-                srv.short_name = short
-                srv.pole_id = pole.id
-            else:
-                srv = Service(
-                    identifier=identifier,
-                    name=name,
-                    short_name=short,
+        # Services : sous le pôle par défaut de l'EG parente
+        services = [(ent, _find_parent(ent, index, ("eg",))) for ent in entities("D", "SERV")]
+        services = [(ent, parent) for ent, parent in services if parent]
+        eg_identifiers = {parent[1]: parent[2] for _, parent in services}
+        poles = _default_poles(session, list(eg_identifiers), eg_identifiers, summary)
+        planned = []
+        for ent, parent in services:
+            code = ent.get("CD")
+            planned.append(_Planned(
+                key=((ent.type_code or "").upper(), code),
+                identifier=ent.get("ID_GLBL") or f"SRV-{code}",
+                fields=dict(
+                    name=_label(ent, f"Service {code}"),
+                    short_name=ent.get("LBL_CRT") or None,
+                    pole_id=poles[parent[1]],
+                ),
+                create=dict(
                     status=LocationStatus.ACTIVE,
                     mode=LocationMode.INSTANCE,
                     physical_type=LocationPhysicalType.SI,
-                    service_type=service_type,
-                    pole_id=pole.id,
-                )
-            session.add(srv); session.commit(); session.refresh(srv)
-            created["service"] += 1
-            # Indexer le service pour les enfants
-            index[(t, code)] = srv
-        elif t in {"N", "UF"}:
-            # Créer UniteFonctionnelle sous Service parent
-            # Chercher un parent Service parmi tous les parents possibles
-            parent_srv = None
-            for p_type, p_code in ent.parent_refs:
-                obj = index.get((p_type, p_code))
-                if isinstance(obj, Service):
-                    parent_srv = obj
-                    break
-            if not parent_srv:
+                    service_type=LocationServiceType.MCO,
+                ),
+            ))
+        _sync_level(session, Service, "service", planned, index, summary, chunk_size)
+
+        # Unités fonctionnelles
+        planned = []
+        for ent in entities("N", "UF"):
+            parent = _find_parent(ent, index, ("service",))
+            if not parent:
                 continue
-            identifier = ent.get("ID_GLBL") or f"UF-{code}"
-            name = ent.get("LBL") or ent.get("TYPE_LABEL") or f"UF {code}"
-            short = ent.get("LBL_CRT") or None
-            uf = session.exec(select(UniteFonctionnelle).where(UniteFonctionnelle.identifier == identifier)).first()
-            if uf:
-                uf.name = name
-                uf.short_name = short
-                uf.service_id = parent_srv.id
-            else:
-                uf = UniteFonctionnelle(
-                    identifier=identifier,
-                    name=name,
-                    short_name=short,
+            code = ent.get("CD")
+            planned.append(_Planned(
+                key=((ent.type_code or "").upper(), code),
+                identifier=ent.get("ID_GLBL") or f"UF-{code}",
+                fields=dict(
+                    name=_label(ent, f"UF {code}"),
+                    short_name=ent.get("LBL_CRT") or None,
+                    service_id=parent[1],
+                ),
+                create=dict(
                     status=LocationStatus.ACTIVE,
                     mode=LocationMode.INSTANCE,
                     physical_type=LocationPhysicalType.WI,  # Aile
-                    service_id=parent_srv.id,
-                )
-            session.add(uf); session.commit(); session.refresh(uf)
-            index[(t, code)] = uf
-        elif t in {"R", "CHAMBRE"}:
-            # Créer Chambre - parent peut être UF ou UniteHebergement
-            # Chercher un parent UF ou UH parmi tous les parents possibles
-            parent_obj = None
-            for p_type, p_code in ent.parent_refs:
-                obj = index.get((p_type, p_code))
-                if isinstance(obj, (UniteFonctionnelle, UniteHebergement)):
-                    parent_obj = obj
-                    break
-            if not parent_obj:
-                continue
-            # Si parent est UF, créer UniteHebergement intermédiaire
-            if isinstance(parent_obj, UniteFonctionnelle):
-                # Créer ou récupérer UH par défaut pour cette UF
-                uh_identifier = f"UH-{parent_obj.identifier}"
-                uh = session.exec(select(UniteHebergement).where(UniteHebergement.identifier == uh_identifier)).first()
-                if not uh:
-                    uh = UniteHebergement(
-                        identifier=uh_identifier,
-                        name=f"Unité d'hébergement - {parent_obj.name}",
+                ),
+            ))
+        uf_names = {p.identifier: p.fields["name"] for p in planned}
+        _sync_level(session, UniteFonctionnelle, "uf", planned, index, summary, chunk_size)
+
+        # Chambres : parent UH, ou UF (UH intermédiaire "UH-<UF>" créée si absente, jamais modifiée)
+        rooms = [(ent, _find_parent(ent, index, ("uf", "uh"))) for ent in entities("R", "CHAMBRE")]
+        rooms = [(ent, parent) for ent, parent in rooms if parent]
+        planned, seen = [], set()
+        for _, (kind, uf_id, uf_identifier) in rooms:
+            if kind == "uf" and uf_id not in seen:
+                seen.add(uf_id)
+                planned.append(_Planned(
+                    key=None,
+                    identifier=f"UH-{uf_identifier}",
+                    fields={},
+                    create=dict(
+                        name=f"Unité d'hébergement - {uf_names.get(uf_identifier, uf_identifier)}",
                         status=LocationStatus.ACTIVE,
                         mode=LocationMode.INSTANCE,
                         physical_type=LocationPhysicalType.FL,  # Étage
-                        unite_fonctionnelle_id=parent_obj.id,
-                    )
-                    session.add(uh); session.commit(); session.refresh(uh)
-                parent_uh = uh
-            elif isinstance(parent_obj, UniteHebergement):
-                parent_uh = parent_obj
-            else:
-                continue
-            identifier = ent.get("ID_GLBL") or f"CH-{code}"
-            name = ent.get("LBL") or ent.get("TYPE_LABEL") or f"Chambre {code}"
-            short = ent.get("LBL_CRT") or None
-            chambre = session.exec(select(Chambre).where(Chambre.identifier == identifier)).first()
-            if chambre:
-                chambre.name = name
-                chambre.short_name = short
-                chambre.unite_hebergement_id = parent_uh.id
-            else:
-                chambre = Chambre(
-                    identifier=identifier,
-                    name=name,
-                    short_name=short,
+                        unite_fonctionnelle_id=uf_id,
+                    ),
+                ))
+        default_uhs = _sync_level(session, UniteHebergement, "uh", planned, index, summary, chunk_size)
+        planned = []
+        for ent, (kind, parent_id, parent_identifier) in rooms:
+            code = ent.get("CD")
+            uh_id = default_uhs[f"UH-{parent_identifier}"] if kind == "uf" else parent_id
+            planned.append(_Planned(
+                key=((ent.type_code or "").upper(), code),
+                identifier=ent.get("ID_GLBL") or f"CH-{code}",
+                fields=dict(
+                    name=_label(ent, f"Chambre {code}"),
+                    short_name=ent.get("LBL_CRT") or None,
+                    unite_hebergement_id=uh_id,
+                ),
+                create=dict(
                     status=LocationStatus.ACTIVE,
                     mode=LocationMode.INSTANCE,
                     physical_type=LocationPhysicalType.RO,  # Room
-                    unite_hebergement_id=parent_uh.id,
-                )
-            session.add(chambre); session.commit(); session.refresh(chambre)
-            index[(t, code)] = chambre
-        elif t in {"B", "LIT"}:
-            # Créer Lit sous Chambre parent
-            # Chercher un parent Chambre parmi tous les parents possibles
-            parent_ch = None
-            for p_type, p_code in ent.parent_refs:
-                obj = index.get((p_type, p_code))
-                if isinstance(obj, Chambre):
-                    parent_ch = obj
-                    break
-            if not parent_ch:
+                ),
+            ))
+        _sync_level(session, Chambre, "chambre", planned, index, summary, chunk_size)
+
+        # Lits
+        planned = []
+        for ent in entities("B", "LIT"):
+            parent = _find_parent(ent, index, ("chambre",))
+            if not parent:
                 continue
-            identifier = ent.get("ID_GLBL") or f"LIT-{code}"
-            name = ent.get("LBL") or ent.get("TYPE_LABEL") or f"Lit {code}"
-            short = ent.get("LBL_CRT") or None
-            lit = session.exec(select(Lit).where(Lit.identifier == identifier)).first()
-            if lit:
-                lit.name = name
-                lit.short_name = short
-                lit.chambre_id = parent_ch.id
-            else:
-                lit = Lit(
-                    identifier=identifier,
-                    name=name,
-                    short_name=short,
+            code = ent.get("CD")
+            planned.append(_Planned(
+                key=((ent.type_code or "").upper(), code),
+                identifier=ent.get("ID_GLBL") or f"LIT-{code}",
+                fields=dict(
+                    name=_label(ent, f"Lit {code}"),
+                    short_name=ent.get("LBL_CRT") or None,
+                    chambre_id=parent[1],
+                ),
+                create=dict(
                     status=LocationStatus.ACTIVE,
                     mode=LocationMode.INSTANCE,
                     physical_type=LocationPhysicalType.BD,  # Bed
-                    chambre_id=parent_ch.id,
-                )
-            session.add(lit); session.commit(); session.refresh(lit)
-            index[(t, code)] = lit
+                ),
+            ))
+        _sync_level(session, Lit, "lit", planned, index, summary, chunk_size)
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
 
-    return created
+    return summary
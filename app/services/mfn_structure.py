@@ -10,6 +10,26 @@ from app.models_structure import (
 
 logger = logging.getLogger(__name__)
 
+# Type LOC (LOC-3) et libellé des lieux émis en MFN (EJ : MFN Organization)
+MFN_LOCATION_TYPES = {
+    "EntiteGeographique": "M",
+    "Pole": "P",
+    "Service": "D",
+    "UniteFonctionnelle": "UF",
+    "UniteHebergement": "UH",
+    "Chambre": "CH",
+    "Lit": "LIT",
+}
+MFN_LOCATION_LABELS = {
+    "EntiteGeographique": "Etablissement juridique",
+    "Pole": "Pole",
+    "Service": "Service",
+    "UniteFonctionnelle": "Unite fonctionnelle",
+    "UniteHebergement": "Unite d'hebergement",
+    "Chambre": "Chambre",
+    "Lit": "Lit",
+}
+
 def clean_hl7_date(hl7_date: Optional[str]) -> Optional[str]:
     """Normalise une date HL7 en chaîne YYYYMMDD[HHMMSS]."""
     if not hl7_date:
@@ -314,105 +334,212 @@ def save_location(
             "error": str(e)
         }
 
-def generate_mfn_message(session: Session) -> str:
-    """
-    Génère un message MFN M05 à partir des locations en base
-    """
-    # En-tête du message
+# Caractéristiques LCH propres à certains modèles : (attribut, code^libellé)
+_EXTRA_LCH = {
+    "EntiteGeographique": [
+        ("finess", "FNS^Code FINESS"),
+        ("category_sae", "CTGR_S^Catégorie SAE"),
+        ("city_insee_code", "INS^Code INSEE commune"),
+        ("type", "TPLG^Typologie"),
+        ("responsible_id", "ID_GLBL_RSPNSBL^Identifiant responsable"),
+        ("responsible_name", "NM_USL_RSPNSBL^Nom responsable"),
+        ("responsible_firstname", "PRNM_RSPNSBL^Prénom responsable"),
+        ("responsible_rpps", "RPPS_RSPNSBL^RPPS responsable"),
+        ("responsible_adeli", "ADL_RSPNSBL^ADELI responsable"),
+        ("responsible_specialty", "CD_SPCLT_RSPNSBL^Spécialité responsable"),
+    ],
+    "Service": [
+        ("typology", "TPLG^Typologie"),
+        ("responsible_id", "ID_GLBL_RSPNSBL^Identifiant unique global du responsable"),
+        ("responsible_name", "NM_USL_RSPNSBL^Nom usuel du responsable"),
+        ("responsible_firstname", "PRNM_RSPNSBL^Prénom du responsable"),
+        ("responsible_rpps", "RPPS_RSPNSBL^Code RPPS du responsable"),
+        ("responsible_adeli", "ADL_RSPNSBL^Code ADELI du responsable"),
+        ("responsible_specialty", "CD_SPCLT_RSPNSBL^Code spécialité B2 du responsable"),
+    ],
+    "UniteFonctionnelle": [("um_code", "CD_UM^Code UM")],
+    "Lit": [("operational_status", "OPERATIONAL_STATUS^Statut opérationnel")],
+}
+
+# Modèle -> (modèle parent, clé étrangère) pour la relation LRL des messages delta
+_MFN_PARENTS = {
+    "Pole": (EntiteGeographique, "entite_geo_id"),
+    "Service": (Pole, "pole_id"),
+    "UniteFonctionnelle": (Service, "service_id"),
+    "UniteHebergement": (UniteFonctionnelle, "unite_fonctionnelle_id"),
+    "Chambre": (UniteHebergement, "unite_hebergement_id"),
+    "Lit": (Chambre, "chambre_id"),
+}
+
+_MFN_MODELS = {
+    "EntiteGeographique": EntiteGeographique,
+    "Pole": Pole,
+    "Service": Service,
+    "UniteFonctionnelle": UniteFonctionnelle,
+    "UniteHebergement": UniteHebergement,
+    "Chambre": Chambre,
+    "Lit": Lit,
+}
+
+
+def _msh_mfi(update: bool) -> List[str]:
     now = datetime.now().strftime("%Y%m%d%H%M%S")
-    message = [
+    return [
         f"MSH|^~\\&|STR|STR|RECEPTEUR|RECEPTEUR|{now}||MFN^M05^MFN_M05|{now}|P|2.5|||||FRA|8859/15",
-        f"MFI|LOC|CPAGE_LOC_FRA|REP||{now}|AL"
+        f"MFI|LOC|CPAGE_LOC_FRA|{'UPD' if update else 'REP'}||{now}|AL",
     ]
-    
-    # Fonction helper pour générer les segments LCH
-    def add_lch_segments(entity: Any, identifier: str) -> List[str]:
-        segments = []
-        
-        # Caractéristiques communes
-        segments.extend([
-            f"LCH|{identifier}|||ID_GLBL^Identifiant unique global^L|^{entity.identifier}",
-            f"LCH|{identifier}|||LBL^Libelle^L|^{entity.name}",
-            f"LCH|{identifier}|||LBL_CRT^Libelle court^L|^{entity.short_name or ''}",
-        ])
-        
-        # Adresse si présente
-        if entity.address_line1:
-            segments.append(f"LCH|{identifier}|||ADRS_1^Adresse 1^L|^{entity.address_line1}")
-        if entity.address_line2:
-            segments.append(f"LCH|{identifier}|||ADRS_2^Adresse 2^L|^{entity.address_line2}")
-        if entity.address_line3:
-            segments.append(f"LCH|{identifier}|||ADRS_3^Adresse 3^L|^{entity.address_line3}")
-        if entity.address_postalcode:
-            segments.append(f"LCH|{identifier}|||CD_PSTL^Code postal^L|^{entity.address_postalcode}")
-        if entity.address_city:
-            segments.append(f"LCH|{identifier}|||VL^Ville^L|^{entity.address_city}")
-            
-        # Dates
-        if entity.opening_date:
-            segments.append(f"LCH|{identifier}|||DT_OVRTR^Date d'ouverture^L|^{format_datetime(entity.opening_date)}")
-        if entity.activation_date:
-            segments.append(f"LCH|{identifier}|||DT_ACTVTN^Date d'activation^L|^{format_datetime(entity.activation_date)}")
-        if entity.closing_date:
-            segments.append(f"LCH|{identifier}|||DT_FRMTR^Date de fermeture^L|^{format_datetime(entity.closing_date)}")
-        if entity.deactivation_date:
-            segments.append(f"LCH|{identifier}|||DT_FN_ACTVTN^Date de fin d'activation^L|^{format_datetime(entity.deactivation_date)}")
-            
-        return segments
-    
+
+
+def _lch_segments(entity: Any, identifier: str) -> List[str]:
+    """Segments LCH communes à tous les lieux puis caractéristiques propres au modèle."""
+    segments = [
+        f"LCH|{identifier}|||ID_GLBL^Identifiant unique global^L|^{entity.identifier}",
+        f"LCH|{identifier}|||LBL^Libelle^L|^{entity.name}",
+        f"LCH|{identifier}|||LBL_CRT^Libelle court^L|^{entity.short_name or ''}",
+    ]
+
+    # Adresse si présente
+    if entity.address_line1:
+        segments.append(f"LCH|{identifier}|||ADRS_1^Adresse 1^L|^{entity.address_line1}")
+    if entity.address_line2:
+        segments.append(f"LCH|{identifier}|||ADRS_2^Adresse 2^L|^{entity.address_line2}")
+    if entity.address_line3:
+        segments.append(f"LCH|{identifier}|||ADRS_3^Adresse 3^L|^{entity.address_line3}")
+    if entity.address_postalcode:
+        segments.append(f"LCH|{identifier}|||CD_PSTL^Code postal^L|^{entity.address_postalcode}")
+    if entity.address_city:
+        segments.append(f"LCH|{identifier}|||VL^Ville^L|^{entity.address_city}")
+
+    # Dates
+    if entity.opening_date:
+        segments.append(f"LCH|{identifier}|||DT_OVRTR^Date d'ouverture^L|^{format_datetime(entity.opening_date)}")
+    if entity.activation_date:
+        segments.append(f"LCH|{identifier}|||DT_ACTVTN^Date d'activation^L|^{format_datetime(entity.activation_date)}")
+    if entity.closing_date:
+        segments.append(f"LCH|{identifier}|||DT_FRMTR^Date de fermeture^L|^{format_datetime(entity.closing_date)}")
+    if entity.deactivation_date:
+        segments.append(f"LCH|{identifier}|||DT_FN_ACTVTN^Date de fin d'activation^L|^{format_datetime(entity.deactivation_date)}")
+
+    for attr, code in _EXTRA_LCH.get(type(entity).__name__, ()):
+        value = getattr(entity, attr, None)
+        if value:
+            segments.append(f"LCH|{identifier}|||{code}^L|^{value}")
+    return segments
+
+
+def _location_segments(entity: Any, event_code: str, parent: Optional[Any] = None) -> List[str]:
+    """Entrée MFE + LOC + LCH (+ LRL vers le parent) d'un lieu."""
+    model_name = type(entity).__name__
+    loc_type = MFN_LOCATION_TYPES[model_name]
+    identifier = f"^^^^^{loc_type}^^^^{entity.identifier}"
+    segments = [
+        f"MFE|{event_code}|||{identifier}|PL",
+        f"LOC|{identifier}||{loc_type}|{MFN_LOCATION_LABELS[model_name]}",
+    ]
+    segments.extend(_lch_segments(entity, identifier))
+    if parent is not None:
+        parent_type = MFN_LOCATION_TYPES[type(parent).__name__]
+        segments.append(
+            f"LRL|{identifier}|||LCLSTN^Relation de localisation^L||^^^^^{parent_type}^^^^{parent.identifier}"
+        )
+    return segments
+
+
+def generate_mfn_message(session: Session) -> str:
+    """
+    Génère un message MFN M05 à partir des locations en base (snapshot complet, MFI-3 = REP)
+    """
+    message = _msh_mfi(update=False)
+
     # Entités géographiques
     for eg in session.exec(select(EntiteGeographique)).all():
-        identifier = f"^^^^^M^^^^{eg.identifier}"
-        message.append(f"MFE|MAD|||{identifier}|PL")
-        message.append(f"LOC|{identifier}||M|Etablissement juridique")
-        message.extend(add_lch_segments(eg, identifier))
-        if eg.finess:
-            message.append(f"LCH|{identifier}|||FNS^Code FINESS^L|^{eg.finess}")
-        if eg.category_sae:
-            message.append(f"LCH|{identifier}|||CTGR_S^Catégorie SAE^L|^{eg.category_sae}")
-        if eg.city_insee_code:
-            message.append(f"LCH|{identifier}|||INS^Code INSEE commune^L|^{eg.city_insee_code}")
-        if eg.type:
-            message.append(f"LCH|{identifier}|||TPLG^Typologie^L|^{eg.type}")
-        if eg.responsible_id:
-            message.append(f"LCH|{identifier}|||ID_GLBL_RSPNSBL^Identifiant responsable^L|^{eg.responsible_id}")
-        if eg.responsible_name:
-            message.append(f"LCH|{identifier}|||NM_USL_RSPNSBL^Nom responsable^L|^{eg.responsible_name}")
-        if eg.responsible_firstname:
-            message.append(f"LCH|{identifier}|||PRNM_RSPNSBL^Prénom responsable^L|^{eg.responsible_firstname}")
-        if eg.responsible_rpps:
-            message.append(f"LCH|{identifier}|||RPPS_RSPNSBL^RPPS responsable^L|^{eg.responsible_rpps}")
-        if eg.responsible_adeli:
-            message.append(f"LCH|{identifier}|||ADL_RSPNSBL^ADELI responsable^L|^{eg.responsible_adeli}")
-        if eg.responsible_specialty:
-            message.append(f"LCH|{identifier}|||CD_SPCLT_RSPNSBL^Spécialité responsable^L|^{eg.responsible_specialty}")
-    
-    # Services (avec leurs responsables)
+        message.extend(_location_segments(eg, "MAD"))
+
+    # Services (avec leurs responsables et la relation avec le pôle)
     for service in session.exec(select(Service)).all():
-        identifier = f"^^^^^D^^^^{service.identifier}"
-        message.append(f"MFE|MAD|||{identifier}|PL")
-        message.append(f"LOC|{identifier}||D|Service")
-        message.extend(add_lch_segments(service, identifier))
-        
-        if service.typology:
-            message.append(f"LCH|{identifier}|||TPLG^Typologie^L|^{service.typology}")
-        if service.responsible_id:
-            message.append(f"LCH|{identifier}|||ID_GLBL_RSPNSBL^Identifiant unique global du responsable^L|^{service.responsible_id}")
-        if service.responsible_name:
-            message.append(f"LCH|{identifier}|||NM_USL_RSPNSBL^Nom usuel du responsable^L|^{service.responsible_name}")
-        if service.responsible_firstname:
-            message.append(f"LCH|{identifier}|||PRNM_RSPNSBL^Prénom du responsable^L|^{service.responsible_firstname}")
-        if service.responsible_rpps:
-            message.append(f"LCH|{identifier}|||RPPS_RSPNSBL^Code RPPS du responsable^L|^{service.responsible_rpps}")
-        if service.responsible_adeli:
-            message.append(f"LCH|{identifier}|||ADL_RSPNSBL^Code ADELI du responsable^L|^{service.responsible_adeli}")
-        if service.responsible_specialty:
-            message.append(f"LCH|{identifier}|||CD_SPCLT_RSPNSBL^Code spécialité B2 du responsable^L|^{service.responsible_specialty}")
-            
-        # Relation avec le pôle
-        if service.pole:
-            message.append(f"LRL|{identifier}|||LCLSTN^Relation de localisation^L||^^^^^P^^^^{service.pole.identifier}")
-    
+        message.extend(_location_segments(service, "MAD", service.pole))
+
     # Et ainsi de suite pour les autres types...
-    
+
+    return "\n".join(message)
+
+
+def _model_segments(session: Session, model_name: str, codes: Optional[Dict[int, str]] = None) -> List[str]:
+    """Entrées d'un modèle (toutes si `codes` est None, sinon ces ids avec leur code MFE)
+    chargées en une requête, parents en une requête."""
+    model = _MFN_MODELS[model_name]
+    stmt = select(model).order_by(model.id)
+    if codes is not None:
+        stmt = stmt.where(model.id.in_(list(codes)))
+    entities = session.exec(stmt).all()
+    parents: Dict[int, Any] = {}
+    parent_attr = None
+    if model_name in _MFN_PARENTS:
+        parent_model, parent_attr = _MFN_PARENTS[model_name]
+        parent_ids = {getattr(e, parent_attr) for e in entities} - {None}
+        if parent_ids:
+            parents = {
+                p.id: p
+                for p in session.exec(select(parent_model).where(parent_model.id.in_(list(parent_ids)))).all()
+            }
+    segments: List[str] = []
+    for entity in entities:
+        parent = parents.get(getattr(entity, parent_attr)) if parent_attr else None
+        segments.extend(_location_segments(entity, codes[entity.id] if codes is not None else "MAD", parent))
+    return segments
+
+
+def generate_mfn_full_snapshot(session: Session) -> str:
+    """
+    Génère un snapshot MFN M05 de tous les niveaux (EG → Lit, MFI-3 = REP, parents avant
+    enfants) : référence initiale d'un endpoint synchronisé en delta.
+    """
+    message = _msh_mfi(update=False)
+    for model_name in _MFN_MODELS:
+        message.extend(_model_segments(session, model_name))
     return "\n".join(message)
+
+
+def generate_mfn_delta(
+    session: Session, since_version: int, limit: Optional[int] = None
+) -> Tuple[Optional[str], int]:
+    """
+    Génère un message MFN M05 incrémental (MFI-3 = UPD) à partir du journal des
+    modifications de structure : entrées MAD/MUP/MDL des seuls lieux modifiés depuis
+    `since_version`, tous niveaux (EG → Lit), parents avant enfants et suppressions
+    des enfants avant les parents.
+
+    Retourne (message, dernière version couverte) ; message None si aucune entrée
+    (la version retournée permet quand même d'avancer le point de synchronisation).
+    """
+    from app.services.structure_journal import changes_since
+
+    entries, last_version = changes_since(session, since_version, limit=limit)
+    entries = [e for e in entries if e.model in MFN_LOCATION_TYPES]
+    if not entries:
+        return None, last_version
+
+    message = _msh_mfi(update=True)
+    upserts: Dict[str, Dict[int, str]] = {}
+    for entry in entries:
+        if entry.code != "MDL":
+            upserts.setdefault(entry.model, {})[entry.entity_id] = entry.code
+
+    # Chargement par modèle (une requête), puis parents (une requête par modèle parent)
+    for model_name in _MFN_MODELS:
+        codes = upserts.get(model_name)
+        if codes:
+            message.extend(_model_segments(session, model_name, codes))
+
+    # Suppressions : MFE MDL + LOC, enfants avant parents
+    order = {name: i for i, name in enumerate(_MFN_MODELS)}
+    deleted = sorted((e for e in entries if e.code == "MDL"), key=lambda e: -order[e.model])
+    for entry in deleted:
+        if not entry.identifier:
+            continue
+        loc_type = MFN_LOCATION_TYPES[entry.model]
+        identifier = f"^^^^^{loc_type}^^^^{entry.identifier}"
+        message.append(f"MFE|MDL|||{identifier}|PL")
+        message.append(f"LOC|{identifier}||{loc_type}|")
+
+    return "\n".join(message), last_version
@@ -4,7 +4,9 @@ Contenu
 - Framing/déframing MLLP: `frame_hl7`, `deframe_hl7`
 - Parsing minimal MSH: `parse_msh_fields`
 - Construction d'ACK: `build_ack`
-- Serveur asyncio: `start_mllp_server` / `stop_mllp_server`
+- Serveur asyncio: `start_mllp_server` / `stop_mllp_server` (arrêt avec
+    drainage des connexions en cours, `open_connections`) ; sessions synchrones
+    ou `AsyncSession` (voir `app.db_async.async_session_factory`)
 - Client simple: `send_mllp`
 
 Traces
@@ -15,9 +17,12 @@ Traces
 import asyncio
 import logging
 import os
+import weakref
+from contextlib import asynccontextmanager
 from typing import Callable, Awaitable
 from datetime import datetime
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.models_endpoints import SystemEndpoint
 
 logger = logging.getLogger("mllp")
@@ -27,6 +32,9 @@ START_BLOCK = b"\x0b"  # VT
 END_BLOCK = b"\x1c"    # FS
 CARRIAGE_RETURN = b"\x0d"
 
+# Connexions en cours de traitement par serveur (drainées à l'arrêt)
+_connections: "weakref.WeakKeyDictionary[asyncio.base_events.Server, set]" = weakref.WeakKeyDictionary()
+
 
 def frame_hl7(message: str) -> bytes:
     """Encapsule un message HL7 en trame MLLP (VT <msg> FS CR)."""
@@ -119,18 +127,32 @@ def _hexdump(b: bytes, width: int = 16) -> str:
         lines.append(f"{i:04x}  {hexs:<{width*3}}  {text}")
     return "\n".join(lines)
 
+@asynccontextmanager
+async def _open_session(session_factory: Callable):
+    """Session de `session_factory` : context manager synchrone ou asynchrone."""
+    factory_cm = session_factory()
+    if hasattr(factory_cm, "__aenter__"):
+        async with factory_cm as s:
+            yield s
+    else:
+        with factory_cm as s:
+            yield s
+
 async def start_mllp_server(
     host: str, port: int,
     on_message: Callable[[str, Session, SystemEndpoint], Awaitable[str]],
     endpoint: SystemEndpoint,
-    session_factory: Callable[[], Session]
+    session_factory: Callable[[], Session | AsyncSession],
+    reuse_port: bool = False,
 ):
     """Démarre un serveur MLLP asyncio.
 
     - `on_message` est appelé pour chaque message HL7 détramé avec une
-      session courte (via `session_factory`). Il doit retourner un ACK HL7.
+      session courte (via `session_factory`, synchrone ou async). Il doit
+      retourner un ACK HL7.
     - En cas d'erreur applicative, un ACK AE est renvoyé; en erreur
       système, un ACK AR.
+    - `reuse_port` (SO_REUSEPORT) permet à plusieurs workers d'écouter le même port.
     """
     async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         peer = writer.get_extra_info("peername")
@@ -153,7 +175,7 @@ async def start_mllp_server(
                     f = parse_msh_fields(msg)
                     ctrl = f.get("control_id")
                     logger.info(f"[MLLP] Frame {idx}/{len(messages)} MSH-10={ctrl or '∅'} MSH-9={f.get('msg_type')}")
-                    with session_factory() as s:
+                    async with _open_session(session_factory) as s:
                         try:
                             ack = await on_message(msg, s, endpoint)
                             writer.write(frame_hl7(ack))
@@ -173,8 +195,19 @@ async def start_mllp_server(
                 pass
             logger.info(f"[MLLP] Disconnect {peer} from {host}:{port}")
 
+    connections: set = set()
+
+    async def tracked(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        connections.add(task)
+        try:
+            await handle(reader, writer)
+        finally:
+            connections.discard(task)
+
     try:
-        server = await asyncio.start_server(handle, host=host, port=port)
+        server = await asyncio.start_server(tracked, host=host, port=port, reuse_port=reuse_port or None)
+        _connections[server] = connections
         sockname = server.sockets[0].getsockname() if server.sockets else (host, port)
         logger.info(f"✅ MLLP {endpoint.name} listening on {sockname[0]}:{sockname[1]}")
         return server
@@ -194,9 +227,27 @@ async def send_mllp(host: str, port: int, message: str, timeout: float = 10.0) -
     return frames[0] if frames else ""
 
 
-async def stop_mllp_server(server: asyncio.base_events.Server) -> None:
-    """Ferme proprement le serveur créé par asyncio.start_server."""
+def open_connections(server: asyncio.base_events.Server) -> int:
+    """Nombre de connexions encore en cours de traitement sur `server`."""
+    return sum(1 for task in _connections.get(server, ()) if not task.done())
+
+
+async def stop_mllp_server(server: asyncio.base_events.Server, drain_timeout: float = 0.0) -> None:
+    """Ferme proprement le serveur créé par asyncio.start_server.
+
+    L'écoute est fermée immédiatement ; avec `drain_timeout`, les connexions
+    en cours finissent leur traitement (ACK compris) pendant ce délai au plus,
+    les restantes sont ensuite interrompues.
+    """
     if server is None:
         return
     server.close()
+    pending = [task for task in _connections.get(server, ()) if not task.done()]
+    if pending and drain_timeout > 0:
+        _, pending = await asyncio.wait(pending, timeout=drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"[MLLP] {len(pending)} connection(s) interrupted after {drain_timeout}s drain")
+            await asyncio.gather(*pending, return_exceptions=True)
     await server.wait_closed()
@@ -7,42 +7,106 @@ Rôle
 - Offrir des méthodes pratiques: `start_endpoint`, `stop_endpoint`,
   `stop_all`, `reload_all`.
 
+Rechargement sans interruption
+- `reload_all` compare la base aux serveurs en cours : seuls les endpoints
+  ajoutés, retirés ou modifiés (adresse ou paramètres) sont démarrés, arrêtés
+  ou relancés.
+- Un serveur arrêté ou remplacé cesse d'accepter les connexions mais laisse
+  finir celles en cours (MLLP_DRAIN_TIMEOUT_SECONDS au plus). À l'adresse
+  changée (ou avec SO_REUSEPORT), la nouvelle écoute est ouverte avant la
+  fermeture de l'ancienne ; au même port, l'ancienne écoute est fermée juste
+  avant la nouvelle.
+
 Concurrence
 - Un verrou asyncio protège la table interne lorsque plusieurs tâches
   demandent un start/stop simultané.
+- Plusieurs workers : chaque adresse host:port est écoutée par le seul worker
+  détenant son bail (`leader_lease`) ; les autres la gardent en attente et la
+  reprennent si ce worker s'arrête. Avec `reuse_port=True` (SO_REUSEPORT), tous
+  les workers écoutent et le noyau répartit les connexions.
 """
 
  # app/services/mllp_manager.py
 import asyncio
-from typing import Dict, Tuple
+import logging
+import os
+from typing import Dict, Optional, Tuple
 from contextlib import suppress
-from sqlmodel import select
 from app.models_endpoints import SystemEndpoint
+from app.services.endpoint_cache import endpoint_config
+from app.services.leader_lease import LeaderLeases
 from app.services.mllp import start_mllp_server, stop_mllp_server
 
+logger = logging.getLogger(__name__)
+
+DRAIN_TIMEOUT = float(os.getenv("MLLP_DRAIN_TIMEOUT_SECONDS", "10"))
+
+# Colonnes sans effet sur l'écoute : leur modification ne relance pas le serveur
+_VOLATILE = ("created_at", "updated_at")
+
+
+def _fingerprint(endpoint) -> tuple:
+    """Configuration d'un endpoint (ligne ORM ou instantané) servant à détecter une modification."""
+    return tuple(
+        getattr(endpoint, column.key, None)
+        for column in SystemEndpoint.__table__.columns
+        if column.key not in _VOLATILE
+    )
+
 class MLLPManager:
     """Gestionnaire de serveurs MLLP.
 
     Args:
-        session_factory: Callable retournant une session DB courte.
+        session_factory: Callable retournant une session DB courte (Session ou AsyncSession).
         on_message: Callback asynchrone appelé pour chaque message entrant.
+        leases: Baux partagés entre workers (None : processus seul).
+        reuse_port: Écoute partagée par tous les workers (SO_REUSEPORT), sans bail.
+        drain_timeout: Délai laissé aux connexions en cours d'un serveur arrêté.
     """
-    def __init__(self, session_factory, on_message):
+    def __init__(
+        self, session_factory, on_message, leases: Optional[LeaderLeases] = None,
+        reuse_port: bool = False, drain_timeout: float = DRAIN_TIMEOUT,
+    ):
         self.session_factory = session_factory
         self.on_message = on_message
+        self.leases = leases
+        self.reuse_port = reuse_port
+        self.drain_timeout = drain_timeout
         self.servers: Dict[int, asyncio.base_events.Server] = {}
         self._by_addr: Dict[Tuple[str,int], int] = {}
+        self._fingerprints: Dict[int, tuple] = {}
+        # Endpoints dont l'adresse est écoutée par un autre worker (repris à sa disparition)
+        self.standby: Dict[int, SystemEndpoint] = {}
+        self._failover_task: Optional[asyncio.Task] = None
+        self._draining: set = set()
         self._lock = asyncio.Lock()
 
+    def _lease_name(self, key: Tuple[str, int]) -> Optional[str]:
+        if self.leases is None or self.reuse_port:
+            return None
+        return f"mllp-{key[0]}-{key[1]}"
+
+    @staticmethod
+    def _eligible(endpoint: SystemEndpoint) -> bool:
+        return endpoint.kind == "MLLP" and endpoint.role in ("receiver", "both") and bool(endpoint.host and endpoint.port)
+
     def running_ids(self) -> list[int]:
         """Retourne la liste des endpoint_ids actuellement en écoute."""
         return list(self.servers.keys())
 
+    def _start_server(self, endpoint: SystemEndpoint):
+        return start_mllp_server(
+            host=endpoint.host,
+            port=endpoint.port,
+            on_message=self.on_message,
+            endpoint=endpoint,
+            session_factory=self.session_factory,
+            reuse_port=self.reuse_port,
+        )
+
     async def start_endpoint(self, endpoint: SystemEndpoint):
         """Démarre un endpoint MLLP s'il est éligible et non déjà démarré."""
-        if endpoint.kind != "MLLP" or endpoint.role not in ("receiver","both"):
-            return
-        if not endpoint.host or not endpoint.port:
+        if not self._eligible(endpoint):
             return
         async with self._lock:
             if endpoint.id in self.servers:
@@ -50,48 +114,131 @@ class MLLPManager:
             key = (endpoint.host, endpoint.port)
             if key in self._by_addr:
                 return
-            server = await start_mllp_server(
-                host=endpoint.host,
-                port=endpoint.port,
-                on_message=self.on_message,
-                endpoint=endpoint,
-                session_factory=self.session_factory,
-            )
+            lease = self._lease_name(key)
+            if lease and not self.leases.acquire(lease):
+                self.standby[endpoint.id] = endpoint
+                return
+            try:
+                server = await self._start_server(endpoint)
+            except Exception:
+                if lease:
+                    self.leases.release(lease)
+                raise
+            self.standby.pop(endpoint.id, None)
             self.servers[endpoint.id] = server
             self._by_addr[key] = endpoint.id
+            self._fingerprints[endpoint.id] = _fingerprint(endpoint)
+
+    def _detach(self, endpoint_id: int):
+        """Retire l'endpoint des tables internes ; retourne (serveur, adresse)."""
+        self._fingerprints.pop(endpoint_id, None)
+        server = self.servers.pop(endpoint_id, None)
+        key = next((k for k, eid in self._by_addr.items() if eid == endpoint_id), None)
+        if key is not None:
+            del self._by_addr[key]
+        return server, key
+
+    async def _drain(self, server, key: Optional[Tuple[str, int]]):
+        """Arrête `server` en laissant finir ses connexions, puis rend le bail de son adresse."""
+        try:
+            await stop_mllp_server(server, self.drain_timeout)
+        finally:
+            # L'adresse a pu être reprise entre-temps par une nouvelle écoute de ce worker
+            if key is not None and key not in self._by_addr:
+                self._release(key)
+
+    def _drain_later(self, server, key: Optional[Tuple[str, int]]):
+        task = asyncio.create_task(self._drain(server, key))
+        self._draining.add(task)
+        task.add_done_callback(self._draining.discard)
 
     async def stop_endpoint(self, endpoint_id: int):
         """Arrête proprement le serveur associé à `endpoint_id`. Idempotent."""
         async with self._lock:
-            server = self.servers.pop(endpoint_id, None)
-            if server:
-                await stop_mllp_server(server)
-            with suppress(KeyError):
-                for k, eid in list(self._by_addr.items()):
-                    if eid == endpoint_id:
-                        del self._by_addr[k]
+            self.standby.pop(endpoint_id, None)
+            server, key = self._detach(endpoint_id)
+        if server:
+            await self._drain(server, key)
+
+    async def _restart_endpoint(self, endpoint: SystemEndpoint):
+        """Relance l'écoute d'un endpoint modifié sans couper les connexions en cours."""
+        async with self._lock:
+            old = self.servers.get(endpoint.id)
+            old_key = next((k for k, eid in self._by_addr.items() if eid == endpoint.id), None)
+            new_key = (endpoint.host, endpoint.port)
+            same_addr = new_key == old_key
+            lease = None if same_addr else self._lease_name(new_key)
+            swappable = old is not None and (same_addr or new_key not in self._by_addr)
+            if swappable and (lease is None or self.leases.acquire(lease)):
+                if same_addr and not self.reuse_port:
+                    # Libère le port ; les connexions déjà acceptées restent ouvertes
+                    old.close()
+                try:
+                    server = await self._start_server(endpoint)
+                except Exception:
+                    if lease:
+                        self.leases.release(lease)
+                    if same_addr and not self.reuse_port:
+                        self._detach(endpoint.id)
+                        self._drain_later(old, old_key)
+                    raise
+                self.servers[endpoint.id] = server
+                if not same_addr:
+                    del self._by_addr[old_key]
+                    self._by_addr[new_key] = endpoint.id
+                self._fingerprints[endpoint.id] = _fingerprint(endpoint)
+                self._drain_later(old, old_key)
+                logger.info(f"[mllp_manager] Écoute MLLP {endpoint.name} relancée sur {endpoint.host}:{endpoint.port}")
+                return
+        # Adresse occupée (autre endpoint ou autre worker) : arrêt puis démarrage classique
+        await self.stop_endpoint(endpoint.id)
+        await self.start_endpoint(endpoint)
+
+    def _release(self, key: Tuple[str, int]) -> None:
+        lease = self._lease_name(key)
+        if lease:
+            self.leases.release(lease)
 
     async def stop_all(self):
-        """Arrête tous les serveurs en cours."""
+        """Arrête tous les serveurs en cours (connexions drainées) et rend leurs baux."""
+        if self._failover_task:
+            self._failover_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._failover_task
+            self._failover_task = None
         async with self._lock:
-            servers = list(self.servers.values())
-            self.servers.clear()
-            self._by_addr.clear()
-        for s in servers:
-            await stop_mllp_server(s)
+            detached = [self._detach(endpoint_id) for endpoint_id in list(self.servers)]
+            self.standby.clear()
+        await asyncio.gather(*(self._drain(server, key) for server, key in detached))
+        if self._draining:
+            await asyncio.gather(*self._draining, return_exceptions=True)
+
+    async def _failover_loop(self):
+        """Reprend les endpoints en attente dont le worker détenteur a disparu."""
+        while True:
+            await asyncio.sleep(self.leases.retry_seconds)
+            for endpoint in list(self.standby.values()):
+                try:
+                    await self.start_endpoint(endpoint)
+                except Exception as e:
+                    logger.warning(f"[mllp_manager] Reprise de {endpoint.name} impossible: {e}")
+                if endpoint.id in self.servers:
+                    logger.info(f"[mllp_manager] Écoute MLLP {endpoint.name} reprise par ce worker")
 
     async def reload_all(self, session):
-        """Re-scanne la base et démarre les endpoints MLLP actifs.
+        """Réconcilie les serveurs en cours avec les endpoints MLLP actifs de la base.
 
-        Arrête d'abord les serveurs existants, puis démarre tous les
-        endpoints MLLP ayant `is_enabled=True`.
+        Les endpoints retirés ou désactivés sont arrêtés, les nouveaux démarrés
+        et ceux dont la configuration a changé relancés ; les autres gardent
+        leur écoute et leurs connexions.
         """
-        await self.stop_all()
-        eps = session.exec(
-            select(SystemEndpoint).where(
-                SystemEndpoint.is_enabled == True,
-                SystemEndpoint.kind == "MLLP"
-            )
-        ).all()
-        for e in eps:
-            await self.start_endpoint(e)
+        wanted = {e.id: e for e in endpoint_config(session).by_kind("MLLP") if self._eligible(e)}
+        removed = [i for i in set(self.servers) | set(self.standby) if i not in wanted]
+        await asyncio.gather(*(self.stop_endpoint(i) for i in removed))
+        for e in wanted.values():
+            if e.id not in self.servers:
+                await self.start_endpoint(e)
+            elif self._fingerprints.get(e.id) != _fingerprint(e):
+                await self._restart_endpoint(e)
+        if self.standby and (self._failover_task is None or self._failover_task.done()):
+            self._failover_task = asyncio.create_task(self._failover_loop())
@@ -8,6 +8,7 @@ import re
 from app.models import Dossier, Patient, Venue, Mouvement
 from app.db import get_next_sequence
 from app.services.identifier_manager import create_identifier_from_hl7
+from app.services.identifier_resolver import get_resolver
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +61,60 @@ MOVEMENT_STATUS_BY_TRIGGER = {
 }
 
 
+def _find_patient_from_pid(session: Session, identifiers: List[Tuple[str, str]]) -> Optional[Patient]:
+    """Retrouve le patient d'un PID-3 (toutes répétitions) via le resolver d'identifiants.
+
+    Repli sur `Patient.identifier` == premier composant de la première répétition.
+    """
+    if not identifiers:
+        return None
+    resolver = get_resolver(session)
+    patient = resolver.find_patient_by_cx([raw for raw, _ in identifiers])
+    if patient:
+        return patient
+    from sqlmodel import select
+    identifier = identifiers[0][0].split("^")[0]
+    return session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+
+
+def _persist_identifiers(
+    session: Session,
+    raw_list: List[str],
+    entity_type: str,
+    entity_id: int,
+    default_type=None,
+) -> None:
+    """Persiste des CX HL7 comme `Identifier` pour une entité, sans doublon (system, value).
+
+    La détection des doublons passe par `resolve_many()` (une requête pour le lot).
+    `default_type` remplace le type PI par défaut (ex: AN pour PID-18, VN pour PV1-19).
+    """
+    from app.models_identifiers import IdentifierType as _IdType
+
+    resolver = get_resolver(session)
+    idents = []
+    for raw_cx in raw_list:
+        try:
+            ident = create_identifier_from_hl7(raw_cx, entity_type, entity_id)
+        except Exception:
+            # ignore bad identifier parsing
+            continue
+        if default_type is not None and ident.type == _IdType.PI:
+            ident.type = default_type
+        idents.append(ident)
+    if not idents:
+        return
+    existing = resolver.resolve_many([(i.system, i.value) for i in idents])
+    for ident in idents:
+        key = (ident.system or "", ident.value)
+        if key in existing:
+            continue
+        session.add(ident)
+        resolver.remember(ident)
+        existing[key] = ident
+    session.flush()
+
+
 def _parse_zbe_segment(message: str) -> Optional[Dict]:
     """
     Parse le segment ZBE (mouvement patient - spécifique IHE PAM France).
@@ -183,10 +238,8 @@ async def _handle_cancel_admission(
             identifiers = pid_data.get("identifiers", [])
             if not identifiers:
                 return False, "No patient identifier found"
-            identifier = identifiers[0][0].split("^")[0]
-            
             from sqlmodel import select
-            patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+            patient = _find_patient_from_pid(session, identifiers)
             if not patient:
                 return False, "Patient not found"
             
@@ -226,9 +279,7 @@ async def _handle_cancel_admission(
                 identifiers = pid_data.get("identifiers", [])
                 if not identifiers:
                     return False, f"Movement with seq={movement_id_str} not found (no patient identifier for fallback)"
-                identifier = identifiers[0][0].split("^")[0]
-                
-                patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+                patient = _find_patient_from_pid(session, identifiers)
                 if not patient:
                     return False, f"Movement with seq={movement_id_str} not found (patient not found for fallback)"
                 
@@ -321,10 +372,8 @@ async def _handle_cancel_discharge(
             identifiers = pid_data.get("identifiers", [])
             if not identifiers:
                 return False, "No patient identifier found"
-            identifier = identifiers[0][0].split("^")[0]
-            
             from sqlmodel import select
-            patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+            patient = _find_patient_from_pid(session, identifiers)
             if not patient:
                 return False, "Patient not found"
             
@@ -363,9 +412,7 @@ async def _handle_cancel_discharge(
                 identifiers = pid_data.get("identifiers", [])
                 if not identifiers:
                     return False, f"Movement with seq={movement_id_str} not found (no patient identifier for fallback)"
-                identifier = identifiers[0][0].split("^")[0]
-                
-                patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+                patient = _find_patient_from_pid(session, identifiers)
                 if not patient:
                     return False, f"Movement with seq={movement_id_str} not found (patient not found for fallback)"
                 
@@ -470,10 +517,8 @@ async def _handle_cancel_transfer(
             identifiers = pid_data.get("identifiers", [])
             if not identifiers:
                 return False, "No patient identifier found"
-            identifier = identifiers[0][0].split("^")[0]
-            
             from sqlmodel import select
-            patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+            patient = _find_patient_from_pid(session, identifiers)
             if not patient:
                 return False, "Patient not found"
             
@@ -512,9 +557,7 @@ async def _handle_cancel_transfer(
                 identifiers = pid_data.get("identifiers", [])
                 if not identifiers:
                     return False, f"Movement with seq={movement_id_str} not found (no patient identifier for fallback)"
-                identifier = identifiers[0][0].split("^")[0]
-                
-                patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+                patient = _find_patient_from_pid(session, identifiers)
                 if not patient:
                     return False, f"Movement with seq={movement_id_str} not found (patient not found for fallback)"
                 
@@ -650,7 +693,7 @@ async def handle_admission_message(
             from sqlmodel import select
             from app.services.patient_update_helper import update_patient_from_pid_data
 
-            existing = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+            existing = _find_patient_from_pid(session, identifiers)
             if existing:
                 # Mise à jour complète avec tous les champs multi-valués
                 update_patient_from_pid_data(existing, pid_data, session, create_mode=False)
@@ -659,19 +702,7 @@ async def handle_admission_message(
                 print(f"[pam] Updated patient id={existing.id} identifier={existing.identifier} family={existing.family} given={existing.given}")
                 # Ensure all identifiers from PID are persisted for this patient
                 try:
-                    from sqlmodel import select
-                    from app.models_identifiers import Identifier as IdModel
-                    for raw_cx, _ in identifiers:
-                        try:
-                            ident = create_identifier_from_hl7(raw_cx, "patient", existing.id)
-                            # Check duplicate by (system,value)
-                            exists = session.exec(select(IdModel).where(IdModel.system == ident.system, IdModel.value == ident.value)).first()
-                            if not exists:
-                                session.add(ident)
-                        except Exception:
-                            # ignore bad identifier parsing
-                            continue
-                    session.flush()
+                    _persist_identifiers(session, [raw_cx for raw_cx, _ in identifiers], "patient", existing.id)
                 except Exception:
                     # identifiers persistence failed; continue silently for POC
                     pass
@@ -689,18 +720,7 @@ async def handle_admission_message(
 
         # Persist all identifiers from PID-3 as Identifier records
         try:
-            from sqlmodel import select
-            from app.models_identifiers import Identifier as IdModel
-            for raw_cx, _ in identifiers:
-                try:
-                    ident = create_identifier_from_hl7(raw_cx, "patient", patient.id)
-                    # Check duplicate by (system,value)
-                    exists = session.exec(select(IdModel).where(IdModel.system == ident.system, IdModel.value == ident.value)).first()
-                    if not exists:
-                        session.add(ident)
-                except Exception:
-                    continue
-            session.flush()
+            _persist_identifiers(session, [raw_cx for raw_cx, _ in identifiers], "patient", patient.id)
         except Exception:
             # if identifiers persistence fails, continue; not fatal for POC
             pass
@@ -733,24 +753,9 @@ async def handle_admission_message(
         try:
             acc_raw = pid_data.get("account_number")
             if acc_raw:
-                from sqlmodel import select
-                from app.models_identifiers import Identifier as IdModel
-                try:
-                    ident = create_identifier_from_hl7(acc_raw, "dossier", dossier.id)
-                    # Ensure PID-18 is recorded as AN (Account Number) when no explicit type present
-                    try:
-                        from app.models_identifiers import IdentifierType as _IdType
-                        if ident.type == _IdType.PI:
-                            ident.type = _IdType.AN
-                    except Exception:
-                        pass
-                    exists = session.exec(select(IdModel).where(IdModel.system == ident.system, IdModel.value == ident.value)).first()
-                    if not exists:
-                        session.add(ident)
-                        session.flush()
-                except Exception:
-                    # tolerate bad format
-                    pass
+                from app.models_identifiers import IdentifierType as _IdType
+                # Ensure PID-18 is recorded as AN (Account Number) when no explicit type present
+                _persist_identifiers(session, [acc_raw], "dossier", dossier.id, default_type=_IdType.AN)
         except Exception:
             pass
 
@@ -786,24 +791,9 @@ async def handle_admission_message(
         try:
             visit_raw = pv1_data.get("visit_number")
             if visit_raw:
-                from sqlmodel import select
-                from app.models_identifiers import Identifier as IdModel
-                try:
-                    ident = create_identifier_from_hl7(visit_raw, "venue", venue.id)
-                    # Ensure PV1-19 is recorded as VN (Visit Number) when no explicit type present
-                    try:
-                        from app.models_identifiers import IdentifierType as _IdType
-                        if ident.type == _IdType.PI:
-                            ident.type = _IdType.VN
-                    except Exception:
-                        pass
-                    exists = session.exec(select(IdModel).where(IdModel.system == ident.system, IdModel.value == ident.value)).first()
-                    if not exists:
-                        session.add(ident)
-                        session.flush()
-                except Exception:
-                    # tolerate bad format
-                    pass
+                from app.models_identifiers import IdentifierType as _IdType
+                # Ensure PV1-19 is recorded as VN (Visit Number) when no explicit type present
+                _persist_identifiers(session, [visit_raw], "venue", venue.id, default_type=_IdType.VN)
         except Exception:
             pass
 
@@ -914,11 +904,9 @@ async def handle_transfer_message(
         identifiers = pid_data.get("identifiers", [])
         if not identifiers:
             return False, "No patient identifier found"
-        identifier = identifiers[0][0].split("^")[0]
-
         from sqlmodel import select
 
-        patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+        patient = _find_patient_from_pid(session, identifiers)
         if not patient:
             return False, "Patient not found"
 
@@ -1006,11 +994,9 @@ async def handle_discharge_message(
         identifiers = pid_data.get("identifiers", [])
         if not identifiers:
             return False, "No patient identifier found"
-        identifier = identifiers[0][0].split("^")[0]
-
         from sqlmodel import select
 
-        patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+        patient = _find_patient_from_pid(session, identifiers)
         if not patient:
             return False, "Patient not found"
 
@@ -1093,11 +1079,9 @@ async def handle_leave_message(
         identifiers = pid_data.get("identifiers", [])
         if not identifiers:
             return False, "No patient identifier found"
-        identifier = identifiers[0][0].split("^")[0]
-
         from sqlmodel import select
 
-        patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+        patient = _find_patient_from_pid(session, identifiers)
         if not patient:
             return False, "Patient not found"
 
@@ -1190,11 +1174,9 @@ async def handle_doctor_message(
         identifiers = pid_data.get("identifiers", [])
         if not identifiers:
             return False, "No patient identifier found"
-        identifier = identifiers[0][0].split("^")[0]
-
         from sqlmodel import select
 
-        patient = session.exec(select(Patient).where(Patient.identifier == identifier)).first()
+        patient = _find_patient_from_pid(session, identifiers)
         if not patient:
             return False, "Patient not found"
 
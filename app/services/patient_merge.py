@@ -32,7 +32,8 @@ from sqlmodel import Session, select
 
 from app.models import Patient, Dossier, Venue, Mouvement
 from app.models_identifiers import Identifier
-from app.services.identifier_manager import merge_identifiers, parse_hl7_cx_identifier
+from app.services.identifier_manager import merge_identifiers
+from app.services.identifier_resolver import get_resolver
 
 logger = logging.getLogger("patient_merge")
 
@@ -99,46 +100,14 @@ def _find_patient_by_identifiers(session: Session, cx_list: List[str]) -> Option
     if not cx_list:
         return None
     
-    # 1. Recherche via la table Identifier
-    for cx in cx_list:
-        value, system, _, type_code = parse_hl7_cx_identifier(cx)
-        if not value:
-            continue
-        
-        # Chercher un identifiant actif correspondant
-        identifier_obj = session.exec(
-            select(Identifier)
-            .where(Identifier.value == value)
-            .where(Identifier.status == "active")
-            .where(Identifier.patient_id.isnot(None))
-        ).first()
-        
-        if identifier_obj and identifier_obj.patient_id:
-            patient = session.get(Patient, identifier_obj.patient_id)
-            if patient:
-                return patient
+    resolver = get_resolver(session)
+    # 1. Recherche via la table Identifier (identifiants actifs, une requête pour le lot)
+    patient = resolver.find_patient_by_cx(cx_list, match_system=False)
+    if patient:
+        return patient
     
     # 2. Fallback: recherche directe par external_id ou identifier (premier composant)
-    for cx in cx_list:
-        id_value = cx.split("^")[0] if "^" in cx else cx
-        if not id_value:
-            continue
-        
-        # Chercher par external_id
-        patient = session.exec(
-            select(Patient).where(Patient.external_id == id_value)
-        ).first()
-        if patient:
-            return patient
-        
-        # Chercher par identifier
-        patient = session.exec(
-            select(Patient).where(Patient.identifier == id_value)
-        ).first()
-        if patient:
-            return patient
-    
-    return None
+    return resolver.find_patient_by_plain_ids(cx_list)
 
 
 async def handle_merge_patient(
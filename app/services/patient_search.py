@@ -0,0 +1,390 @@
+"""
+Recherche démographique patient (PDQ/PDQm) insensible aux accents, phonétique et approchée
+
+Contenu
+- `normalize_name`: majuscules, sans accents, ponctuation → espaces, tokens séparés par un espace.
+- `phonetic_fr`: clé phonétique adaptée aux noms français (PH→F, GU→G, EAU→O, finales muettes…).
+- `name_trigrams`: trigrammes d'un nom normalisé (index `PatientNameTrigram`).
+- Écouteurs mapper (`before_insert`/`before_update`/`after_insert`/`after_update` sur `Patient`)
+  qui maintiennent les colonnes `family_norm`, `given_norm`, `*_phonetic` et la table de
+  trigrammes dans la même transaction que l'écriture du patient.
+- `index_values`: mêmes valeurs pour les insertions groupées (Core) sans écouteurs.
+- `search_patients`: recherche classée avec score (0..1) et pagination (offset/count).
+
+Notes
+- La sélection des candidats n'utilise que des égalités / intervalles sur colonnes indexées
+  et l'index (field, trigram), classés en SQL (exact, préfixe, phonétique, trigrammes) ;
+  le score final est calculé en Python sur les seules colonnes de recherche, les patients
+  complets ne sont chargés que pour la page retournée.
+- Au-delà de MAX_CANDIDATES candidats (PATIENT_SEARCH_MAX_CANDIDATES), les moins bien
+  classés ne sont pas évalués : avertissement journalisé, `total` compté en SQL.
+- `reindex_patients` recalcule les colonnes pour les patients antérieurs à la migration 011.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, or_
+from sqlmodel import Session, select
+
+from app.models import Patient, PatientNameTrigram
+
+logger = logging.getLogger(__name__)
+
+# Score minimal pour qu'un candidat soit retourné
+DEFAULT_MIN_SCORE = 0.5
+# Nombre maximal de candidats évalués par requête (borne le coût du scoring)
+MAX_CANDIDATES = int(os.getenv("PATIENT_SEARCH_MAX_CANDIDATES", "20000"))
+
+_NON_ALPHA = re.compile(r"[^A-Z0-9]+")
+
+# Règles phonétiques (ordre significatif), appliquées sur un nom normalisé sans espaces
+_PHONETIC_RULES = [
+    (r"GN", "N"),
+    (r"GU([EIY])", r"K\1"),
+    (r"G([EIY])", r"J\1"),
+    (r"GU", "K"),
+    (r"G", "K"),
+    (r"QU", "K"),
+    (r"Q", "K"),
+    (r"C([EIY])", r"S\1"),
+    (r"SCH", "CH"),
+    (r"CH", "#"),  # son "ch" conservé distinct de K/S
+    (r"CK", "K"),
+    (r"C", "K"),
+    (r"PH", "F"),
+    (r"EAU", "O"),
+    (r"AU", "O"),
+    (r"AI", "E"),
+    (r"EI", "E"),
+    (r"ER$", "E"),
+    (r"EZ$", "E"),
+    (r"ET$", "E"),
+    (r"OU", "U"),
+    (r"OI", "WA"),
+    (r"(?<=[AEIOUY])S(?=[AEIOUY])", "Z"),
+    (r"H", ""),
+    (r"Y", "I"),
+    (r"W", "V"),
+    (r"Z", "S"),
+    (r"X$", ""),
+    (r"X", "KS"),
+    (r"[EA]N(?=[^AEIOU]|$)", "AN"),
+    (r"[EA]M(?=[BP])", "AN"),
+    (r"[AE]IN|UN(?=[^AEIOU]|$)", "IN"),
+]
+_PHONETIC_COMPILED = [(re.compile(p), r) for p, r in _PHONETIC_RULES]
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """Majuscules sans accents, tokens alphanumériques séparés par un espace."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    stripped = stripped.upper().replace("Œ", "OE").replace("Æ", "AE").replace("ß", "SS")
+    return _NON_ALPHA.sub(" ", stripped).strip()
+
+
+def phonetic_fr(value: Optional[str]) -> str:
+    """Clé phonétique française d'un nom (tous tokens concaténés)."""
+    s = normalize_name(value).replace(" ", "")
+    s = re.sub(r"[0-9]", "", s)
+    if not s:
+        return ""
+    for pattern, repl in _PHONETIC_COMPILED:
+        s = pattern.sub(repl, s)
+    # Lettres doublées
+    s = re.sub(r"(.)\1+", r"\1", s)
+    # Finales muettes
+    while len(s) > 1 and s[-1] in "STDE":
+        s = s[:-1]
+    return s.replace("#", "CH")
+
+
+def name_trigrams(normalized: str) -> Set[str]:
+    """Trigrammes (avec bornes) de chaque token d'un nom normalisé."""
+    out: Set[str] = set()
+    for token in normalized.split():
+        padded = f"  {token} "
+        for i in range(len(padded) - 2):
+            out.add(padded[i:i + 3])
+    return out
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    """Coefficient de Dice sur les trigrammes de deux noms normalisés."""
+    ta, tb = name_trigrams(a), name_trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return 2.0 * len(ta & tb) / (len(ta) + len(tb))
+
+
+def name_score(query: str, normalized: Optional[str], phonetic: Optional[str]) -> float:
+    """Score d'un nom stocké vis-à-vis d'un critère de recherche (0..1)."""
+    q_norm = normalize_name(query)
+    if not q_norm or not normalized:
+        return 0.0
+    if normalized == q_norm:
+        return 1.0
+    if q_norm in normalized.split():
+        return 0.95
+    if normalized.startswith(q_norm):
+        return 0.9
+    if phonetic and phonetic == phonetic_fr(query):
+        return 0.85
+    return round(0.8 * trigram_similarity(q_norm, normalized), 4)
+
+
+# ----------------------------------------------------------------------
+# Maintenance des colonnes et de l'index trigrammes
+# ----------------------------------------------------------------------
+
+def _fill_search_columns(patient: Patient) -> None:
+    patient.family_norm = normalize_name(patient.family) or None
+    patient.given_norm = normalize_name(patient.given) or None
+    patient.family_phonetic = phonetic_fr(patient.family) or None
+    patient.given_phonetic = phonetic_fr(patient.given) or None
+
+
+def _trigram_rows(patient: Patient) -> List[Dict]:
+    rows = []
+    family_tri = name_trigrams(normalize_name(patient.family)) | name_trigrams(normalize_name(patient.birth_family))
+    for tri in sorted(family_tri):
+        rows.append({"patient_id": patient.id, "field": "F", "trigram": tri})
+    for tri in sorted(name_trigrams(normalize_name(patient.given))):
+        rows.append({"patient_id": patient.id, "field": "G", "trigram": tri})
+    return rows
+
+
+def index_values(patient) -> Tuple[Dict, List[Dict]]:
+    """Colonnes de recherche et lignes de trigrammes d'un patient (objet portant `id`, `family`,
+    `given`, `birth_family`), pour les insertions groupées qui contournent les écouteurs."""
+    _fill_search_columns(patient)
+    columns = {
+        "family_norm": patient.family_norm,
+        "given_norm": patient.given_norm,
+        "family_phonetic": patient.family_phonetic,
+        "given_phonetic": patient.given_phonetic,
+    }
+    return columns, _trigram_rows(patient)
+
+
+def _write_trigrams(connection, patient: Patient) -> None:
+    table = PatientNameTrigram.__table__
+    connection.execute(delete(table).where(table.c.patient_id == patient.id))
+    rows = _trigram_rows(patient)
+    if rows:
+        connection.execute(insert(table), rows)
+
+
+def _names_changed(patient: Patient) -> bool:
+    state = inspect(patient)
+    return any(state.attrs[name].history.has_changes() for name in ("family", "given", "birth_family"))
+
+
+def _before_write(mapper, connection, target):
+    _fill_search_columns(target)
+
+
+def _after_insert(mapper, connection, target):
+    _write_trigrams(connection, target)
+
+
+def _after_update(mapper, connection, target):
+    if _names_changed(target):
+        _write_trigrams(connection, target)
+
+
+def _before_delete(mapper, connection, target):
+    table = PatientNameTrigram.__table__
+    connection.execute(delete(table).where(table.c.patient_id == target.id))
+
+
+event.listen(Patient, "before_insert", _before_write)
+event.listen(Patient, "before_update", _before_write)
+event.listen(Patient, "after_insert", _after_insert)
+event.listen(Patient, "after_update", _after_update)
+event.listen(Patient, "before_delete", _before_delete)
+
+
+def reindex_patients(session: Session, batch_size: int = 1000) -> int:
+    """Recalcule colonnes normalisées et trigrammes pour les patients non indexés."""
+    count = 0
+    last_id = 0
+    while True:
+        patients = session.exec(
+            select(Patient)
+            .where(Patient.family_norm.is_(None))
+            .where(Patient.id > last_id)
+            .order_by(Patient.id)
+            .limit(batch_size)
+        ).all()
+        if not patients:
+            break
+        last_id = patients[-1].id
+        for patient in patients:
+            _fill_search_columns(patient)
+            session.add(patient)
+        session.flush()
+        connection = session.connection()
+        for patient in patients:
+            _write_trigrams(connection, patient)
+        count += len(patients)
+    session.commit()
+    return count
+
+
+# ----------------------------------------------------------------------
+# Recherche
+# ----------------------------------------------------------------------
+
+@dataclass
+class PatientMatch:
+    patient: Patient
+    score: float
+    reasons: List[str]
+
+
+@dataclass
+class PatientSearchResult:
+    matches: List[PatientMatch]
+    total: int
+    offset: int
+    count: int
+
+    @property
+    def next_offset(self) -> Optional[int]:
+        nxt = self.offset + len(self.matches)
+        return nxt if self.matches and nxt < self.total else None
+
+
+def _prefix_range(column, prefix: str):
+    """Intervalle [prefix, prefix+U+FFFF) : équivalent LIKE 'prefix%' utilisable par l'index."""
+    return and_(column >= prefix, column < prefix + "\uffff")
+
+
+def _trigram_candidates(field: str, q_norm: str):
+    grams = sorted(name_trigrams(q_norm))
+    if not grams:
+        return None
+    # Au moins ~40% de trigrammes communs pour être candidat
+    needed = max(1, math.ceil(len(grams) * 0.4))
+    return (
+        select(PatientNameTrigram.patient_id)
+        .where(PatientNameTrigram.field == field)
+        .where(PatientNameTrigram.trigram.in_(grams))
+        .group_by(PatientNameTrigram.patient_id)
+        .having(func.count(PatientNameTrigram.id) >= needed)
+    )
+
+
+def _name_condition(query: str, norm_col, phonetic_col, field: str):
+    q_norm = normalize_name(query)
+    conds = [norm_col == q_norm, _prefix_range(norm_col, q_norm)]
+    phon = phonetic_fr(query)
+    if phon:
+        conds.append(phonetic_col == phon)
+    tri = _trigram_candidates(field, q_norm)
+    if tri is not None:
+        conds.append(Patient.id.in_(tri))
+    return or_(*conds)
+
+
+def _name_rank(query: str, norm_col, phonetic_col):
+    """Rang SQL d'un critère de nom : 0 exact, 1 préfixe, 2 phonétique, 3 trigrammes."""
+    q_norm = normalize_name(query)
+    whens = [(norm_col == q_norm, 0), (_prefix_range(norm_col, q_norm), 1)]
+    phon = phonetic_fr(query)
+    if phon:
+        whens.append((phonetic_col == phon, 2))
+    return case(*whens, else_=3)
+
+
+def search_patients(
+    session: Session,
+    family: Optional[str] = None,
+    given: Optional[str] = None,
+    birth_date: Optional[str] = None,
+    gender: Optional[str] = None,
+    patient_ids: Optional[Iterable[int]] = None,
+    offset: int = 0,
+    count: Optional[int] = None,
+    min_score: float = DEFAULT_MIN_SCORE,
+) -> PatientSearchResult:
+    """
+    Recherche classée de patients.
+
+    - family/given: correspondance exacte, préfixe, phonétique ou trigrammes (score décroissant).
+    - birth_date/gender/patient_ids: filtres exacts.
+    Les résultats sont triés par score décroissant puis id, puis découpés (offset, count).
+    """
+    query = select(
+        Patient.id, Patient.family_norm, Patient.family_phonetic, Patient.birth_family,
+        Patient.given_norm, Patient.given_phonetic,
+    )
+    ranks = []
+    if family:
+        query = query.where(_name_condition(family, Patient.family_norm, Patient.family_phonetic, "F"))
+        ranks.append(_name_rank(family, Patient.family_norm, Patient.family_phonetic))
+    if given:
+        query = query.where(_name_condition(given, Patient.given_norm, Patient.given_phonetic, "G"))
+        ranks.append(_name_rank(given, Patient.given_norm, Patient.given_phonetic))
+    if birth_date:
+        query = query.where(Patient.birth_date == birth_date)
+    if gender:
+        query = query.where(Patient.gender == gender)
+    if patient_ids is not None:
+        query = query.where(Patient.id.in_(list(patient_ids)))
+
+    # Meilleurs candidats d'abord : une troncature n'écarte que les moins bien classés
+    ordered = query.order_by(*ranks, Patient.id) if ranks else query.order_by(Patient.id)
+    candidates = session.exec(ordered.limit(MAX_CANDIDATES)).all()
+    unscored = 0
+    if len(candidates) == MAX_CANDIDATES:
+        unscored = session.exec(select(func.count()).select_from(query.subquery())).one() - MAX_CANDIDATES
+        if unscored:
+            logger.warning(
+                f"[patient_search] {unscored} candidats non évalués au-delà de MAX_CANDIDATES={MAX_CANDIDATES}"
+            )
+
+    scored: List[Tuple[float, int, List[str]]] = []
+    for patient_id, family_norm, family_phonetic, birth_family, given_norm, given_phonetic in candidates:
+        scores = []
+        reasons = []
+        if family:
+            fam = max(
+                name_score(family, family_norm, family_phonetic),
+                name_score(family, normalize_name(birth_family), phonetic_fr(birth_family)),
+            )
+            scores.append(fam)
+            reasons.append("NA" if fam >= 0.9 else "NP")
+        if given:
+            giv = name_score(given, given_norm, given_phonetic)
+            scores.append(giv)
+            reasons.append("NA" if giv >= 0.9 else "NP")
+        if birth_date:
+            reasons.append("DB")
+        score = round(sum(scores) / len(scores), 4) if scores else 1.0
+        if score < min_score:
+            continue
+        scored.append((score, patient_id, sorted(set(reasons))))
+
+    scored.sort(key=lambda m: (-m[0], m[1]))
+    # Candidats non évalués comptés dans le total (borne haute, cf. avertissement ci-dessus)
+    total = len(scored) + unscored
+    offset = max(0, offset)
+    window = scored[offset:offset + count] if count is not None else scored[offset:]
+    patients = {}
+    if window:
+        patients = {
+            p.id: p for p in session.exec(select(Patient).where(Patient.id.in_([m[1] for m in window]))).all()
+        }
+    page = [PatientMatch(patient=patients[pid], score=score, reasons=reasons) for score, pid, reasons in window]
+    return PatientSearchResult(matches=page, total=total, offset=offset, count=len(page))
@@ -7,7 +7,9 @@ Implémente :
 """
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlencode
 import logging
+import re
 from sqlmodel import Session, select
 
 from app.models import Patient
@@ -17,6 +19,8 @@ from app.services.identifier_manager import (
     create_fhir_identifier,
     get_main_identifier
 )
+from app.services.identifier_resolver import get_resolver
+from app.services.patient_search import PatientSearchResult, search_patients
 
 logger = logging.getLogger(__name__)
 
@@ -57,39 +61,47 @@ class PIXPDQManager:
             logger.exception("PIX query error")
             return False, str(e), None
             
-    def handle_pdq_query(self, msg: str, session: Session) -> Tuple[bool, Optional[str], Optional[List[Patient]]]:
+    def handle_pdq_query(
+        self, msg: str, session: Session
+    ) -> Tuple[bool, Optional[str], Optional[PatientSearchResult], str]:
         """
         Traite une requête PDQ (QBP^Q22).
         
+        Recherche classée (nom exact / préfixe / phonétique / trigrammes) et paginée :
+        RCP-2 limite le nombre de résultats, DSC-1 porte le pointeur de continuation
+        d'une requête précédente.
+        
         Args:
             msg: Message HL7v2 QBP^Q22
             session: Session SQLModel active
             
         Returns:
-            (success, error_message, patients_found)
+            (success, error_message, search_result, query_tag) ; query_tag (QPD-2) est repris
+            dans le QAK de la réponse
         """
+        query_tag = ""
         try:
             # Parser les critères de recherche du QPD
             qpd = self._parse_qpd(msg)
+            query_tag = qpd.pop("query_tag", "")
             if not qpd:
-                return False, "No search criteria in QPD", None
-                
-            # Construire la requête
-            query = select(Patient)
+                return False, "No search criteria in QPD", None, query_tag
             
-            if qpd.get("family"):
-                query = query.where(Patient.family.ilike(f"%{qpd['family']}%"))
-            if qpd.get("given"):
-                query = query.where(Patient.given.ilike(f"%{qpd['given']}%"))
-            if qpd.get("birth_date"):
-                query = query.where(Patient.birth_date == qpd["birth_date"])
-                
-            patients = session.exec(query).all()
-            return True, None, patients
+            paging = self._parse_paging(msg)
+            result = search_patients(
+                session,
+                family=qpd.get("family"),
+                given=qpd.get("given"),
+                birth_date=qpd.get("birth_date"),
+                gender=qpd.get("gender"),
+                offset=paging["offset"],
+                count=paging["count"],
+            )
+            return True, None, result, query_tag
             
         except Exception as e:
             logger.exception("PDQ query error")
-            return False, str(e), None
+            return False, str(e), None, query_tag
 
     def handle_pixm_query(self, params: Dict, session: Session) -> Dict:
         """
@@ -163,33 +175,46 @@ class PIXPDQManager:
             Bundle FHIR avec les patients trouvés
         """
         try:
-            # Construire la requête
-            query = select(Patient)
-            
-            if params.get("family"):
-                query = query.where(Patient.family.ilike(f"%{params['family']}%"))
-            if params.get("given"):
-                query = query.where(Patient.given.ilike(f"%{params['given']}%"))
-            if params.get("birthdate"):
-                query = query.where(Patient.birth_date == params["birthdate"])
-            if params.get("gender"):
-                query = query.where(Patient.gender == params["gender"])
+            patient_ids = None
             if params.get("identifier"):
                 # Format attendu: system|value
                 system, value = params["identifier"].split("|")
-                query = query.join(Identifier).where(
-                    (Identifier.system == system) & (Identifier.value == value)
-                )
-                
-            patients = session.exec(query).all()
+                ident = get_resolver(session).resolve(system, value)
+                patient_ids = [ident.patient_id] if ident and ident.patient_id else []
+            
+            offset = int(params.get("_offset") or 0)
+            count = int(params["_count"]) if params.get("_count") else None
+            result = search_patients(
+                session,
+                family=params.get("family"),
+                given=params.get("given"),
+                birth_date=params.get("birthdate"),
+                gender=params.get("gender"),
+                patient_ids=patient_ids,
+                offset=offset,
+                count=count,
+            )
+            
+            # Identifiants des patients de la page en une requête
+            ids_by_patient: Dict[int, List[Identifier]] = {}
+            page_ids = [m.patient.id for m in result.matches]
+            if page_ids:
+                for identifier in session.exec(
+                    select(Identifier).where(Identifier.patient_id.in_(page_ids))
+                ).all():
+                    ids_by_patient.setdefault(identifier.patient_id, []).append(identifier)
             
             # Construire le Bundle de réponse
             entries = []
-            for patient in patients:
+            for match in result.matches:
+                patient = match.patient
                 resource = {
                     "resourceType": "Patient",
                     "id": f"pat-{patient.id}",
-                    "identifier": [],
+                    "identifier": [
+                        create_fhir_identifier(identifier)
+                        for identifier in ids_by_patient.get(patient.id, [])
+                    ],
                     "name": [{
                         "family": patient.family,
                         "given": [patient.given] if patient.given else []
@@ -197,34 +222,50 @@ class PIXPDQManager:
                     "birthDate": patient.birth_date,
                     "gender": patient.gender
                 }
-                
-                # Ajouter les identifiants
-                identifiers = session.exec(
-                    select(Identifier)
-                    .where(Identifier.patient_id == patient.id)
-                ).all()
-                
-                for identifier in identifiers:
-                    resource["identifier"].append(
-                        create_fhir_identifier(identifier)
-                    )
-                    
                 entries.append({
                     "fullUrl": f"urn:uuid:pat-{patient.id}",
-                    "resource": resource
+                    "resource": resource,
+                    "search": {"mode": "match", "score": match.score},
                 })
-                
-            return {
+            
+            bundle = {
                 "resourceType": "Bundle",
                 "type": "searchset",
-                "total": len(entries),
+                "total": result.total,
                 "entry": entries
             }
+            if count is not None:
+                links = [{"relation": "self", "url": self._pdqm_url(params, offset, count)}]
+                if result.next_offset is not None:
+                    links.append({"relation": "next", "url": self._pdqm_url(params, result.next_offset, count)})
+                bundle["link"] = links
+            return bundle
             
         except Exception as e:
             logger.exception("PDQm query error")
             raise ValueError(str(e))
 
+    @staticmethod
+    def _pdqm_url(params: Dict, offset: int, count: int) -> str:
+        query = {k: v for k, v in params.items() if k not in ("_offset", "_count")}
+        query["_count"] = count
+        query["_offset"] = offset
+        return f"Patient?{urlencode(query)}"
+
+    def _parse_paging(self, msg: str) -> Dict:
+        """Parse RCP-2 (quantité demandée) et DSC-1 (pointeur de continuation)."""
+        out = {"count": None, "offset": 0}
+        for line in re.split(r"\r|\n", msg):
+            parts = line.split("|")
+            if parts[0] == "RCP" and len(parts) > 2 and parts[2]:
+                qty = parts[2].split("^")[0]
+                if qty.isdigit() and int(qty) > 0:
+                    out["count"] = int(qty)
+            elif parts[0] == "DSC" and len(parts) > 1 and parts[1]:
+                if parts[1].isdigit():
+                    out["offset"] = int(parts[1])
+        return out
+
     def _parse_qpd(self, msg: str) -> Dict:
         """Parse le segment QPD pour extraire les paramètres de recherche."""
         out = {}
@@ -236,6 +277,10 @@ class PIXPDQManager:
                 
             parts = qpd.split("|")
             
+            # QPD-2 : Query Tag (renvoyé dans QAK-1)
+            if len(parts) > 2 and parts[2]:
+                out["query_tag"] = parts[2]
+            
             # QPD-3 : Patient Identifier
             if len(parts) > 3 and parts[3]:
                 out["patient_id"] = parts[3]
@@ -254,8 +299,12 @@ class PIXPDQManager:
                             # @PID.5.1 -> family, @PID.7 -> birth_date
                             if ".5.1" in field:
                                 out["family"] = value
+                            elif ".5.2" in field:
+                                out["given"] = value
                             elif ".7" in field:
                                 out["birth_date"] = value
+                            elif ".8" in field:
+                                out["gender"] = value
                     else:
                         # Standard CX identifier
                         out["patient_id"] = crit
@@ -268,15 +317,6 @@ class PIXPDQManager:
     def _find_patient_by_identifier(self, cx_value: str, session: Session) -> Optional[Patient]:
         """Recherche un patient par son identifiant HL7 CX."""
         try:
-            identifier = create_identifier_from_hl7(cx_value, "patient", 0)
-            result = session.exec(
-                select(Patient)
-                .join(Identifier)
-                .where(
-                    (Identifier.system == identifier.system) &
-                    (Identifier.value == identifier.value)
-                )
-            ).first()
-            return result
+            return get_resolver(session).find_patient_by_cx([cx_value])
         except Exception:
             return None
\ No newline at end of file
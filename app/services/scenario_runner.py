@@ -9,7 +9,8 @@ from sqlmodel import Session, select
 
 from app.models_endpoints import FHIRConfig, MessageLog, SystemEndpoint
 from app.models_scenarios import InteropScenario, InteropScenarioStep
-from app.services.fhir_transport import post_fhir_bundle
+from app.services.fhir_transport import fhir_config_options, post_fhir_bundle
+from app.services.file_sender import file_sender
 from app.services.mllp import parse_msh_fields, send_mllp
 from app.services.scenario_date_updater import update_hl7_message_dates
 from app.services.scenario_transform import transform_hl7_for_context
@@ -19,11 +20,11 @@ class ScenarioExecutionError(Exception):
     """Erreur personnalisée pour l'exécution d'un scénario."""
 
 
-def _build_fhir_targets(endpoint: SystemEndpoint) -> List[Tuple[str, str, str | None]]:
-    targets: List[Tuple[str, str, str | None]] = []
+def _build_fhir_targets(endpoint: SystemEndpoint) -> List[Tuple[str, str, str | None, dict]]:
+    targets: List[Tuple[str, str, str | None, dict]] = []
     for cfg in getattr(endpoint, "fhir_configs", []) or []:
         if isinstance(cfg, FHIRConfig) and cfg.is_enabled and cfg.base_url:
-            targets.append((cfg.base_url, cfg.auth_kind or "none", cfg.auth_token))
+            targets.append((cfg.base_url, cfg.auth_kind or "none", cfg.auth_token, fhir_config_options(cfg)))
     if targets:
         return targets
 
@@ -40,7 +41,7 @@ def _build_fhir_targets(endpoint: SystemEndpoint) -> List[Tuple[str, str, str |
         base_url = f"{scheme}://{host}"
         if endpoint.port:
             base_url = f"{base_url}:{endpoint.port}"
-    targets.append((base_url, "none", None))
+    targets.append((base_url, "none", None, {}))
     return targets
 
 
@@ -64,7 +65,7 @@ async def _send_hl7_step(
     update_dates: bool = True
 ) -> MessageLog:
     """
-    Envoie une étape HL7 via MLLP.
+    Envoie une étape HL7 via MLLP (ou dépôt dans l'outbox d'un endpoint FILE).
     
     Args:
         session: Session de base de données
@@ -72,7 +73,7 @@ async def _send_hl7_step(
         endpoint: Endpoint cible
         update_dates: Si True, met à jour les dates du message pour qu'elles soient récentes
     """
-    if not endpoint.host or not endpoint.port:
+    if endpoint.kind == "MLLP" and (not endpoint.host or not endpoint.port):
         raise ScenarioExecutionError("Endpoint MLLP incomplet (host/port manquant)")
 
     # Adapter le message au contexte local (MSH, namespaces PID-3)
@@ -109,7 +110,13 @@ async def _send_hl7_step(
     ack_payload = ""
     status = "error"
     try:
-        ack_payload = await send_mllp(endpoint.host, endpoint.port, payload_to_send)
+        if endpoint.kind == "FILE":
+            result = await file_sender.send(endpoint, payload_to_send)
+            if not result.ok:
+                raise ScenarioExecutionError(result.ack_payload())
+            ack_payload = result.ack_payload()
+        else:
+            ack_payload = await send_mllp(endpoint.host, endpoint.port, payload_to_send)
         status = "sent" if ack_payload else "unknown"
     except Exception as exc:
         ack_payload = str(exc)
@@ -119,7 +126,7 @@ async def _send_hl7_step(
     msh_fields = parse_msh_fields(payload_to_send)
     log = MessageLog(
         direction="out",
-        kind="MLLP",
+        kind=endpoint.kind,
         endpoint_id=endpoint.id,
         payload=payload_to_send,  # Logger le message avec dates mises à jour
         ack_payload=ack_payload or "",
@@ -146,13 +153,14 @@ async def _send_fhir_step(session: Session, step: InteropScenarioStep, endpoint:
     ack_payload = ""
     last_status_code = None
 
-    for base_url, auth_kind, auth_token in targets:
+    for base_url, auth_kind, auth_token, options in targets:
         try:
             status_code, response = await post_fhir_bundle(
                 base_url,
                 payload_obj,
                 auth_kind=auth_kind,
                 auth_token=auth_token,
+                **options,
             )
             last_status_code = status_code
             ack_payload = json.dumps(response or {}, default=str)
@@ -211,7 +219,7 @@ async def send_step(
         session.refresh(log)
         return log
 
-    if endpoint.kind == "MLLP":
+    if endpoint.kind in ("MLLP", "FILE"):
         return await _send_hl7_step(session, step, endpoint, update_dates=update_dates)
     if endpoint.kind == "FHIR":
         return await _send_fhir_step(session, step, endpoint)
@@ -17,10 +17,10 @@ from __future__ import annotations
 
 from typing import Optional
 
-from sqlmodel import Session, select
+from sqlmodel import Session
 
-from app.models_structure_fhir import IdentifierNamespace, GHTContext
 from app.models_shared import SystemEndpoint
+from app.services.endpoint_cache import endpoint_config
 
 
 def _remap_msh(msh_line: str, endpoint: SystemEndpoint) -> str:
@@ -70,13 +70,8 @@ def _remap_pid_identifiers(pid_line: str, new_system: Optional[str]) -> str:
 def _select_namespace_system(session: Session, ght_context_id: Optional[int]) -> Optional[str]:
     if not ght_context_id:
         return None
-    # Prefer IPP-type namespace; else first active namespace
-    ns = session.exec(
-        select(IdentifierNamespace)
-        .where(IdentifierNamespace.ght_context_id == ght_context_id)
-        .where(IdentifierNamespace.is_active == True)
-        .order_by(IdentifierNamespace.type == "IPP").order_by(IdentifierNamespace.id)
-    ).all()
+    # Prefer IPP-type namespace; else first active namespace (cached configuration snapshot)
+    ns = endpoint_config(session).namespaces_for(ght_context_id)
     if not ns:
         return None
     # Try to find IPP first
@@ -1,38 +1,83 @@
 """
 Background task scheduler for file endpoint polling.
 
-Runs periodic tasks like scanning file-based endpoints.
+Runs periodic tasks like scanning file-based endpoints, and applies scheduled
+structure status transitions (activation/deactivation dates) when they fall due.
+
+On Linux, file endpoint inboxes are watched with inotify (see file_watcher) and files
+are processed as soon as they are written; the periodic scan then covers endpoints
+that cannot be watched and refreshes the watches. Watched inboxes are still listed
+every FILE_RECONCILE_INTERVAL seconds (default 300s), for files the watcher missed
+(producers that never close-write or rename, overflowed events) and files whose lease
+expired after a worker crash.
+
+With several workers, each job runs only in the worker holding its leader lease
+(see leader_lease); the others retry periodically and take over if it stops.
 """
 import asyncio
 import logging
+import os
+import time
 from typing import Optional
 from datetime import datetime
 
 from sqlmodel import Session
 from app.db import get_session
+from app.db_async import to_thread
 from app.services.file_poller import scan_file_endpoints
+from app.services.file_watcher import FileEndpointWatcher
+from app.services.leader_lease import LeaderLeases
+from app.services.bed_occupancy import next_bed_status_change, refresh_scheduled_beds
+from app.services.structure_schedule import next_scheduled_change, sweep_scheduled_status
 
 logger = logging.getLogger(__name__)
 
+FILE_POLL_JOB = "scheduler-file-poll"
+STATUS_JOB = "scheduler-status"
+
+DEFAULT_RECONCILE_SECONDS = float(os.getenv("FILE_RECONCILE_INTERVAL", "300"))
+
 
 class BackgroundScheduler:
     """
     Background task scheduler for periodic jobs.
     
     Currently handles:
-    - File endpoint polling (configurable interval)
+    - File endpoint watching (inotify) with polling fallback (configurable interval)
+    - Scheduled structure status transitions and bed occupancy refresh, run when
+      the next activation/deactivation date falls due
     """
     
-    def __init__(self, poll_interval_seconds: int = 60):
+    def __init__(
+        self,
+        poll_interval_seconds: int = 60,
+        status_max_sleep_seconds: float = 60,
+        watch_files: bool = True,
+        leases: Optional[LeaderLeases] = None,
+        reconcile_interval_seconds: float = DEFAULT_RECONCILE_SECONDS,
+    ):
         """
         Initialize the scheduler.
         
         Args:
             poll_interval_seconds: Interval between file polls (default: 60s = 1 minute)
+            status_max_sleep_seconds: Upper bound between two status sweeps, so that
+                dates scheduled after the last sweep are picked up (default: 60s)
+            watch_files: Watch file endpoint inboxes with inotify when available
+            leases: Leader leases shared between workers (None: single process)
+            reconcile_interval_seconds: Minimum interval between two listings of the
+                watched inboxes (default: 300s)
         """
         self.poll_interval_seconds = poll_interval_seconds
+        self.reconcile_interval_seconds = reconcile_interval_seconds
+        self.status_max_sleep_seconds = status_max_sleep_seconds
+        self.watch_files = watch_files
+        self.leases = leases
+        self.watcher: Optional[FileEndpointWatcher] = None
+        self._last_reconcile = 0.0
         self.running = False
         self.task: Optional[asyncio.Task] = None
+        self.status_task: Optional[asyncio.Task] = None
     
     async def start(self):
         """Start the background scheduler"""
@@ -42,6 +87,7 @@ class BackgroundScheduler:
         
         self.running = True
         self.task = asyncio.create_task(self._poll_loop())
+        self.status_task = asyncio.create_task(self._status_loop())
         logger.info(f"Background scheduler started (poll interval: {self.poll_interval_seconds}s)")
     
     async def stop(self):
@@ -50,26 +96,78 @@ class BackgroundScheduler:
             return
         
         self.running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.task, self.status_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self.watcher:
+            await self.watcher.stop()
+            self.watcher = None
+        if self.leases:
+            for job in (FILE_POLL_JOB, STATUS_JOB):
+                self.leases.release(job)
         
         logger.info("Background scheduler stopped")
+
+    def _is_leader(self, job: str) -> bool:
+        """True if this worker runs `job` (always, without leases)"""
+        return self.leases is None or self.leases.acquire(job)
+
+    def _standby_delay(self, delay: float) -> float:
+        """Delay before a worker without the lease tries to take it over"""
+        return min(delay, self.leases.retry_seconds)
+
+    def _start_watcher(self):
+        """Start the inotify watcher once this worker owns file polling"""
+        if not self.watch_files or self.watcher:
+            return
+        watcher = FileEndpointWatcher()
+        if watcher.start():
+            self.watcher = watcher
+            # The watcher lists each inbox when it starts watching it
+            self._last_reconcile = time.monotonic()
+            logger.info(f"File endpoint watcher active ({len(watcher.watched_ids)} inboxes)")
+        else:
+            self.watch_files = False
     
     async def _poll_loop(self):
         """Main polling loop"""
         while self.running:
-            try:
-                await self._scan_file_endpoints()
-            except Exception as e:
-                logger.error(f"Error in file endpoint polling: {e}", exc_info=True)
+            delay = self.poll_interval_seconds
+            if self._is_leader(FILE_POLL_JOB):
+                try:
+                    self._start_watcher()
+                    await self._scan_file_endpoints()
+                except Exception as e:
+                    logger.error(f"Error in file endpoint polling: {e}", exc_info=True)
+            else:
+                delay = self._standby_delay(delay)
             
             # Wait for next poll
             try:
-                await asyncio.sleep(self.poll_interval_seconds)
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                break
+
+    async def _status_loop(self):
+        """Apply scheduled status transitions, sleeping until the next one is due"""
+        while self.running:
+            delay = self.status_max_sleep_seconds
+            if not self._is_leader(STATUS_JOB):
+                delay = self._standby_delay(delay)
+            else:
+                try:
+                    # Sync writes in a worker thread, off the loop (see app.db_async)
+                    next_due = await to_thread(self._apply_scheduled_transitions)
+                    if next_due is not None:
+                        delay = min(delay, max(0.0, (next_due - datetime.utcnow()).total_seconds()))
+                except Exception as e:
+                    logger.error(f"Error applying scheduled status transitions: {e}", exc_info=True)
+            try:
+                await asyncio.sleep(delay)
             except asyncio.CancelledError:
                 break
     
@@ -81,7 +179,16 @@ class BackgroundScheduler:
         
         try:
             logger.debug("Scanning file endpoints...")
-            stats = await scan_file_endpoints(session)
+            exclude_ids = None
+            if self.watcher:
+                # Pick up added/removed/changed endpoints; watched inboxes are only
+                # listed again by the periodic reconciliation
+                self.watcher.sync()
+                if time.monotonic() - self._last_reconcile < self.reconcile_interval_seconds:
+                    exclude_ids = self.watcher.watched_ids
+                else:
+                    self._last_reconcile = time.monotonic()
+            stats = await scan_file_endpoints(session, exclude_ids)
             
             if stats['files_processed'] > 0 or stats['errors']:
                 logger.info(
@@ -100,35 +207,70 @@ class BackgroundScheduler:
             except StopIteration:
                 pass
 
+    def _apply_scheduled_transitions(self) -> Optional[datetime]:
+        """
+        Flip due structure statuses (one batched update, coalesced emissions), then
+        recompute beds whose scheduled transition is due.
+        Returns the next pending transition date, if any.
+        """
+        session_gen = get_session()
+        session = next(session_gen)
+        try:
+            count = sweep_scheduled_status(session)
+            if count:
+                logger.info(f"Scheduled status applied to {count} location(s)")
+            count = refresh_scheduled_beds(session)
+            if count:
+                logger.info(f"Bed occupancy refreshed for {count} bed(s) with due scheduled transitions")
+            upcoming = [d for d in (next_scheduled_change(session), next_bed_status_change(session)) if d]
+            return min(upcoming) if upcoming else None
+        finally:
+            try:
+                next(session_gen, None)  # Close the session
+            except StopIteration:
+                pass
+
 
 # Global scheduler instance
 _scheduler: Optional[BackgroundScheduler] = None
 
 
-def get_scheduler(poll_interval_seconds: int = 60) -> BackgroundScheduler:
+def get_scheduler(
+    poll_interval_seconds: int = 60,
+    watch_files: bool = True,
+    leases: Optional[LeaderLeases] = None,
+) -> BackgroundScheduler:
     """
     Get or create the global scheduler instance.
     
     Args:
         poll_interval_seconds: Polling interval (default: 60s)
+        watch_files: Watch file endpoint inboxes with inotify when available
+        leases: Leader leases shared between workers (None: single process)
     
     Returns:
         BackgroundScheduler instance
     """
     global _scheduler
     if _scheduler is None:
-        _scheduler = BackgroundScheduler(poll_interval_seconds)
+        _scheduler = BackgroundScheduler(poll_interval_seconds, watch_files=watch_files, leases=leases)
     return _scheduler
 
 
-async def start_scheduler(poll_interval_seconds: int = 60):
+async def start_scheduler(
+    poll_interval_seconds: int = 60,
+    watch_files: bool = True,
+    leases: Optional[LeaderLeases] = None,
+):
     """
     Start the background scheduler.
     
     Args:
         poll_interval_seconds: Polling interval (default: 60s = 1 minute)
+        watch_files: Watch file endpoint inboxes with inotify when available
+        leases: Leader leases shared between workers (None: single process)
     """
-    scheduler = get_scheduler(poll_interval_seconds)
+    scheduler = get_scheduler(poll_interval_seconds, watch_files, leases)
     await scheduler.start()
 
 
@@ -0,0 +1,304 @@
+"""
+Clonage ensembliste de la structure d'une Entité Juridique
+
+Contenu
+- `clone_ej_structure`: copie EJ → EG → Pôle → Service → UF → UH → Chambre → Lit
+  (et liens UF ↔ activités) niveau par niveau : sous-arbre source préchargé en une
+  requête par niveau, identifiants alloués par lots, INSERT groupés par lot (un flush)
+  et tables de correspondance ancien id → nouvel id pour les clés étrangères.
+  Transaction unique ; les émissions FHIR/MFN sont regroupées par `structure_emitter`
+  ou supprimées (`emit=False`, le journal de structure reste alimenté).
+- `start_clone_job` / `get_clone_job`: exécution en tâche de fond (thread) avec
+  progression consultable (entités copiées / total, niveau courant).
+
+Notes
+- Identifiants : suffixe `_clone` (puis `_clone2`, `_clone3`... si déjà pris).
+- FINESS des EG : préfixe "CLN" ; SIREN/SIRET non copiés (comme le clonage historique).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import insert, select as sa_select
+from sqlmodel import Session, select
+
+from app.models_structure import (
+    Chambre, Lit, Pole, Service, UniteFonctionnelle, UniteFonctionnelleActivityLink, UniteHebergement,
+)
+from app.models_structure_fhir import EntiteGeographique, EntiteJuridique
+from app.services.entity_events_structure import SUPPRESS_EMISSION_KEY
+
+logger = logging.getLogger(__name__)
+
+# Niveaux copiés dans l'ordre : (clé, modèle, clé étrangère vers le niveau précédent)
+LEVELS = (
+    ("eg", EntiteGeographique, "entite_juridique_id"),
+    ("pole", Pole, "entite_geo_id"),
+    ("service", Service, "pole_id"),
+    ("uf", UniteFonctionnelle, "service_id"),
+    ("uh", UniteHebergement, "unite_fonctionnelle_id"),
+    ("chambre", Chambre, "unite_hebergement_id"),
+    ("lit", Lit, "chambre_id"),
+)
+
+# Entités insérées par flush (et taille des listes IN)
+BATCH_SIZE = 1000
+
+IDENTIFIER_SUFFIX = "_clone"
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def _load_level(session: Session, model, fk: str, parent_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """Lignes (dict de colonnes) des enfants de `parent_ids`, par lots d'IN."""
+    table = model.__table__
+    rows: List[Dict[str, Any]] = []
+    parent_ids = list(parent_ids)
+    for start in range(0, len(parent_ids), BATCH_SIZE):
+        result = session.connection().execute(
+            sa_select(table)
+            .where(table.c[fk].in_(parent_ids[start:start + BATCH_SIZE]))
+            .order_by(table.c.id)
+        )
+        rows.extend(dict(row._mapping) for row in result)
+    return rows
+
+
+def _allocate_identifiers(session: Session, model, sources: Sequence[str]) -> Dict[str, str]:
+    """Identifiant source -> identifiant libre (suffixe `_clone`, puis `_clone2`...), par lots."""
+    column = model.identifier
+    allocated: Dict[str, str] = {}
+    remaining = list(dict.fromkeys(sources))
+    attempt = 1
+    while remaining:
+        suffix = IDENTIFIER_SUFFIX if attempt == 1 else f"{IDENTIFIER_SUFFIX}{attempt}"
+        candidates = {source: f"{source}{suffix}" for source in remaining}
+        taken = set()
+        values = list(candidates.values())
+        for start in range(0, len(values), BATCH_SIZE):
+            taken.update(session.exec(select(column).where(column.in_(values[start:start + BATCH_SIZE]))).all())
+        remaining = [source for source, candidate in candidates.items() if candidate in taken]
+        allocated.update({s: c for s, c in candidates.items() if c not in taken})
+        attempt += 1
+    return allocated
+
+
+def _clone_values(model_key: str, row: Dict[str, Any], fk: str, parent_id: int,
+                  identifier: str, now: datetime) -> Dict[str, Any]:
+    values = {k: v for k, v in row.items() if k != "id"}
+    values[fk] = parent_id
+    values["identifier"] = identifier
+    if model_key == "eg":
+        finess = row.get("finess")
+        values["finess"] = f"CLN{finess[3:]}" if finess else None
+        values["siren"] = None
+        values["siret"] = None
+    for column in ("created_at", "updated_at"):
+        if column in values:
+            values[column] = now
+    return values
+
+
+def clone_ej_structure(
+    session: Session,
+    source_ej: EntiteJuridique,
+    new_name: str,
+    new_finess_ej: str,
+    emit: bool = True,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Clone la structure complète de `source_ej` sous une nouvelle EJ, en une transaction.
+
+    `progress(niveau, copiées, total)` est appelé après chaque lot inséré.
+    Retourne {"ej_id": id de la nouvelle EJ, "counts": {niveau: nombre copié}}.
+    """
+    # Sous-arbre source : une requête (par lot d'IN) par niveau
+    source_rows: Dict[str, List[Dict[str, Any]]] = {}
+    parent_ids: Sequence[int] = [source_ej.id]
+    for key, model, fk in LEVELS:
+        source_rows[key] = _load_level(session, model, fk, parent_ids)
+        parent_ids = [row["id"] for row in source_rows[key]]
+    total = sum(len(rows) for rows in source_rows.values())
+    done = 0
+
+    try:
+        if not emit:
+            session.info[SUPPRESS_EMISSION_KEY] = True
+        new_ej = EntiteJuridique(
+            name=new_name,
+            finess_ej=new_finess_ej,
+            short_name=f"{source_ej.short_name} (Clonée)" if source_ej.short_name else None,
+            description=f"Clone de {source_ej.name}",
+            siren=None,  # Ne pas copier les identifiants légaux
+            siret=None,
+            address_line=source_ej.address_line,
+            postal_code=source_ej.postal_code,
+            city=source_ej.city,
+            country=source_ej.country,
+            is_active=source_ej.is_active,
+            ght_context_id=source_ej.ght_context_id,
+        )
+        session.add(new_ej)
+        session.flush()
+
+        now = datetime.utcnow()
+        id_map: Dict[int, int] = {source_ej.id: new_ej.id}
+        counts: Dict[str, int] = {}
+        for key, model, fk in LEVELS:
+            rows = source_rows[key]
+            identifiers = _allocate_identifiers(session, model, [row["identifier"] for row in rows])
+            level_map: Dict[int, int] = {}
+            for start in range(0, len(rows), BATCH_SIZE):
+                batch = rows[start:start + BATCH_SIZE]
+                objects = [
+                    model(**_clone_values(key, row, fk, id_map[row[fk]], identifiers[row["identifier"]], now))
+                    for row in batch
+                ]
+                session.add_all(objects)
+                session.flush()  # INSERT groupés ; ids disponibles pour le niveau suivant
+                level_map.update((row["id"], obj.id) for row, obj in zip(batch, objects))
+                done += len(batch)
+                if progress:
+                    progress(key, done, total)
+            counts[key] = len(rows)
+            id_map = level_map
+            if key == "uf":
+                _clone_uf_activities(session, level_map)
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(SUPPRESS_EMISSION_KEY, None)
+
+    logger.info("[structure_clone] EJ %s cloned as %s: %s", source_ej.id, new_ej.id, counts)
+    return {"ej_id": new_ej.id, "counts": counts}
+
+
+def _clone_uf_activities(session: Session, uf_map: Dict[int, int]) -> None:
+    """Copie les liens UF ↔ activités des UF clonées (INSERT groupé)."""
+    table = UniteFonctionnelleActivityLink.__table__
+    links = []
+    uf_ids = list(uf_map)
+    for start in range(0, len(uf_ids), BATCH_SIZE):
+        result = session.connection().execute(
+            sa_select(table.c.uf_id, table.c.activity_id).where(table.c.uf_id.in_(uf_ids[start:start + BATCH_SIZE]))
+        )
+        links.extend({"uf_id": uf_map[uf_id], "activity_id": activity_id} for uf_id, activity_id in result)
+    if links:
+        session.connection().execute(insert(table), links)
+
+
+# ----------------------------------------------------------------------
+# Tâches de fond
+# ----------------------------------------------------------------------
+
+@dataclass
+class CloneJob:
+    id: str
+    source_ej_id: int
+    new_name: str
+    new_finess_ej: str
+    emit: bool = True
+    context_id: Optional[int] = None  # contexte GHT de l'EJ source (périmètre du suivi)
+    status: str = "pending"  # pending, running, done, error
+    level: Optional[str] = None
+    done: int = 0
+    total: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "source_ej_id": self.source_ej_id,
+            "context_id": self.context_id,
+            "status": self.status,
+            "level": self.level,
+            "done": self.done,
+            "total": self.total,
+            "percent": round(100 * self.done / self.total, 1) if self.total else (100.0 if self.status == "done" else 0.0),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+_jobs: Dict[str, CloneJob] = {}
+_jobs_lock = threading.Lock()
+_tasks: set = set()
+
+# Nombre de tâches terminées conservées pour consultation
+MAX_FINISHED_JOBS = 50
+
+
+def _run_job(job: CloneJob) -> None:
+    from app.db import engine
+
+    def _progress(level: str, done: int, total: int) -> None:
+        job.level, job.done, job.total = level, done, total
+
+    job.status = "running"
+    try:
+        with Session(engine) as session:
+            source = session.get(EntiteJuridique, job.source_ej_id)
+            if source is None:
+                raise ValueError(f"Entité juridique {job.source_ej_id} introuvable")
+            job.result = clone_ej_structure(
+                session, source, job.new_name, job.new_finess_ej, emit=job.emit, progress=_progress,
+            )
+        job.status = "done"
+    except Exception as exc:  # noqa: BLE001
+        logger.error("[structure_clone] Job %s failed: %s", job.id, exc, exc_info=True)
+        job.status = "error"
+        job.error = str(exc)
+    finally:
+        job.finished_at = datetime.utcnow()
+
+
+def _forget_finished_jobs() -> None:
+    finished = sorted((j for j in _jobs.values() if j.finished_at), key=lambda j: j.finished_at)
+    for job in finished[:-MAX_FINISHED_JOBS]:
+        _jobs.pop(job.id, None)
+
+
+def start_clone_job(
+    source_ej_id: int,
+    new_name: str,
+    new_finess_ej: str,
+    emit: bool = True,
+    context_id: Optional[int] = None,
+) -> CloneJob:
+    """Lance le clonage dans un thread (ne bloque pas la requête). À appeler depuis la boucle asyncio."""
+    job = CloneJob(id=uuid.uuid4().hex, source_ej_id=source_ej_id, new_name=new_name,
+                   new_finess_ej=new_finess_ej, emit=emit, context_id=context_id)
+    with _jobs_lock:
+        _forget_finished_jobs()
+        _jobs[job.id] = job
+    task = asyncio.get_running_loop().create_task(asyncio.to_thread(_run_job, job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_clone_job(job_id: str) -> Optional[CloneJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+async def wait_clone_job(job_id: str) -> Optional[CloneJob]:
+    """Attend la fin d'une tâche lancée par ce processus (tests, arrêt)."""
+    if _tasks:
+        await asyncio.gather(*list(_tasks), return_exceptions=True)
+    return get_clone_job(job_id)
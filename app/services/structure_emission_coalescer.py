@@ -0,0 +1,203 @@
+"""
+Émission coalescée des modifications de structure (FHIR Location / MFN^M05)
+
+Contenu
+- `StructureEmissionCoalescer`: collecte les modifications commitées (modèle, id, op)
+  pendant une fenêtre glissante (debounce) puis émet le lot en une fois via
+  `emit_structure_batch` : un Bundle transaction par endpoint FHIR et un MFN
+  (snapshot ou delta selon l'endpoint) par endpoint MLLP.
+- `structure_emitter`: instance globale alimentée par `entity_events_structure`.
+
+Notes
+- Fenêtre : chaque nouvel événement repousse l'émission de `window` secondes, sans
+  dépasser `max_delay` depuis le premier événement du lot (flux continu borné).
+  Réglages : STRUCTURE_EMIT_WINDOW_SECONDS / STRUCTURE_EMIT_MAX_DELAY_SECONDS.
+- Plusieurs écritures d'une même entité dans la fenêtre sont fusionnées
+  (insert+update = insert, update+delete = delete, insert+delete = rien).
+- `add` peut être appelé hors de la boucle asyncio (endpoints synchrones exécutés dans
+  un thread) : l'émission est alors planifiée sur la boucle ayant lancé le thread
+  (`app.db_async.to_thread`), à défaut sur la dernière boucle connue.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = float(os.getenv("STRUCTURE_EMIT_WINDOW_SECONDS", "0.1"))
+DEFAULT_MAX_DELAY = float(os.getenv("STRUCTURE_EMIT_MAX_DELAY_SECONDS", "2.0"))
+
+Change = Tuple[str, int, str, Dict[str, Any]]
+
+
+def _merge_op(previous: Optional[str], op: str) -> Optional[str]:
+    """Opération résultante de deux écritures successives d'une entité (None : rien à émettre)."""
+    if previous is None:
+        return op
+    if previous == "insert":
+        return None if op == "delete" else "insert"
+    if previous == "delete" and op != "delete":
+        return "update"  # id réutilisé après suppression
+    return op
+
+
+async def _emit_window(changes: List[Change]) -> Dict[str, int]:
+    from sqlmodel import Session as SQLModelSession
+
+    from app.db import engine
+    from app.services.structure_emit import emit_structure_batch
+
+    with SQLModelSession(engine) as session:
+        return await emit_structure_batch(changes, session)
+
+
+class StructureEmissionCoalescer:
+    def __init__(
+        self,
+        window: float = DEFAULT_WINDOW,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        emitter: Optional[Callable[[List[Change]], Awaitable[Dict[str, int]]]] = None,
+    ):
+        self.window = window
+        self.max_delay = max_delay
+        self._emitter = emitter or _emit_window
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, int], Tuple[str, Dict[str, Any]]] = {}
+        self._pending_events = 0
+        self._first_at: Optional[float] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: set = set()
+        self._metrics: Dict[str, Any] = {
+            "events": 0,
+            "windows": 0,
+            "entities_emitted": 0,
+            "cancelled": 0,
+            "fhir_entries": 0,
+            "mfn_messages": 0,
+            "errors": 0,
+            "last_window": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Collecte
+    # ------------------------------------------------------------------
+
+    def add_many(self, changes: Iterable[Change]) -> None:
+        """Ajoute des modifications commitées et (re)planifie l'émission du lot."""
+        from app.db_async import event_loop
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        target = loop or event_loop() or self._loop
+        if target is None or target.is_closed():
+            logger.warning("[structure_emitter] No event loop; skipping emissions")
+            return
+
+        with self._lock:
+            for model_name, entity_id, op, metadata in changes:
+                key = (model_name, entity_id)
+                previous = self._pending.get(key)
+                merged = _merge_op(previous[0] if previous else None, op)
+                self._metrics["events"] += 1
+                self._pending_events += 1
+                if merged is None:
+                    self._pending.pop(key, None)
+                    self._metrics["cancelled"] += 1
+                else:
+                    self._pending[key] = (merged, dict(metadata or {}))
+            self._loop = target
+
+        if loop is target:
+            self._reschedule()
+        else:
+            target.call_soon_threadsafe(self._reschedule)
+
+    def add(self, model_name: str, entity_id: int, op: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        self.add_many([(model_name, entity_id, op, metadata or {})])
+
+    def _reschedule(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        with self._lock:
+            if not self._pending_events:
+                return
+            if self._first_at is None:
+                self._first_at = now
+            deadline = min(now + self.window, self._first_at + self.max_delay)
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = loop.call_at(deadline, self._start_flush)
+
+    def _start_flush(self) -> None:
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # ------------------------------------------------------------------
+    # Emission
+    # ------------------------------------------------------------------
+
+    def _take(self) -> Tuple[List[Change], int]:
+        with self._lock:
+            batch = [(name, entity_id, op, metadata) for (name, entity_id), (op, metadata) in self._pending.items()]
+            events = self._pending_events
+            self._pending = {}
+            self._pending_events = 0
+            self._first_at = None
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+        return batch, events
+
+    async def flush(self) -> Optional[Dict[str, int]]:
+        """Émet immédiatement le lot en attente. Retourne les compteurs d'émission du lot."""
+        batch, events = self._take()
+        if not batch:
+            return None
+        started = time.perf_counter()
+        stats: Dict[str, int] = {}
+        try:
+            stats = await self._emitter(batch) or {}
+        except Exception as exc:  # noqa: BLE001
+            self._metrics["errors"] += 1
+            logger.error("[structure_emitter] Emission failed for %d entities: %s", len(batch), exc, exc_info=True)
+        self._metrics["windows"] += 1
+        self._metrics["entities_emitted"] += len(batch)
+        self._metrics["fhir_entries"] += stats.get("fhir_entries", 0)
+        self._metrics["mfn_messages"] += stats.get("mfn_messages", 0)
+        self._metrics["last_window"] = {
+            "events": events,
+            "entities": len(batch),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        logger.info("[structure_emitter] Emitted %d entities for %d change events", len(batch), events)
+        return stats
+
+    async def drain(self) -> None:
+        """Émet le lot en attente et attend les émissions en cours (arrêt, tests)."""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["pending"] = len(self._pending)
+            pending_events = self._pending_events
+        emitted = metrics["entities_emitted"]
+        # Evénements absorbés par une autre écriture de la même entité (fusion ou annulation)
+        metrics["coalesced"] = metrics["events"] - pending_events - emitted
+        metrics["coalescing_ratio"] = round(metrics["events"] / emitted, 2) if emitted else None
+        return metrics
+
+
+# Instance globale (écouteurs de `entity_events_structure`)
+structure_emitter = StructureEmissionCoalescer()
@@ -2,37 +2,93 @@
 
 Cette couche envoie:
 - FHIR: Bundle transaction avec PUT/DELETE Location/{id} vers les endpoints FHIR "sender"
-- HL7: message MFN^M05 (snapshot complet) vers les endpoints MLLP "sender"
+- HL7: message MFN^M05 (snapshot complet, ou delta incrémental depuis la dernière
+  version acquittée selon `mfn_emission_mode` de l'endpoint, pour les émissions
+  groupées) vers les endpoints MLLP "sender", et déposé dans l'outbox des endpoints
+  FILE "sender" (`file_sender` ; écriture réussie = acquittement)
 
 Utilisation:
 - await emit_structure_change(entity, session, operation="insert|update")
 - await emit_structure_delete(entity_id, session)
+- await emit_structure_batch(changes, session): un Bundle et un MFN par endpoint pour
+  un lot de modifications (voir `structure_emission_coalescer`)
+
+Les entrées FHIR passent par `fhir_batcher` : les émissions concurrentes vers un même
+endpoint partagent un Bundle (un MessageLog par émission).
+
+`emit_structure_batch` (émission de fond) n'écrit rien avant la fin des envois : les
+MessageLog et points de synchronisation restent en mémoire (`no_autoflush`), puis sont
+écrits et commités en une transaction dans un thread (`app.db_async.to_thread`), sans
+jamais garder le verrou d'écriture SQLite pendant un `await`.
 """
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from sqlmodel import Session, select
 
+from app.db_async import to_thread
+
 from app.models_endpoints import SystemEndpoint, MessageLog
-from app.services.fhir_structure import entity_to_fhir_location
+from app.services.fhir_structure import entities_to_fhir_locations, entity_to_fhir_location
 from app.services.fhir_organization import organization_to_bundle
-from app.services.fhir_transport import post_fhir_bundle
+from app.services.endpoint_cache import endpoint_config
+from app.services.fhir_batcher import fhir_batcher
+from app.services.fhir_transport import fhir_endpoint_options
+from app.services.file_sender import file_sender
 from app.services.mllp import send_mllp
-from app.services.mfn_structure import generate_mfn_message
+from app.services.mfn_structure import generate_mfn_delta, generate_mfn_full_snapshot, generate_mfn_message
 from app.services.mfn_organization import generate_mfn_organization_message, generate_mfn_organization_delete
+from app.services.structure_journal import current_version, get_sync_state, prune_journal, record_sent
 
 logger = logging.getLogger(__name__)
 
 
 def _get_senders(session: Session):
-    endpoints = session.exec(select(SystemEndpoint).where(SystemEndpoint.role == "sender")).all()
-    fhir_senders = [e for e in endpoints if (e.kind or "").lower() == "fhir" and e.is_enabled]
-    mllp_senders = [e for e in endpoints if (e.kind or "").upper() == "MLLP" and e.is_enabled]
-    return fhir_senders, mllp_senders
+    """Endpoints sender actifs : (FHIR, HL7 v2 = MLLP puis FILE)."""
+    config = endpoint_config(session)
+    hl7_senders = config.senders("MLLP", enabled_only=True) + config.senders("FILE", enabled_only=True)
+    return list(config.senders("FHIR", enabled_only=True)), list(hl7_senders)
+
+
+def _hl7_kind(endpoint) -> str:
+    return "FILE" if (endpoint.kind or "").upper() == "FILE" else "MLLP"
+
+
+async def _deliver_hl7(endpoint, message: str) -> Tuple[str, str, bool]:
+    """Envoie un message HL7 v2 (MLLP ou dépôt FILE) : (statut, acquittement, acquitté)."""
+    if _hl7_kind(endpoint) == "FILE":
+        result = await file_sender.send(endpoint, message)
+        return ("sent" if result.ok else "error"), result.ack_payload(), result.ok
+    try:
+        if not (endpoint.host and endpoint.port):
+            raise ValueError("Endpoint MLLP incomplet (host/port)")
+        ack = await send_mllp(endpoint.host, endpoint.port, message)
+    except Exception as exc:  # noqa: BLE001
+        return "error", str(exc), False
+    return "sent", ack, _is_positive_ack(ack)
+
+
+async def _send_fhir_bundle(bundle: Dict[str, Any], fhir_senders, session: Session) -> None:
+    """Envoie les entrées de `bundle` aux endpoints FHIR (en parallèle) via le regroupeur
+    `fhir_batcher` : un MessageLog par endpoint avec les réponses de ses propres entrées."""
+    payload = json.dumps(bundle, ensure_ascii=False)
+
+    async def _send(endpoint) -> MessageLog:
+        base = endpoint.base_url or endpoint.host or ""
+        if not base:
+            return MessageLog(direction="out", kind="FHIR", endpoint_id=endpoint.id, payload=payload,
+                              ack_payload="Endpoint sans host/base_url", status="error")
+        result = await fhir_batcher.submit(base, bundle["entry"], **fhir_endpoint_options(endpoint))
+        return MessageLog(direction="out", kind="FHIR", endpoint_id=endpoint.id, payload=payload,
+                          ack_payload=result.ack_payload(), status="sent" if result.ok else "error")
+
+    for log in await asyncio.gather(*(_send(endpoint) for endpoint in fhir_senders)):
+        session.add(log)
 
 
 async def _emit_organization_upsert(entity, session: Session) -> None:
@@ -40,40 +96,7 @@ async def _emit_organization_upsert(entity, session: Session) -> None:
     bundle = organization_to_bundle(entity, session, method="PUT")
 
     fhir_senders, _ = _get_senders(session)
-    for endpoint in fhir_senders:
-        # Pour FHIR, utiliser base_url au lieu de host
-        base = endpoint.base_url or endpoint.host or ""
-        if not base:
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload="Endpoint sans host/base_url",
-                status="error",
-            )
-            session.add(log)
-            continue
-        try:
-            status_code, response = await post_fhir_bundle(base, bundle)
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=json.dumps(response or {}, ensure_ascii=False),
-                status="sent" if 200 <= status_code < 300 else "error",
-            )
-        except Exception as exc:  # noqa: BLE001
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=str(exc),
-                status="error",
-            )
-        session.add(log)
+    await _send_fhir_bundle(bundle, fhir_senders, session)
 
 
 async def _emit_organization_delete(entity_id: int, finess_ej: str, session: Session) -> None:
@@ -87,60 +110,18 @@ async def _emit_organization_delete(entity_id: int, finess_ej: str, session: Ses
         ],
     }
     fhir_senders, _ = _get_senders(session)
-    for endpoint in fhir_senders:
-        # Pour FHIR, utiliser base_url au lieu de host
-        base = endpoint.base_url or endpoint.host or ""
-        if not base:
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload="Endpoint sans host/base_url",
-                status="error",
-            )
-            session.add(log)
-            continue
-        try:
-            status_code, response = await post_fhir_bundle(base, bundle)
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=json.dumps(response or {}, ensure_ascii=False),
-                status="sent" if 200 <= status_code < 300 else "error",
-            )
-        except Exception as exc:  # noqa: BLE001
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=str(exc),
-                status="error",
-            )
-        session.add(log)
+    await _send_fhir_bundle(bundle, fhir_senders, session)
 
 
 async def _emit_mfn_organization(entity, session: Session) -> None:
-    """Génère et envoie un message MFN M05 pour Organization aux endpoints MLLP."""
+    """Génère et envoie un message MFN M05 pour Organization aux endpoints MLLP/FILE."""
     mfn = generate_mfn_organization_message(session, ej=entity)
-    _, mllp_senders = _get_senders(session)
-    for endpoint in mllp_senders:
-        ack = ""
-        status = "generated"
-        try:
-            if not (endpoint.host and endpoint.port):
-                raise ValueError("Endpoint MLLP incomplet (host/port)")
-            ack = await send_mllp(endpoint.host, endpoint.port, mfn)
-            status = "sent"
-        except Exception as exc:  # noqa: BLE001
-            status = "error"
-            ack = str(exc)
+    _, hl7_senders = _get_senders(session)
+    for endpoint in hl7_senders:
+        status, ack, _ = await _deliver_hl7(endpoint, mfn)
         log = MessageLog(
             direction="out",
-            kind="MLLP",
+            kind=_hl7_kind(endpoint),
             endpoint_id=endpoint.id,
             payload=mfn,
             ack_payload=ack,
@@ -153,21 +134,12 @@ async def _emit_mfn_organization(entity, session: Session) -> None:
 async def _emit_mfn_organization_delete(entity_id: int, finess_ej: str, session: Session) -> None:
     """Génère et envoie un message MFN M05 DELETE pour Organization."""
     mfn = generate_mfn_organization_delete(entity_id, finess_ej)
-    _, mllp_senders = _get_senders(session)
-    for endpoint in mllp_senders:
-        ack = ""
-        status = "generated"
-        try:
-            if not (endpoint.host and endpoint.port):
-                raise ValueError("Endpoint MLLP incomplet (host/port)")
-            ack = await send_mllp(endpoint.host, endpoint.port, mfn)
-            status = "sent"
-        except Exception as exc:  # noqa: BLE001
-            status = "error"
-            ack = str(exc)
+    _, hl7_senders = _get_senders(session)
+    for endpoint in hl7_senders:
+        status, ack, _ = await _deliver_hl7(endpoint, mfn)
         log = MessageLog(
             direction="out",
-            kind="MLLP",
+            kind=_hl7_kind(endpoint),
             endpoint_id=endpoint.id,
             payload=mfn,
             ack_payload=ack,
@@ -191,40 +163,7 @@ async def _emit_fhir_upsert(entity, session: Session) -> None:
     }
 
     fhir_senders, _ = _get_senders(session)
-    for endpoint in fhir_senders:
-        # Pour FHIR, utiliser base_url au lieu de host
-        base = endpoint.base_url or endpoint.host or ""
-        if not base:
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload="Endpoint sans host/base_url",
-                status="error",
-            )
-            session.add(log)
-            continue
-        try:
-            status_code, response = await post_fhir_bundle(base, bundle)
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=json.dumps(response or {}, ensure_ascii=False),
-                status="sent" if 200 <= status_code < 300 else "error",
-            )
-        except Exception as exc:  # noqa: BLE001
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=str(exc),
-                status="error",
-            )
-        session.add(log)
+    await _send_fhir_bundle(bundle, fhir_senders, session)
 
 
 async def _emit_fhir_delete(entity_id: int, session: Session) -> None:
@@ -236,60 +175,18 @@ async def _emit_fhir_delete(entity_id: int, session: Session) -> None:
         ],
     }
     fhir_senders, _ = _get_senders(session)
-    for endpoint in fhir_senders:
-        # Pour FHIR, utiliser base_url au lieu de host
-        base = endpoint.base_url or endpoint.host or ""
-        if not base:
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload="Endpoint sans host/base_url",
-                status="error",
-            )
-            session.add(log)
-            continue
-        try:
-            status_code, response = await post_fhir_bundle(base, bundle)
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=json.dumps(response or {}, ensure_ascii=False),
-                status="sent" if 200 <= status_code < 300 else "error",
-            )
-        except Exception as exc:  # noqa: BLE001
-            log = MessageLog(
-                direction="out",
-                kind="FHIR",
-                endpoint_id=endpoint.id,
-                payload=json.dumps(bundle, ensure_ascii=False),
-                ack_payload=str(exc),
-                status="error",
-            )
-        session.add(log)
+    await _send_fhir_bundle(bundle, fhir_senders, session)
 
 
 async def _emit_mfn_snapshot(session: Session) -> None:
-    """Génère et envoie un snapshot MFN M05 complet aux endpoints MLLP."""
+    """Génère et envoie un snapshot MFN M05 complet aux endpoints MLLP/FILE."""
     mfn = generate_mfn_message(session)
-    _, mllp_senders = _get_senders(session)
-    for endpoint in mllp_senders:
-        ack = ""
-        status = "generated"
-        try:
-            if not (endpoint.host and endpoint.port):
-                raise ValueError("Endpoint MLLP incomplet (host/port)")
-            ack = await send_mllp(endpoint.host, endpoint.port, mfn)
-            status = "sent"
-        except Exception as exc:  # noqa: BLE001
-            status = "error"
-            ack = str(exc)
+    _, hl7_senders = _get_senders(session)
+    for endpoint in hl7_senders:
+        status, ack, _ = await _deliver_hl7(endpoint, mfn)
         log = MessageLog(
             direction="out",
-            kind="MLLP",
+            kind=_hl7_kind(endpoint),
             endpoint_id=endpoint.id,
             payload=mfn,
             ack_payload=ack,
@@ -328,3 +225,140 @@ async def emit_structure_delete(entity_id: int, session: Session, entity_type: s
     await _emit_fhir_delete(entity_id, session)
     await _emit_mfn_snapshot(session)
     session.commit()
+
+
+# ----------------------------------------------------------------------
+# Emission groupée (un lot de modifications coalescées)
+# ----------------------------------------------------------------------
+
+async def _send_mfn(mfn: str, endpoint, session: Session) -> bool:
+    """Envoie un MFN et le journalise ; retourne True s'il est acquitté."""
+    status, ack, acknowledged = await _deliver_hl7(endpoint, mfn)
+    session.add(MessageLog(direction="out", kind=_hl7_kind(endpoint), endpoint_id=endpoint.id, payload=mfn,
+                           ack_payload=ack, status=status, message_type="MFN^M05"))
+    return acknowledged
+
+
+def _is_positive_ack(ack: str) -> bool:
+    return "MSA|AA" in ack or "MSA|CA" in ack
+
+
+async def sync_mfn_endpoint(
+    endpoint, session: Session, cache: Optional[Dict[int, Tuple[Optional[str], int]]] = None
+) -> bool:
+    """Synchronise un endpoint MLLP/FILE en MFN delta depuis sa dernière version acquittée.
+
+    Sans point de synchronisation : snapshot de tous les niveaux EG → Lit (référence),
+    puis deltas. Le point n'avance que sur ACK positif ; sinon les mêmes modifications
+    seront renvoyées.
+    `cache` partage les messages générés entre endpoints au même point.
+    Retourne True si un message a été envoyé.
+    """
+    state = get_sync_state(session, endpoint.id)
+    if state is None:
+        version = current_version(session)
+        mfn = generate_mfn_full_snapshot(session)
+    else:
+        if cache is not None and state.acked_version in cache:
+            mfn, version = cache[state.acked_version]
+        else:
+            mfn, version = generate_mfn_delta(session, state.acked_version)
+            if cache is not None:
+                cache[state.acked_version] = (mfn, version)
+        if mfn is None:
+            if version != state.acked_version:
+                # Seules des entités hors MFN Location ont changé : rien à envoyer
+                record_sent(session, endpoint.id, version, acknowledged=True)
+            return False
+    acknowledged = await _send_mfn(mfn, endpoint, session)
+    record_sent(session, endpoint.id, version, acknowledged=acknowledged)
+    return True
+
+
+def _prune_and_commit(session: Session) -> None:
+    prune_journal(session)
+    session.commit()
+
+
+async def emit_structure_batch(
+    changes: Sequence[Tuple[str, int, str, Dict[str, Any]]],
+    session: Session,
+) -> Dict[str, int]:
+    """Émet un lot de modifications de structure : (modèle, id, op, métadonnées).
+
+    - FHIR : un seul Bundle transaction (PUT/DELETE Location et Organization) par endpoint.
+    - MFN : un message par endpoint MLLP/FILE, snapshot (une génération pour tous) ou delta
+      (journal depuis la version acquittée par l'endpoint, voir `sync_mfn_endpoint`)
+      selon `mfn_emission_mode` ; EJ émises en MFN Organization.
+    Retourne le nombre d'entrées FHIR et de messages MFN envoyés.
+    """
+    from app.models_structure_fhir import EntiteJuridique
+    from app.services.location_index import MODELS
+
+    upserts: Dict[str, Dict[int, str]] = {}
+    deletes: List[Tuple[str, int, Dict[str, Any]]] = []
+    for model_name, entity_id, op, metadata in changes:
+        if op == "delete":
+            deletes.append((model_name, entity_id, metadata))
+        else:
+            upserts.setdefault(model_name, {})[entity_id] = op
+
+    # Aucune écriture avant la fin des envois (voir module)
+    with session.no_autoflush:
+        # Chargement par modèle (une requête) et rendu par lot
+        entries: List[Dict[str, Any]] = []
+        locations: List[Any] = []
+        organizations: List[Any] = []
+        for model_name, ops in upserts.items():
+            model = MODELS.get(model_name)
+            if model is None:
+                continue
+            for entity in session.exec(select(model).where(model.id.in_(list(ops)))).all():
+                (organizations if isinstance(entity, EntiteJuridique) else locations).append(entity)
+        for entity, resource in zip(locations, entities_to_fhir_locations(locations, session)):
+            entries.append({"resource": resource, "request": {"method": "PUT", "url": f"Location/{entity.id}"}})
+        for ej in organizations:
+            entries.extend(organization_to_bundle(ej, session, method="PUT")["entry"])
+        for model_name, entity_id, _ in deletes:
+            resource_type = "Organization" if model_name == "EntiteJuridique" else "Location"
+            entries.append({"request": {"method": "DELETE", "url": f"{resource_type}/{entity_id}"}})
+
+        fhir_senders, hl7_senders = _get_senders(session)
+        stats = {"fhir_entries": len(entries), "mfn_messages": 0}
+        if entries and fhir_senders:
+            # Lots de `max_entries` entrées : un MessageLog par lot et par endpoint
+            size = fhir_batcher.max_entries
+            await asyncio.gather(*(
+                _send_fhir_bundle({"resourceType": "Bundle", "type": "transaction", "entry": entries[i:i + size]},
+                                  fhir_senders, session)
+                for i in range(0, len(entries), size)
+            ))
+
+        # MFN Organization (EJ) : un message par EJ, comme l'émission unitaire
+        for ej in organizations:
+            await _emit_mfn_organization(ej, session)
+            stats["mfn_messages"] += len(hl7_senders)
+        for model_name, entity_id, metadata in deletes:
+            if model_name == "EntiteJuridique":
+                await _emit_mfn_organization_delete(entity_id, metadata.get("finess_ej"), session)
+                stats["mfn_messages"] += len(hl7_senders)
+
+        # MFN Location : snapshot (généré une fois pour tous) ou delta incrémental par endpoint
+        has_locations = bool(locations) or any(name != "EntiteJuridique" for name, _, _ in deletes)
+        snapshot = None
+        deltas: Dict[int, Tuple[Optional[str], int]] = {}
+        for endpoint in hl7_senders:
+            mode = (endpoint.mfn_emission_mode or "snapshot").lower()
+            if mode == "delta":
+                sent = await sync_mfn_endpoint(endpoint, session, deltas)
+                stats["mfn_messages"] += int(sent)
+                continue
+            if not has_locations:
+                continue
+            if snapshot is None:
+                snapshot = generate_mfn_message(session)
+            await _send_mfn(snapshot, endpoint, session)
+            stats["mfn_messages"] += 1
+
+    await to_thread(_prune_and_commit, session)
+    return stats
@@ -0,0 +1,154 @@
+"""
+Journal des modifications de structure et points de synchronisation MFN par endpoint
+
+Contenu
+- `record_changes`: insertion groupée de lignes `StructureChange` (appelée par les écouteurs
+  de `location_index`, dans la transaction de l'écriture).
+- `changes_since`: modifications postérieures à une version, réduites à une opération par
+  entité (MAD/MUP/MDL) ; coût proportionnel au nombre de modifications, pas à la structure.
+- `get_sync_state` / `record_sent` / `acknowledge`: points de synchronisation (high-water
+  marks) des endpoints récepteurs.
+- `prune_journal`: purge des lignes acquittées par tous les endpoints suivis (senders
+  MLLP/FILE actifs en mode delta) ; sans endpoint suivi, tout le journal est purgé.
+
+Notes
+- La version globale est `StructureChange.id` (autoincrement, jamais réutilisé).
+- Un endpoint sans point de synchronisation n'a pas de référence : il reçoit d'abord un
+  snapshot complet, puis les deltas depuis la version courante au moment du snapshot.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select as sa_select
+from sqlmodel import Session
+
+from app.models_shared import SystemEndpoint
+from app.models_structure import StructureChange, StructureSyncState
+
+
+@dataclass
+class JournalEntry:
+    """Modification nette d'une entité depuis une version (code MFE-1)."""
+    model: str
+    entity_id: int
+    code: str  # "MAD", "MUP" ou "MDL"
+    identifier: Optional[str]
+
+
+def record_changes(connection, entries: Sequence[Dict[str, Any]]) -> None:
+    """Ajoute des lignes au journal : dicts (model, entity_id, op, identifier, entity_version)."""
+    if not entries:
+        return
+    now = datetime.utcnow()
+    connection.execute(
+        insert(StructureChange.__table__),
+        [dict(entry, changed_at=now) for entry in entries],
+    )
+
+
+def current_version(session: Session) -> int:
+    """Version courante de la structure (0 si le journal est vide)."""
+    return session.exec(sa_select(func.coalesce(func.max(StructureChange.id), 0))).one()[0]
+
+
+def changes_since(
+    session: Session, version: int, limit: Optional[int] = None
+) -> Tuple[List[JournalEntry], int]:
+    """
+    Modifications d'id > `version` (au plus `limit` lignes de journal), réduites par entité :
+    créée puis supprimée = rien, créée = MAD, supprimée = MDL, sinon MUP.
+    Retourne (entrées dans l'ordre de première modification, dernière version lue).
+    """
+    table = StructureChange.__table__
+    query = sa_select(
+        table.c.id, table.c.model, table.c.entity_id, table.c.op, table.c.identifier
+    ).where(table.c.id > version).order_by(table.c.id)
+    if limit:
+        query = query.limit(limit)
+
+    last_version = version
+    first_op: Dict[Tuple[str, int], str] = {}
+    last: Dict[Tuple[str, int], Tuple[str, Optional[str]]] = {}
+    for row in session.connection().execute(query):
+        key = (row.model, row.entity_id)
+        first_op.setdefault(key, row.op)
+        previous = last.get(key)
+        # L'identifiant d'une suppression est celui de la dernière écriture connue
+        identifier = row.identifier or (previous[1] if previous else None)
+        last[key] = (row.op, identifier)
+        last_version = row.id
+
+    entries = []
+    for key, first in first_op.items():
+        op, identifier = last[key]
+        if op == "delete":
+            if first == "insert":
+                continue
+            code = "MDL"
+        else:
+            code = "MAD" if first == "insert" else "MUP"
+        entries.append(JournalEntry(key[0], key[1], code, identifier))
+    return entries, last_version
+
+
+def get_sync_state(session: Session, endpoint_id: int) -> Optional[StructureSyncState]:
+    return session.get(StructureSyncState, endpoint_id)
+
+
+def record_sent(session: Session, endpoint_id: int, version: int, acknowledged: bool) -> StructureSyncState:
+    """Enregistre l'envoi d'un message couvrant le journal jusqu'à `version`.
+
+    Le point de synchronisation n'avance que si le récepteur a acquitté (AA/CA) :
+    sinon les mêmes modifications seront renvoyées au prochain envoi.
+    """
+    state = session.get(StructureSyncState, endpoint_id)
+    if state is None:
+        state = StructureSyncState(endpoint_id=endpoint_id)
+    now = datetime.utcnow()
+    state.sent_version = version
+    state.sent_at = now
+    if acknowledged:
+        state.acked_version = max(state.acked_version or 0, version)
+        state.acked_at = now
+    session.add(state)
+    return state
+
+
+def acknowledge(session: Session, endpoint_id: int, version: int) -> StructureSyncState:
+    """Acquittement reçu hors de l'envoi (ACK différé) : avance le point de synchronisation."""
+    return record_sent(session, endpoint_id, version, acknowledged=True)
+
+
+def _tracked_endpoints():
+    """Endpoints dont le point de synchronisation retient le journal : senders MLLP/FILE actifs en delta."""
+    return sa_select(SystemEndpoint.id).where(
+        SystemEndpoint.role == "sender",
+        SystemEndpoint.is_enabled.is_(True),
+        func.upper(SystemEndpoint.kind).in_(("MLLP", "FILE")),
+        func.lower(func.coalesce(SystemEndpoint.mfn_emission_mode, "snapshot")) == "delta",
+    )
+
+
+def prune_journal(session: Session) -> int:
+    """Supprime les lignes acquittées par tous les endpoints suivis. Retourne le nombre purgé.
+
+    Les points de synchronisation des endpoints qui ne sont plus suivis (désactivés,
+    supprimés, repassés en snapshot) sont supprimés : ils ne bloquent plus la purge et
+    l'endpoint repartira d'un snapshot complet s'il revient en delta.
+    """
+    session.flush()
+    sync_table = StructureSyncState.__table__
+    connection = session.connection()
+    connection.execute(delete(sync_table).where(sync_table.c.endpoint_id.not_in(_tracked_endpoints())))
+    floor = connection.execute(sa_select(func.min(sync_table.c.acked_version))).scalar()
+    if floor is None:
+        floor = current_version(session)
+    if not floor:
+        return 0
+    result = session.connection().execute(
+        delete(StructureChange.__table__).where(StructureChange.__table__.c.id <= floor)
+    )
+    return result.rowcount or 0
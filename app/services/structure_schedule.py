@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Iterable, Optional, Sequence, Union
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
-from app.models_structure import BaseLocation, LocationStatus
+from sqlalchemy import bindparam, func, select as sa_select, update
+from sqlmodel import Session, select
+
+from app.models_structure import BaseLocation, LocationIndex, LocationStatus
 
 HL7_FORMATS: Sequence[str] = ("%Y%m%d%H%M%S", "%Y%m%d%H%M", "%Y%m%d")
+# Nombre de chiffres attendus pour chaque format (len(fmt) ne correspond pas à la longueur de la valeur)
+_HL7_FORMAT_LENGTHS = {"%Y%m%d%H%M%S": 14, "%Y%m%d%H%M": 12, "%Y%m%d": 8}
 
 
 def parse_hl7_datetime(value: Optional[str]) -> Optional[datetime]:
@@ -15,7 +20,7 @@ def parse_hl7_datetime(value: Optional[str]) -> Optional[datetime]:
     raw = value.strip()
     for fmt in HL7_FORMATS:
         try:
-            return datetime.strptime(raw[: len(fmt)], fmt)
+            return datetime.strptime(raw[: _HL7_FORMAT_LENGTHS[fmt]], fmt)
         except ValueError:
             continue
     return None
@@ -55,6 +60,49 @@ def _desired_status(entity: BaseLocation, *, now: Optional[datetime] = None) ->
     return LocationStatus.ACTIVE
 
 
+def scheduled_state(
+    status: Optional[Union[str, LocationStatus]],
+    activation_date: Optional[str],
+    deactivation_date: Optional[str],
+    *,
+    now: Optional[datetime] = None,
+) -> Tuple[bool, Optional[datetime]]:
+    """
+    Effective state from raw column values, without loading the entity.
+    Returns (active, next_change): same rules as `apply_scheduled_status`
+    (manual suspension wins) and the next scheduled date after `now`, if any.
+    """
+    now = now or datetime.utcnow()
+    if getattr(status, "value", status) == LocationStatus.SUSPENDED.value:
+        return False, None
+    activation = parse_hl7_datetime(activation_date)
+    deactivation = parse_hl7_datetime(deactivation_date)
+    active = not (activation and activation > now) and not (deactivation and deactivation <= now)
+    upcoming = [d for d in (activation, deactivation) if d and d > now]
+    return active, min(upcoming) if upcoming else None
+
+
+def next_status_check(
+    status: Optional[Union[str, LocationStatus]],
+    activation_date: Optional[str],
+    deactivation_date: Optional[str],
+    *,
+    now: Optional[datetime] = None,
+) -> Optional[datetime]:
+    """
+    When the sweeper must next look at a location (`LocationIndex.next_status_change`):
+    `now` if the stored status disagrees with the schedule, else the next scheduled
+    date, None when nothing is scheduled or the location is manually suspended.
+    """
+    now = now or datetime.utcnow()
+    if getattr(status, "value", status) == LocationStatus.SUSPENDED.value:
+        return None
+    active, next_change = scheduled_state(status, activation_date, deactivation_date, now=now)
+    if (getattr(status, "value", status) == LocationStatus.ACTIVE.value) != active:
+        return now
+    return next_change
+
+
 def apply_scheduled_status(
     entities: Union[BaseLocation, Iterable[BaseLocation]],
     *,
@@ -89,3 +137,65 @@ def apply_scheduled_status(
             entity.status = desired
             changed = True
     return changed
+
+
+def next_scheduled_change(session: Session) -> Optional[datetime]:
+    """Earliest pending status change across all locations (indexed MIN)."""
+    return session.connection().execute(
+        sa_select(func.min(LocationIndex.__table__.c.next_status_change))
+    ).scalar()
+
+
+def sweep_scheduled_status(session: Session, *, now: Optional[datetime] = None, batch_size: int = 500) -> int:
+    """
+    Flip the status of every location whose activation/deactivation date has passed.
+
+    Due locations are read from the `LocationIndex.next_status_change` index, loaded
+    per model in batches and updated in a single flush (one batched UPDATE per model);
+    the ORM listeners refresh the index, the change journal and bed occupancy, and the
+    commit hands the changes to the coalesced structure emitter.
+    Returns the number of locations whose status changed.
+    """
+    from app.services.location_index import MODELS
+
+    now = now or datetime.utcnow()
+    table = LocationIndex.__table__
+    connection = session.connection()
+    due: Dict[str, Dict[int, int]] = {}
+    for index_id, model_name, entity_id in connection.execute(
+        sa_select(table.c.id, table.c.model, table.c.entity_id).where(table.c.next_status_change <= now)
+    ):
+        due.setdefault(model_name, {})[entity_id] = index_id
+    if not due:
+        return 0
+
+    changed = 0
+    unchanged: List[Dict[str, object]] = []
+    for model_name, rows in due.items():
+        model = MODELS.get(model_name)
+        if model is None or not issubclass(model, BaseLocation):
+            unchanged.extend({"_id": index_id, "next_status_change": None} for index_id in rows.values())
+            continue
+        entity_ids = list(rows)
+        for start in range(0, len(entity_ids), batch_size):
+            for entity in session.exec(
+                select(model).where(model.id.in_(entity_ids[start:start + batch_size]))
+            ).all():
+                if apply_scheduled_status(entity, now=now):
+                    changed += 1
+                    continue
+                # Already consistent: only move the index to the next scheduled date
+                unchanged.append({
+                    "_id": rows[entity.id],
+                    "next_status_change": next_status_check(
+                        entity.status, entity.activation_date, entity.deactivation_date, now=now
+                    ),
+                })
+    session.flush()
+    if unchanged:
+        connection.execute(
+            update(table).where(table.c.id == bindparam("_id")).values(next_status_change=bindparam("next_status_change")),
+            unchanged,
+        )
+    session.commit()
+    return changed
@@ -0,0 +1,549 @@
+"""
+Génération de données synthétiques à volumétrie hospitalière (démo, tests de charge)
+
+Contenu
+- `SyntheticConfig`: volumétrie (lits, patients, séjours, transferts, présents) et graine.
+- `build_dataset`: jeu de données déterministe, sans base : structure (codes et rattachements),
+  patients, séjours et leurs mouvements (A01, A02..., A03 pour les séjours terminés).
+- `load_dataset`: écriture en base
+  * structure GHT → EJ → EG → Pôle → Service → UF → UH → Chambre → Lit par l'ORM, un flush
+    par lot et par niveau (index des lieux, journal de structure et occupation des lits
+    alimentés par les écouteurs, émissions supprimées sauf `emit=True`) ;
+  * patients, dossiers, venues, mouvements, identifiants (IPP/NDA/VN/MVT) et journal des
+    messages par INSERT groupés (executemany par lots de `batch_size`), séquences métier
+    réservées par bloc.
+- `iter_adt_messages` / `write_adt_stream`: flux ADT correspondant aux mêmes séjours, dans
+  l'ordre des mouvements générés, pour rejouer la volumétrie en entrée (MLLP, fichiers).
+- `build_adt_workload`: même flux réparti en files parallèles (un patient par file), avec
+  annulations (A12/A13) et fusions (A40) en proportions configurables.
+
+Notes
+- Reproductible : même configuration (graine comprise) → mêmes données et mêmes messages ;
+  seuls les ids techniques et les séquences métier dépendent du contenu de la base.
+- Les INSERT groupés contournent les écouteurs mapper : colonnes de recherche patient,
+  trigrammes et occupation des lits (séjours en cours) sont renseignés ici ;
+  `rebuild_bed_occupancy` redonne le même résultat.
+- Les ids des patients/dossiers/venues/mouvements sont préalloués (max(id) + n) : ne pas
+  exécuter en parallèle d'autres écritures sur ces tables.
+- Le préfixe (`prefix`) rend les codes de structure et les identifiants uniques : utiliser
+  un préfixe différent pour charger plusieurs jeux dans la même base.
+"""
+from __future__ import annotations
+
+import logging
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, func, insert, select as sa_select, update
+from sqlmodel import Session
+
+from app.models import Dossier, DossierType, Mouvement, Patient, PatientNameTrigram, Sequence as SequenceRow, Venue
+from app.models_identifiers import Identifier, IdentifierType
+from app.models_shared import MessageLog
+from app.models_structure import BedOccupancy, Chambre, Lit, Pole, Service, UniteFonctionnelle, UniteHebergement
+from app.models_structure_fhir import EntiteGeographique, EntiteJuridique, GHTContext, IdentifierNamespace
+from app.services.entity_events_structure import SUPPRESS_EMISSION_KEY
+from app.services.patient_search import index_values
+
+logger = logging.getLogger(__name__)
+
+# Espaces de noms des identifiants générés : nom → (type, OID) ; mêmes OID que la démo
+NAMESPACES = {
+    "IPP": (IdentifierType.IPP, "1.2.250.1.213.1.1.1.1"),
+    "NDA": (IdentifierType.NDA, "1.2.250.1.213.1.1.1.2"),
+    "VENUE": (IdentifierType.VN, "1.2.250.1.213.1.1.1.3"),
+    "MOUVEMENT": (IdentifierType.MVT, "1.2.250.1.213.1.1.1.4"),
+}
+
+FAMILY_NAMES = [
+    "Martin", "Bernard", "Thomas", "Petit", "Robert", "Richard", "Durand", "Dubois", "Moreau", "Laurent",
+    "Simon", "Michel", "Lefèvre", "Leroy", "Roux", "David", "Bertrand", "Morel", "Fournier", "Girard",
+    "Bonnet", "Dupont", "Lambert", "Fontaine", "Rousseau", "Vincent", "Muller", "Lefebvre", "Faure", "André",
+    "Mercier", "Blanc", "Guérin", "Boyer", "Garnier", "Chevalier", "François", "Legrand", "Gauthier", "Garcia",
+    "Perrin", "Robin", "Clément", "Morin", "Nicolas", "Henry", "Roussel", "Mathieu", "Gautier", "Masson",
+    "Nguyen", "Lemaire", "Duval", "Joly", "Gérard", "Meunier", "Brun", "Roy", "Noël", "Schmitt",
+]
+GIVEN_NAMES = {
+    "female": [
+        "Marie", "Nathalie", "Isabelle", "Sylvie", "Catherine", "Sophie", "Camille", "Léa", "Chloé", "Manon",
+        "Émilie", "Julie", "Inès", "Hélène", "Céline", "Anaïs", "Zoé", "Louise", "Jeanne", "Françoise",
+    ],
+    "male": [
+        "Jean", "Pierre", "Michel", "Philippe", "Alain", "Nicolas", "Julien", "Thomas", "Lucas", "Hugo",
+        "François", "Jérôme", "Stéphane", "Benoît", "Léo", "Gabriel", "Raphaël", "Noé", "Théo", "Loïc",
+    ],
+}
+HL7_GENDER = {"female": "F", "male": "M"}
+
+# (clé, modèle, clé étrangère, physical_type) ; l'EG est rattachée à l'EJ créée par `load_dataset`
+STRUCTURE_LEVELS = (
+    ("pole", Pole, "entite_geo_id", "area"),
+    ("service", Service, "pole_id", "wi"),
+    ("uf", UniteFonctionnelle, "service_id", "area"),
+    ("uh", UniteHebergement, "unite_fonctionnelle_id", "wi"),
+    ("chambre", Chambre, "unite_hebergement_id", "ro"),
+    ("lit", Lit, "chambre_id", "bd"),
+)
+LEVEL_LABELS = {
+    "pole": "Pôle", "service": "Service", "uf": "UF", "uh": "Unité d'hébergement",
+    "chambre": "Chambre", "lit": "Lit",
+}
+
+BATCH_SIZE = 5000
+
+
+@dataclass
+class SyntheticConfig:
+    seed: int = 42
+    prefix: str = "SYN"
+    beds: int = 200
+    patients: int = 1000
+    stays_per_patient: int = 1
+    max_transfers: int = 2  # A02 par séjour : 0..max_transfers
+    in_house_ratio: float = 0.2  # part des séjours en cours (sans A03), bornée par le nombre de lits
+    start: datetime = datetime(2025, 1, 1)
+    days: int = 90  # fenêtre des admissions
+    beds_per_room: int = 2
+    rooms_per_uh: int = 10
+    ufs_per_service: int = 2
+    services_per_pole: int = 4
+    message_log: bool = True  # une ligne MessageLog (message ADT entrant) par mouvement
+    emit: bool = False  # émissions structure (FHIR/MFN) lors du chargement
+    batch_size: int = BATCH_SIZE
+
+
+@dataclass
+class SyntheticStay:
+    patient: int  # index dans `SyntheticDataset.patients`
+    beds: List[int]  # lit (index) de l'admission puis de chaque transfert
+    times: List[datetime]  # date de l'admission puis de chaque transfert
+    discharge: Optional[datetime] = None  # None : séjour en cours
+
+
+@dataclass
+class SyntheticDataset:
+    config: SyntheticConfig
+    levels: Dict[str, List[Tuple[str, int]]]  # niveau → [(code, index du parent)]
+    patients: List[Tuple[str, str, str, str]]  # (nom, prénom, sexe, date de naissance AAAA-MM-JJ)
+    stays: List[SyntheticStay] = field(default_factory=list)
+
+    @property
+    def movement_count(self) -> int:
+        return sum(len(s.beds) + (1 if s.discharge else 0) for s in self.stays)
+
+    def bed_location(self, bed: int) -> str:
+        """PV1-3 d'un lit : UF^Chambre^Lit."""
+        lit_code, chambre = self.levels["lit"][bed]
+        chambre_code, uh = self.levels["chambre"][chambre]
+        uf = self.levels["uh"][uh][1]
+        return f"{self.levels['uf'][uf][0]}^{chambre_code}^{lit_code}"
+
+    def bed_uf(self, bed: int) -> str:
+        chambre = self.levels["lit"][bed][1]
+        uh = self.levels["chambre"][chambre][1]
+        return self.levels["uf"][self.levels["uh"][uh][1]][0]
+
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def _build_levels(config: SyntheticConfig) -> Dict[str, List[Tuple[str, int]]]:
+    """Codes et rattachements : lit i → chambre i // beds_per_room → UH → UF (1 UH par UF)..."""
+    counts = {"lit": max(1, config.beds)}
+    counts["chambre"] = _ceil_div(counts["lit"], config.beds_per_room)
+    counts["uh"] = _ceil_div(counts["chambre"], config.rooms_per_uh)
+    counts["uf"] = counts["uh"]
+    counts["service"] = _ceil_div(counts["uf"], config.ufs_per_service)
+    counts["pole"] = _ceil_div(counts["service"], config.services_per_pole)
+    per_parent = {
+        "pole": None, "service": config.services_per_pole, "uf": config.ufs_per_service,
+        "uh": 1, "chambre": config.rooms_per_uh, "lit": config.beds_per_room,
+    }
+    levels = {}
+    for key, *_ in STRUCTURE_LEVELS:
+        fanout = per_parent[key]
+        levels[key] = [
+            (f"{config.prefix}-{key.upper()}{n + 1:06d}", n // fanout if fanout else 0)
+            for n in range(counts[key])
+        ]
+    return levels
+
+
+def _birth_date(rng: random.Random) -> str:
+    return (date(1930, 1, 1) + timedelta(days=rng.randrange(95 * 365))).isoformat()
+
+
+def build_dataset(config: SyntheticConfig) -> SyntheticDataset:
+    """Jeu de données complet, déterministe pour une configuration donnée."""
+    rng = random.Random(config.seed)
+    levels = _build_levels(config)
+    dataset = SyntheticDataset(config=config, levels=levels, patients=[])
+
+    for _ in range(config.patients):
+        gender = rng.choice(("female", "male"))
+        dataset.patients.append(
+            (rng.choice(FAMILY_NAMES), rng.choice(GIVEN_NAMES[gender]), gender, _birth_date(rng))
+        )
+
+    bed_count = len(levels["lit"])
+    total = config.patients * config.stays_per_patient
+    in_house = min(int(total * config.in_house_ratio), bed_count)
+    # Lits des séjours en cours réservés : aucun autre séjour n'y passe ensuite (occupation cohérente au rejeu)
+    beds = list(range(bed_count))
+    rng.shuffle(beds)
+    final_beds, other_beds = beds[:in_house], beds[in_house:] or beds
+    end = config.start + timedelta(days=config.days)
+
+    stay_patients = [p for p in range(config.patients) for _ in range(config.stays_per_patient)]
+    rng.shuffle(stay_patients)
+    finished: List[SyntheticStay] = []
+    for patient in stay_patients[in_house:]:
+        admit = config.start + timedelta(minutes=rng.randrange(max(1, (config.days - 1) * 1440)))
+        discharge = min(admit + timedelta(hours=rng.randint(4, 240)), end)
+        steps = sorted(rng.uniform(0, 1) for _ in range(rng.randint(0, config.max_transfers)))
+        times = [admit] + [admit + (discharge - admit) * s for s in steps]
+        finished.append(SyntheticStay(patient, [rng.choice(other_beds) for _ in times], times, discharge))
+    current: List[SyntheticStay] = []
+    for patient, bed in zip(stay_patients[:in_house], final_beds):
+        admit = end - timedelta(minutes=rng.randrange(10 * 1440))
+        steps = sorted(rng.uniform(0, 1) for _ in range(rng.randint(0, config.max_transfers)))
+        times = [admit] + [admit + (end - admit) * s for s in steps]
+        path = [rng.choice(other_beds) for _ in times[:-1]] + [bed] if in_house < bed_count else [bed]
+        current.append(SyntheticStay(patient, path, times[:len(path)]))
+
+    # Séjours terminés d'abord : au rejeu, les séjours en cours laissent leurs lits occupés
+    dataset.stays = sorted(finished, key=lambda s: s.times[0]) + sorted(current, key=lambda s: s.times[0])
+    return dataset
+
+
+def _iter_movements(dataset: SyntheticDataset) -> Iterator[Tuple[int, SyntheticStay, str, datetime, int, Optional[int]]]:
+    """(n° de séjour, séjour, événement, date, lit, lit précédent) dans l'ordre de génération."""
+    for number, stay in enumerate(dataset.stays):
+        previous = None
+        for step, (bed, when) in enumerate(zip(stay.beds, stay.times)):
+            yield number, stay, "A01" if step == 0 else "A02", when, bed, previous
+            previous = bed
+        if stay.discharge:
+            yield number, stay, "A03", stay.discharge, stay.beds[-1], None
+
+
+# ----------------------------------------------------------------------
+# Messages ADT
+# ----------------------------------------------------------------------
+
+def _ts(value: datetime) -> str:
+    return value.strftime("%Y%m%d%H%M%S")
+
+
+def _identifier_values(config: SyntheticConfig) -> Dict[str, str]:
+    """Gabarits des valeurs d'identifiants (IPP, NDA, VN, MVT) par numéro 1..n."""
+    return {
+        "IPP": f"{config.prefix}P{{:08d}}",
+        "NDA": f"{config.prefix}D{{:08d}}",
+        "VENUE": f"{config.prefix}V{{:08d}}",
+        "MOUVEMENT": f"{config.prefix}M{{:08d}}",
+    }
+
+
+def _pid(dataset: SyntheticDataset, patient: int) -> str:
+    family, given, gender, birth_date = dataset.patients[patient]
+    ipp = _identifier_values(dataset.config)["IPP"].format(patient + 1)
+    return (
+        f"PID|1||{ipp}^^^IPP&{NAMESPACES['IPP'][1]}&ISO^PI||{family.upper()}^{given}^^^^^L||"
+        f"{birth_date.replace('-', '')}|{HL7_GENDER[gender]}"
+    )
+
+
+def _render_adt(dataset: SyntheticDataset, number: int, stay: SyntheticStay, trigger: str,
+                when: datetime, bed: int, previous: Optional[int], movement: int,
+                cancelled: Optional[str] = None) -> str:
+    """Message d'un mouvement ; `cancelled` : événement annulé (A12/A13, ZBE-1 vide = dernier mouvement)."""
+    config = dataset.config
+    values = _identifier_values(config)
+    nda = values["NDA"].format(number + 1)
+    mvt = values["MOUVEMENT"].format(movement)
+
+    pv1 = [""] * 46
+    pv1[1], pv1[2], pv1[3] = "1", "I", dataset.bed_location(bed)
+    if previous is not None:
+        pv1[6] = dataset.bed_location(previous)
+    pv1[19] = f"{nda}^^^NDA&{NAMESPACES['NDA'][1]}&ISO^AN"
+    pv1[44] = _ts(stay.times[0])
+    if trigger == "A03":
+        pv1[45] = _ts(when)
+    uf = f"^^^^^^UF^^^{dataset.bed_uf(bed)}"
+    if cancelled:
+        zbe = f"ZBE||{_ts(when)}||CANCEL|Y|{cancelled}|{uf}||HMS"
+    else:
+        zbe = f"ZBE|{mvt}^MOUVEMENT^{NAMESPACES['MOUVEMENT'][1]}^ISO|{_ts(when)}||INSERT|N||{uf}||HMS"
+
+    return "\r".join([
+        f"MSH|^~\\&|SYNTH|{config.prefix}|RECEPTEUR|RECEPTEUR|{_ts(when)}||ADT^{trigger}^ADT_{trigger}|{mvt}|P|2.5",
+        f"EVN|{trigger}|{_ts(when)}",
+        _pid(dataset, stay.patient),
+        "PV1|" + "|".join(pv1[1:]),
+        zbe,
+    ]) + "\r"
+
+
+def _render_merge(dataset: SyntheticDataset, survivor: int, prior: int, when: datetime, movement: int) -> str:
+    """ADT^A40 : fusion du patient `prior` (MRG) dans `survivor` (PID)."""
+    config = dataset.config
+    values = _identifier_values(config)
+    control = values["MOUVEMENT"].format(movement)
+    prior_ipp = values["IPP"].format(prior + 1)
+    return "\r".join([
+        f"MSH|^~\\&|SYNTH|{config.prefix}|RECEPTEUR|RECEPTEUR|{_ts(when)}||ADT^A40^ADT_A39|{control}|P|2.5",
+        f"EVN|A40|{_ts(when)}",
+        _pid(dataset, survivor),
+        f"MRG|{prior_ipp}^^^IPP&{NAMESPACES['IPP'][1]}&ISO^PI",
+    ]) + "\r"
+
+
+def iter_adt_messages(dataset: SyntheticDataset) -> Iterator[str]:
+    """Messages ADT^A01/A02/A03 (PAM FR : MSH, EVN, PID, PV1, ZBE) des séjours du jeu de données."""
+    for movement, item in enumerate(_iter_movements(dataset), start=1):
+        yield _render_adt(dataset, *item, movement)
+
+
+def build_adt_workload(
+    dataset: SyntheticDataset, streams: int = 1, cancel_ratio: float = 0.0, merge_ratio: float = 0.0,
+) -> List[List[str]]:
+    """
+    Flux ADT répartis en `streams` files ordonnées (tous les messages d'un patient dans la même
+    file) : mouvements du jeu de données, plus annulations et fusions tirées avec la graine.
+
+    - `cancel_ratio` : part des transferts suivis d'un A12 et des sorties suivies d'un A13 (puis
+      de la sortie renvoyée) ;
+    - `merge_ratio` : part des patients fusionnés (A40) dans un autre patient de la même file,
+      en fin de file.
+    """
+    streams = max(1, streams)
+    rng = random.Random(dataset.config.seed + 1)
+    queues: List[List[str]] = [[] for _ in range(streams)]
+    extra = dataset.movement_count
+    for movement, (number, stay, trigger, when, bed, previous) in enumerate(_iter_movements(dataset), start=1):
+        queue = queues[stay.patient % streams]
+        queue.append(_render_adt(dataset, number, stay, trigger, when, bed, previous, movement))
+        if trigger == "A02" and rng.random() < cancel_ratio:
+            extra += 1
+            queue.append(_render_adt(dataset, number, stay, "A12", when, previous, bed, extra, cancelled="A02"))
+        elif trigger == "A03" and rng.random() < cancel_ratio:
+            extra += 1
+            queue.append(_render_adt(dataset, number, stay, "A13", when, bed, None, extra, cancelled="A03"))
+            extra += 1
+            queue.append(_render_adt(dataset, number, stay, "A03", when, bed, None, extra))
+
+    end = dataset.config.start + timedelta(days=dataset.config.days)
+    for index, queue in enumerate(queues):
+        patients = list(range(index, len(dataset.patients), streams))
+        rng.shuffle(patients)
+        merges = min(int(len(patients) * merge_ratio), len(patients) // 2)
+        for prior, survivor in zip(patients[:merges], patients[merges:2 * merges]):
+            extra += 1
+            queue.append(_render_merge(dataset, survivor, prior, end, extra))
+    return queues
+
+
+def write_adt_stream(dataset: SyntheticDataset, path: Path) -> int:
+    """Écrit le flux ADT dans un fichier (segments terminés par CR, un message par ligne). Retourne le nombre de messages."""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        for message in iter_adt_messages(dataset):
+            handle.write(message + "\n")
+            count += 1
+    return count
+
+
+# ----------------------------------------------------------------------
+# Chargement en base
+# ----------------------------------------------------------------------
+
+def _reserve_sequence(session: Session, name: str, count: int) -> int:
+    """Réserve `count` valeurs de la séquence métier `name` ; retourne la première."""
+    seq = session.get(SequenceRow, name) or SequenceRow(name=name, value=0)
+    first = seq.value + 1
+    seq.value += count
+    session.add(seq)
+    session.flush()
+    return first
+
+
+def _next_id(session: Session, model) -> int:
+    table = model.__table__
+    return (session.connection().execute(sa_select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+class _BulkWriter:
+    """Tampons d'INSERT par table, vidés ensemble dans l'ordre des clés étrangères."""
+
+    def __init__(self, session: Session, models: Sequence[Any], batch_size: int):
+        self.connection = session.connection()
+        self.rows: Dict[Any, List[Dict[str, Any]]] = {model: [] for model in models}
+        self.batch_size = batch_size
+        self.counts: Dict[str, int] = {model.__tablename__: 0 for model in models}
+
+    def add(self, model, row: Dict[str, Any]) -> None:
+        rows = self.rows[model]
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for model, rows in self.rows.items():
+            if rows:
+                self.connection.execute(insert(model.__table__), rows)
+                self.counts[model.__tablename__] += len(rows)
+                rows.clear()
+
+
+def _load_structure(session: Session, dataset: SyntheticDataset) -> Tuple[GHTContext, List[int]]:
+    """GHT, EJ, EG et niveaux de structure (ORM, un flush par lot). Retourne (GHT, ids des lits)."""
+    config = dataset.config
+    finess = f"99{config.seed % 10_000_000:07d}"
+    ght = GHTContext(name=f"GHT synthétique {config.prefix}", code=config.prefix,
+                     description=f"Données synthétiques (graine {config.seed})")
+    session.add(ght)
+    session.flush()
+    ej = EntiteJuridique(name=f"EJ synthétique {config.prefix}", finess_ej=finess,
+                         short_name=config.prefix, ght_context_id=ght.id)
+    session.add(ej)
+    session.flush()
+    eg = EntiteGeographique(identifier=f"{config.prefix}-EG", name=f"Site {config.prefix}",
+                            finess=finess, entite_juridique_id=ej.id)
+    session.add(eg)
+    session.flush()
+    for name, (_, oid) in NAMESPACES.items():
+        session.add(IdentifierNamespace(
+            name=name, system=f"urn:oid:{oid}", oid=oid, type=NAMESPACES[name][0].value,
+            ght_context_id=ght.id, entite_juridique_id=ej.id,
+        ))
+
+    parent_ids = [eg.id]
+    for key, model, fk, physical_type in STRUCTURE_LEVELS:
+        rows = dataset.levels[key]
+        ids: List[int] = []
+        for start in range(0, len(rows), config.batch_size):
+            extra = {"service_type": "mco"} if key == "service" else {}
+            objects = [
+                model(identifier=code, name=f"{LEVEL_LABELS[key]} {start + n + 1}", physical_type=physical_type,
+                      **{fk: parent_ids[parent]}, **extra)
+                for n, (code, parent) in enumerate(rows[start:start + config.batch_size])
+            ]
+            session.add_all(objects)
+            session.flush()  # INSERT groupés ; écouteurs d'index par lot
+            ids.extend(obj.id for obj in objects)
+        parent_ids = ids
+    return ght, parent_ids
+
+
+def load_dataset(session: Session, dataset: SyntheticDataset) -> Dict[str, int]:
+    """Écrit le jeu de données en une transaction. Retourne le nombre de lignes par table."""
+    config = dataset.config
+    try:
+        if not config.emit:
+            session.info[SUPPRESS_EMISSION_KEY] = True
+        ght, lit_ids = _load_structure(session, dataset)
+
+        stays = dataset.stays
+        n_movements = dataset.movement_count
+        patient_seq = _reserve_sequence(session, "patient", len(dataset.patients))
+        dossier_seq = _reserve_sequence(session, "dossier", len(stays))
+        venue_seq = _reserve_sequence(session, "venue", len(stays))
+        mouvement_seq = _reserve_sequence(session, "mouvement", n_movements)
+        patient_id = _next_id(session, Patient)
+        dossier_id = _next_id(session, Dossier)
+        venue_id = _next_id(session, Venue)
+        mouvement_id = _next_id(session, Mouvement)
+
+        writer = _BulkWriter(
+            session, [Patient, PatientNameTrigram, Dossier, Venue, Mouvement, Identifier, MessageLog],
+            config.batch_size,
+        )
+        values = _identifier_values(config)
+        now = datetime.utcnow()
+
+        def identifier(kind: str, number: int, **links) -> Dict[str, Any]:
+            type_, oid = NAMESPACES[kind]
+            row = {"value": values[kind].format(number), "type": type_, "system": f"urn:oid:{oid}", "oid": oid,
+                   "status": "active", "assigned_date": now, "last_updated": now,
+                   "patient_id": None, "dossier_id": None, "venue_id": None, "mouvement_id": None}
+            row.update(links)  # executemany : mêmes clés pour toutes les lignes
+            return row
+
+        for n, (family, given, gender, birth_date) in enumerate(dataset.patients):
+            pid = patient_id + n
+            patient = SimpleNamespace(id=pid, family=family, given=given, birth_family=None)
+            columns, trigrams = index_values(patient)
+            writer.add(Patient, {
+                "id": pid, "patient_seq": patient_seq + n, "identifier": str(patient_seq + n),
+                "family": family, "given": given, "gender": gender, "birth_date": birth_date,
+                "country": "FR", **columns,
+            })
+            for row in trigrams:
+                writer.add(PatientNameTrigram, row)
+            writer.add(Identifier, identifier("IPP", n + 1, patient_id=pid))
+
+        occupied = []
+        movement = 0
+        for number, stay, trigger, when, bed, previous in _iter_movements(dataset):
+            did, vid = dossier_id + number, venue_id + number
+            if trigger == "A01":
+                uf = dataset.bed_uf(bed)
+                writer.add(Dossier, {
+                    "id": did, "dossier_seq": dossier_seq + number, "patient_id": patient_id + stay.patient,
+                    "uf_responsabilite": uf, "admit_time": when, "discharge_time": stay.discharge,
+                    "dossier_type": DossierType.HOSPITALISE, "encounter_class": "IMP",
+                })
+                writer.add(Venue, {
+                    "id": vid, "venue_seq": venue_seq + number, "dossier_id": did, "uf_responsabilite": uf,
+                    "start_time": when, "code": uf, "assigned_location": dataset.bed_location(stay.beds[-1]),
+                })
+                writer.add(Identifier, identifier("NDA", number + 1, dossier_id=did))
+                writer.add(Identifier, identifier("VENUE", number + 1, venue_id=vid))
+                if stay.discharge is None:
+                    occupied.append({"b_lit": lit_ids[stay.beds[-1]], "b_venue": vid, "b_since": stay.times[-1]})
+            location = dataset.bed_location(bed)
+            mid = mouvement_id + movement
+            movement += 1
+            writer.add(Mouvement, {
+                "id": mid, "mouvement_seq": mouvement_seq + movement - 1, "venue_id": vid,
+                "type": f"ADT^{trigger}", "trigger_event": trigger, "when": when, "location": location,
+                "from_location": dataset.bed_location(previous) if previous is not None else None,
+                "to_location": location if trigger != "A03" else None,
+            })
+            writer.add(Identifier, identifier("MOUVEMENT", movement, mouvement_id=mid))
+            if config.message_log:
+                writer.add(MessageLog, {
+                    "direction": "in", "kind": "MLLP", "message_type": f"ADT^{trigger}",
+                    "correlation_id": values["MOUVEMENT"].format(movement), "status": "processed",
+                    "payload": _render_adt(dataset, number, stay, trigger, when, bed, previous, movement),
+                    "created_at": when,
+                })
+        writer.flush()
+
+        # Occupation courante (les INSERT groupés de mouvements ne passent pas par bed_occupancy)
+        if occupied:
+            table = BedOccupancy.__table__
+            session.connection().execute(
+                update(table).where(table.c.lit_id == bindparam("b_lit")).values(
+                    occupancy="occupied", venue_id=bindparam("b_venue"),
+                    occupied_since=bindparam("b_since"), available=False,
+                ),
+                occupied,
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(SUPPRESS_EMISSION_KEY, None)
+
+    counts = dict(writer.counts, lit=len(lit_ids))
+    logger.info("[synthetic_data] GHT %s loaded: %s", ght.id, counts)
+    return counts
@@ -7,9 +7,9 @@ Fonctions principales
 - Journalisation dans `MessageLog` et génération des ACK HL7 (AA/AE/AR)
 
 Transactions & sessions
-- Utilise la session SQLModel fournie (voir `session_factory` côté MLLP)
-    et enchaîne les opérations dans un contexte transactionnel `session.begin()`
-    lorsque nécessaire.
+- Utilise la session SQLModel fournie (voir `session_factory` côté MLLP), synchrone
+    ou `AsyncSession` (traitement via `AsyncSession.run_sync`), et enchaîne les
+    opérations dans un contexte transactionnel `session.begin()` lorsque nécessaire.
 """
 
 # app/services/transport_inbound.py
@@ -19,6 +19,7 @@ from typing import Dict, List, Optional, Tuple
 import logging
 
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.models_endpoints import MessageLog
 from app.services.mllp import parse_msh_fields, build_ack
@@ -27,6 +28,7 @@ import json
 from app.models import Patient, Dossier, Venue, Mouvement
 from app.models_identifiers import Identifier, IdentifierType
 from app.db import get_next_sequence
+from app.db_async import run_to_completion
 from app.services.emit_on_create import emit_to_senders
 from app.services.identifier_manager import (
     create_identifier_from_hl7,
@@ -670,6 +672,13 @@ async def on_message_inbound_async(msg: str, session, endpoint) -> str:
     Returns:
         Message ACK formaté HL7v2 (AA=succès, AE=erreur applicative, AR=erreur système)
     """
+    if isinstance(session, AsyncSession):
+        # Handlers ORM synchrones exécutés via le pont greenlet : les requêtes passent
+        # par le pilote async sans bloquer la boucle (voir app.db_async)
+        return await session.run_sync(
+            lambda sync_session: run_to_completion(on_message_inbound_async(msg, sync_session, endpoint))
+        )
+
     log = None
     
     # 1. Validation structurelle
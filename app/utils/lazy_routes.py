@@ -0,0 +1,78 @@
+"""
+Enregistrement différé de routes peu utilisées (documentation, administration)
+
+Contenu
+- `LazyRoutes` : route Starlette réservant un préfixe d'URL. À la première requête sur ce
+  préfixe, le chargeur fourni importe ses modules et enregistre les vraies routes sur
+  l'application ; elles prennent la place de la réservation (même priorité de routage)
+  et la requête est routée à nouveau.
+- `lazy_router(module, prefix="")` : chargeur incluant `module.router` (APIRouter).
+- `load_lazy_routes(app)` : charge immédiatement toutes les réservations (schéma OpenAPI
+  complet, préchauffage).
+
+Notes
+- Tant qu'un groupe n'est pas chargé, ses routes n'apparaissent ni dans `/openapi.json`
+  ni dans `url_for` ; le schéma OpenAPI est recalculé après chargement.
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+from typing import Callable
+
+from starlette._utils import get_route_path
+from starlette.routing import BaseRoute, Match, NoMatchFound
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+def lazy_router(module: str, prefix: str = "") -> Callable:
+    """Chargeur incluant le routeur `router` du module `module` sous `prefix`."""
+    def _load(app):
+        app.include_router(importlib.import_module(module).router, prefix=prefix)
+    return _load
+
+
+class LazyRoutes(BaseRoute):
+    """Réserve `path_prefix` ; `loaders` enregistrent les vraies routes au premier accès."""
+
+    def __init__(self, app, path_prefix: str, *loaders: Callable):
+        self.app = app
+        self.path_prefix = path_prefix.rstrip("/")
+        self.loaders = loaders
+        self.loaded = False
+
+    def matches(self, scope: Scope):
+        if scope["type"] in ("http", "websocket"):
+            path = get_route_path(scope)
+            if path == self.path_prefix or path.startswith(self.path_prefix + "/"):
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        raise NoMatchFound(name, path_params)
+
+    def load(self) -> None:
+        if self.loaded:
+            return
+        routes = self.app.router.routes
+        count = len(routes)
+        for loader in self.loaders:
+            loader(self.app)
+        added = routes[count:]
+        del routes[count:]
+        index = routes.index(self)
+        routes[index:index + 1] = added
+        self.loaded = True
+        self.app.openapi_schema = None
+        logger.info(f"Lazy routes loaded for {self.path_prefix} ({len(added)} routes)")
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.load()
+        await self.app.router(scope, receive, send)
+
+
+def load_lazy_routes(app) -> None:
+    for route in [r for r in app.router.routes if isinstance(r, LazyRoutes)]:
+        route.load()
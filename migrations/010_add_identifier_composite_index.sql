@@ -0,0 +1,51 @@
+-- Migration 010: index composite unique (system, value, type) sur identifier
+-- Utilisé par app/services/identifier_resolver.py pour résoudre les CX PID-3/MRG-1/QPD-3
+-- en une recherche d'index (et en lot via IN sur le couple (system, value)).
+--
+-- Les doublons (system, value, type) existants empêcheraient la création de l'index.
+-- Pour les lister avant application :
+--   SELECT system, value, type, COUNT(*), GROUP_CONCAT(id) FROM identifier
+--   WHERE system IS NOT NULL AND type IS NOT NULL
+--   GROUP BY system, value, type HAVING COUNT(*) > 1;
+-- Pour chaque triplet, l'identifiant actif le plus ancien est conservé (à défaut le plus
+-- ancien). Les autres lignes ne sont pas perdues : elles sont archivées telles quelles
+-- (patient, dossier, venue, mouvement liés) dans identifier_duplicate, avec archived_at,
+-- avant d'être retirées de identifier. À revoir après application :
+--   SELECT * FROM identifier_duplicate ORDER BY system, value, type, id;
+-- Restauration d'une ligne (après correction du triplet) :
+--   INSERT INTO identifier (id, value, type, system, oid, status, assigned_date,
+--     last_updated, patient_id, dossier_id, venue_id, mouvement_id)
+--   SELECT id, value, type, system, oid, status, assigned_date,
+--     last_updated, patient_id, dossier_id, venue_id, mouvement_id
+--   FROM identifier_duplicate WHERE id = <id>;
+-- Les triplets avec un system ou un type NULL ne sont pas concernés (jamais en conflit
+-- dans l'index).
+
+CREATE TABLE IF NOT EXISTS identifier_duplicate AS
+SELECT identifier.*, CURRENT_TIMESTAMP AS archived_at FROM identifier WHERE 1 = 0;
+
+INSERT INTO identifier_duplicate
+SELECT identifier.*, CURRENT_TIMESTAMP FROM identifier
+WHERE system IS NOT NULL AND type IS NOT NULL
+  AND id <> (
+    SELECT keep.id FROM identifier AS keep
+    WHERE keep.system = identifier.system
+      AND keep.value = identifier.value
+      AND keep.type = identifier.type
+    ORDER BY CASE WHEN keep.status = 'active' THEN 0 ELSE 1 END, keep.id
+    LIMIT 1
+  );
+
+DELETE FROM identifier
+WHERE system IS NOT NULL AND type IS NOT NULL
+  AND id <> (
+    SELECT keep.id FROM identifier AS keep
+    WHERE keep.system = identifier.system
+      AND keep.value = identifier.value
+      AND keep.type = identifier.type
+    ORDER BY CASE WHEN keep.status = 'active' THEN 0 ELSE 1 END, keep.id
+    LIMIT 1
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_identifier_system_value_type
+ON identifier (system, value, type);
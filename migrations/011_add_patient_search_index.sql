@@ -0,0 +1,23 @@
+-- Migration 011: colonnes de recherche PDQ/PDQm et index trigrammes des noms patients
+-- Colonnes maintenues par app/services/patient_search.py (écouteurs mapper Patient).
+-- Après application, lancer `python tools/reindex_patient_search.py` pour indexer
+-- les patients existants.
+
+ALTER TABLE patient ADD COLUMN family_norm TEXT;
+ALTER TABLE patient ADD COLUMN given_norm TEXT;
+ALTER TABLE patient ADD COLUMN family_phonetic TEXT;
+ALTER TABLE patient ADD COLUMN given_phonetic TEXT;
+
+CREATE INDEX IF NOT EXISTS ix_patient_family_norm ON patient (family_norm);
+CREATE INDEX IF NOT EXISTS ix_patient_given_norm ON patient (given_norm);
+CREATE INDEX IF NOT EXISTS ix_patient_family_phonetic ON patient (family_phonetic);
+CREATE INDEX IF NOT EXISTS ix_patient_given_phonetic ON patient (given_phonetic);
+
+CREATE TABLE IF NOT EXISTS patientnametrigram (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patient(id),
+    field VARCHAR NOT NULL,
+    trigram VARCHAR NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_patientnametrigram_patient_id ON patientnametrigram (patient_id);
+CREATE INDEX IF NOT EXISTS ix_patientnametrigram_field_trigram ON patientnametrigram (field, trigram);
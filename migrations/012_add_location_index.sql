@@ -0,0 +1,27 @@
+-- Migration 012: registre unifié des lieux de structure (recherche FHIR Location)
+-- Table maintenue par app/services/location_index.py (écouteurs mapper structure).
+-- Après application, lancer `python tools/rebuild_location_index.py` pour indexer
+-- les structures existantes.
+
+CREATE TABLE IF NOT EXISTS locationindex (
+    id INTEGER PRIMARY KEY,
+    model VARCHAR NOT NULL,
+    entity_id INTEGER NOT NULL,
+    identifier VARCHAR,
+    finess VARCHAR,
+    name VARCHAR,
+    name_norm VARCHAR,
+    status VARCHAR,
+    parent_id INTEGER,
+    path VARCHAR NOT NULL,
+    depth INTEGER NOT NULL,
+    CONSTRAINT ux_locationindex_model_entity UNIQUE (model, entity_id)
+);
+CREATE INDEX IF NOT EXISTS ix_locationindex_model ON locationindex (model);
+CREATE INDEX IF NOT EXISTS ix_locationindex_identifier ON locationindex (identifier);
+CREATE INDEX IF NOT EXISTS ix_locationindex_finess ON locationindex (finess);
+CREATE INDEX IF NOT EXISTS ix_locationindex_name_norm ON locationindex (name_norm);
+CREATE INDEX IF NOT EXISTS ix_locationindex_status ON locationindex (status);
+CREATE INDEX IF NOT EXISTS ix_locationindex_parent_id ON locationindex (parent_id);
+CREATE INDEX IF NOT EXISTS ix_locationindex_path ON locationindex (path);
+CREATE INDEX IF NOT EXISTS ix_locationindex_entity_depth ON locationindex (entity_id, depth);
@@ -0,0 +1,5 @@
+-- Migration 013: version et date de mise à jour des lieux (meta.versionId, ETag, Last-Modified)
+-- Colonnes maintenues par app/services/location_index.py.
+
+ALTER TABLE locationindex ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE locationindex ADD COLUMN last_updated DATETIME;
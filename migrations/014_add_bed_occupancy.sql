@@ -0,0 +1,33 @@
+-- Migration 014: index d'occupation et de disponibilité des lits
+-- Table maintenue par app/services/bed_occupancy.py (écouteurs structure et mouvements,
+-- échéances programmées rafraîchies par le scheduler).
+-- Après application, lancer `python tools/rebuild_bed_occupancy.py` pour indexer les
+-- lits existants et rejouer les mouvements.
+
+CREATE TABLE IF NOT EXISTS bedoccupancy (
+    lit_id INTEGER PRIMARY KEY,
+    chambre_id INTEGER,
+    uh_id INTEGER,
+    uf_id INTEGER,
+    service_id INTEGER,
+    pole_id INTEGER,
+    eg_id INTEGER,
+    service_type VARCHAR,
+    operational_status VARCHAR,
+    structure_active BOOLEAN NOT NULL DEFAULT 1,
+    next_status_change DATETIME,
+    occupancy VARCHAR NOT NULL DEFAULT 'free',
+    venue_id INTEGER,
+    occupied_since DATETIME,
+    available BOOLEAN NOT NULL DEFAULT 0,
+    updated_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_chambre_id ON bedoccupancy (chambre_id);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_uh_id ON bedoccupancy (uh_id);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_uf_id ON bedoccupancy (uf_id);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_service_id ON bedoccupancy (service_id);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_pole_id ON bedoccupancy (pole_id);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_next_status_change ON bedoccupancy (next_status_change);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_venue_id ON bedoccupancy (venue_id);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_available_service_type ON bedoccupancy (available, service_type);
+CREATE INDEX IF NOT EXISTS ix_bedoccupancy_available_uf ON bedoccupancy (available, uf_id);
@@ -0,0 +1,4 @@
+-- Migration 015: mode d'émission MFN^M05 des structures par endpoint MLLP sender
+-- snapshot (défaut, structure complète) ou delta (entités modifiées dans la fenêtre d'émission)
+
+ALTER TABLE systemendpoint ADD COLUMN mfn_emission_mode TEXT DEFAULT 'snapshot';
@@ -0,0 +1,23 @@
+-- Migration 016: journal des modifications de structure et points de synchronisation MFN
+-- `structurechange` est alimentée par app/services/location_index.py ; `structuresyncstate`
+-- conserve par endpoint la dernière version acquittée (MFN delta incrémental).
+-- Les endpoints sans point de synchronisation reçoivent d'abord un snapshot complet.
+
+CREATE TABLE IF NOT EXISTS structurechange (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model VARCHAR NOT NULL,
+    entity_id INTEGER NOT NULL,
+    op VARCHAR NOT NULL,
+    identifier VARCHAR,
+    entity_version INTEGER,
+    changed_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_structurechange_model_entity ON structurechange (model, entity_id);
+
+CREATE TABLE IF NOT EXISTS structuresyncstate (
+    endpoint_id INTEGER PRIMARY KEY REFERENCES systemendpoint (id),
+    acked_version INTEGER NOT NULL DEFAULT 0,
+    acked_at DATETIME,
+    sent_version INTEGER,
+    sent_at DATETIME
+);
@@ -0,0 +1,8 @@
+-- Migration 017: prochaine échéance de statut programmé par lieu (activation/désactivation)
+-- Colonne maintenue par app/services/location_index.py et balayée par le scheduler
+-- (structure_schedule.sweep_scheduled_status).
+-- Après application, lancer `python tools/rebuild_location_index.py` pour renseigner
+-- les lieux existants.
+
+ALTER TABLE locationindex ADD COLUMN next_status_change DATETIME;
+CREATE INDEX IF NOT EXISTS ix_locationindex_next_status_change ON locationindex (next_status_change);
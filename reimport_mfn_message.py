@@ -33,8 +33,9 @@ print("\nRéimportation...")
 result = import_mfn(msg.payload, session, ght)
 
 print(f"\nRésultat:")
-print(f"  EJ créées: {result['ej']}")
-print(f"  EG créées: {result['eg']}")
-print(f"  Services créés: {result['service']}")
+print(f"  EJ créées: {result['created']['ej']}")
+print(f"  EG créées: {result['created']['eg']}")
+print(f"  Services créés: {result['created']['service']}")
+print(f"  Mis à jour: {sum(result['updated'].values())}, inchangés: {sum(result['unchanged'].values())}")
 
 print("\n✅ Import terminé!")
@@ -0,0 +1,72 @@
+"""
+Corpus figés des micro-benchmarks HL7.
+
+Les messages et la structure proviennent du générateur synthétique avec une graine fixe :
+d'une exécution à l'autre, chaque benchmark mesure exactement le même travail. La base est
+une SQLite en mémoire propre aux benchmarks (indépendante de la base des tests, remise à zéro
+par la fixture autouse de tests/conftest.py).
+"""
+from dataclasses import dataclass
+from typing import List
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models import Dossier, Mouvement, Patient, Venue
+from app.models_endpoints import SystemEndpoint
+from app.models_structure import EntiteGeographique, Lit, Service, UniteFonctionnelle
+from app.services.mllp import frame_hl7
+from app.services.synthetic_data import SyntheticConfig, build_adt_workload, build_dataset, load_dataset
+
+BENCHMARK_CONFIG = SyntheticConfig(
+    seed=20240601, prefix="BEN", beds=60, patients=40, stays_per_patient=2, max_transfers=3, in_house_ratio=0.25,
+)
+
+
+@dataclass
+class HL7Corpus:
+    """Messages ADT (admissions, mutations, sorties, annulations, fusions) et flux MLLP équivalent."""
+
+    messages: List[str]
+    stream: bytes
+
+
+@pytest.fixture(scope="session")
+def hl7_corpus() -> HL7Corpus:
+    dataset = build_dataset(BENCHMARK_CONFIG)
+    streams = build_adt_workload(dataset, streams=1, cancel_ratio=0.2, merge_ratio=0.1)
+    messages = [message for stream in streams for message in stream]
+    return HL7Corpus(messages=messages, stream=b"".join(frame_hl7(message) for message in messages))
+
+
+@pytest.fixture(scope="session")
+def bench_session():
+    """Session sur une base en mémoire chargée avec le jeu synthétique (structure + patients)."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        load_dataset(session, build_dataset(BENCHMARK_CONFIG))
+        session.add(SystemEndpoint(
+            name="BEN-OUT", kind="MLLP", role="sender", host="localhost", port=2575,
+            sending_app="BENCH", sending_facility="BENCH_FAC", receiving_app="DEST", receiving_facility="DEST_FAC",
+        ))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def bench_entities(bench_session: Session) -> dict:
+    """Entités représentatives (premier enregistrement de chaque type) pour les générateurs."""
+    first = lambda model: bench_session.exec(select(model).order_by(model.id)).first()  # noqa: E731
+    return {
+        "patient": first(Patient),
+        "dossier": first(Dossier),
+        "venue": first(Venue),
+        "mouvement": first(Mouvement),
+        "endpoint": bench_session.exec(select(SystemEndpoint).where(SystemEndpoint.name == "BEN-OUT")).one(),
+        "locations": [first(EntiteGeographique), first(Service), first(UniteFonctionnelle), first(Lit)],
+    }
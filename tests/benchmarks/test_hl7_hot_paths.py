@@ -0,0 +1,118 @@
+"""
+Micro-benchmarks des chemins chauds HL7 (MLLP, parsing PAM, validation, transformation, génération).
+
+Chaque benchmark traite le corpus figé complet par tour. Sans le plugin pytest-benchmark, le
+module est ignoré ; les références et le seuil de régression sont gérés par
+tools/run_benchmarks.py.
+"""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.services.emit_on_create import generate_pam_hl7
+from app.services.fhir_structure import entity_to_fhir_location
+from app.services.mfn_structure import generate_mfn_message
+from app.services.mllp import build_ack, deframe_hl7, frame_hl7, parse_msh_fields
+from app.services.pam_validation import validate_pam
+from app.services.scenario_date_updater import update_hl7_message_dates
+from app.services.scenario_transform import transform_hl7_for_context
+from app.services.scenario_validation import validate_scenario
+from app.services.transport_inbound import _parse_pid, _parse_pv1, _parse_zbe
+
+pytestmark = pytest.mark.benchmark(min_rounds=5, max_time=0.5)
+
+REFERENCE_TIME = datetime(2024, 6, 1, 8, 0, 0)
+
+
+@pytest.mark.benchmark(group="mllp")
+def test_frame_hl7(benchmark, hl7_corpus):
+    frames = benchmark(lambda: [frame_hl7(message) for message in hl7_corpus.messages])
+    assert b"".join(frames) == hl7_corpus.stream
+
+
+@pytest.mark.benchmark(group="mllp")
+def test_deframe_hl7(benchmark, hl7_corpus):
+    assert benchmark(deframe_hl7, hl7_corpus.stream) == hl7_corpus.messages
+
+
+@pytest.mark.benchmark(group="mllp")
+def test_parse_msh_fields(benchmark, hl7_corpus):
+    fields = benchmark(lambda: [parse_msh_fields(message) for message in hl7_corpus.messages])
+    assert {f["trigger"] for f in fields} >= {"A01", "A02", "A03", "A12", "A13", "A40"}
+
+
+@pytest.mark.benchmark(group="mllp")
+def test_build_ack(benchmark, hl7_corpus):
+    acks = benchmark(lambda: [build_ack(message) for message in hl7_corpus.messages])
+    assert all("MSA|AA|" in ack for ack in acks)
+
+
+@pytest.mark.benchmark(group="pam-parse")
+def test_parse_pid(benchmark, hl7_corpus):
+    pids = benchmark(lambda: [_parse_pid(message) for message in hl7_corpus.messages])
+    assert all(pid["family"] for pid in pids)
+
+
+@pytest.mark.benchmark(group="pam-parse")
+def test_parse_pv1(benchmark, hl7_corpus):
+    pv1s = benchmark(lambda: [_parse_pv1(message) for message in hl7_corpus.messages])
+    assert any(pv1["location"] for pv1 in pv1s)
+
+
+@pytest.mark.benchmark(group="pam-parse")
+def test_parse_zbe(benchmark, hl7_corpus):
+    zbes = benchmark(lambda: [_parse_zbe(message) for message in hl7_corpus.messages])
+    assert len(zbes) == len(hl7_corpus.messages)
+
+
+@pytest.mark.benchmark(group="validation")
+def test_validate_pam(benchmark, hl7_corpus):
+    results = benchmark(lambda: [validate_pam(message) for message in hl7_corpus.messages])
+    assert len(results) == len(hl7_corpus.messages)
+
+
+@pytest.mark.benchmark(group="validation")
+def test_validate_scenario(benchmark, hl7_corpus):
+    text = "\n".join(message.replace("\r", "\n") for message in hl7_corpus.messages)
+    result = benchmark(validate_scenario, text)
+    assert result.total_messages == len(hl7_corpus.messages)
+
+
+@pytest.mark.benchmark(group="scenario")
+def test_update_hl7_message_dates(benchmark, hl7_corpus):
+    updated = benchmark(
+        lambda: [update_hl7_message_dates(message, REFERENCE_TIME) for message in hl7_corpus.messages]
+    )
+    assert len(updated) == len(hl7_corpus.messages)
+
+
+@pytest.mark.benchmark(group="scenario")
+def test_transform_hl7_for_context(benchmark, hl7_corpus, bench_session, bench_entities):
+    endpoint = bench_entities["endpoint"]
+    transformed = benchmark(lambda: [
+        transform_hl7_for_context(bench_session, message, endpoint=endpoint) for message in hl7_corpus.messages
+    ])
+    assert all(message.startswith("MSH|^~\\&|BENCH|BENCH_FAC|") for message in transformed)
+
+
+@pytest.mark.benchmark(group="emission")
+def test_generate_pam_hl7(benchmark, bench_session, bench_entities):
+    kinds = ("patient", "dossier", "venue", "mouvement")
+    messages = benchmark(lambda: [generate_pam_hl7(bench_entities[kind], kind, bench_session) for kind in kinds])
+    assert all(message.startswith("MSH|") for message in messages)
+
+
+@pytest.mark.benchmark(group="emission")
+def test_entity_to_fhir_location(benchmark, bench_session, bench_entities):
+    locations = benchmark(
+        lambda: [entity_to_fhir_location(entity, bench_session) for entity in bench_entities["locations"]]
+    )
+    assert all(location["resourceType"] == "Location" for location in locations)
+
+
+@pytest.mark.benchmark(group="emission")
+def test_generate_mfn_message(benchmark, bench_session):
+    message = benchmark(generate_mfn_message, bench_session)
+    assert message.startswith("MSH|") and "\nLOC|" in message
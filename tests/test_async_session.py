@@ -0,0 +1,230 @@
+"""
+Tests de la couche AsyncSession (réception MLLP, émission, pages messages)
+"""
+import ast
+import asyncio
+import inspect
+import textwrap
+import time
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.app import mllp_manager
+from app.db import engine
+from app.db_async import async_session_factory, run_to_completion, to_thread
+from app.models import Patient
+from app.models_shared import MessageLog, SystemEndpoint
+from app.services import entity_events, message_router, pam, patient_merge, transport_inbound
+from app.services.emit_on_create import emit_to_senders_async
+from app.services.file_poller import FilePollerService
+from app.services.mllp import send_mllp, start_mllp_server, stop_mllp_server
+from app.services.transport_inbound import on_message_inbound_async
+
+
+@pytest.mark.asyncio
+async def test_inbound_over_mllp_with_async_sessions(session: Session):
+    endpoint = SystemEndpoint(name="ASYNC-IN", kind="MLLP", role="receiver", host="127.0.0.1", port=0)
+    session.add(endpoint)
+    session.commit()
+    session.refresh(endpoint)
+
+    server = await start_mllp_server("127.0.0.1", 0, on_message_inbound_async, endpoint, async_session_factory)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        message = (
+            "MSH|^~\\&|SRC|SRC_FAC|POC|POC_FAC|20240101120000||ADT^A04^ADT_A04|ASYNC-1|P|2.5\r"
+            "EVN|A04|20240101120000\r"
+            "PID|1||ASYNC123^^^HOSP^PI||ASYNC^Test||19800101|F\r"
+            "PV1|1|O|CONS^001^001|||||||||||||||V-ASYNC|||||||||||||||||||||20240101120000\r"
+            "ZBE|1|20240101120000||CREATE|N|A04||||HMS"
+        )
+        ack = await send_mllp("127.0.0.1", port, message)
+    finally:
+        await stop_mllp_server(server)
+
+    assert "MSA|AA|ASYNC-1" in ack
+    session.expire_all()
+    log = session.exec(select(MessageLog).where(MessageLog.endpoint_id == endpoint.id)).one()
+    assert (log.direction, log.status) == ("in", "processed")
+    assert session.exec(select(Patient).where(Patient.family == "ASYNC")).first() is not None
+
+
+COUNT = 20
+
+
+def _a04(n: int) -> str:
+    return (
+        f"MSH|^~\\&|SRC|SRC_FAC|POC|POC_FAC|20240101120000||ADT^A04^ADT_A04|CONC-{n}|P|2.5\r"
+        "EVN|A04|20240101120000\r"
+        f"PID|1||CONC{n}^^^HOSP^PI||CONC{n}^Test||19800101|F\r"
+        f"PV1|1|O|CONS^001^001|||||||||||||||V-CONC-{n}|||||||||||||||||||||20240101120000\r"
+        "ZBE|1|20240101120000||CREATE|N|A04||||HMS"
+    )
+
+
+@pytest.mark.asyncio
+async def test_mllp_ingest_alongside_file_poller_ingest_and_route_writes(session: Session, tmp_path):
+    """Réception MLLP (sessions de l'application), fichiers entrants et écritures synchrones
+    d'une route sur la boucle en parallèle, sans bloquer la boucle."""
+    receiver = SystemEndpoint(name="CONC-MLLP", kind="MLLP", role="receiver", host="127.0.0.1", port=0)
+    inbox = tmp_path / "in"
+    inbox.mkdir()
+    for n in range(COUNT):
+        (inbox / f"{n:02d}.hl7").write_text(_a04(100 + n))
+    files = SystemEndpoint(
+        name="CONC-FILE", kind="FILE", role="receiver", inbox_path=str(inbox),
+        archive_path=str(tmp_path / "archive"), error_path=str(tmp_path / "error"), file_extensions=".hl7",
+    )
+    session.add_all([receiver, files])
+    session.commit()
+
+    stalls = []
+
+    async def _heartbeat():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - started)
+
+    server = await start_mllp_server(
+        "127.0.0.1", 0, on_message_inbound_async, receiver, mllp_manager.session_factory
+    )
+    port = server.sockets[0].getsockname()[1]
+    heartbeat = asyncio.create_task(_heartbeat())
+    try:
+        async def _stream(first: int):
+            return [await send_mllp("127.0.0.1", port, _a04(n)) for n in range(first, COUNT, 4)]
+
+        async def _poll():
+            await asyncio.sleep(0.05)
+            return await FilePollerService(session).scan_all_file_endpoints()
+
+        async def _route_writes():
+            # Comme patients.create_patient : commit synchrone sur le thread de la boucle
+            for n in range(COUNT):
+                with Session(engine) as route_session:
+                    route_session.add(Patient(family=f"CONC{200 + n}", given="Test"))
+                    route_session.commit()
+                await asyncio.sleep(0.01)
+
+        streams, stats, _ = await asyncio.wait_for(asyncio.gather(
+            asyncio.gather(*(_stream(first) for first in range(4))), _poll(), _route_writes(),
+        ), timeout=60)
+        acks = [ack for stream in streams for ack in stream]
+    finally:
+        heartbeat.cancel()
+        await stop_mllp_server(server)
+
+    assert all("MSA|AA" in ack for ack in acks)
+    assert stats["files_processed"] == COUNT and not stats["errors"]
+    assert len(list((tmp_path / "archive").iterdir())) == COUNT
+    # Aucune attente du verrou SQLite sur le thread de la boucle (délai d'attente : 5 s)
+    assert max(stalls) < 2
+    session.expire_all()
+    families = set(session.exec(select(Patient.family).where(Patient.family.like("CONC%"))).all())
+    assert families == {f"CONC{n}" for n in (*range(COUNT), *range(100, 100 + COUNT), *range(200, 200 + COUNT))}
+
+
+@pytest.mark.asyncio
+async def test_commit_in_worker_thread_schedules_emission_on_caller_loop(monkeypatch):
+    emitted = []
+
+    async def _emit(entity_class, entity_id, entity_type, operation):
+        emitted.append((entity_id, entity_type, operation, asyncio.get_running_loop()))
+
+    monkeypatch.setattr(entity_events, "_emit_in_new_session", _emit)
+
+    def _commit_in_thread():
+        session = object()
+        entity_events._pending_emissions[entity_events._get_session_id(session)] = {(7, "patient", "insert")}
+        entity_events.after_commit(session)
+
+    await to_thread(_commit_in_thread)
+    await asyncio.sleep(0.05)
+    assert emitted == [(7, "patient", "insert", asyncio.get_running_loop())]
+
+
+def test_pam_handlers_never_await_real_io():
+    """Invariant de run_to_completion : les handlers PAM n'attendent que d'autres handlers."""
+    modules = [transport_inbound, message_router, pam, patient_merge]
+    trees = [ast.parse(inspect.getsource(module)) for module in modules]
+    # Traitement d'un fichier entrant, exécuté par run_to_completion dans un thread
+    trees += [
+        ast.parse(textwrap.dedent(inspect.getsource(method)))
+        for method in (FilePollerService._handle_message, FilePollerService._handle_adt)
+    ]
+    handlers = {
+        node.name for tree in trees for node in ast.walk(tree) if isinstance(node, ast.AsyncFunctionDef)
+    }
+    assert all(
+        handler is None or inspect.iscoroutinefunction(handler)
+        for _, handler in message_router.IHEMessageRouter.HANDLERS.values()
+    )
+    awaited = set()
+    for tree in trees:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Await) and isinstance(node.value, ast.Call):
+                func = node.value.func
+                awaited.add(func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None))
+    # `handler` : entrée de IHEMessageRouter.HANDLERS ; `run_sync` : pont AsyncSession lui-même
+    assert awaited - handlers <= {"handler", "run_sync"}
+
+    # Une coroutine qui se suspend est refusée par le pont synchrone
+    async def _suspends():
+        await asyncio.sleep(0)
+
+    with pytest.raises(RuntimeError):
+        run_to_completion(_suspends())
+
+
+@pytest.mark.asyncio
+async def test_emission_reads_endpoints_from_the_async_session_database(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'other.db'}"
+    other_engine = create_engine(url)
+    SQLModel.metadata.create_all(other_engine)
+    with Session(other_engine) as s:
+        endpoint = SystemEndpoint(name="OTHER-DB", kind="MLLP", role="sender", host="127.0.0.1", port=1)
+        patient = Patient(patient_seq=1, identifier="1", family="OTHERDB", given="Test", gender="male")
+        s.add_all([endpoint, patient])
+        s.commit()
+        endpoint_id, patient_id = endpoint.id, patient.id
+
+    async def _send(host, port, message):
+        return "MSA|AA|1"
+
+    monkeypatch.setattr("app.services.emit_on_create.send_mllp", _send)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as s:
+            await emit_to_senders_async(await s.get(Patient, patient_id), "patient", s)
+    finally:
+        await async_engine.dispose()
+
+    with Session(other_engine) as s:
+        logs = s.exec(select(MessageLog)).all()
+    other_engine.dispose()
+    assert [(log.endpoint_id, log.status) for log in logs] == [(endpoint_id, "sent")]
+
+
+@pytest.mark.asyncio
+async def test_emission_and_message_pages_with_async_session(session: Session, client):
+    patient = Patient(patient_seq=4242, identifier="4242", family="ASYNCOUT", given="Test", gender="male")
+    session.add(patient)
+    session.commit()
+    await asyncio.sleep(0.15)
+
+    async with async_session_factory() as s:
+        entity = await s.get(Patient, patient.id)
+        await emit_to_senders_async(entity, "patient", s)
+
+    session.expire_all()
+    logs = session.exec(select(MessageLog).where(MessageLog.status == "generated")).all()
+    hl7 = next(log for log in logs if log.kind == "MLLP" and "ASYNCOUT" in log.payload)
+
+    resp = client.get("/messages", params={"kind": "MLLP", "direction": "out"})
+    assert resp.status_code == 200 and f"/messages/{hl7.id}" in resp.text
+    detail = client.get(f"/messages/{hl7.id}")
+    assert detail.status_code == 200 and "ASYNCOUT" in detail.text
@@ -0,0 +1,150 @@
+"""
+Tests de l'index d'occupation des lits (BedOccupancy) et de la recherche de lits disponibles
+"""
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.db import get_next_sequence
+from app.models import Dossier, Mouvement, Patient, Venue
+from app.models_structure import (
+    BedOccupancy, Chambre, EntiteGeographique, Lit, Pole, Service,
+    UniteFonctionnelle, UniteHebergement,
+)
+from app.services.bed_occupancy import find_available_beds, rebuild_bed_occupancy, refresh_scheduled_beds
+
+
+def _build_ward(session: Session):
+    eg = EntiteGeographique(identifier="EG-BED", name="Site", finess="750000003")
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-BED", name="Pôle", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    service = Service(identifier="SRV-BED", name="Médecine", physical_type="wi", service_type="mco", pole_id=pole.id)
+    session.add(service)
+    session.flush()
+    uf = UniteFonctionnelle(identifier="UF-BED", name="UF Médecine", physical_type="area", service_id=service.id)
+    session.add(uf)
+    session.flush()
+    uh = UniteHebergement(identifier="UH-BED", name="Aile A", physical_type="wi", unite_fonctionnelle_id=uf.id)
+    session.add(uh)
+    session.flush()
+    chambre = Chambre(identifier="CH-BED", name="Chambre 1", physical_type="ro", unite_hebergement_id=uh.id)
+    session.add(chambre)
+    session.flush()
+    lits = [
+        Lit(identifier=f"LIT-BED-{i}", name=f"Lit {i}", physical_type="bd", chambre_id=chambre.id)
+        for i in range(3)
+    ]
+    session.add_all(lits)
+    session.commit()
+    return service, uf, lits
+
+
+def _venue(session: Session) -> Venue:
+    patient = Patient(patient_seq=get_next_sequence(session, "patient"), family="LIT", given="Test", gender="male")
+    session.add(patient)
+    session.flush()
+    dossier = Dossier(dossier_seq=get_next_sequence(session, "dossier"), patient_id=patient.id,
+                      uf_responsabilite="UF-BED", admit_time=datetime.now())
+    session.add(dossier)
+    session.flush()
+    venue = Venue(venue_seq=get_next_sequence(session, "venue"), dossier_id=dossier.id,
+                  uf_responsabilite="UF-BED", start_time=datetime.now())
+    session.add(venue)
+    session.commit()
+    return venue
+
+
+def _move(session: Session, venue: Venue, trigger: str, bed: str = None):
+    session.add(Mouvement(
+        mouvement_seq=get_next_sequence(session, "mouvement"),
+        venue_id=venue.id,
+        type=f"ADT^{trigger}",
+        trigger_event=trigger,
+        when=datetime.now(),
+        location=f"UF-BED^CH-BED^{bed}" if bed else None,
+    ))
+    session.commit()
+
+
+def _available(session: Session, **filters):
+    return [lit.identifier for _, lit, *_ in find_available_beds(session, **filters)]
+
+
+def test_occupancy_follows_mouvements(session: Session):
+    service, uf, lits = _build_ward(session)
+    assert _available(session, service_type="mco") == ["LIT-BED-0", "LIT-BED-1", "LIT-BED-2"]
+
+    venue = _venue(session)
+    _move(session, venue, "A01", "LIT-BED-0")
+    assert _available(session, uf_id=uf.id) == ["LIT-BED-1", "LIT-BED-2"]
+
+    # Mutation : l'ancien lit est libéré
+    _move(session, venue, "A02", "LIT-BED-1")
+    assert _available(session, uf_id=uf.id) == ["LIT-BED-0", "LIT-BED-2"]
+
+    # Absence provisoire : le lit reste réservé
+    _move(session, venue, "A21")
+    _move(session, venue, "A22")
+    row = session.get(BedOccupancy, lits[1].id)
+    session.refresh(row)
+    assert row.occupancy == "occupied"
+    assert row.venue_id == venue.id
+
+    _move(session, venue, "A03")
+    assert _available(session, uf_id=uf.id) == ["LIT-BED-0", "LIT-BED-1", "LIT-BED-2"]
+
+    # Statut opérationnel non libre et suspension d'un ancêtre
+    lits[2].operational_status = "C"
+    session.add(lits[2])
+    service.status = "suspended"
+    session.add(service)
+    session.commit()
+    assert _available(session, service_type="mco") == []
+
+    # Reconstruction : même état
+    service.status = "active"
+    session.add(service)
+    session.commit()
+    assert rebuild_bed_occupancy(session) == 3
+    assert _available(session, service_type="mco") == ["LIT-BED-0", "LIT-BED-1"]
+
+
+def test_scheduled_transitions_and_search_endpoint(client: TestClient, session: Session):
+    _, uf, lits = _build_ward(session)
+    soon = datetime.utcnow() + timedelta(hours=1)
+    uf.deactivation_date = soon.strftime("%Y%m%d%H%M%S")
+    session.add(uf)
+    session.commit()
+
+    row = session.get(BedOccupancy, lits[0].id)
+    assert row.next_status_change == soon.replace(microsecond=0)
+
+    response = client.get("/structure/search/lits-disponibles", params={"uf_id": uf.id})
+    assert response.status_code == 200
+    assert [lit["identifier"] for lit in response.json()] == ["LIT-BED-0", "LIT-BED-1", "LIT-BED-2"]
+
+    # Échéance passée : recalcul par la tâche de fond, la lecture n'écrit pas
+    assert refresh_scheduled_beds(session, now=soon + timedelta(minutes=1)) == 3
+    response = client.get("/structure/search/lits-disponibles", params={"service_type": "mco"})
+    assert response.json() == []
+    assert session.exec(select(BedOccupancy).where(BedOccupancy.structure_active.is_(True))).all() == []
+
+
+def test_portable_upsert_without_on_conflict(session: Session, monkeypatch):
+    import app.services.bed_occupancy as bed_occupancy
+
+    # Dialecte sans INSERT ... ON CONFLICT : UPDATE des lits connus puis INSERT des nouveaux
+    monkeypatch.setattr(bed_occupancy, "_UPSERT_INSERTS", {})
+    service, uf, lits = _build_ward(session)
+    assert _available(session, uf_id=uf.id) == ["LIT-BED-0", "LIT-BED-1", "LIT-BED-2"]
+
+    lits[1].operational_status = "C"
+    session.add(lits[1])
+    session.commit()
+    assert _available(session, uf_id=uf.id) == ["LIT-BED-0", "LIT-BED-2"]
+    assert rebuild_bed_occupancy(session) == 3
+    assert _available(session, uf_id=uf.id) == ["LIT-BED-0", "LIT-BED-2"]
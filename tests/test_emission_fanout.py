@@ -0,0 +1,89 @@
+"""
+Tests de l'émission vers les endpoints sender : rendu unique par variante, envois parallèles
+"""
+import asyncio
+import time
+
+import pytest
+from sqlmodel import Session, select
+
+from app.db import get_next_sequence
+from app.models import Patient
+from app.models_shared import MessageLog, SystemEndpoint
+from app.services import emit_on_create
+from app.services.emit_on_create import emit_to_senders_async
+
+
+def _patient(session: Session) -> Patient:
+    seq = get_next_sequence(session, "patient")
+    patient = Patient(patient_seq=seq, identifier=str(seq), family="FANOUT", given="Test", gender="female")
+    session.add(patient)
+    session.commit()
+    return patient
+
+
+def _sender(session: Session, name: str, port: int, **kwargs) -> SystemEndpoint:
+    endpoint = SystemEndpoint(name=name, kind="MLLP", role="sender", host="127.0.0.1", port=port, **kwargs)
+    session.add(endpoint)
+    session.commit()
+    return endpoint
+
+
+@pytest.mark.asyncio
+async def test_variants_rendered_once_and_sent_concurrently(session: Session, monkeypatch):
+    renders = []
+    original = emit_on_create.generate_pam_hl7
+
+    def _counting_render(*args, **kwargs):
+        renders.append(kwargs.get("forced_identifier_system"))
+        return original(*args, **kwargs)
+
+    finished = []
+
+    async def _send(host, port, message):
+        await asyncio.sleep(0.3 if port == 1 else 0.01)
+        finished.append(port)
+        return "MSH|^~\\&|R|R|S|S|20240101||ACK|1|P|2.5\rMSA|AA|1"
+
+    monkeypatch.setattr(emit_on_create, "generate_pam_hl7", _counting_render)
+    monkeypatch.setattr(emit_on_create, "send_mllp", _send)
+    slow = _sender(session, "FAN-SLOW", 1)
+    fast_a = _sender(session, "FAN-A", 2)
+    fast_b = _sender(session, "FAN-B", 3)
+    forced = _sender(session, "FAN-FORCED", 4, forced_identifier_system="GHT-X", forced_identifier_oid="1.2.3")
+    patient = _patient(session)
+
+    started = time.perf_counter()
+    await emit_to_senders_async(patient, "patient", session)
+    assert time.perf_counter() - started < 0.5
+
+    # Deux variantes (sans surcharge / GHT-X) pour quatre endpoints
+    assert sorted(renders, key=str) == sorted([None, "GHT-X"], key=str)
+    assert finished[-1] == 1  # l'endpoint lent ne retarde pas les autres
+    logs = session.exec(select(MessageLog).where(MessageLog.direction == "out").order_by(MessageLog.id)).all()
+    assert [log.endpoint_id for log in logs] == [slow.id, fast_a.id, fast_b.id, forced.id]
+    assert all(log.status == "sent" and log.pam_validation_status for log in logs)
+    forced_log = next(log for log in logs if log.endpoint_id == forced.id)
+    assert "GHT-X&1.2.3&ISO" in forced_log.payload
+    assert "GHT-X" not in next(log for log in logs if log.endpoint_id == slow.id).payload
+
+
+@pytest.mark.asyncio
+async def test_concurrent_emissions_keep_per_endpoint_order(session: Session, monkeypatch):
+    in_flight, peak, order = [0], [0], []
+
+    async def _send(host, port, message):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.02)
+        in_flight[0] -= 1
+        order.append(message.split("\r")[0].split("|")[9])
+        return "MSA|AA|1"
+
+    monkeypatch.setattr(emit_on_create, "send_mllp", _send)
+    _sender(session, "FAN-ORDER", 5)
+    patients = [_patient(session) for _ in range(3)]
+
+    await asyncio.gather(*(emit_to_senders_async(p, "patient", session) for p in patients))
+    assert peak[0] == 1
+    assert order == [str(p.patient_seq) for p in patients]
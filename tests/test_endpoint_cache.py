@@ -0,0 +1,66 @@
+"""
+Tests du cache de configuration des endpoints (instantanés immuables, invalidation sur commit)
+"""
+import dataclasses
+
+import pytest
+from sqlmodel import Session
+
+from app.db import engine
+from app.models_endpoints import FHIRConfig
+from app.models_shared import SystemEndpoint
+from app.models_structure_fhir import GHTContext, IdentifierNamespace
+from app.services.endpoint_cache import endpoint_config, endpoint_config_cache
+from app.services.scenario_transform import _select_namespace_system
+
+
+def test_snapshot_cached_until_commit_of_endpoint_change(session: Session):
+    endpoint = SystemEndpoint(name="CACHE-FHIR", kind="FHIR", role="sender", base_url="http://fhir.test")
+    session.add(endpoint)
+    session.commit()
+    session.add(FHIRConfig(name="cfg", base_url="http://fhir.test", endpoint_id=endpoint.id))
+    session.commit()
+
+    first = endpoint_config(session)
+    loads = endpoint_config_cache.metrics["loads"]
+    with Session(engine) as other:
+        assert endpoint_config(other) is first
+    assert endpoint_config_cache.metrics["loads"] == loads
+
+    snapshot = first.senders("fhir")[0]
+    assert snapshot.name == "CACHE-FHIR" and snapshot.fhir_configs[0].name == "cfg"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.is_enabled = False
+
+    # Modification non commitée : visible dans la session, invisible ailleurs ; rollback sans effet
+    endpoint.is_enabled = False
+    assert endpoint_config(session).senders("FHIR", enabled_only=True) == ()
+    with Session(engine) as other:
+        assert endpoint_config(other) is first
+    session.rollback()
+    assert endpoint_config(session) is first
+
+    endpoint = session.get(SystemEndpoint, endpoint.id)
+    endpoint.is_enabled = False
+    session.add(endpoint)
+    session.commit()
+    refreshed = endpoint_config(session)
+    assert refreshed is not first and refreshed.version > first.version
+    assert refreshed.senders("FHIR", enabled_only=True) == ()
+
+
+def test_namespace_selection_uses_cached_namespaces(session: Session):
+    ght = GHTContext(name="GHT-CACHE", code="GHT-CACHE")
+    session.add(ght)
+    session.commit()
+    session.add(IdentifierNamespace(name="NDA", system="urn:nda", oid="1.2.1", type="NDA", ght_context_id=ght.id))
+    ipp = IdentifierNamespace(name="IPP", system="", oid="1.2.2", type="IPP", ght_context_id=ght.id)
+    session.add(ipp)
+    session.commit()
+
+    assert _select_namespace_system(session, ght.id) == "1.2.2"
+    ipp.is_active = False
+    session.add(ipp)
+    session.commit()
+    assert _select_namespace_system(session, ght.id) == "urn:nda"
+    assert _select_namespace_system(session, None) is None
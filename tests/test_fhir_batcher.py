@@ -0,0 +1,126 @@
+"""
+Tests du regroupement des émissions FHIR sortantes (Bundles batch, réponses par entrée)
+"""
+import asyncio
+import json
+
+import pytest
+from sqlmodel import Session, select
+
+from app.db import engine, get_next_sequence
+from app.models import Patient
+from app.models_shared import MessageLog, SystemEndpoint
+from app.services.emit_on_create import emit_to_senders_async
+from app.services.fhir_batcher import FHIRBatcher, resource_entries
+from app.services.structure_emit import emit_structure_delete
+
+
+def _fake_server(bundles):
+    async def _post(url, bundle, **options):
+        bundles.append((url, bundle, options))
+        entries = [
+            {"response": {"status": "400 Bad Request" if "bad" in entry["request"]["url"] else "200 OK"}}
+            for entry in bundle["entry"]
+        ]
+        return 200, {"resourceType": "Bundle", "type": "batch-response", "entry": entries}
+    return _post
+
+
+@pytest.mark.asyncio
+async def test_batcher_groups_units_and_maps_entry_responses(monkeypatch):
+    bundles = []
+    monkeypatch.setattr("app.services.fhir_batcher.post_fhir_bundle", _fake_server(bundles))
+    batcher = FHIRBatcher(max_entries=4, max_latency=0.01)
+    units = [
+        resource_entries({"resourceType": "Patient", "id": "1"}),
+        resource_entries({"resourceType": "Encounter"}),
+        resource_entries({"resourceType": "Bundle", "type": "transaction", "entry": [
+            {"request": {"method": "DELETE", "url": "Location/bad"}},
+            {"request": {"method": "DELETE", "url": "Location/2"}},
+        ]}),
+        resource_entries({"resourceType": "Location", "id": "3"}),
+    ]
+    assert units[0][0]["request"] == {"method": "PUT", "url": "Patient/1"}
+    assert units[1][0]["request"] == {"method": "POST", "url": "Encounter"}
+    collection = resource_entries({"resourceType": "Bundle", "type": "collection", "entry": [
+        {"resource": {"resourceType": "Patient", "id": "pat-1"}, "fullUrl": "urn:uuid:pat-1"},
+        {"resource": {"resourceType": "Encounter"}},
+    ]})
+    assert [entry["request"] for entry in collection] == [
+        {"method": "PUT", "url": "Patient/pat-1"}, {"method": "POST", "url": "Encounter"},
+    ]
+
+    results = await asyncio.gather(*(batcher.submit("http://fhir/x", entries, auth_kind="none") for entries in units))
+    # 5 entrées, 4 max par Bundle : deux requêtes au lieu de quatre, unité multi-entrées non découpée
+    assert [len(bundle["entry"]) for _, bundle, _ in bundles] == [4, 1]
+    assert all(bundle["type"] == "batch" for _, bundle, _ in bundles)
+    assert bundles[0][2] == {"auth_kind": "none"}
+    assert [result.ok for result in results] == [True, True, False, True]
+    assert [len(result.entries) for result in results] == [1, 1, 2, 1]
+    assert json.loads(results[2].ack_payload())["entry"][0]["response"]["status"].startswith("400")
+
+    # Cibles différentes : Bundles distincts ; erreur réseau remontée à chaque unité
+    async def _down(url, bundle, **options):
+        raise ConnectionError("refused")
+    monkeypatch.setattr("app.services.fhir_batcher.post_fhir_bundle", _down)
+    failed = await asyncio.gather(batcher.submit("http://a", units[0]), batcher.submit("http://b", units[3]))
+    assert [(r.ok, r.error) for r in failed] == [(False, "refused"), (False, "refused")]
+    assert batcher.metrics["bundles"] == 4
+
+
+@pytest.mark.asyncio
+async def test_structure_emissions_share_one_bundle_with_one_log_each(session: Session, monkeypatch):
+    bundles = []
+    monkeypatch.setattr("app.services.fhir_batcher.post_fhir_bundle", _fake_server(bundles))
+    endpoint = SystemEndpoint(name="BATCH-FHIR", kind="FHIR", role="sender", base_url="http://fhir.test/fhir")
+    session.add(endpoint)
+    session.commit()
+
+    with Session(engine) as other:
+        await asyncio.gather(emit_structure_delete(101, session), emit_structure_delete(102, other))
+
+    assert len(bundles) == 1
+    assert [e["request"]["url"] for e in bundles[0][1]["entry"]] == ["Location/101", "Location/102"]
+    logs = session.exec(select(MessageLog).where(MessageLog.endpoint_id == endpoint.id)).all()
+    assert sorted(json.loads(log.payload)["entry"][0]["request"]["url"] for log in logs) == [
+        "Location/101", "Location/102",
+    ]
+    assert all(log.status == "sent" and len(json.loads(log.ack_payload)["entry"]) == 1 for log in logs)
+
+
+@pytest.mark.asyncio
+async def test_entity_emissions_submit_generated_resources(session: Session, monkeypatch):
+    bundles = []
+    monkeypatch.setattr("app.services.fhir_batcher.post_fhir_bundle", _fake_server(bundles))
+    seq = get_next_sequence(session, "patient")
+    patient = Patient(patient_seq=seq, identifier=str(seq), family="BUNDLE", given="Test", gender="male")
+    session.add(patient)
+    session.commit()
+
+    other_seq = get_next_sequence(session, "patient")
+    other = Patient(patient_seq=other_seq, identifier=str(other_seq), family="SHARED", given="Test", gender="female")
+    session.add(other)
+    session.commit()
+    # Patients créés avant l'endpoint : les émissions after_commit éventuelles (entity_events) ne l'atteignent pas
+    await asyncio.sleep(0.05)
+
+    endpoint = SystemEndpoint(name="EMIT-FHIR", kind="FHIR", role="sender", host="http://fhir.test/fhir")
+    session.add(endpoint)
+    session.commit()
+
+    await emit_to_senders_async(patient, "patient", session)
+    assert [e["request"] for e in bundles[0][1]["entry"]] == [{"method": "PUT", "url": f"Patient/{patient.id}"}]
+    log = session.exec(select(MessageLog).where(MessageLog.endpoint_id == endpoint.id)).one()
+    assert log.status == "sent"
+    assert json.loads(log.payload)["name"][0]["family"] == "BUNDLE"
+
+    # Émissions concurrentes vers le même endpoint : un seul Bundle (pas de plafond MLLP)
+    with Session(engine) as second:
+        await asyncio.gather(
+            emit_to_senders_async(patient, "patient", session),
+            emit_to_senders_async(second.get(Patient, other.id), "patient", second),
+        )
+    assert len(bundles) == 2
+    assert sorted(e["request"]["url"] for e in bundles[1][1]["entry"]) == sorted(
+        [f"Patient/{patient.id}", f"Patient/{other.id}"]
+    )
@@ -0,0 +1,102 @@
+"""
+Tests du pool de clients FHIR sortants (keep-alive, réessais 429/5xx, limite de concurrence)
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.models_endpoints import FHIRConfig
+from app.models_shared import SystemEndpoint
+from app.services.fhir_transport import FHIRClientPool, fhir_endpoint_options, post_fhir_bundle
+
+
+class _FHIRServer:
+    """Serveur HTTP/1.1 keep-alive minimal : réponses scriptées, compte connexions et requêtes."""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.connections = 0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/fhir"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {
+                    name.lower(): value
+                    for name, value in (line.split(": ", 1) for line in head.decode().split("\r\n")[1:] if ": " in line)
+                }
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests.append((headers, json.loads(body)))
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(self.delay)
+                self.in_flight -= 1
+                status = self.statuses.pop(0) if self.statuses else 200
+                payload = json.dumps({"resourceType": "Bundle", "type": "transaction-response"}).encode()
+                extra = "Retry-After: 0\r\n" if status in (429, 503) else ""
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/fhir+json\r\n{extra}"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_connections_and_retries_transient_errors(monkeypatch):
+    pool = FHIRClientPool(retries=2, backoff=0.0)
+    monkeypatch.setattr("app.services.fhir_transport.fhir_client_pool", pool)
+    bundle = {"resourceType": "Bundle", "type": "transaction", "entry": []}
+    async with _FHIRServer(statuses=[503, 429]) as server:
+        status, body = await post_fhir_bundle(server.url, bundle, "bearer", "tok", timeout=5)
+        assert status == 200 and body["type"] == "transaction-response"
+        assert pool.metrics["retries"] == 2
+
+        for _ in range(5):
+            assert (await post_fhir_bundle(server.url, bundle))[0] == 200
+        # 8 requêtes (dont 2 réessais) sur une seule connexion keep-alive
+        assert len(server.requests) == 8 and server.connections == 1
+        assert server.requests[0][0]["authorization"] == "Bearer tok"
+
+        server.statuses = [500, 500, 500]
+        assert (await post_fhir_bundle(server.url, bundle))[0] == 500
+        await pool.aclose()
+    assert pool.metrics["clients"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pool_limits_concurrency_per_endpoint(monkeypatch):
+    pool = FHIRClientPool(max_connections=2, retries=0)
+    monkeypatch.setattr("app.services.fhir_transport.fhir_client_pool", pool)
+    async with _FHIRServer(delay=0.05) as server:
+        results = await asyncio.gather(*(post_fhir_bundle(server.url, {"n": i}) for i in range(6)))
+        assert [status for status, _ in results] == [200] * 6
+        assert server.max_in_flight == 2 and server.connections == 2
+        await pool.aclose()
+
+    endpoint = SystemEndpoint(name="FHIR-OUT", kind="FHIR", role="sender", auth_kind="bearer", auth_token="t")
+    endpoint.fhir_configs = [
+        FHIRConfig(name="off", base_url="https://x", is_enabled=False, endpoint_id=0),
+        FHIRConfig(name="on", base_url="https://x", timeout=4.5, verify_ssl=False, endpoint_id=0),
+    ]
+    assert fhir_endpoint_options(endpoint) == {
+        "auth_kind": "bearer", "auth_token": "t", "timeout": 4.5, "verify_ssl": False,
+    }
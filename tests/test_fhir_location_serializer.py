@@ -0,0 +1,103 @@
+"""
+Tests du sérialiseur FHIR Location par lot, du cache de ressources et des en-têtes ETag/Last-Modified
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.db import engine
+from app.models_structure import EntiteGeographique, Pole, Service, UFActivity, UniteFonctionnelle
+from app.services.fhir_structure import entities_to_fhir_locations, location_cache
+
+
+def _count_selects(fn):
+    statements = []
+
+    def _before(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    return result, statements
+
+
+def _build_service(session: Session, uf_count: int = 5):
+    eg = EntiteGeographique(identifier="EG-SER", name="Site", finess="750000002")
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-SER", name="Pôle", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    service = Service(identifier="SRV-SER", name="Médecine", physical_type="wi", service_type="mco", pole_id=pole.id)
+    session.add(service)
+    session.flush()
+    activities = [UFActivity(code="hospitalisation", display="Hospitalisation"),
+                  UFActivity(code="consultations", display="Consultations")]
+    session.add_all(activities)
+    ufs = []
+    for i in range(uf_count):
+        uf = UniteFonctionnelle(identifier=f"UF-SER-{i}", name=f"UF {i}", physical_type="area",
+                                service_id=service.id, activities=list(activities))
+        session.add(uf)
+        ufs.append(uf)
+    session.commit()
+    return eg, service, ufs
+
+
+def test_batch_serializer_preloads_activities_and_caches(session: Session):
+    location_cache.clear()
+    _, _, ufs = _build_service(session)
+    session.expire_all()
+    ufs = [session.get(UniteFonctionnelle, uf.id) for uf in ufs]
+
+    resources, statements = _count_selects(lambda: entities_to_fhir_locations(ufs, session))
+    # Versions (1 requête) + activités de toutes les UF (1 requête), sans N+1
+    assert len(statements) == 2
+    codes = [e["valueCode"] for e in resources[0]["extension"] if e["url"].endswith("fr-uf-type")]
+    assert codes == ["hospitalisation", "consultations"]
+    assert resources[0]["meta"]["versionId"] == "1"
+
+    # Deuxième rendu : ressources servies par le cache (seule la lecture des versions)
+    again, statements = _count_selects(lambda: entities_to_fhir_locations(ufs, session))
+    assert len(statements) == 1
+    assert again[0] is resources[0]
+
+    # Une écriture change la version et évince l'entrée
+    ufs[0].name = "UF renommée"
+    session.add(ufs[0])
+    session.commit()
+    updated = entities_to_fhir_locations([ufs[0]], session)[0]
+    assert updated["name"] == "UF renommée"
+    assert updated["meta"]["versionId"] == "2"
+
+
+def test_location_read_etag_and_last_modified(client: TestClient, session: Session):
+    _, service, _ = _build_service(session, uf_count=1)
+
+    response = client.get(f"/fhir/Location/{service.id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag == 'W/"1"'
+    assert response.headers["Last-Modified"].endswith("GMT")
+
+    response = client.get(f"/fhir/Location/{service.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    service.name = "Médecine interne"
+    session.add(service)
+    session.commit()
+    response = client.get(f"/fhir/Location/{service.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == 'W/"2"'
+    assert response.json()["name"] == "Médecine interne"
+
+    # Recherche : ETag de page, 304 tant que la page ne change pas
+    response = client.get("/fhir/Location", params={"identifier": "SRV-SER"})
+    search_etag = response.headers["ETag"]
+    response = client.get("/fhir/Location", params={"identifier": "SRV-SER"},
+                          headers={"If-None-Match": search_etag})
+    assert response.status_code == 304
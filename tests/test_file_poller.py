@@ -0,0 +1,89 @@
+"""
+Tests du traitement concurrent des endpoints FILE (baux de fichiers, ordre par patient)
+"""
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from sqlmodel import Session
+
+from app.adapters.filesystem_transport import FileSystemReader
+from app.models_shared import SystemEndpoint
+from app.services.file_poller import FilePollerService, ordering_key
+
+
+def _adt(pid: str, n: int) -> str:
+    return f"MSH|^~\\&|S|S|R|R|20240101||ADT^A08|{n}|P|2.5\rPID|1||{pid}^^^HOP||DOE"
+
+
+def test_lease_claim_is_exclusive_and_expired_lease_is_reclaimed(tmp_path):
+    reader = FileSystemReader(str(tmp_path / "in"), lease_seconds=60)
+    message = tmp_path / "in" / "a.hl7"
+    message.write_text("x")
+
+    lease = reader.claim(message)
+    assert lease and (tmp_path / "in" / "a.hl7.lease").exists()
+    assert reader.claim(message) is None
+    assert reader.list_pending_files() == [message]
+
+    # Bail d'un worker arrêté brutalement : repris une fois expiré
+    lease.lease_path.write_text(json.dumps({"owner": "crashed", "expires_at": time.time() - 1}))
+    taken_over = reader.claim(message)
+    assert taken_over and taken_over.token != lease.token
+    reader.release(lease)  # l'ancien propriétaire ne libère pas le nouveau bail
+    assert taken_over.lease_path.exists()
+    reader.release(taken_over)
+    assert not taken_over.lease_path.exists()
+
+    message.unlink()
+    assert reader.claim(message) is None
+    assert sorted(p.name for p in (tmp_path / "in").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_files_processed_concurrently_in_order_per_patient(session: Session, tmp_path, monkeypatch):
+    inbox = tmp_path / "in"
+    inbox.mkdir()
+    for i, pid in enumerate(["P1", "P2", "P1", "P3", "P2", "P1"]):
+        (inbox / f"{i:02d}.hl7").write_text(_adt(pid, i))
+    (inbox / "06.hl7").write_text(_adt("P9", 6))
+    (inbox / "06.hl7.lease").write_text(json.dumps({"owner": "live", "expires_at": time.time() + 60}))
+    (inbox / "07.hl7").write_text(_adt("P3", 7))
+    (inbox / "07.hl7.lease").write_text("")  # bail tronqué d'un worker arrêté il y a une heure
+    os.utime(inbox / "07.hl7.lease", (time.time() - 3600, time.time() - 3600))
+
+    order, in_flight, peak = {}, [0], [0]
+
+    async def _process(self, content, file_path, endpoint):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.02)
+        in_flight[0] -= 1
+        order.setdefault(ordering_key(content), []).append(file_path.name)
+        return file_path.name != "04.hl7"
+
+    monkeypatch.setattr(FilePollerService, "_process_message", _process)
+    endpoint = SystemEndpoint(
+        name="FILE-CONC", kind="FILE", role="receiver", inbox_path=str(inbox),
+        archive_path=str(tmp_path / "archive"), error_path=str(tmp_path / "error"), file_extensions=".hl7",
+    )
+    session.add(endpoint)
+    session.commit()
+
+    stats = await FilePollerService(session).scan_all_file_endpoints()
+
+    assert order == {
+        "PID:P1^^^HOP": ["00.hl7", "02.hl7", "05.hl7"],
+        "PID:P2^^^HOP": ["01.hl7", "04.hl7"],
+        "PID:P3^^^HOP": ["03.hl7", "07.hl7"],
+    }
+    assert peak[0] == 3
+    assert stats["files_processed"] == 6 and stats["endpoints_scanned"] == 1
+    assert sorted(p.name for p in (tmp_path / "archive").iterdir()) == [
+        "00.hl7", "01.hl7", "02.hl7", "03.hl7", "05.hl7", "07.hl7",
+    ]
+    assert [p.name for p in (tmp_path / "error").iterdir()] == ["04.hl7"]
+    # Fichier sous bail actif d'un autre worker : laissé en place
+    assert sorted(p.name for p in inbox.iterdir()) == ["06.hl7", "06.hl7.lease"]
@@ -0,0 +1,66 @@
+"""
+Tests de l'émission vers les endpoints FILE (écriture atomique, fichiers batch HL7)
+"""
+import asyncio
+
+import pytest
+from sqlmodel import Session, select
+
+from app.adapters.filesystem_transport import FileSystemReader, FileSystemWriter
+from app.db import get_next_sequence
+from app.models import Patient
+from app.models_shared import MessageLog, SystemEndpoint
+from app.services.emit_on_create import emit_to_senders_async
+from app.services.file_sender import FileSender
+from app.services.hl7_batch import HL7BatchReader, is_batch_file
+
+
+def test_writer_publishes_atomically_without_overwriting(tmp_path):
+    writer = FileSystemWriter(str(tmp_path / "out"))
+    first = writer.write_message("MSH|1", filename="a.hl7")
+    second = writer.write_message("MSH|2", filename="a.hl7")
+    assert (first.name, second.name) == ("a.hl7", "a_1.hl7")
+    assert first.read_text() == "MSH|1" and second.read_text() == "MSH|2"
+
+    paths = writer.write_batch([("MSH|3", "C3"), ("MSH|4", "C4")])
+    assert [p.read_text() for p in paths] == ["MSH|3", "MSH|4"]
+    assert not any(p.name.endswith(".tmp") for p in (tmp_path / "out").iterdir())
+
+    # Un fichier temporaire en cours d'écriture n'est jamais lu comme un message
+    (tmp_path / "out" / ".b.hl7.123.tmp").write_text("MSH|partiel")
+    pending = FileSystemReader(str(tmp_path / "out")).list_pending_files()
+    assert sorted(p.name for p in pending) == sorted(["a.hl7", "a_1.hl7", paths[0].name, paths[1].name])
+
+
+@pytest.mark.asyncio
+async def test_file_senders_group_batches_and_receive_emissions(session: Session, tmp_path):
+    # Patient créé avant l'endpoint : l'émission after_commit éventuelle (entity_events) ne l'atteint pas
+    seq = get_next_sequence(session, "patient")
+    patient = Patient(patient_seq=seq, identifier=str(seq), family="FILEOUT", given="Test", gender="female")
+    session.add(patient)
+    session.commit()
+    await asyncio.sleep(0.15)
+
+    endpoint = SystemEndpoint(name="FILE-OUT", kind="FILE", role="sender", outbox_path=str(tmp_path / "out"))
+    session.add(endpoint)
+    session.commit()
+
+    sender = FileSender(max_messages=3, max_latency=0.05)
+    messages = [f"MSH|^~\\&|POC|POC_FAC|DST|DST_FAC|20240101||ADT^A08|C{i}|P|2.5\rPID|1||P{i}" for i in range(4)]
+    results = await asyncio.gather(*(sender.send(endpoint, message) for message in messages))
+    assert all(result.ok for result in results)
+    assert results[0].path == results[2].path != results[3].path
+    assert is_batch_file(results[0].path) and not is_batch_file(results[3].path)
+    batch = HL7BatchReader(results[0].path)
+    assert [m.text for m in batch.messages()] == messages[:3]
+    assert batch.batch_header.split("|")[2:6] == ["POC", "POC_FAC", "DST", "DST_FAC"]
+    assert sender.metrics == {"messages": 4, "files": 2, "errors": 0}
+
+    # Endpoint FILE "sender" servi par l'émission à la création, comme MLLP/FHIR
+    before = set((tmp_path / "out").iterdir())
+    await emit_to_senders_async(patient, "patient", session)
+
+    written = set((tmp_path / "out").iterdir()) - before
+    assert len(written) == 1 and "FILEOUT" in written.pop().read_text()
+    log = session.exec(select(MessageLog).where(MessageLog.endpoint_id == endpoint.id)).one()
+    assert (log.kind, log.status) == ("FILE", "sent") and "FILEOUT" in log.payload
@@ -0,0 +1,116 @@
+"""
+Tests de la surveillance inotify des endpoints FILE (traitement à l'arrivée, repli polling)
+"""
+import asyncio
+import time
+
+import pytest
+from sqlmodel import Session
+
+from app.adapters.filesystem_transport import FileSystemWriter
+from app.models_shared import SystemEndpoint
+from app.services import file_watcher
+from app.services.file_poller import FilePollerService
+from app.services.file_watcher import FileEndpointWatcher, inotify_available
+from app.services.scheduler import BackgroundScheduler
+
+
+def _file_endpoint(session: Session, tmp_path, name: str = "WATCH-IN") -> SystemEndpoint:
+    endpoint = SystemEndpoint(
+        name=name, kind="FILE", role="receiver",
+        inbox_path=str(tmp_path / "in"), archive_path=str(tmp_path / "archive"), file_extensions=".hl7",
+    )
+    session.add(endpoint)
+    session.commit()
+    return endpoint
+
+
+async def _wait_for(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify requis (Linux)")
+@pytest.mark.asyncio
+async def test_watcher_processes_new_files_in_arrival_order(session: Session, tmp_path, monkeypatch):
+    processed = []
+
+    async def _process(self, content, file_path, endpoint):
+        processed.append(content)
+        return True
+
+    monkeypatch.setattr(FilePollerService, "_process_message", _process)
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "0-backlog.hl7").write_text("backlog")
+    _file_endpoint(session, tmp_path)
+
+    watcher = FileEndpointWatcher()
+    assert watcher.start()
+    try:
+        await _wait_for(lambda: processed == ["backlog"])
+        started = time.monotonic()
+        for i, name in enumerate(["z.hl7", "a.hl7", "ignored.txt", "m.hl7"]):
+            (tmp_path / "in" / name).write_text(f"msg{i}")
+        # Fichier écrit ailleurs puis déplacé dans la boîte (IN_MOVED_TO)
+        (tmp_path / "staged.hl7").write_text("moved")
+        (tmp_path / "staged.hl7").rename(tmp_path / "in" / "staged.hl7")
+        # Fichier publié par l'émetteur FILE (écriture atomique)
+        FileSystemWriter(str(tmp_path / "in")).write_message("written", filename="w.hl7")
+        await _wait_for(lambda: len(processed) == 6)
+        assert time.monotonic() - started < 1.0
+    finally:
+        await watcher.stop()
+
+    assert processed == ["backlog", "msg0", "msg1", "msg3", "moved", "written"]
+    assert sorted(p.name for p in (tmp_path / "archive").iterdir()) == [
+        "0-backlog.hl7", "a.hl7", "m.hl7", "staged.hl7", "w.hl7", "z.hl7",
+    ]
+    assert [p.name for p in (tmp_path / "in").iterdir()] == ["ignored.txt"]
+    assert watcher.metrics["files"] == 6
+
+
+@pytest.mark.asyncio
+async def test_scheduler_falls_back_to_polling_without_inotify(session: Session, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_watcher, "_libc", lambda: None)
+    scanned = []
+
+    async def _scan(self, exclude_ids=None):
+        scanned.append(exclude_ids)
+        return self.stats
+
+    monkeypatch.setattr(FilePollerService, "scan_all_file_endpoints", _scan)
+    _file_endpoint(session, tmp_path)
+
+    scheduler = BackgroundScheduler(poll_interval_seconds=3600)
+    await scheduler.start()
+    try:
+        await _wait_for(lambda: scanned)
+        assert scheduler.watcher is None and scanned == [None]
+    finally:
+        await scheduler.stop()
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify requis (Linux)")
+@pytest.mark.asyncio
+async def test_scheduler_still_lists_watched_inboxes_periodically(session: Session, tmp_path, monkeypatch):
+    scanned = []
+
+    async def _scan(self, exclude_ids=None):
+        scanned.append(exclude_ids)
+        return self.stats
+
+    monkeypatch.setattr(FilePollerService, "scan_all_file_endpoints", _scan)
+    (tmp_path / "in").mkdir()
+    endpoint = _file_endpoint(session, tmp_path)
+
+    scheduler = BackgroundScheduler(poll_interval_seconds=0.05, reconcile_interval_seconds=0.2)
+    await scheduler.start()
+    try:
+        # Fichiers manqués par le watcher ou baux expirés : listage de réconciliation
+        await _wait_for(lambda: None in scanned)
+    finally:
+        await scheduler.stop()
+
+    assert endpoint.id in scanned[0]
+    assert None in scanned
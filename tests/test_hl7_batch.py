@@ -0,0 +1,94 @@
+"""
+Tests des fichiers batch HL7 (lecture en flux, reprise sur point de contrôle, ACK de batch)
+"""
+import json
+import time
+
+import pytest
+from sqlmodel import Session
+
+from app.models_shared import SystemEndpoint
+from app.services.file_poller import FilePollerService
+from app.services.hl7_batch import HL7BatchReader, is_batch_file
+
+HEADER = "FHS|^~\\&|EXP|EXP_FAC|POC|POC_FAC|20240101||||F001\rBHS|^~\\&|EXP|EXP_FAC|POC|POC_FAC|20240101||||B001"
+
+
+def _batch(count: int, terminator: str = "\r", declared=None) -> str:
+    messages = [
+        f"MSH|^~\\&|EXP|EXP_FAC|POC|POC_FAC|20240101||ADT^A08|C{i}|P|2.5{terminator}PID|1||P{i}^^^HOP||DOE{'X' * 40}"
+        for i in range(count)
+    ]
+    trailer = f"BTS|{count if declared is None else declared}{terminator}FTS|1"
+    return terminator.join([HEADER.replace("\r", terminator), *messages, trailer]) + terminator
+
+
+def test_reader_streams_messages_across_chunks_and_resumes(tmp_path):
+    path = tmp_path / "export.hl7"
+    path.write_bytes(_batch(60, "\r\n").encode())
+    assert is_batch_file(path) and path.stat().st_size > 4 * 1024
+
+    reader = HL7BatchReader(path, chunk_size=1024)
+    messages = list(reader.messages())
+    assert len(messages) == 60
+    assert messages[59].text.startswith("MSH|") and messages[59].text.endswith("DOE" + "X" * 40)
+    assert messages[0].text.count("\r") == 1 and "\n" not in messages[0].text
+    assert reader.batch_header.endswith("B001") and reader.batch_trailers == ["BTS|60", "FTS|1"]
+
+    resumed = HL7BatchReader(path, chunk_size=1024)
+    assert [m.text for m in resumed.messages(messages[41].end)] == [m.text for m in messages[42:]]
+    assert resumed.batch_header is None
+    resumed.read_envelope()
+    assert resumed.file_header.endswith("F001")
+
+
+class _Crash(BaseException):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_batch_file_resumes_from_checkpoint_and_writes_batch_ack(session: Session, tmp_path, monkeypatch):
+    inbox = tmp_path / "in"
+    inbox.mkdir()
+    (inbox / "nightly.hl7").write_text(_batch(5, declared=6))
+    monkeypatch.setattr("app.services.file_poller.CHECKPOINT_EVERY", 2)
+    endpoint = SystemEndpoint(
+        name="FILE-BATCH", kind="FILE", role="receiver", inbox_path=str(inbox),
+        outbox_path=str(tmp_path / "out"), archive_path=str(tmp_path / "archive"), error_path=str(tmp_path / "error"),
+    )
+    session.add(endpoint)
+    session.commit()
+    seen = []
+
+    async def _crashing(self, content, file_path, endpoint):
+        if len(seen) == 3:
+            raise _Crash()
+        seen.append(content.split("|")[9])
+        return True
+
+    monkeypatch.setattr(FilePollerService, "_process_message", _crashing)
+    with pytest.raises(_Crash):
+        await FilePollerService(session).scan_all_file_endpoints()
+    checkpoint = json.loads((inbox / "nightly.hl7.checkpoint").read_text())
+    assert checkpoint["messages"] == 2 and seen == ["C0", "C1", "C2"]
+
+    # Bail du worker arrêté expiré : un autre worker reprend après le point de contrôle
+    (inbox / "nightly.hl7.lease").write_text(json.dumps({"owner": "crashed", "expires_at": time.time() - 1}))
+
+    async def _process(self, content, file_path, endpoint):
+        seen.append(content.split("|")[9])
+        return "C3" not in content
+
+    monkeypatch.setattr(FilePollerService, "_process_message", _process)
+    stats = await FilePollerService(session).scan_all_file_endpoints()
+
+    assert seen == ["C0", "C1", "C2", "C2", "C3", "C4"]
+    assert stats["batch_messages"] == 5
+    assert sorted(p.name for p in inbox.iterdir()) == []
+    assert [p.name for p in (tmp_path / "error").iterdir()] == ["nightly.hl7"]
+    ack = (tmp_path / "out" / "nightly.hl7.ack").read_bytes().decode().split("\r")
+    assert ack[0].startswith("FHS|^~\\&|POC|POC_FAC|EXP|EXP_FAC|") and ack[0].endswith("|F001")
+    assert ack[1].startswith("BHS|") and ack[1].endswith("|B001")
+    assert ack[2].startswith("MSH|") and ack[3].startswith("MSA|AE|C3|")
+    assert ack[-3] == "BTS|1|5 received, 4 accepted, 1 rejected, BTS-1 declared 6"
+    assert ack[-2] == "FTS|1"
@@ -0,0 +1,129 @@
+"""
+Tests du resolver d'identifiants (index composite + résolution par lot)
+"""
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, create_engine, select, text
+
+from app.db import engine, get_next_sequence
+from app.models import Patient
+from app.models_identifiers import Identifier, IdentifierType
+from app.services.identifier_manager import create_identifier_from_hl7
+from app.services.identifier_resolver import get_resolver
+
+
+def _make_patient(session: Session, identifier: str, *cx_pairs) -> Patient:
+    patient = Patient(
+        patient_seq=get_next_sequence(session, "patient"),
+        identifier=identifier,
+        family="RESOLVER",
+        given="Test",
+    )
+    session.add(patient)
+    session.flush()
+    for system, value in cx_pairs:
+        session.add(Identifier(value=value, system=system, type=IdentifierType.PI, patient_id=patient.id))
+    session.commit()
+    return patient
+
+
+def _count_selects(fn):
+    statements = []
+
+    def _before(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    return result, statements
+
+
+def test_resolve_many_single_query_and_cache(session: Session):
+    _make_patient(session, "P1", ("HOSP_A", "111"), ("HOSP_B", "222"))
+
+    resolver = get_resolver(session)
+    keys = [("HOSP_A", "111"), ("HOSP_B", "222"), ("HOSP_A", "999")]
+    found, statements = _count_selects(lambda: resolver.resolve_many(keys))
+    assert set(found) == {("HOSP_A", "111"), ("HOSP_B", "222")}
+    assert len(statements) == 1
+
+    # Deuxième appel dans la même transaction: servi par le cache (y compris le miss)
+    again, statements = _count_selects(lambda: resolver.resolve_many(keys))
+    assert set(again) == set(found)
+    assert statements == []
+
+
+def test_cache_cleared_on_commit(session: Session):
+    patient = _make_patient(session, "P2")
+    resolver = get_resolver(session)
+    assert resolver.resolve("HOSP_A", "333") is None
+
+    session.add(Identifier(value="333", system="HOSP_A", type=IdentifierType.PI, patient_id=patient.id))
+    session.commit()
+
+    hit = resolver.resolve("HOSP_A", "333")
+    assert hit is not None and hit.patient_id == patient.id
+
+    # Absence mémorisée, puis identifiant créé hors resolver (identifier_manager) sans remember()
+    assert resolver.resolve("HOSP_A", "334") is None
+    session.add(create_identifier_from_hl7("334^^^HOSP_A^PI", "patient", patient.id))
+    hit = resolver.resolve("HOSP_A", "334")
+    assert hit is not None and hit.patient_id == patient.id
+
+
+def test_find_patient_by_cx(session: Session):
+    patient = _make_patient(session, "P3", ("HOSP_A", "444"))
+    resolver = get_resolver(session)
+
+    assert resolver.find_patient_by_cx(["000^^^HOSP_A^PI", "444^^^HOSP_A^PI"]).id == patient.id
+    # Autre autorité: pas de correspondance stricte, mais correspondance sur la valeur seule
+    assert resolver.find_patient_by_cx(["444^^^HOSP_Z^PI"]) is None
+    assert resolver.find_patient_by_cx(["444^^^HOSP_Z^PI"], match_system=False).id == patient.id
+    assert resolver.find_patient_by_plain_ids(["P3^^^HOSP_Z^PI"]).id == patient.id
+
+
+def test_composite_index_is_unique(session: Session):
+    _make_patient(session, "P4", ("HOSP_A", "555"))
+    session.add(Identifier(value="555", system="HOSP_A", type=IdentifierType.PI))
+    with pytest.raises(IntegrityError):
+        session.commit()
+    session.rollback()
+
+    # Même couple (system, value) avec un autre type: autorisé
+    session.add(Identifier(value="555", system="HOSP_A", type=IdentifierType.IPP))
+    session.commit()
+
+
+def test_migration_010_archives_duplicates_before_unique_index(tmp_path):
+    migration = Path(__file__).parent.parent / "migrations" / "010_add_identifier_composite_index.sql"
+    lines = [l for l in migration.read_text(encoding="utf-8").splitlines() if not l.strip().startswith("--")]
+    statements = [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+
+    db = create_engine(f"sqlite:///{tmp_path / 'migration.db'}")
+    SQLModel.metadata.create_all(db)
+    with Session(db) as s:
+        s.exec(text("DROP INDEX ux_identifier_system_value_type"))
+        for status in ("inactive", "active", "active"):
+            s.add(Identifier(value="IPP-DUP", system="HOSP", type=IdentifierType.PI, status=status))
+        s.add(Identifier(value="IPP-UNIQ", system="HOSP", type=IdentifierType.PI))
+        s.commit()
+
+        for statement in statements:
+            s.exec(text(statement))
+        s.commit()
+
+        kept = s.exec(select(Identifier.id, Identifier.status).where(Identifier.value == "IPP-DUP")).all()
+        archived = s.exec(text("SELECT id, status FROM identifier_duplicate ORDER BY id")).all()
+        assert kept == [(2, "active")]
+        assert [tuple(row) for row in archived] == [(1, "inactive"), (3, "active")]
+        assert s.exec(select(Identifier).where(Identifier.value == "IPP-UNIQ")).one()
+        with pytest.raises(IntegrityError):
+            s.add(Identifier(value="IPP-DUP", system="HOSP", type=IdentifierType.PI))
+            s.commit()
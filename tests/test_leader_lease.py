@@ -0,0 +1,94 @@
+"""
+Tests des baux de direction entre workers (écoutes MLLP et tâches planifiées)
+"""
+import asyncio
+import socket
+import time
+
+import pytest
+from sqlmodel import Session
+
+from app.db_session_factory import session_factory
+from app.models_shared import SystemEndpoint
+from app.services.file_poller import FilePollerService
+from app.services import leader_lease
+from app.services.leader_lease import LeaderLeases
+from app.services.mllp import send_mllp
+from app.services.mllp_manager import MLLPManager
+from app.services.scheduler import FILE_POLL_JOB, BackgroundScheduler
+
+pytestmark = pytest.mark.skipif(leader_lease.fcntl is None, reason="fcntl requis (POSIX)")
+
+
+async def _wait_for(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_scheduled_job_runs_in_one_worker_and_fails_over(tmp_path, monkeypatch):
+    worker_a, worker_b = LeaderLeases(str(tmp_path), 0.02), LeaderLeases(str(tmp_path), 0.02)
+    assert worker_a.acquire("job") and worker_a.acquire("job")
+    assert not worker_b.acquire("job")
+    assert worker_a.owner("job")["pid"] > 0
+    worker_a.release("job")
+    assert worker_b.acquire("job")
+    worker_b.release_all()
+
+    scans = []
+
+    async def _scan(self, exclude_ids=None):
+        scans.append(self)
+        return self.stats
+
+    monkeypatch.setattr(FilePollerService, "scan_all_file_endpoints", _scan)
+    first = BackgroundScheduler(poll_interval_seconds=3600, watch_files=False, leases=worker_a)
+    second = BackgroundScheduler(poll_interval_seconds=3600, watch_files=False, leases=worker_b)
+    await first.start()
+    await second.start()
+    try:
+        await _wait_for(lambda: scans)
+        await asyncio.sleep(0.1)
+        assert len(scans) == 1 and worker_a.holds(FILE_POLL_JOB) and not worker_b.holds(FILE_POLL_JOB)
+
+        # Arrêt du worker leader : l'autre reprend la tâche à sa prochaine tentative
+        await first.stop()
+        await _wait_for(lambda: len(scans) == 2)
+        assert len(scans) == 2 and worker_b.holds(FILE_POLL_JOB)
+    finally:
+        await first.stop()
+        await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_mllp_listener_owned_by_one_worker_with_failover(session: Session, tmp_path):
+    endpoint = SystemEndpoint(name="MLLP-LEASE", kind="MLLP", role="receiver", host="127.0.0.1", port=_free_port())
+    session.add(endpoint)
+    session.commit()
+
+    async def _on_message(message, s, ep):
+        return f"MSH|^~\\&|{ep.name}\rMSA|AA|1"
+
+    first = MLLPManager(session_factory, _on_message, leases=LeaderLeases(str(tmp_path), 0.02))
+    second = MLLPManager(session_factory, _on_message, leases=LeaderLeases(str(tmp_path), 0.02))
+    try:
+        await first.reload_all(session)
+        await second.reload_all(session)  # pas d'erreur "address already in use"
+        assert first.running_ids() == [endpoint.id]
+        assert second.running_ids() == [] and list(second.standby) == [endpoint.id]
+
+        await first.stop_all()
+        await _wait_for(lambda: second.running_ids())
+        assert second.running_ids() == [endpoint.id] and not second.standby
+        ack = await send_mllp("127.0.0.1", endpoint.port, "MSH|^~\\&|A|B|C|D|20240101||ADT^A01|1|P|2.5")
+        assert "MSA|AA" in ack
+    finally:
+        await first.stop_all()
+        await second.stop_all()
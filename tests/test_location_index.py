@@ -0,0 +1,139 @@
+"""
+Tests du registre unifié des lieux (LocationIndex) et de la recherche FHIR Location
+"""
+from fastapi.testclient import TestClient
+from sqlmodel import Session, func, select
+
+from app.models_structure import (
+    Chambre, EntiteGeographique, Lit, LocationIndex, Pole, Service,
+    UniteFonctionnelle, UniteHebergement,
+)
+from app.services.location_index import rebuild_location_index
+
+
+def _build_tree(session: Session):
+    eg = EntiteGeographique(identifier="EG-IDX", name="Hôpital Nord", finess="750000001")
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-IDX", name="Pôle Médecine", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    service = Service(identifier="SRV-IDX", name="Cardiologie", physical_type="wi",
+                      service_type="mco", pole_id=pole.id)
+    session.add(service)
+    session.flush()
+    uf = UniteFonctionnelle(identifier="UF-IDX", name="Soins intensifs", physical_type="area",
+                            service_id=service.id)
+    session.add(uf)
+    session.flush()
+    uh = UniteHebergement(identifier="UH-IDX", name="Aile B", physical_type="wi",
+                          unite_fonctionnelle_id=uf.id)
+    session.add(uh)
+    session.flush()
+    # Deux chambres : les lits sont dans la seconde (id 2, sans collision avec les niveaux supérieurs)
+    session.add(Chambre(identifier="CH-IDX-0", name="Chambre 10", physical_type="ro", unite_hebergement_id=uh.id))
+    chambre = Chambre(identifier="CH-IDX", name="Chambre 12", physical_type="ro",
+                      unite_hebergement_id=uh.id)
+    session.add(chambre)
+    session.flush()
+    lits = [
+        Lit(identifier=f"LIT-IDX-{i}", name=f"Lit {i}", physical_type="bd", chambre_id=chambre.id)
+        for i in range(3)
+    ]
+    session.add_all(lits)
+    session.commit()
+    return eg, pole, service, uf, uh, chambre, lits
+
+
+def _index_row(session: Session, entity) -> LocationIndex:
+    return session.exec(
+        select(LocationIndex)
+        .where(LocationIndex.model == type(entity).__name__)
+        .where(LocationIndex.entity_id == entity.id)
+    ).one()
+
+
+def test_index_maintained_with_materialised_paths(session: Session):
+    eg, pole, service, uf, uh, chambre, lits = _build_tree(session)
+
+    eg_row = _index_row(session, eg)
+    lit_row = _index_row(session, lits[0])
+    assert eg_row.path == f"/{eg_row.id}/"
+    assert lit_row.depth == eg_row.depth + 6
+    assert lit_row.path.startswith(eg_row.path)
+    assert lit_row.parent_id == _index_row(session, chambre).id
+
+    # Déplacement d'un service sous un autre pôle : le sous-arbre suit
+    other = Pole(identifier="POLE-IDX-2", name="Pôle Chirurgie", physical_type="area", entite_geo_id=eg.id)
+    session.add(other)
+    session.flush()
+    service.pole_id = other.id
+    session.add(service)
+    session.commit()
+    other_row = _index_row(session, other)
+    assert _index_row(session, lits[2]).path.startswith(other_row.path)
+
+    # Suppression
+    session.delete(lits[2])
+    session.commit()
+    assert session.exec(select(LocationIndex).where(LocationIndex.identifier == "LIT-IDX-2")).first() is None
+
+    # Reconstruction complète : mêmes relations
+    assert rebuild_location_index(session) == 10
+    assert _index_row(session, lits[0]).path.startswith(_index_row(session, other).path)
+
+
+def test_fhir_location_search_uses_index(client: TestClient, session: Session):
+    eg, pole, service, uf, uh, chambre, lits = _build_tree(session)
+
+    body = client.get("/fhir/Location", params={"identifier": "750000001"}).json()
+    assert [e["resource"]["name"] for e in body["entry"]] == ["Hôpital Nord"]
+
+    # partof : enfants directs ; partof:below : tout le sous-arbre
+    body = client.get("/fhir/Location", params={"partof": f"Location/{chambre.id}"}).json()
+    assert body["total"] == 3
+    body = client.get("/fhir/Location", params={"partof:below": f"Location/{eg.id}", "_count": 4}).json()
+    assert body["total"] == 9
+    assert len(body["entry"]) == 4
+    next_link = next(l["url"] for l in body["link"] if l["relation"] == "next")
+    assert "_offset=4" in next_link
+    body = client.get(
+        "/fhir/Location", params={"partof:below": f"Location/{eg.id}", "_count": 4, "_offset": 8}
+    ).json()
+    assert len(body["entry"]) == 1
+    assert not any(l["relation"] == "next" for l in body["link"])
+
+    # name : préfixe insensible aux accents et à la casse
+    body = client.get("/fhir/Location", params={"name": "pole med"}).json()
+    assert [e["resource"]["name"] for e in body["entry"]] == ["Pôle Médecine"]
+    body = client.get("/fhir/Location", params={"name:contains": "INTENSIF"}).json()
+    assert [e["resource"]["name"] for e in body["entry"]] == ["Soins intensifs"]
+
+
+def test_fhir_location_search_by_id_and_last_updated(client: TestClient, session: Session):
+    eg, pole, service, uf, uh, chambre, lits = _build_tree(session)
+
+    # _id : résolu comme une lecture (niveau le plus haut en cas de collision d'ids)
+    body = client.get("/fhir/Location", params={"_id": f"{chambre.id},{lits[2].id}"}).json()
+    expected = [client.get(f"/fhir/Location/{i}").json()["name"] for i in (chambre.id, lits[2].id)]
+    assert sorted(e["resource"]["name"] for e in body["entry"]) == sorted(expected)
+    assert client.get("/fhir/Location", params={"_id": "abc"}).status_code == 400
+
+    # Même id pour une EG et un Service : _id et lecture résolvent la même entité
+    shared = max(session.exec(select(func.max(model.id))).one() or 0 for model in (EntiteGeographique, Service)) + 1
+    session.add(EntiteGeographique(id=shared, identifier="EG-IDX-DUP", name="Site homonyme", finess="750000002"))
+    session.add(Service(id=shared, identifier="SRV-IDX-DUP", name="Service homonyme", physical_type="wi",
+                        service_type="mco", pole_id=pole.id))
+    session.commit()
+    body = client.get("/fhir/Location", params={"_id": str(shared)}).json()
+    assert [e["resource"]["name"] for e in body["entry"]] == ["Service homonyme"]
+    assert client.get(f"/fhir/Location/{shared}").json()["name"] == "Service homonyme"
+
+    row = _index_row(session, lits[0])
+    stamp = row.last_updated.strftime("%Y-%m-%dT%H:%M:%S")
+    body = client.get("/fhir/Location", params={"_lastUpdated": f"ge{stamp}", "name": "Lit"}).json()
+    assert body["total"] == 3
+    body = client.get("/fhir/Location", params={"_lastUpdated": "lt2000-01-01"}).json()
+    assert body["total"] == 0
+    assert client.get("/fhir/Location", params={"_lastUpdated": "sa2020-01-01"}).status_code == 400
+    assert client.get("/fhir/Location", params={"_id": "1", "type": "bd"}).status_code == 400
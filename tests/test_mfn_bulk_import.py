@@ -0,0 +1,93 @@
+"""
+Tests de l'import MFN^M05 en masse (diff créés / mis à jour / inchangés, transaction unique)
+"""
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models_structure import Chambre, Lit, LocationIndex, Pole, Service, UniteHebergement
+from app.models_structure_fhir import EntiteGeographique, EntiteJuridique, GHTContext
+from app.services.mfn_importer import import_mfn
+
+
+def _entity(type_code, code, label, parent=None):
+    comp = f"^^^^^{type_code}^^^^{code}&CPAGE&TEST&FINEJ"
+    lines = [
+        f"MFE|MAD|||{comp}|PL",
+        f"LOC|{comp}||{type_code}|{label}",
+        f"LCH|{comp}|||ID_GLBL^Identifiant unique global^L|^{code}",
+        f"LCH|{comp}|||CD^Code^L|^{code}",
+        f"LCH|{comp}|||LBL^Libelle^L|^{label}",
+    ]
+    if type_code == "M":
+        lines.append(f"LCH|{comp}|||FNS^Code FINESS^L|^{code}")
+    if parent:
+        lines.append(f"LRL|{comp}|||LCLSTN^Localisation^L||^^^^^{parent[0]}^^^^{parent[1]}&CPAGE&TEST&FINEJ")
+    return lines
+
+
+def _message(bed_label="Lit"):
+    lines = ["MSH|^~\\&|STR|STR|RCV|RCV|20250101000000||MFN^M05^MFN_M05|1|P|2.5", "MFI|LOC|CPAGE_LOC_FRA|REP"]
+    lines += _entity("M", "910000001", "EJ Test")
+    lines += _entity("ETBL_GRPQ", "910000002", "EG Test", ("M", "910000001"))
+    lines += _entity("D", "SRV1", "Cardiologie", ("ETBL_GRPQ", "910000002"))
+    lines += _entity("N", "UF1", "UF Cardio", ("D", "SRV1"))
+    for r in range(2):
+        lines += _entity("R", f"CH{r}", f"Chambre {r}", ("N", "UF1"))
+        for b in range(2):
+            lines += _entity("B", f"LIT{r}{b}", f"{bed_label} {r}{b}", ("R", f"CH{r}"))
+    return "\r".join(lines) + "\r"
+
+
+def _ght(session: Session) -> GHTContext:
+    ght = GHTContext(name="GHT MFN", code="MFN")
+    session.add(ght)
+    session.commit()
+    session.refresh(ght)
+    return ght
+
+
+def test_bulk_import_creates_in_one_transaction(session: Session):
+    ght = _ght(session)
+    commits = []
+
+    def _on_commit(sess):
+        commits.append(sess)
+
+    event.listen(session, "after_commit", _on_commit)
+    try:
+        summary = import_mfn(_message(), session, ght)
+    finally:
+        event.remove(session, "after_commit", _on_commit)
+
+    assert len(commits) == 1
+    assert summary["created"] == {
+        "ej": 1, "eg": 1, "pole": 1, "service": 1, "uf": 1, "uh": 1, "chambre": 2, "lit": 4,
+    }
+    eg = session.exec(select(EntiteGeographique).where(EntiteGeographique.identifier == "910000002")).one()
+    ej = session.exec(select(EntiteJuridique).where(EntiteJuridique.finess_ej == "910000001")).one()
+    assert eg.entite_juridique_id == ej.id
+    assert session.exec(select(Pole).where(Pole.entite_geo_id == eg.id)).one().identifier == "910000002-POLE"
+    uh = session.exec(select(UniteHebergement).where(UniteHebergement.identifier == "UH-UF1")).one()
+    lit = session.exec(select(Lit).where(Lit.identifier == "LIT11")).one()
+    assert session.get(Chambre, lit.chambre_id).unite_hebergement_id == uh.id
+    # Les écouteurs d'index restent actifs pendant l'import en masse
+    row = session.exec(
+        select(LocationIndex).where(LocationIndex.model == "Lit").where(LocationIndex.entity_id == lit.id)
+    ).one()
+    assert row.depth == 7
+
+
+def test_bulk_reimport_reports_unchanged_and_updated(session: Session):
+    ght = _ght(session)
+    import_mfn(_message(), session, ght)
+
+    summary = import_mfn(_message(), session, ght)
+    assert sum(summary["created"].values()) == 0
+    assert sum(summary["updated"].values()) == 0
+    assert summary["unchanged"]["lit"] == 4
+
+    summary = import_mfn(_message(bed_label="Lit rénové"), session, ght, chunk_size=3)
+    assert summary["updated"]["lit"] == 4
+    assert summary["unchanged"]["chambre"] == 2
+    assert session.exec(select(Lit).where(Lit.identifier == "LIT00")).one().name == "Lit rénové 00"
+    assert len(session.exec(select(Service).where(Service.identifier == "SRV1")).all()) == 1
@@ -0,0 +1,96 @@
+"""
+Tests du rechargement différentiel des serveurs MLLP (drainage des connexions en cours)
+"""
+import asyncio
+import socket
+
+import pytest
+from sqlmodel import Session
+
+from app.db_session_factory import session_factory
+from app.models_shared import SystemEndpoint
+from app.services.mllp import open_connections, send_mllp
+from app.services.mllp_manager import MLLPManager
+
+MESSAGE = "MSH|^~\\&|A|B|C|D|20240101||ADT^A01|1|P|2.5"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _endpoint(session: Session, name: str) -> SystemEndpoint:
+    endpoint = SystemEndpoint(name=name, kind="MLLP", role="receiver", host="127.0.0.1", port=_free_port())
+    session.add(endpoint)
+    session.commit()
+    return endpoint
+
+
+@pytest.mark.asyncio
+async def test_reload_restarts_only_changed_endpoint_and_drains_connections(session: Session):
+    kept, changed = _endpoint(session, "MLLP-KEPT"), _endpoint(session, "MLLP-OLD")
+    release = asyncio.Event()
+
+    async def _on_message(message, s, ep):
+        if ep.name == "MLLP-OLD":
+            await release.wait()
+        return f"MSH|^~\\&|{ep.name}\rMSA|AA|1"
+
+    manager = MLLPManager(session_factory, _on_message, drain_timeout=5)
+    try:
+        await manager.reload_all(session)
+        servers = dict(manager.servers)
+        in_flight = asyncio.create_task(send_mllp("127.0.0.1", changed.port, MESSAGE))
+        while not open_connections(servers[changed.id]):
+            await asyncio.sleep(0.01)
+
+        changed.name = "MLLP-NEW"
+        session.add(changed)
+        session.commit()
+        await manager.reload_all(session)
+
+        assert manager.servers[kept.id] is servers[kept.id]
+        assert manager.servers[changed.id] is not servers[changed.id]
+        assert "MLLP-NEW" in await send_mllp("127.0.0.1", changed.port, MESSAGE)
+        # La connexion acceptée avant le rechargement reçoit son ACK de l'ancienne configuration
+        release.set()
+        assert "|MLLP-OLD\r" in await in_flight
+    finally:
+        await manager.stop_all()
+
+
+@pytest.mark.asyncio
+async def test_reload_moves_address_and_stops_removed_endpoint_after_drain_timeout(session: Session):
+    moved, removed = _endpoint(session, "MLLP-MOVED"), _endpoint(session, "MLLP-REMOVED")
+    old_port = moved.port
+    stuck = asyncio.Event()
+
+    async def _on_message(message, s, ep):
+        if ep.name == "MLLP-REMOVED":
+            await stuck.wait()
+        return f"MSH|^~\\&|{ep.name}\rMSA|AA|1"
+
+    manager = MLLPManager(session_factory, _on_message, drain_timeout=0.2)
+    try:
+        await manager.reload_all(session)
+        blocked = asyncio.create_task(send_mllp("127.0.0.1", removed.port, MESSAGE, timeout=5))
+        while not open_connections(manager.servers[removed.id]):
+            await asyncio.sleep(0.01)
+
+        moved.port = _free_port()
+        removed.is_enabled = False
+        session.add(moved)
+        session.add(removed)
+        session.commit()
+        await manager.reload_all(session)
+
+        assert manager.running_ids() == [moved.id]
+        assert "MLLP-MOVED" in await send_mllp("127.0.0.1", moved.port, MESSAGE)
+        with pytest.raises(OSError):
+            await send_mllp("127.0.0.1", old_port, MESSAGE)
+        # Connexion bloquée au-delà du délai de drainage : interrompue sans ACK
+        assert await blocked == ""
+    finally:
+        await manager.stop_all()
@@ -0,0 +1,130 @@
+"""
+Tests de la recherche patient PDQ/PDQm (accents, phonétique, trigrammes, pagination)
+"""
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.models import Patient, PatientNameTrigram
+from app.services.pix_pdq_manager import PIXPDQManager
+from app.services.patient_search import normalize_name, phonetic_fr, search_patients
+
+
+def _add_patients(session: Session, names):
+    patients = [Patient(family=f, given=g, birth_date="19800101") for f, g in names]
+    session.add_all(patients)
+    session.commit()
+    return patients
+
+
+def test_normalize_and_phonetic():
+    assert normalize_name("  Lefèvre-Dupré ") == "LEFEVRE DUPRE"
+    assert normalize_name("Œdipe") == "OEDIPE"
+    assert phonetic_fr("Dupont") == phonetic_fr("Dupond") == phonetic_fr("DUPON")
+    assert phonetic_fr("Philippe") == phonetic_fr("Filipe")
+    assert phonetic_fr("Thomas") == phonetic_fr("Tomas")
+    assert phonetic_fr("Gérard") == phonetic_fr("Jerard")
+
+
+def test_search_columns_maintained_on_insert_and_update(session: Session):
+    (patient,) = _add_patients(session, [("Hélène", "Zoé")])
+    assert patient.family_norm == "HELENE"
+    assert patient.given_norm == "ZOE"
+    grams = session.exec(select(PatientNameTrigram).where(PatientNameTrigram.patient_id == patient.id)).all()
+    assert {g.field for g in grams} == {"F", "G"}
+
+    patient.family = "Éloïse"
+    session.add(patient)
+    session.commit()
+    assert patient.family_norm == "ELOISE"
+    grams = session.exec(
+        select(PatientNameTrigram.trigram)
+        .where(PatientNameTrigram.patient_id == patient.id)
+        .where(PatientNameTrigram.field == "F")
+    ).all()
+    assert "ELO" in grams and "HEL" not in grams
+
+
+def test_ranked_fuzzy_search(session: Session):
+    _add_patients(session, [("Dupont", "Jean"), ("Dupond", "Jean"), ("Lefebvre", "Anne"), ("Martin", "Paul")])
+
+    result = search_patients(session, family="DUPONT")
+    families = [m.patient.family for m in result.matches]
+    assert families[0] == "Dupont"
+    assert "Dupond" in families
+    assert "Martin" not in families
+    assert result.matches[0].score == 1.0
+    assert result.matches[0].score > result.matches[1].score
+
+    # Insensible aux accents
+    result = search_patients(session, family="lefèbvre")
+    assert [m.patient.family for m in result.matches] == ["Lefebvre"]
+
+    # Faute de frappe rattrapée par les trigrammes
+    result = search_patients(session, family="Lefebre")
+    assert [m.patient.family for m in result.matches] == ["Lefebvre"]
+
+
+def test_pdq_paging_with_continuation_pointer(client: TestClient, session: Session):
+    _add_patients(session, [("Moreau", f"P{i}") for i in range(5)])
+    now = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    base = (
+        f"MSH|^~\\&|CLIENT|HOPITAL|SERVEUR|DOMAINE|{now}||QBP^Q22^QBP_Q21|{now}|P|2.5\r"
+        f"QPD|IHE PDQ Query|Q300|@PID.5.1^MOREAU\r"
+        f"RCP|I|2^RD\r"
+    )
+
+    response = client.post("/ihe/pdq/query", content=base)
+    assert response.status_code == 200
+    assert "QAK|Q300|OK||5|2|3" in response.text
+    assert response.text.count("PID|") == 2
+    assert "QRI|1.0|NA|" in response.text
+    assert "DSC|2|I" in response.text
+
+    response = client.post("/ihe/pdq/query", content=base + "DSC|4|I\r")
+    assert response.text.count("PID|") == 1
+    assert "DSC|" not in response.text
+
+
+def test_pdq_query_tag_alone_is_not_a_criterion(session: Session):
+    _add_patients(session, [("Moreau", "Tag")])
+    msg = (
+        "MSH|^~\\&|CLIENT|HOPITAL|SERVEUR|DOMAINE|20240101120000||QBP^Q22^QBP_Q21|TAG1|P|2.5\r"
+        "QPD|IHE PDQ Query|Q301\r"
+    )
+    success, error, result, query_tag = PIXPDQManager().handle_pdq_query(msg, session)
+    assert (success, error, result, query_tag) == (False, "No search criteria in QPD", None, "Q301")
+
+
+def test_pdqm_scores_and_next_link(client: TestClient, session: Session):
+    _add_patients(session, [("Bernard", "Luc"), ("Bénard", "Luc"), ("Bernardi", "Luc")])
+
+    response = client.get("/ihe/pdqm/Patient", params={"family": "Bernard", "_count": 2})
+    assert response.status_code == 200
+    bundle = response.json()
+    assert bundle["total"] == 3
+    assert len(bundle["entry"]) == 2
+    scores = [e["search"]["score"] for e in bundle["entry"]]
+    assert scores == sorted(scores, reverse=True)
+    assert bundle["entry"][0]["resource"]["name"][0]["family"] == "Bernard"
+    next_link = next(l["url"] for l in bundle["link"] if l["relation"] == "next")
+    assert "_offset=2" in next_link
+
+    response = client.get("/ihe/pdqm/Patient", params={"family": "Bernard", "_count": 2, "_offset": 2})
+    bundle = response.json()
+    assert len(bundle["entry"]) == 1
+    assert all(l["relation"] != "next" for l in bundle["link"])
+
+
+def test_candidate_cap_keeps_best_ranked(session: Session, monkeypatch):
+    import app.services.patient_search as patient_search
+
+    # Correspondances phonétiques (ids les plus anciens) puis la correspondance exacte
+    _add_patients(session, [("Dupond", f"P{i}") for i in range(4)] + [("Dupont", "Exact")])
+    monkeypatch.setattr(patient_search, "MAX_CANDIDATES", 2)
+
+    result = search_patients(session, family="DUPONT", count=1)
+    assert result.matches[0].patient.given == "Exact"
+    assert result.total == 5 and result.next_offset == 1
+    assert search_patients(session, family="DUPONT", offset=5).next_offset is None
@@ -0,0 +1,51 @@
+"""
+Tests du démarrage à froid (budget de temps, imports différés) et des routes chargées à la demande
+"""
+import importlib.util
+import os
+from pathlib import Path
+
+from app.utils.lazy_routes import LazyRoutes
+
+_spec = importlib.util.spec_from_file_location(
+    "import_time_report", Path(__file__).resolve().parents[1] / "tools" / "import_time_report.py"
+)
+import_time_report = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(import_time_report)
+
+# Référence mesurée (1 cœur, sous -X importtime) : 2,8 à 3,5 s, meilleur de 3 essais ≈ 2,8 s.
+# Budget = référence + ~40 % de marge, sur le meilleur de 3 essais (bruit d'ordonnancement) ;
+# les imports différés sont vérifiés à part. Machine plus lente : COLD_START_BUDGET_MS.
+COLD_START_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "4000"))
+COLD_START_RUNS = 3
+DEFERRED = ("sqladmin", "markdown", "app.admin_views", "app.routers.ght", "app.routers.namespaces", "app.routers.documentation")
+
+
+def test_cold_start_within_budget_without_deferred_imports():
+    report = min((import_time_report.measure() for _ in range(COLD_START_RUNS)), key=lambda r: r["cold_start_ms"])
+
+    modules = {entry["module"] for entry in report["modules"]}
+    assert "app.app" in modules and "app.routers.structure" in modules
+    assert [name for name in DEFERRED if name in modules] == []
+    assert report["cold_start_ms"] < COLD_START_BUDGET_MS, f"Démarrage à froid : {report['cold_start_ms']:.0f} ms"
+
+    trace = "import time:       120 |        450 |   app.db\nimport time: self [us] | cumulative | imported package"
+    assert import_time_report.parse_importtime(trace) == [
+        {"module": "app.db", "self_us": 120, "cumulative_us": 450, "depth": 1}
+    ]
+
+
+def test_lazy_routes_are_loaded_on_first_request(client):
+    routes = client.app.router.routes
+    placeholder = next(r for r in routes if isinstance(r, LazyRoutes) and r.path_prefix == "/documentation")
+    position = routes.index(placeholder)
+
+    response = client.get("/documentation/")
+    assert response.status_code == 200
+    assert placeholder not in routes and placeholder.loaded
+    assert routes[position].path.startswith("/documentation")
+    assert "/documentation/" in client.app.openapi()["paths"]
+
+    # Préfixe /admin/ght déjà chargé par la fixture (sélection du contexte GHT)
+    assert not any(isinstance(r, LazyRoutes) and r.path_prefix == "/admin/ght" for r in routes)
+    assert client.get("/admin/ght/").status_code == 200
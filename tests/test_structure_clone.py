@@ -0,0 +1,110 @@
+"""
+Tests du clonage ensembliste de structure d'EJ (service et tâche de fond)
+"""
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from app.models_structure import (
+    Chambre, EntiteGeographique, Lit, LocationIndex, Pole, Service, StructureChange,
+    UniteFonctionnelle, UniteHebergement,
+)
+from app.models_structure_fhir import EntiteJuridique, GHTContext
+from app.routers.ght import clone_job_status
+from app.services.structure_clone import clone_ej_structure, start_clone_job, wait_clone_job
+
+
+def _build_ej(session: Session) -> EntiteJuridique:
+    ght = GHTContext(name="GHT Clone", code="CLONE")
+    session.add(ght)
+    session.flush()
+    ej = EntiteJuridique(name="EJ Source", finess_ej="920000001", short_name="SRC", ght_context_id=ght.id)
+    session.add(ej)
+    session.flush()
+    eg = EntiteGeographique(identifier="EG-CLN", name="Site", finess="920000002", entite_juridique_id=ej.id)
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-CLN", name="Pôle", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    service = Service(identifier="SRV-CLN", name="Médecine", physical_type="wi", service_type="mco", pole_id=pole.id)
+    session.add(service)
+    session.flush()
+    uf = UniteFonctionnelle(identifier="UF-CLN", name="UF", physical_type="area", service_id=service.id)
+    session.add(uf)
+    session.flush()
+    uh = UniteHebergement(identifier="UH-CLN", name="Aile", physical_type="wi", unite_fonctionnelle_id=uf.id)
+    session.add(uh)
+    session.flush()
+    for r in range(2):
+        chambre = Chambre(identifier=f"CH-CLN-{r}", name=f"Chambre {r}", physical_type="ro", unite_hebergement_id=uh.id)
+        session.add(chambre)
+        session.flush()
+        session.add_all([
+            Lit(identifier=f"LIT-CLN-{r}{b}", name=f"Lit {r}{b}", physical_type="bd", chambre_id=chambre.id)
+            for b in range(3)
+        ])
+    session.commit()
+    return ej
+
+
+def test_clone_copies_subtree_level_by_level(session: Session):
+    source = _build_ej(session)
+    calls = []
+    result = clone_ej_structure(session, source, "EJ Clone", "920000099",
+                                progress=lambda level, done, total: calls.append((level, done, total)))
+
+    assert result["counts"] == {"eg": 1, "pole": 1, "service": 1, "uf": 1, "uh": 1, "chambre": 2, "lit": 6}
+    # Un lot par niveau : pas de flush par entité
+    assert [level for level, _, _ in calls] == ["eg", "pole", "service", "uf", "uh", "chambre", "lit"]
+    assert calls[-1][1:] == (13, 13)
+
+    new_ej = session.get(EntiteJuridique, result["ej_id"])
+    assert new_ej.description == "Clone de EJ Source" and new_ej.siren is None
+    eg = session.exec(select(EntiteGeographique).where(EntiteGeographique.identifier == "EG-CLN_clone")).one()
+    assert eg.entite_juridique_id == new_ej.id and eg.finess == "CLN000002"
+    lit = session.exec(select(Lit).where(Lit.identifier == "LIT-CLN-12_clone")).one()
+    chambre = session.get(Chambre, lit.chambre_id)
+    assert chambre.identifier == "CH-CLN-1_clone"
+    uh = session.get(UniteHebergement, chambre.unite_hebergement_id)
+    assert uh.identifier == "UH-CLN_clone"
+    # Index des lieux et journal alimentés par les écouteurs, par lots
+    row = session.exec(select(LocationIndex).where(LocationIndex.model == "Lit").where(LocationIndex.entity_id == lit.id)).one()
+    assert row.depth == 7
+    assert session.exec(
+        select(StructureChange).where(StructureChange.model == "Lit").where(StructureChange.entity_id == lit.id)
+    ).one().op == "insert"
+
+    # Deuxième clone : identifiants libres suivants
+    clone_ej_structure(session, source, "EJ Clone 2", "920000098", emit=False)
+    assert session.exec(select(Lit).where(Lit.identifier == "LIT-CLN-00_clone2")).one()
+
+
+@pytest.mark.asyncio
+async def test_clone_job_runs_in_background_with_progress(session: Session):
+    source = _build_ej(session)
+    job = start_clone_job(source.id, "EJ Clone Job", "920000097")
+    assert job.status in ("pending", "running")
+
+    job = await wait_clone_job(job.id)
+    status = job.to_dict()
+    assert status["status"] == "done", status["error"]
+    assert status["percent"] == 100.0
+    assert status["result"]["counts"]["lit"] == 6
+    session.expire_all()
+    assert session.get(EntiteJuridique, status["result"]["ej_id"]).name == "EJ Clone Job"
+
+    failed = await wait_clone_job(start_clone_job(999999, "X", "920000096").id)
+    assert failed.status == "error"
+
+
+@pytest.mark.asyncio
+async def test_clone_job_status_is_scoped_to_its_context(session: Session):
+    source = _build_ej(session)
+    job = start_clone_job(source.id, "EJ Clone Ctx", "920000094", emit=False, context_id=source.ght_context_id)
+    await wait_clone_job(job.id)
+
+    assert (await clone_job_status(source.ght_context_id, job.id))["status"] == "done"
+    with pytest.raises(HTTPException) as exc:
+        await clone_job_status(source.ght_context_id + 1, job.id)
+    assert exc.value.status_code == 404
@@ -0,0 +1,114 @@
+"""
+Tests de l'émission coalescée des structures (fenêtre de debounce, Bundle unique, MFN delta/snapshot)
+"""
+import asyncio
+import json
+
+import pytest
+from sqlmodel import Session, select
+
+from app.models_shared import MessageLog, SystemEndpoint
+from app.models_structure import Pole, Service
+from app.models_structure_fhir import EntiteGeographique
+from app.services.structure_emission_coalescer import StructureEmissionCoalescer, structure_emitter
+from app.services.structure_emit import emit_structure_batch
+
+
+@pytest.mark.asyncio
+async def test_coalescer_merges_changes_within_window():
+    batches = []
+
+    async def _emitter(changes):
+        batches.append(sorted(changes))
+        return {"fhir_entries": len(changes), "mfn_messages": 1}
+
+    emitter = StructureEmissionCoalescer(window=0.05, max_delay=1.0, emitter=_emitter)
+    emitter.add_many([("Service", 1, "insert", {}), ("Service", 2, "insert", {})])
+    emitter.add("Service", 1, "update")
+    emitter.add_many([("Service", 2, "delete", {"identifier": "SRV-2"}), ("Lit", 7, "update", {})])
+    assert batches == []
+
+    await asyncio.sleep(0.15)
+    assert batches == [[("Lit", 7, "update", {}), ("Service", 1, "insert", {})]]
+    metrics = emitter.metrics()
+    assert metrics["events"] == 5
+    assert metrics["windows"] == 1
+    assert metrics["entities_emitted"] == 2
+    assert metrics["coalesced"] == 3
+    assert metrics["cancelled"] == 1
+
+    # Flux continu : l'émission n'attend pas au-delà de max_delay
+    emitter = StructureEmissionCoalescer(window=0.05, max_delay=0.12, emitter=_emitter)
+    for i in range(8):
+        emitter.add("Lit", i, "update")
+        await asyncio.sleep(0.03)
+    await emitter.drain()
+    assert len(batches) >= 3
+    assert sum(len(b) for b in batches[1:]) == 8
+
+
+@pytest.mark.asyncio
+async def test_batch_emission_single_bundle_and_mfn_modes(session: Session, monkeypatch):
+    async def _ack(host, port, message, timeout=10.0):
+        return "MSH|^~\\&|RCV|RCV|STR|STR|20250101000000||ACK|1|P|2.5\rMSA|AA|1"
+
+    monkeypatch.setattr("app.services.structure_emit.send_mllp", _ack)
+    # Lots émis explicitement : ni les reliquats des tests précédents ni les écouteurs de structure
+    # (enregistrés par d'autres tests) n'émettent vers les endpoints créés ici
+    await structure_emitter.drain()
+    monkeypatch.setattr(structure_emitter, "add_many", lambda changes: None)
+    eg = EntiteGeographique(identifier="EG-COAL", name="Site", finess="750000009")
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-COAL", name="Pôle", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    services = [
+        Service(identifier=f"SRV-COAL-{i}", name=f"Service {i}", physical_type="wi", service_type="mco", pole_id=pole.id)
+        for i in range(3)
+    ]
+    session.add_all(services)
+    fhir = SystemEndpoint(name="COAL-FHIR", kind="FHIR", role="sender")
+    delta = SystemEndpoint(name="COAL-DELTA", kind="MLLP", role="sender", host="127.0.0.1", port=2575,
+                           mfn_emission_mode="delta")
+    snapshot = SystemEndpoint(name="COAL-SNAP", kind="MLLP", role="sender", host="127.0.0.1", port=2576)
+    session.add_all([fhir, delta, snapshot])
+    session.commit()
+
+    def _last_payload(endpoint):
+        return session.exec(
+            select(MessageLog).where(MessageLog.endpoint_id == endpoint.id).order_by(MessageLog.id.desc())
+        ).first().payload
+
+    changes = [("Service", s.id, "update", {}) for s in services[:2]]
+    changes.append(("Service", 999, "delete", {"identifier": "SRV-OLD"}))
+    stats = await emit_structure_batch(changes, session)
+    assert stats == {"fhir_entries": 3, "mfn_messages": 2}
+
+    bundle = json.loads(_last_payload(fhir))
+    assert [e["request"]["method"] for e in bundle["entry"]] == ["PUT", "PUT", "DELETE"]
+    snapshot_mfn = _last_payload(snapshot)
+    assert "MFI|LOC|CPAGE_LOC_FRA|REP" in snapshot_mfn
+    assert "SRV-COAL-2" in snapshot_mfn
+    # Premier envoi delta sans point de synchronisation : snapshot de référence, tous niveaux
+    bootstrap = _last_payload(delta)
+    assert "MFI|LOC|CPAGE_LOC_FRA|REP" in bootstrap
+    assert "MFE|MAD|||^^^^^P^^^^POLE-COAL|PL" in bootstrap
+
+    # Ensuite : seules les modifications journalisées depuis la version acquittée
+    services[0].name = "Service renommé"
+    session.add(services[0])
+    session.delete(services[1])
+    session.commit()
+    stats = await emit_structure_batch(
+        [("Service", services[0].id, "update", {}), ("Service", services[1].id, "delete", {"identifier": "SRV-COAL-1"})],
+        session,
+    )
+    assert stats["mfn_messages"] == 2
+    delta_mfn = _last_payload(delta)
+    assert "MFI|LOC|CPAGE_LOC_FRA|UPD" in delta_mfn
+    assert "MFE|MUP|||^^^^^D^^^^SRV-COAL-0|PL" in delta_mfn
+    assert "LCLSTN^Relation de localisation^L||^^^^^P^^^^POLE-COAL" in delta_mfn
+    assert "MFE|MDL|||^^^^^D^^^^SRV-COAL-1|PL" in delta_mfn
+    assert "SRV-COAL-2" not in delta_mfn
+    assert "MFI|LOC|CPAGE_LOC_FRA|REP" in _last_payload(snapshot)
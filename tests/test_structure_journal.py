@@ -0,0 +1,147 @@
+"""
+Tests du journal des modifications de structure et du MFN delta incrémental
+"""
+from sqlmodel import Session, select
+
+from app.models_endpoints import SystemEndpoint
+from app.models_structure import (
+    Chambre, EntiteGeographique, Lit, Pole, Service, StructureChange,
+    UniteFonctionnelle, UniteHebergement,
+)
+from app.services.mfn_structure import generate_mfn_delta, generate_mfn_full_snapshot
+from app.services.structure_journal import (
+    changes_since, current_version, get_sync_state, prune_journal, record_sent,
+)
+
+
+def _build(session: Session):
+    eg = EntiteGeographique(identifier="EG-JRN", name="Site", finess="750000011")
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-JRN", name="Pôle", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    service = Service(identifier="SRV-JRN", name="Médecine", physical_type="wi", service_type="mco", pole_id=pole.id)
+    session.add(service)
+    session.flush()
+    uf = UniteFonctionnelle(identifier="UF-JRN", name="UF", physical_type="area", service_id=service.id)
+    session.add(uf)
+    session.flush()
+    uh = UniteHebergement(identifier="UH-JRN", name="Aile", physical_type="wi", unite_fonctionnelle_id=uf.id)
+    session.add(uh)
+    session.flush()
+    chambre = Chambre(identifier="CH-JRN", name="Chambre", physical_type="ro", unite_hebergement_id=uh.id)
+    session.add(chambre)
+    session.flush()
+    lit = Lit(identifier="LIT-JRN", name="Lit", physical_type="bd", chambre_id=chambre.id)
+    session.add(lit)
+    session.commit()
+    return uh, chambre, lit
+
+
+def test_journal_records_writes_and_collapses_per_entity(session: Session):
+    start = current_version(session)
+    uh, chambre, lit = _build(session)
+
+    entries, version = changes_since(session, start)
+    assert [(e.model, e.code) for e in entries] == [
+        ("EntiteGeographique", "MAD"), ("Pole", "MAD"), ("Service", "MAD"), ("UniteFonctionnelle", "MAD"),
+        ("UniteHebergement", "MAD"), ("Chambre", "MAD"), ("Lit", "MAD"),
+    ]
+    assert version == current_version(session)
+    assert session.exec(select(StructureChange).where(StructureChange.model == "Lit")).one().entity_version == 1
+
+    # Créée puis supprimée depuis la version : rien ; modifiée : MUP ; supprimée : MDL
+    lit.name = "Lit fenêtre"
+    session.add(lit)
+    extra = Chambre(identifier="CH-TMP", name="Temporaire", physical_type="ro", unite_hebergement_id=uh.id)
+    session.add(extra)
+    session.commit()
+    session.delete(extra)
+    session.commit()
+    old = Lit(identifier="LIT-OLD", name="Ancien", physical_type="bd", chambre_id=chambre.id)
+    session.add(old)
+    session.commit()
+    since = current_version(session)
+    session.delete(old)
+    session.commit()
+
+    entries, _ = changes_since(session, version)
+    assert [(e.model, e.identifier, e.code) for e in entries] == [("Lit", "LIT-JRN", "MUP")]
+
+    mfn, last = generate_mfn_delta(session, version)
+    assert "MFI|LOC|CPAGE_LOC_FRA|UPD" in mfn
+    assert "MFE|MUP|||^^^^^LIT^^^^LIT-JRN|PL" in mfn
+    assert "LCLSTN^Relation de localisation^L||^^^^^CH^^^^CH-JRN" in mfn
+    assert "LIT-OLD" not in mfn and "CH-TMP" not in mfn
+    assert last == current_version(session)
+
+    mfn, _ = generate_mfn_delta(session, since)
+    assert mfn.splitlines()[2:] == ["MFE|MDL|||^^^^^LIT^^^^LIT-OLD|PL", "LOC|^^^^^LIT^^^^LIT-OLD||LIT|"]
+    assert generate_mfn_delta(session, last) == (None, last)
+
+
+def test_full_snapshot_covers_every_level(session: Session):
+    _build(session)
+    mfn = generate_mfn_full_snapshot(session)
+    assert "MFI|LOC|CPAGE_LOC_FRA|REP" in mfn
+    order = [
+        mfn.index(f"MFE|MAD|||^^^^^{loc_type}^^^^{identifier}|PL")
+        for loc_type, identifier in [
+            ("M", "EG-JRN"), ("P", "POLE-JRN"), ("D", "SRV-JRN"), ("UF", "UF-JRN"),
+            ("UH", "UH-JRN"), ("CH", "CH-JRN"), ("LIT", "LIT-JRN"),
+        ]
+    ]
+    assert order == sorted(order)
+    assert "LRL|^^^^^LIT^^^^LIT-JRN|||LCLSTN^Relation de localisation^L||^^^^^CH^^^^CH-JRN" in mfn
+
+
+def test_sync_state_advances_only_on_ack_and_prunes(session: Session):
+    endpoint = SystemEndpoint(name="JRN-MLLP", kind="MLLP", role="sender", mfn_emission_mode="delta")
+    session.add(endpoint)
+    session.commit()
+    _build(session)
+    version = current_version(session)
+
+    state = record_sent(session, endpoint.id, version, acknowledged=False)
+    assert (state.acked_version, state.sent_version) == (0, version)
+    record_sent(session, endpoint.id, version, acknowledged=True)
+    session.commit()
+    assert get_sync_state(session, endpoint.id).acked_version == version
+
+    assert prune_journal(session) >= 7
+    session.commit()
+    assert session.exec(select(StructureChange).where(StructureChange.id <= version)).all() == []
+    # Les versions restent croissantes après purge
+    lit = session.exec(select(Lit).where(Lit.identifier == "LIT-JRN")).one()
+    lit.name = "Lit après purge"
+    session.add(lit)
+    session.commit()
+    assert current_version(session) > version
+
+
+def test_prune_ignores_untracked_endpoints(session: Session):
+    # Aucun endpoint delta : tout le journal est purgé
+    _build(session)
+    assert current_version(session) > 0
+    assert prune_journal(session) > 0
+    session.commit()
+    assert session.exec(select(StructureChange)).all() == []
+
+    # Un endpoint désactivé ne retient plus le journal et perd son point de synchronisation
+    endpoint = SystemEndpoint(name="JRN-OFF", kind="FILE", role="sender", mfn_emission_mode="delta")
+    session.add(endpoint)
+    session.commit()
+    record_sent(session, endpoint.id, 0, acknowledged=True)
+    lit = session.exec(select(Lit).where(Lit.identifier == "LIT-JRN")).one()
+    lit.name = "Lit modifié"
+    session.add(lit)
+    session.commit()
+    assert prune_journal(session) == 0
+
+    endpoint.is_enabled = False
+    session.add(endpoint)
+    session.commit()
+    assert prune_journal(session) == 1
+    session.commit()
+    assert get_sync_state(session, endpoint.id) is None
@@ -0,0 +1,85 @@
+"""
+Tests du balayage des statuts programmés (activation/désactivation) par le scheduler
+"""
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, select
+
+from app.models_structure import (
+    EntiteGeographique, LocationIndex, LocationStatus, Pole, Service, StructureChange, UniteFonctionnelle,
+)
+from app.services.scheduler import BackgroundScheduler
+from app.services.structure_schedule import next_scheduled_change, sweep_scheduled_status
+
+
+def _hl7(value: datetime) -> str:
+    return value.strftime("%Y%m%d%H%M%S")
+
+
+def _index_row(session: Session, model: str, entity_id: int) -> LocationIndex:
+    row = session.exec(
+        select(LocationIndex).where(LocationIndex.model == model).where(LocationIndex.entity_id == entity_id)
+    ).one()
+    session.refresh(row)
+    return row
+
+
+def test_sweeper_flips_due_statuses_in_one_pass(session: Session):
+    now = datetime.utcnow().replace(microsecond=0)
+    eg = EntiteGeographique(identifier="EG-SWP", name="Site", finess="750000012")
+    session.add(eg)
+    session.flush()
+    pole = Pole(identifier="POLE-SWP", name="Pôle", physical_type="area", entite_geo_id=eg.id)
+    session.add(pole)
+    session.flush()
+    service = Service(identifier="SRV-SWP", name="Médecine", physical_type="wi", service_type="mco", pole_id=pole.id)
+    session.add(service)
+    session.flush()
+    # Activation passée mais statut inactif, désactivation passée mais statut actif, échéance future
+    opening = UniteFonctionnelle(identifier="UF-SWP-1", name="UF 1", physical_type="area", service_id=service.id,
+                                 status=LocationStatus.INACTIVE, activation_date=_hl7(now - timedelta(hours=1)))
+    closing = UniteFonctionnelle(identifier="UF-SWP-2", name="UF 2", physical_type="area", service_id=service.id,
+                                 deactivation_date=_hl7(now - timedelta(minutes=5)))
+    later = UniteFonctionnelle(identifier="UF-SWP-3", name="UF 3", physical_type="area", service_id=service.id,
+                               deactivation_date=_hl7(now + timedelta(days=1)))
+    suspended = UniteFonctionnelle(identifier="UF-SWP-4", name="UF 4", physical_type="area", service_id=service.id,
+                                   status=LocationStatus.SUSPENDED, deactivation_date=_hl7(now - timedelta(days=1)))
+    session.add_all([opening, closing, later, suspended])
+    session.commit()
+
+    assert _index_row(session, "UniteFonctionnelle", closing.id).next_status_change <= datetime.utcnow()
+    assert _index_row(session, "UniteFonctionnelle", later.id).next_status_change == now + timedelta(days=1)
+    assert _index_row(session, "UniteFonctionnelle", suspended.id).next_status_change is None
+    journal_before = len(session.exec(select(StructureChange)).all())
+
+    assert sweep_scheduled_status(session) == 2
+    for uf in (opening, closing, later, suspended):
+        session.refresh(uf)
+    assert opening.status == LocationStatus.ACTIVE
+    assert closing.status == LocationStatus.INACTIVE
+    assert later.status == LocationStatus.ACTIVE
+    assert suspended.status == LocationStatus.SUSPENDED
+    assert _index_row(session, "UniteFonctionnelle", opening.id).status == "active"
+    assert _index_row(session, "UniteFonctionnelle", closing.id).next_status_change is None
+    # Les bascules passent par les écouteurs ORM (journal → émissions coalescées)
+    assert len(session.exec(select(StructureChange)).all()) == journal_before + 2
+
+    # Plus rien d'échu : prochaine échéance = désactivation programmée
+    assert sweep_scheduled_status(session) == 0
+    assert next_scheduled_change(session) <= now + timedelta(days=1)
+    assert sweep_scheduled_status(session, now=now + timedelta(days=1, seconds=1)) == 1
+    session.refresh(later)
+    assert later.status == LocationStatus.INACTIVE
+
+
+def test_scheduler_sleeps_until_next_transition(session: Session):
+    soon = datetime.utcnow().replace(microsecond=0) + timedelta(minutes=10)
+    eg = EntiteGeographique(identifier="EG-SWP-NEXT", name="Site", finess="750000013")
+    session.add(eg)
+    session.flush()
+    session.add(Pole(identifier="POLE-SWP-NEXT", name="Pôle", physical_type="area", entite_geo_id=eg.id,
+                     activation_date=_hl7(soon)))
+    session.commit()
+
+    next_due = BackgroundScheduler()._apply_scheduled_transitions()
+    assert next_due is not None and next_due <= soon
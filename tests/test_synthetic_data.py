@@ -0,0 +1,70 @@
+"""
+Tests du générateur de données synthétiques (jeu reproductible, chargement groupé, flux ADT)
+"""
+import pytest
+from sqlmodel import Session, func, select
+
+from app.models import Mouvement, Patient
+from app.models_endpoints import SystemEndpoint
+from app.models_identifiers import Identifier
+from app.models_structure import BedOccupancy, Lit
+from app.services.bed_occupancy import rebuild_bed_occupancy
+from app.services.patient_search import search_patients
+from app.services.synthetic_data import (
+    SyntheticConfig, build_adt_workload, build_dataset, iter_adt_messages, load_dataset,
+)
+from app.services.transport_inbound import on_message_inbound
+
+
+def _occupancy(session: Session):
+    return sorted(
+        (row.lit_id, row.venue_id, row.occupancy)
+        for row in session.exec(select(BedOccupancy).where(BedOccupancy.occupancy != "free")).all()
+    )
+
+
+def test_dataset_is_reproducible_and_loads_consistently(session: Session):
+    config = SyntheticConfig(seed=7, prefix="TSY", beds=30, patients=40, stays_per_patient=2, in_house_ratio=0.25)
+    dataset = build_dataset(config)
+    assert list(iter_adt_messages(build_dataset(config))) == list(iter_adt_messages(dataset))
+    assert build_dataset(SyntheticConfig(seed=8, prefix="TSY", beds=30, patients=40)).patients != dataset.patients
+
+    counts = load_dataset(session, dataset)
+    assert counts["patient"] == 40 and counts["dossier"] == 80 and counts["lit"] == 30
+    assert counts["mouvement"] == counts["messagelog"] == dataset.movement_count
+    assert counts["identifier"] == 40 + 2 * 80 + dataset.movement_count
+    assert session.exec(select(func.count()).select_from(Lit)).one() == 30
+
+    # Colonnes de recherche renseignées malgré les INSERT groupés
+    family = dataset.patients[0][0]
+    assert search_patients(session, family=family).total >= 1
+    # 20 séjours en cours : autant de lits occupés, identiques au rejeu complet des mouvements
+    occupied = _occupancy(session)
+    assert len(occupied) == 20
+    rebuild_bed_occupancy(session)
+    assert _occupancy(session) == occupied
+
+
+@pytest.mark.asyncio
+async def test_adt_workload_is_accepted_by_inbound_pam(session: Session):
+    config = SyntheticConfig(seed=3, prefix="TSA", beds=10, patients=6, in_house_ratio=0.0)
+    load_dataset(session, build_dataset(SyntheticConfig(seed=3, prefix="TSA", beds=10, patients=0)))
+    endpoint = SystemEndpoint(name="SYN-IN", kind="MLLP", role="receiver")
+    session.add(endpoint)
+    session.commit()
+
+    dataset = build_dataset(config)
+    streams = build_adt_workload(dataset, streams=2, cancel_ratio=0.5, merge_ratio=0.5)
+    messages = [message for stream in streams for message in stream]
+    triggers = [message.split("|")[8].split("^")[1] for message in messages]
+    assert {"A01", "A02", "A03", "A12", "A13", "A40"} <= set(triggers)
+    # Mouvements du jeu de données (numéros 1..n), complétés par les annulations et fusions
+    base = [m for m in messages if int(m.split("|")[9][len("TSAM"):]) <= dataset.movement_count]
+    assert sorted(base) == sorted(iter_adt_messages(dataset))
+
+    for message in messages:
+        ack = await on_message_inbound(message, session, endpoint)
+        assert "MSA|AA|" in ack, ack
+    assert session.exec(select(func.count()).select_from(Mouvement)).one() >= dataset.movement_count
+    ipp = session.exec(select(Identifier).where(Identifier.value == "TSAP00000001")).first()
+    assert ipp is not None and session.get(Patient, ipp.patient_id).family
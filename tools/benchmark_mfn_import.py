@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Mesure du temps d'import MFN^M05 sur une structure générée (base SQLite temporaire).
+
+Génère un message MFN (EJ → EG → Services → UF → Chambres → Lits), puis chronomètre :
+- l'import initial (créations),
+- le ré-import du même message (tout inchangé),
+- le ré-import avec libellés de lits modifiés (mises à jour).
+
+Usage:
+    python tools/benchmark_mfn_import.py --beds 20000
+    python tools/benchmark_mfn_import.py --beds 20000 --chunk-size 2000
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ajouter le répertoire racine au path pour importer les modules app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import db  # noqa: F401 - enregistre les modèles (create_all) et les écouteurs de session
+from app.models_structure_fhir import GHTContext
+from app.services.mfn_importer import import_mfn
+
+
+def _entity(type_code: str, code: str, label: str, parent=None) -> list:
+    comp = f"^^^^^{type_code}^^^^{code}&CPAGE&BENCH&FINEJ"
+    lines = [
+        f"MFE|MAD|||{comp}|PL",
+        f"LOC|{comp}||{type_code}|{label}",
+        f"LCH|{comp}|||ID_GLBL^Identifiant unique global^L|^{code}",
+        f"LCH|{comp}|||CD^Code^L|^{code}",
+        f"LCH|{comp}|||LBL^Libelle^L|^{label}",
+    ]
+    if type_code == "M":
+        lines.append(f"LCH|{comp}|||FNS^Code FINESS^L|^{code}")
+    if parent:
+        relation = "ETBLSMNT" if type_code == "ETBL_GRPQ" else "LCLSTN"
+        p_type, p_code = parent
+        lines.append(
+            f"LRL|{comp}|||{relation}^Relation^L||^^^^^{p_type}^^^^{p_code}&CPAGE&BENCH&FINEJ"
+        )
+    return lines
+
+
+def generate_mfn_structure(
+    beds: int,
+    beds_per_room: int = 2,
+    rooms_per_uf: int = 20,
+    ufs_per_service: int = 4,
+    bed_label: str = "Lit",
+) -> str:
+    """Message MFN^M05 d'une structure d'environ `beds` lits."""
+    lines = [
+        "MSH|^~\\&|STR|STR|RECEPTEUR|RECEPTEUR|20250101000000||MFN^M05^MFN_M05|BENCH|P|2.5|||||FRA|8859/15",
+        "MFI|LOC|CPAGE_LOC_FRA|REP||20250101000000|AL",
+    ]
+    lines += _entity("M", "900000001", "EJ Bench")
+    lines += _entity("ETBL_GRPQ", "900000002", "EG Bench", ("M", "900000001"))
+    rooms = -(-beds // beds_per_room)
+    ufs = -(-rooms // rooms_per_uf)
+    services = -(-ufs // ufs_per_service)
+    bed = room = 0
+    for s in range(services):
+        srv = f"SRV{s:04d}"
+        lines += _entity("D", srv, f"Service {s}", ("ETBL_GRPQ", "900000002"))
+        for u in range(ufs_per_service):
+            uf = f"{srv}UF{u}"
+            lines += _entity("N", uf, f"UF {s}.{u}", ("D", srv))
+            for _ in range(rooms_per_uf):
+                if room >= rooms:
+                    break
+                ch = f"CH{room:06d}"
+                lines += _entity("R", ch, f"Chambre {room}", ("N", uf))
+                room += 1
+                for _ in range(beds_per_room):
+                    if bed >= beds:
+                        break
+                    lines += _entity("B", f"LIT{bed:06d}", f"{bed_label} {bed}", ("R", ch))
+                    bed += 1
+    return "\r".join(lines) + "\r"
+
+
+def _timed(label: str, fn):
+    start = time.perf_counter()
+    summary = fn()
+    elapsed = time.perf_counter() - start
+    totals = {status: sum(counts.values()) for status, counts in summary.items()}
+    print(f"{label:<28} {elapsed:8.2f} s  {totals}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'import MFN^M05")
+    parser.add_argument("--beds", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=None, help="Commit tous les N entités d'un niveau")
+    args = parser.parse_args()
+
+    message = generate_mfn_structure(args.beds)
+    renamed = generate_mfn_structure(args.beds, bed_label="Lit renommé")
+    print(f"Message généré: {len(message.splitlines())} lignes, {args.beds} lits")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            ght = GHTContext(name="GHT Bench", code="BENCH")
+            session.add(ght)
+            session.commit()
+            session.refresh(ght)
+            _timed("Import initial", lambda: import_mfn(message, session, ght, chunk_size=args.chunk_size))
+            _timed("Ré-import (inchangé)", lambda: import_mfn(message, session, ght, chunk_size=args.chunk_size))
+            _timed("Ré-import (lits renommés)", lambda: import_mfn(renamed, session, ght, chunk_size=args.chunk_size))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
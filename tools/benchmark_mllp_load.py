@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Banc de charge de bout en bout : ingestion MLLP (PAM entrant) et émission vers un récepteur.
+
+Dans un répertoire de travail temporaire (base `poc.db` neuve) :
+- charge la structure synthétique (mêmes codes d'UF/lits que les messages) ;
+- démarre l'écouteur MLLP de l'application (`MLLPManager` + `on_message_inbound`) et un
+  récepteur local qui acquitte (AA) les messages émis par l'application (endpoint "sender") ;
+- envoie un flux ADT synthétique (admissions, transferts, sorties, annulations, fusions)
+  sur `--concurrency` connexions parallèles, un patient restant sur la même file ;
+- mesure : messages/s, latence d'ACK (p50/p95/p99, par événement), croissance de la base,
+  délai d'émission (ACK entrant → réception par le récepteur du message émis pour le patient ;
+  les messages émis sans PID, ex. Z99, sont comptés dans `emission.unmatched`).
+
+Le rapport JSON (`--report`) est comparable d'un commit à l'autre (`--compare ancien.json`).
+
+Usage:
+    python tools/benchmark_mllp_load.py --patients 500 --concurrency 8
+    python tools/benchmark_mllp_load.py --patients 2000 --concurrency 16 --cancel-ratio 0.1 --merge-ratio 0.02 \\
+        --report bench.json --compare bench_main.json
+    python tools/benchmark_mllp_load.py --patients 500 --no-emission
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+# Ajouter le répertoire racine au path pour importer les modules app
+sys.path.insert(0, str(ROOT))
+
+# Métriques comparées par --compare : (chemin dans le rapport, plus grand = mieux)
+COMPARED = [
+    (("throughput_msg_s",), True),
+    (("ack_latency_ms", "p50"), False),
+    (("ack_latency_ms", "p95"), False),
+    (("ack_latency_ms", "p99"), False),
+    (("db", "bytes_per_message"), False),
+    (("emission", "lag_ms", "p95"), False),
+    (("emission", "drain_s"), False),
+]
+
+
+def percentiles(values) -> dict:
+    """p50/p95/p99/max/moyenne (rang le plus proche) d'une liste de mesures."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "p50": round(rank(50), 3),
+        "p95": round(rank(95), 3),
+        "p99": round(rank(99), 3),
+        "max": round(ordered[-1], 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def _db_size(workdir: Path) -> int:
+    return sum(p.stat().st_size for p in workdir.glob("poc.db*"))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _pid3_values(message: str) -> list:
+    """Valeurs CX-1 de PID-3 (identifiants patient) d'un message HL7."""
+    for segment in message.split("\r"):
+        if segment.startswith("PID|"):
+            fields = segment.split("|")
+            return [rep.split("^")[0] for rep in fields[3].split("~")] if len(fields) > 3 else []
+    return []
+
+
+class StandInReceiver:
+    """Récepteur MLLP local : acquitte AA et horodate les messages émis par l'application."""
+
+    def __init__(self):
+        self.received = []  # (instant, valeurs PID-3)
+        self.server = None
+
+    async def start(self) -> int:
+        from app.services.mllp import build_ack, deframe_hl7, frame_hl7
+
+        async def handle(reader, writer):
+            try:
+                data = await reader.read(65536)
+                for message in deframe_hl7(data):
+                    self.received.append((time.perf_counter(), _pid3_values(message)))
+                    writer.write(frame_hl7(build_ack(message, "AA")))
+                await writer.drain()
+            finally:
+                writer.close()
+
+        self.server = await asyncio.start_server(handle, host="127.0.0.1", port=0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def _send_stream(port: int, messages, results: list, acked: dict) -> None:
+    """Envoie une file dans l'ordre (une connexion par message, comme `send_mllp`).
+
+    `acked` : identifiant patient → [(envoi, ACK reçu)] pour le calcul du délai d'émission.
+    """
+    from app.services.mllp import send_mllp
+
+    for message in messages:
+        trigger = message.split("|")[8].split("^")[1]
+        started = time.perf_counter()
+        try:
+            ack = await send_mllp("127.0.0.1", port, message)
+            code = ack.split("MSA|")[1][:2] if "MSA|" in ack else "??"
+        except Exception as exc:  # noqa: BLE001 - compté comme erreur de transport
+            code = f"ERR:{type(exc).__name__}"
+        finished = time.perf_counter()
+        results.append((trigger, code, (finished - started) * 1000))
+        for value in _pid3_values(message):
+            acked.setdefault(value, []).append((started, finished))
+
+
+async def run(args) -> dict:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="bench_mllp_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)  # app.db utilise ./poc.db : base neuve dans le répertoire de travail
+
+    from sqlmodel import Session, func, select
+
+    from app.db import engine, init_db
+    from app.db_session_factory import session_factory
+    from app.models import Dossier, Mouvement, Patient
+    from app.models_endpoints import MessageLog, SystemEndpoint
+    from app.models_identifiers import Identifier
+    from app.services.entity_events import register_entity_events
+    from app.services.mllp_manager import MLLPManager
+    from app.services.synthetic_data import SyntheticConfig, build_adt_workload, build_dataset, load_dataset
+    from app.services.transport_inbound import on_message_inbound
+
+    init_db()
+    config = SyntheticConfig(
+        seed=args.seed, prefix=args.prefix, beds=args.beds, patients=args.patients,
+        max_transfers=args.max_transfers, in_house_ratio=args.in_house_ratio,
+    )
+    with Session(engine) as session:
+        load_dataset(session, build_dataset(replace(config, patients=0)))  # structure seule
+    streams = build_adt_workload(build_dataset(config), streams=args.concurrency,
+                                 cancel_ratio=args.cancel_ratio, merge_ratio=args.merge_ratio)
+    total = sum(len(s) for s in streams)
+
+    receiver = StandInReceiver()
+    receiver_port = await receiver.start()
+    with Session(engine) as session:
+        inbound = SystemEndpoint(name="BENCH-IN", kind="MLLP", role="receiver", host="127.0.0.1",
+                                 port=args.port or _free_port())
+        session.add(inbound)
+        if not args.no_emission:
+            session.add(SystemEndpoint(name="BENCH-OUT", kind="MLLP", role="sender", host="127.0.0.1",
+                                       port=receiver_port))
+        session.commit()
+        session.refresh(inbound)
+        manager = MLLPManager(session_factory=session_factory, on_message=on_message_inbound)
+        await manager.start_endpoint(inbound)
+        port = inbound.port
+    if not args.no_emission:
+        register_entity_events()
+
+    size_before = _db_size(workdir)
+    results: list = []
+    acked: dict = {}
+    print(f"🚀 {total} messages sur {len(streams)} connexions (récepteur :{receiver_port}, écoute :{port})")
+    started = time.perf_counter()
+    await asyncio.gather(*(_send_stream(port, stream, results, acked) for stream in streams))
+    elapsed = time.perf_counter() - started
+    last_ack = max((done for sends in acked.values() for _, done in sends), default=started)
+
+    # Attente de la fin des émissions : plus rien reçu pendant --drain-idle secondes
+    if not args.no_emission:
+        deadline = time.perf_counter() + args.drain_timeout
+        seen = -1
+        while time.perf_counter() < deadline and seen != len(receiver.received):
+            seen = len(receiver.received)
+            await asyncio.sleep(args.drain_idle)
+    await manager.stop_all()
+    await receiver.stop()
+
+    # Délai d'émission : réception - ACK du dernier message entrant du patient envoyé avant la
+    # réception (négatif si l'émission arrive avant que le client ait reçu l'ACK)
+    lags = []
+    for arrived, values in receiver.received:
+        sends = [send for v in values for send in acked.get(v, ()) if send[0] <= arrived]
+        if sends:
+            lags.append((arrived - max(sends)[1]) * 1000)
+
+    codes = defaultdict(int)
+    by_trigger = defaultdict(list)
+    for trigger, code, latency in results:
+        codes[code] += 1
+        by_trigger[trigger].append(latency)
+    with Session(engine) as session:
+        rows = {model.__tablename__: session.exec(select(func.count()).select_from(model)).one()
+                for model in (Patient, Dossier, Mouvement, Identifier, MessageLog)}
+    size_after = _db_size(workdir)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "workdir": str(workdir),
+        "config": {
+            "seed": args.seed, "patients": args.patients, "beds": args.beds, "concurrency": args.concurrency,
+            "max_transfers": args.max_transfers, "in_house_ratio": args.in_house_ratio,
+            "cancel_ratio": args.cancel_ratio, "merge_ratio": args.merge_ratio, "emission": not args.no_emission,
+        },
+        "messages": {"sent": total, "acks": dict(codes)},
+        "duration_s": round(elapsed, 3),
+        "throughput_msg_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "ack_latency_ms": percentiles([r[2] for r in results]),
+        "ack_latency_by_trigger_ms": {t: percentiles(v) for t, v in sorted(by_trigger.items())},
+        "db": {
+            "size_before": size_before, "size_after": size_after, "growth_bytes": size_after - size_before,
+            "bytes_per_message": round((size_after - size_before) / total, 1) if total else 0.0,
+            "rows": rows,
+        },
+        "emission": {
+            "received": len(receiver.received),
+            "unmatched": len(receiver.received) - len(lags),
+            "lag_ms": percentiles(lags),
+            "drain_s": round(max(0.0, max((a for a, _ in receiver.received), default=last_ack) - last_ack), 3),
+        },
+    }
+
+
+def _get(report: dict, path):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def compare(previous: dict, current: dict) -> None:
+    print(f"\n📊 Comparaison {previous.get('commit') or '?'} → {current.get('commit') or '?'}")
+    for path, higher_is_better in COMPARED:
+        old, new = _get(previous, path), _get(current, path)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            continue
+        delta = (new - old) / old * 100 if old else 0.0
+        better = (delta >= 0) == higher_is_better or delta == 0
+        print(f"  {'.'.join(path):<28} {old:>12} → {new:<12} {delta:+6.1f}% {'✅' if better else '⚠️'}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="BENCH")
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--beds", type=int, default=400)
+    parser.add_argument("--max-transfers", type=int, default=2)
+    parser.add_argument("--in-house-ratio", type=float, default=0.2)
+    parser.add_argument("--cancel-ratio", type=float, default=0.05)
+    parser.add_argument("--merge-ratio", type=float, default=0.01)
+    parser.add_argument("--concurrency", type=int, default=8, help="Connexions MLLP parallèles")
+    parser.add_argument("--port", type=int, default=0, help="Port d'écoute MLLP (0 = libre)")
+    parser.add_argument("--no-emission", action="store_true", help="Sans endpoint émetteur ni récepteur")
+    parser.add_argument("--drain-idle", type=float, default=2.0, help="Silence (s) marquant la fin des émissions")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--workdir", help="Répertoire de la base de test (temporaire par défaut)")
+    parser.add_argument("--report", type=Path, help="Fichier du rapport JSON")
+    parser.add_argument("--compare", type=Path, help="Rapport JSON précédent à comparer")
+    args = parser.parse_args()
+    report_path = args.report.resolve() if args.report else None
+    compare_path = args.compare.resolve() if args.compare else None
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if report_path:
+        report_path.write_text(text, encoding="utf-8")
+        print(f"💾 Rapport: {report_path}")
+    else:
+        print(text)
+    latency = report["ack_latency_ms"]
+    print(f"⏱️  {report['throughput_msg_s']} msg/s — ACK p50 {latency.get('p50')} ms, "
+          f"p95 {latency.get('p95')} ms, p99 {latency.get('p99')} ms — ACKs {report['messages']['acks']}")
+    if compare_path:
+        compare(json.loads(compare_path.read_text(encoding="utf-8")), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Génère un jeu de données synthétique reproductible (structure, patients, séjours, mouvements,
+identifiants, journal des messages) dans la base de l'application, et/ou le flux ADT
+correspondant dans un fichier (un message par ligne, segments terminés par CR).
+
+Usage:
+    python tools/generate_synthetic_data.py --beds 2000 --patients 50000
+    python tools/generate_synthetic_data.py --beds 500 --patients 10000 --seed 7 --prefix S7
+    python tools/generate_synthetic_data.py --patients 10000 --no-db --hl7-out adt_stream.hl7
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Ajouter le répertoire racine au path pour importer les modules app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlmodel import Session
+
+from app.db import engine, init_db  # enregistre les modèles et les écouteurs
+from app.services.synthetic_data import SyntheticConfig, build_dataset, load_dataset, write_adt_stream
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="SYN", help="Préfixe des codes de structure et des identifiants")
+    parser.add_argument("--beds", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--stays-per-patient", type=int, default=1)
+    parser.add_argument("--max-transfers", type=int, default=2)
+    parser.add_argument("--in-house-ratio", type=float, default=0.2)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--no-message-log", action="store_true", help="Ne pas alimenter le journal des messages")
+    parser.add_argument("--emit", action="store_true", help="Émettre la structure créée (FHIR/MFN)")
+    parser.add_argument("--no-db", action="store_true", help="Ne rien écrire en base")
+    parser.add_argument("--hl7-out", type=Path, help="Fichier du flux ADT correspondant")
+    args = parser.parse_args()
+
+    config = SyntheticConfig(
+        seed=args.seed, prefix=args.prefix, beds=args.beds, patients=args.patients,
+        stays_per_patient=args.stays_per_patient, max_transfers=args.max_transfers,
+        in_house_ratio=args.in_house_ratio, days=args.days, batch_size=args.batch_size,
+        message_log=not args.no_message_log, emit=args.emit,
+    )
+    started = time.perf_counter()
+    dataset = build_dataset(config)
+    print(f"🎲 Jeu de données: {len(dataset.patients)} patients, {len(dataset.stays)} séjours, "
+          f"{dataset.movement_count} mouvements ({time.perf_counter() - started:.2f} s)")
+
+    if not args.no_db:
+        init_db()
+        started = time.perf_counter()
+        with Session(engine) as session:
+            counts = load_dataset(session, dataset)
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        for table, count in counts.items():
+            print(f"  {table:<20} {count:>10}")
+        print(f"💾 {total} lignes en {elapsed:.2f} s ({total / elapsed:,.0f} lignes/s)")
+
+    if args.hl7_out:
+        started = time.perf_counter()
+        count = write_adt_stream(dataset, args.hl7_out)
+        print(f"📨 {count} messages ADT écrits dans {args.hl7_out} ({time.perf_counter() - started:.2f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
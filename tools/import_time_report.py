@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Rapport du coût d'import au démarrage de l'application (python -X importtime).
+
+Lance un interpréteur neuf qui importe app.app et construit l'application (create_app),
+analyse la trace `-X importtime` et affiche les modules les plus coûteux (temps cumulé),
+ainsi que la durée totale du démarrage à froid. L'exécution échoue si cette durée dépasse
+le budget (option --budget-ms ou variable COLD_START_BUDGET_MS).
+
+Usage:
+    python tools/import_time_report.py
+    python tools/import_time_report.py --top 40 --budget-ms 4000
+    python tools/import_time_report.py --json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent.parent
+STARTUP = (
+    "import time; t = time.perf_counter(); "
+    "from app.app import create_app; create_app(); "
+    "print('cold_start_ms=%.1f' % ((time.perf_counter() - t) * 1000))"
+)
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+
+def parse_importtime(trace: str) -> List[Dict]:
+    """Lignes `import time: self | cumulative | module` (µs) -> dicts, dans l'ordre de la trace."""
+    entries = []
+    for line in trace.splitlines():
+        match = _LINE.match(line)
+        if match:
+            entries.append({
+                "module": match.group(4),
+                "self_us": int(match.group(1)),
+                "cumulative_us": int(match.group(2)),
+                "depth": len(match.group(3)) // 2,
+            })
+    return entries
+
+
+def measure(env: Optional[Dict[str, str]] = None) -> Dict:
+    """Démarrage à froid dans un sous-processus : durée, modules importés et leurs coûts."""
+    run_env = {**os.environ, "TESTING": "1", **(env or {})}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=ROOT, env=run_env, capture_output=True, text=True, check=True,
+    )
+    cold_start = re.search(r"cold_start_ms=([\d.]+)", result.stdout)
+    entries = parse_importtime(result.stderr)
+    return {
+        "cold_start_ms": float(cold_start.group(1)) if cold_start else None,
+        "import_ms": sum(e["self_us"] for e in entries) / 1000,
+        "modules": entries,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=25, help="Nombre de modules affichés")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("COLD_START_BUDGET_MS", "0")),
+                        help="Durée maximale du démarrage à froid, en ms (0 : pas de contrôle)")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    report = measure()
+    top = sorted(report["modules"], key=lambda e: e["cumulative_us"], reverse=True)[:args.top]
+    if args.json:
+        print(json.dumps({**report, "modules": top}, indent=2))
+    else:
+        print(f"⏱️  Démarrage à froid : {report['cold_start_ms']:.0f} ms "
+              f"(imports : {report['import_ms']:.0f} ms, {len(report['modules'])} modules)")
+        print(f"{'cumulé (ms)':>12} {'propre (ms)':>12}  module")
+        for entry in top:
+            print(f"{entry['cumulative_us'] / 1000:>12.1f} {entry['self_us'] / 1000:>12.1f}  {entry['module']}")
+
+    if args.budget_ms and report["cold_start_ms"] > args.budget_ms:
+        print(f"❌ Budget dépassé : {report['cold_start_ms']:.0f} ms > {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Applique la migration 014 (index d'occupation des lits) si besoin, puis reconstruit l'index :
+hiérarchie et état programmé de chaque lit, puis rejeu des mouvements dans l'ordre.
+
+Usage:
+    python tools/rebuild_bed_occupancy.py
+"""
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire racine au path pour importer les modules app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlmodel import Session, text
+from app.db import engine
+from app.services.bed_occupancy import rebuild_bed_occupancy
+
+
+def apply_migration_014(session: Session) -> None:
+    result = session.exec(text("SELECT name FROM sqlite_master WHERE type='table' AND name='bedoccupancy'"))
+    if result.fetchone():
+        print("✅ Migration 014 déjà appliquée.")
+        return
+    migration_file = Path(__file__).parent.parent / "migrations" / "014_add_bed_occupancy.sql"
+    sql_content = migration_file.read_text(encoding="utf-8")
+    lines = [l for l in sql_content.splitlines() if not l.strip().startswith("--")]
+    for stmt in [s.strip() for s in "\n".join(lines).split(";") if s.strip()]:
+        print(f"  Exécution: {stmt[:60]}...")
+        session.exec(text(stmt))
+    session.commit()
+    print("✅ Migration 014 appliquée.")
+
+
+def main():
+    with Session(engine) as session:
+        apply_migration_014(session)
+        count = rebuild_bed_occupancy(session)
+        print(f"📊 Lits indexés: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Applique les migrations 012/013 (registre unifié des lieux, versions) si besoin, puis reconstruit
+l'index à partir des tables de structure (EJ → EG → Pôle → Service → UF → UH → Chambre → Lit).
+
+Usage:
+    python tools/rebuild_location_index.py
+"""
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire racine au path pour importer les modules app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlmodel import Session, text
+from app.db import engine
+from app.services.location_index import rebuild_location_index
+
+
+def _run_sql_file(session: Session, filename: str) -> None:
+    migration_file = Path(__file__).parent.parent / "migrations" / filename
+    sql_content = migration_file.read_text(encoding="utf-8")
+    lines = [l for l in sql_content.splitlines() if not l.strip().startswith("--")]
+    for stmt in [s.strip() for s in "\n".join(lines).split(";") if s.strip()]:
+        print(f"  Exécution: {stmt[:60]}...")
+        session.exec(text(stmt))
+    session.commit()
+
+
+def apply_migration_012(session: Session) -> None:
+    result = session.exec(text("SELECT name FROM sqlite_master WHERE type='table' AND name='locationindex'"))
+    if result.fetchone():
+        print("✅ Migration 012 déjà appliquée.")
+        return
+    _run_sql_file(session, "012_add_location_index.sql")
+    print("✅ Migration 012 appliquée.")
+
+
+def apply_migration_013(session: Session) -> None:
+    columns = [row[1] for row in session.exec(text("PRAGMA table_info(locationindex)")).fetchall()]
+    if "version" in columns:
+        print("✅ Migration 013 déjà appliquée.")
+        return
+    _run_sql_file(session, "013_add_location_index_version.sql")
+    print("✅ Migration 013 appliquée.")
+
+
+def main():
+    with Session(engine) as session:
+        apply_migration_012(session)
+        apply_migration_013(session)
+        count = rebuild_location_index(session)
+        print(f"📊 Lieux indexés: {count}")
+
+
+if __name__ == "__main__":
+    main()
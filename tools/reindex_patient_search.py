@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Applique la migration 011 (colonnes de recherche patient + index trigrammes) si besoin,
+puis indexe les patients existants pour la recherche PDQ/PDQm.
+
+Usage:
+    python tools/reindex_patient_search.py
+"""
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire racine au path pour importer les modules app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlmodel import Session, text
+from app.db import engine
+from app.services.patient_search import reindex_patients
+
+
+def apply_migration_011(session: Session) -> None:
+    result = session.exec(text("PRAGMA table_info(patient)"))
+    columns = [row[1] for row in result.fetchall()]
+    if "family_norm" in columns:
+        print("✅ Migration 011 déjà appliquée.")
+        return
+    migration_file = Path(__file__).parent.parent / "migrations" / "011_add_patient_search_index.sql"
+    sql_content = migration_file.read_text(encoding="utf-8")
+    lines = [l for l in sql_content.splitlines() if not l.strip().startswith("--")]
+    for stmt in [s.strip() for s in "\n".join(lines).split(";") if s.strip()]:
+        print(f"  Exécution: {stmt[:60]}...")
+        session.exec(text(stmt))
+    session.commit()
+    print("✅ Migration 011 appliquée.")
+
+
+def main():
+    with Session(engine) as session:
+        apply_migration_011(session)
+        count = reindex_patients(session)
+        print(f"📊 Patients indexés: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Lance les micro-benchmarks HL7 (tests/benchmarks) et les compare à la référence enregistrée.
+
+Les références sont stockées dans tests/benchmarks/baselines/<machine>/ (une par plateforme
+Python/OS) : enregistrer la référence sur la machine de mesure, puis comparer chaque exécution
+à la dernière référence. L'exécution échoue si la moyenne d'un benchmark régresse au-delà du
+seuil (en %, option --max-regression ou variable BENCHMARK_MAX_REGRESSION, 20 % par défaut).
+
+Usage:
+    python tools/run_benchmarks.py --save-baseline
+    python tools/run_benchmarks.py
+    python tools/run_benchmarks.py --max-regression 10 -- -k mllp
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+BASELINE_DIR = ROOT / "tests" / "benchmarks" / "baselines"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistrer l'exécution comme nouvelle référence")
+    parser.add_argument("--max-regression", type=int, choices=range(1, 100), metavar="1-99",
+                        default=int(os.environ.get("BENCHMARK_MAX_REGRESSION", "20")),
+                        help="Régression maximale tolérée sur la moyenne, en %% entier")
+    parser.add_argument("pytest_args", nargs="*", help="Arguments supplémentaires pour pytest (après --)")
+    args = parser.parse_args()
+
+    try:
+        import pytest
+        import pytest_benchmark  # noqa: F401
+    except ImportError:
+        print("❌ pytest-benchmark n'est pas installé (pip install -r requirements.txt)")
+        return 2
+
+    pytest_args = [
+        str(ROOT / "tests" / "benchmarks"), "-q", "--benchmark-only",
+        f"--benchmark-storage=file://{BASELINE_DIR}",
+    ]
+    if args.save_baseline:
+        pytest_args.append("--benchmark-save=baseline")
+        print(f"📏 Enregistrement de la référence dans {BASELINE_DIR}")
+    else:
+        if not any(BASELINE_DIR.glob("*/*.json")):
+            print("❌ Aucune référence enregistrée : lancer d'abord avec --save-baseline")
+            return 2
+        pytest_args += ["--benchmark-compare", f"--benchmark-compare-fail=mean:{args.max_regression}%"]
+        print(f"⏱️  Comparaison avec la dernière référence (régression max {args.max_regression} %)")
+    return pytest.main(pytest_args + args.pytest_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())